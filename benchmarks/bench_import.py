@@ -0,0 +1,78 @@
+"""
+Import-time benchmark
+---
+Measure the time of importing Odmactor modules in fresh interpreters, and enforce an import-time budget:
+the process exits with a non-zero status if the budget is exceeded, or if heavy vendor and plotting
+packages are loaded eagerly.
+
+Usage: python benchmarks/bench_import.py [--budget 0.5] [--output import.json]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from common import ROOT, summarize, write_report
+
+MODULES = ['odmactor', 'odmactor.utils', 'odmactor.instrument', 'odmactor.scheduler']
+
+# packages which should only be imported when a scheduler actually uses them
+LAZY_PACKAGES = ['matplotlib', 'scipy', 'tqdm', 'TimeTagger', 'nidaqmx', 'pyvisa', 'pymeasure', 'RsInstrument']
+
+BUDGET = 0.5  # unit: s
+
+PROBE = '''
+import sys, time, json
+t = time.perf_counter()
+import {module}
+t = time.perf_counter() - t
+print(json.dumps({{'time': t, 'loaded': [m for m in {lazy!r} if m in sys.modules]}}))
+'''
+
+
+def probe(module: str) -> dict:
+    """
+    Import a module in a fresh interpreter
+    """
+    out = subprocess.run([sys.executable, '-c', PROBE.format(module=module, lazy=LAZY_PACKAGES)],
+                         cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(out)
+
+
+def run(repeat: int = 5, budget: float = BUDGET) -> dict:
+    results = {}
+    for module in MODULES:
+        probes = [probe(module) for _ in range(repeat)]
+        results[module] = summarize([p['time'] for p in probes])
+        results[module]['eager_packages'] = sorted(set(sum([p['loaded'] for p in probes], [])))
+
+    scheduler = results['odmactor.scheduler']
+    results['budget'] = {
+        'module': 'odmactor.scheduler',
+        'limit': budget,
+        'median': scheduler['median'],
+        'passed': scheduler['median'] <= budget and not scheduler['eager_packages'],
+    }
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--budget', type=float, default=BUDGET, help='import-time budget of odmactor.scheduler, unit: s')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat, args.budget)
+    scheduler = results['odmactor.scheduler']
+    write_report('import', results, args.output)
+
+    if scheduler['eager_packages']:
+        print('Eagerly imported packages: {}'.format(scheduler['eager_packages']), file=sys.stderr)
+    if scheduler['median'] > args.budget:
+        print('Import time {:.3f} s exceeds budget {:.3f} s'.format(scheduler['median'], args.budget), file=sys.stderr)
+    return 0 if results['budget']['passed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Benchmarks of scheduler data processing and scanning host overhead, with simulated instruments
+---
+Usage: python benchmarks/bench_scheduler.py [--quick] [--output scheduler.json]
+"""
+
+import argparse
+import sys
+import time
+import numpy as np
+from common import measure, quiet, sandbox, simulated_scheduler, write_report
+
+
+def bench_cal_counts_result(n_values, n_points, repeat) -> dict:
+    """
+    Calculate counting results from raw data of `n_points` detection points with `n_values` values each
+    """
+    from odmactor.scheduler import CWScheduler, RabiScheduler
+
+    rng = np.random.default_rng(0)
+    results = {}
+    for cls, with_ref, two_pulse_readout in [(CWScheduler, True, False), (RabiScheduler, False, True),
+                                             (RabiScheduler, False, False)]:
+        scheduler = simulated_scheduler(cls, with_ref=with_ref)
+        scheduler.two_pulse_readout = two_pulse_readout
+        scheduler._freqs = scheduler._times = list(range(n_points))
+        scheduler._data = [rng.poisson(10, n_values).tolist() for _ in range(n_points)]
+        scheduler._data_ref = [rng.poisson(10, n_values).tolist() for _ in range(n_points)] if with_ref else []
+        key = '{}-ref-{}-two-pulse-{}'.format(cls.__name__, with_ref, two_pulse_readout)
+        results[key] = measure(scheduler._cal_counts_result, repeat)
+    return results
+
+
+def scanning_overhead(scheduler, n_points: int) -> dict:
+    """
+    Host overhead per detection point: wall time of `run_scanning` beyond the dwell time (and time padding)
+    """
+    n_acq = n_points * (2 if scheduler.with_ref else 1)
+    t = time.perf_counter()
+    scheduler.run_scanning()
+    wall = time.perf_counter() - t
+    dwell = n_acq * (scheduler.asg_dwell + scheduler.time_pad)
+    return {'n_points': n_points, 'wall': wall, 'dwell': dwell, 'overhead_per_point': (wall - dwell) / n_points}
+
+
+def bench_run_scanning(n_points) -> dict:
+    """
+    Run frequency-domain and time-domain scanning
+    """
+    from odmactor.scheduler import CWScheduler, PulseScheduler, RabiScheduler
+
+    results = {}
+    scheduler = simulated_scheduler(CWScheduler)
+    scheduler.configure_odmr_seq(period=1000, N=100)
+    scheduler.set_mw_freqs(2.80e9, 2.80e9 + (n_points - 0.5) * 1e6, 1e6)
+    scheduler.configure_mw_paras(power=0)
+    scheduler.configure_tagger_counting()
+    results['CWScheduler'] = scanning_overhead(scheduler, n_points)
+
+    scheduler = simulated_scheduler(PulseScheduler)
+    scheduler.configure_odmr_seq(t_init=3000, t_mw=200, t_read_sig=400, N=100)
+    scheduler.set_mw_freqs(2.80e9, 2.80e9 + (n_points - 0.5) * 1e6, 1e6)
+    scheduler.configure_mw_paras(power=0)
+    scheduler.configure_tagger_counting(reader='cbm')
+    results['PulseScheduler'] = scanning_overhead(scheduler, n_points)
+
+    scheduler = simulated_scheduler(RabiScheduler, with_ref=False)
+    scheduler.configure_odmr_seq(t_init=3000, t_read_sig=400, N=100)
+    scheduler.set_delay_times(times=range(20, 20 + 10 * n_points, 10))
+    scheduler.configure_mw_paras(power=0, freq=2.87e9)
+    scheduler.gene_pseudo_detect_seq()
+    scheduler.configure_tagger_counting(reader='cbm')
+    results['RabiScheduler'] = scanning_overhead(scheduler, n_points)
+    return results
+
+
+def run(quick: bool = False) -> dict:
+    with sandbox(), quiet():
+        return {
+            'cal_counts_result': bench_cal_counts_result(100000, 4 if quick else 20, 3),
+            'run_scanning': bench_run_scanning(20 if quick else 200),
+        }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help='run a reduced set of cases')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+    write_report('scheduler', run(args.quick), args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
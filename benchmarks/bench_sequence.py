@@ -0,0 +1,135 @@
+"""
+Benchmarks of ASG sequence generation, normalization and rendering
+---
+Usage: python benchmarks/bench_sequence.py [--quick] [--output sequence.json]
+"""
+
+import argparse
+import sys
+from common import measure, quiet, sandbox, simulated_scheduler, write_report
+
+ORDERS = [1, 4, 16, 64, 256]
+
+
+def bench_gene_detect_seq(orders, repeat) -> dict:
+    """
+    Generate and download (into a simulated ASG) detection sequences of every time-domain scheduler
+    """
+    from odmactor.scheduler import RamseyScheduler, RabiScheduler, RelaxationScheduler
+    from odmactor.scheduler import HahnEchoScheduler, HighDecouplingScheduler
+
+    results = {}
+    for cls in [RamseyScheduler, RabiScheduler, RelaxationScheduler, HahnEchoScheduler, HighDecouplingScheduler]:
+        results[cls.__name__] = {}
+        for order in orders:
+            scheduler = simulated_scheduler(cls, order=order, ms=1)
+            scheduler.configure_odmr_seq(t_init=3000, t_read_sig=400, N=1000)
+            results[cls.__name__][str(order)] = measure(lambda: scheduler.gene_detect_seq(1000), repeat, 10)
+    return results
+
+
+def dd_sequences(order: int):
+    from odmactor.scheduler import HighDecouplingScheduler
+    scheduler = simulated_scheduler(HighDecouplingScheduler, order=order)
+    scheduler.configure_odmr_seq(t_init=3000, t_read_sig=400, N=1000)
+    scheduler.gene_detect_seq(1000)
+    return scheduler.asg, scheduler.sequences
+
+
+def bench_asg_data(orders, repeat) -> dict:
+    """
+    Normalize and check ASG data of high-order dynamical decoupling sequences
+    """
+    results = {'normalize_data': {}, 'checkdata': {}}
+    for order in orders:
+        asg, sequences = dd_sequences(order)
+        data = asg.normalize_data(sequences)
+        results['normalize_data'][str(order)] = measure(lambda: asg.normalize_data(sequences), repeat, 10)
+        results['checkdata'][str(order)] = measure(lambda: asg.check_data(data), repeat, 10)
+    return results
+
+
+def legacy_marshal(asg_data):
+    """
+    Marshalling of `ASG8005.download_ASG_pulse_data()`, i.e., ctypes arrays built from Python tuples
+    """
+    from ctypes import POINTER, c_double, c_int
+    length = [len(row) for row in asg_data]
+    c_length = (c_int * 8)(*tuple(length))
+    c_asg_data = (c_double * max(length) * 8)(*(tuple(i) for i in asg_data))
+    return (POINTER(c_double) * len(c_asg_data))(*c_asg_data), c_length
+
+
+def bench_download(orders, repeat) -> dict:
+    """
+    Marshal ASG data for downloading: legacy tuple-based ctypes arrays versus pointers of persistent buffers
+    (NumPy arrays passed without copying, and lists copied into buffers), excluding data checking
+    """
+    import numpy as np
+    results = {'legacy': {}, 'pointers_arrays': {}, 'pointers_lists': {}}
+    for order in orders:
+        asg, sequences = dd_sequences(order)
+        data = asg.normalize_data(sequences)
+        arrays = [np.asarray(seq, dtype=np.float64) for seq in data]
+        results['legacy'][str(order)] = measure(lambda: legacy_marshal(data), repeat, 10)
+        results['pointers_arrays'][str(order)] = measure(lambda: asg._marshal(arrays), repeat, 10)
+        results['pointers_lists'][str(order)] = measure(lambda: asg._marshal(data), repeat, 10)
+    return results
+
+
+def bench_expand(repeat) -> dict:
+    """
+    Expand channels of (mutually prime) different periods to the same length
+    """
+    from odmactor.utils.sequence import expand_to_same_length
+    results = {}
+    for periods in [(1000, 1000), (1000, 1500), (1010, 1030), (1070, 1090, 1130), (499979, 500009)]:
+        sequences = [[p // 2, p - p // 2] for p in periods] + [[0, 0]] * (8 - len(periods))
+        results['-'.join(map(str, periods))] = measure(lambda: expand_to_same_length(sequences), repeat)
+    return results
+
+
+def bench_render(orders, repeat) -> dict:
+    """
+    Render sequences into a string and a figure
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from odmactor.utils.sequence import sequences_to_figure, sequences_to_string
+
+    def to_figure(sequences):
+        plt.close(sequences_to_figure(sequences))
+
+    results = {'sequences_to_string': {}, 'sequences_to_figure': {}}
+    for order in orders:
+        _, sequences = dd_sequences(order)
+        results['sequences_to_string'][str(order)] = measure(lambda: sequences_to_string(sequences), repeat)
+        results['sequences_to_figure'][str(order)] = measure(lambda: to_figure(sequences), repeat)
+    return results
+
+
+def run(quick: bool = False) -> dict:
+    orders = ORDERS[:2] if quick else ORDERS
+    repeat = 3 if quick else 5
+    with sandbox(), quiet():
+        return {
+            'gene_detect_seq': bench_gene_detect_seq(orders, repeat),
+            'asg_data': bench_asg_data(orders, repeat),
+            'download': bench_download(orders, repeat),
+            'expand_to_same_length': bench_expand(repeat),
+            'render': bench_render(orders[:3], repeat),
+        }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help='run a reduced set of cases')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+    write_report('sequence', run(args.quick), args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
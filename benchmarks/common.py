@@ -0,0 +1,125 @@
+"""
+Common helpers of Odmactor benchmarks
+---
+Every benchmark script writes a machine-readable JSON report, so that results can be compared across releases
+"""
+
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def environment() -> dict:
+    """
+    Information of the running environment, recorded along with each report
+    """
+    import odmactor
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'odmactor': getattr(odmactor, '__version__', None),
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def summarize(samples) -> dict:
+    """
+    Summary statistics of timing samples
+    :param samples: durations, unit: s
+    """
+    samples = sorted(samples)
+    n = len(samples)
+    return {
+        'n': n,
+        'min': samples[0],
+        'median': samples[n // 2],
+        'mean': sum(samples) / n,
+        'max': samples[-1],
+    }
+
+
+def measure(func, repeat: int = 5, number: int = 1) -> dict:
+    """
+    Time a callable, in the spirit of `timeit.repeat`
+    :param func: callable without arguments
+    :param repeat: number of timing samples
+    :param number: number of calls in each sample
+    :return: summary of per-call durations, unit: s
+    """
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - t) / number)
+    return summarize(samples)
+
+
+@contextlib.contextmanager
+def quiet():
+    """
+    Silence console output (prints, progress bars) of schedulers
+    """
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        yield
+
+
+@contextlib.contextmanager
+def sandbox():
+    """
+    Run in a temporary working directory, since schedulers write results into "../output/",
+    and keep local state (e.g. measured overheads) apart from the user's one
+    """
+    cwd = os.getcwd()
+    home = os.environ.get('ODMACTOR_HOME')
+    with tempfile.TemporaryDirectory() as tmp:
+        work = os.path.join(tmp, 'work')
+        os.mkdir(work)
+        os.chdir(work)
+        os.environ['ODMACTOR_HOME'] = os.path.join(tmp, 'state')
+        try:
+            yield work
+        finally:
+            os.chdir(cwd)
+            if home is None:
+                os.environ.pop('ODMACTOR_HOME')
+            else:
+                os.environ['ODMACTOR_HOME'] = home
+
+
+def simulated_scheduler(cls, **kwargs):
+    """
+    Construct a scheduler with simulated instruments and a calibrated pi pulse
+    """
+    with quiet():
+        scheduler = cls(simulation=True, **kwargs)
+    scheduler.pi_pulse = {'freq': 2.87e9, 'power': 0, 'time': 160e-9}
+    return scheduler
+
+
+def write_report(name: str, results: dict, output: str = None) -> dict:
+    """
+    Write a benchmark report as JSON
+    :param name: benchmark name
+    :param results: benchmark results
+    :param output: output file name; if not designed, the report is printed to stdout
+    :return: the report, `dict` type
+    """
+    report = {'benchmark': name, 'environment': environment(), 'results': results}
+    if output is None:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
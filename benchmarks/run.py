@@ -0,0 +1,31 @@
+"""
+Run all Odmactor benchmarks and write a single JSON report
+---
+Usage: python benchmarks/run.py [--quick] [--output benchmarks.json]
+"""
+
+import argparse
+import sys
+import bench_import
+import bench_scheduler
+import bench_sequence
+from common import write_report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help='run a reduced set of cases')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    results = {
+        'import': bench_import.run(repeat=3 if args.quick else 5),
+        'sequence': bench_sequence.run(args.quick),
+        'scheduler': bench_scheduler.run(args.quick),
+    }
+    write_report('all', results, args.output)
+    return 0 if results['import']['budget']['passed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,32 @@
 """
 Abstract interfaces of instruments, i.e., Laser, Microwave, ASG, ...
+---
+Instrument classes are imported on first access, so that vendor packages (e.g. RsInstrument, pyvisa, pymeasure)
+are only loaded when the corresponding instrument is actually used
 """
 
-from .asg import ASG
-from .laser import Laser
-from .microwave import Microwave
-from .lockin import LockInAmplifier
+import importlib
+
+_instruments = {
+    'ASG': '.asg',
+    'ASGCounter': '.asg',
+    'Laser': '.laser',
+    'Microwave': '.microwave',
+    'LockInAmplifier': '.lockin',
+    'GalvoScanner': '.scanner',
+    'PiezoStage': '.stage',
+}
+
+__all__ = list(_instruments)
+
+
+def __getattr__(name):
+    if name in _instruments:
+        instr = getattr(importlib.import_module(_instruments[name], __name__), name)
+        globals()[name] = instr
+        return instr
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
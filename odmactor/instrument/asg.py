@@ -1,7 +1,21 @@
+import threading
 import numpy as np
 from copy import deepcopy
-from typing import List
+from ctypes import POINTER, c_double, c_int
+from typing import List, Tuple, Optional, Sequence
 from odmactor.utils.asg import ASG8005
+from odmactor.utils.asg.ASG8005_PythonSDK import STATUS_CALLBACK_COUNT
+from odmactor.utils.sequence import ASG_MIN_HIGH, ASG_MIN_LOW, ASG_MAX_LENGTH
+from odmactor.utils.sequence import CompressedSequence, expand_sequence, sequence_edges
+
+ASG_CHANNELS = 8
+ASG_MAX_WIDTH = 26e9  # maximal width of a segment, unit: ns
+
+# constraints of count data of the ASG built-in counter, unit: ns
+COUNT_RESOLUTION = 5
+COUNT_MIN_WINDOW = 20
+COUNT_MIN_GAP = 5
+COUNT_MIN_PERIOD = 1500
 
 """
 ASG sequences example:
@@ -19,16 +33,54 @@ asg_data1=[
 """
 
 
+def pulse_data_error(asg_data: Sequence[Sequence[float]]) -> Optional[str]:
+    """
+    Check pulse data of ASG channels, as `ASG8005.checkdata()` does, vectorized over segments of each channel
+    :return: description of the first error, None if data are valid
+    """
+    if len(asg_data) > ASG_CHANNELS:
+        return '{} channels exceed {}'.format(len(asg_data), ASG_CHANNELS)
+    for i, seq in enumerate(asg_data):
+        x = np.asarray(seq, dtype=np.float64)
+        if x.ndim != 1 or x.size < 2 or x.size % 2 != 0:
+            return 'channel {}: length {} should be even and at least 2'.format(i + 1, x.size)
+        highs, lows = x[0::2], x[1::2]
+        if np.any(x > ASG_MAX_WIDTH):
+            return 'channel {}: width exceeds {} ns'.format(i + 1, ASG_MAX_WIDTH)
+        if x.size == 2:
+            if highs[0] != 0 and highs[0] < ASG_MIN_HIGH or lows[0] != 0 and lows[0] < ASG_MIN_LOW:
+                return 'channel {}: widths {} too short'.format(i + 1, x.tolist())
+            continue
+        # widths of 0.05-ns resolution (of two decimals), compared in the manner of `checkdata()`
+        scaled = np.trunc(x * 1e6)
+        if np.any(scaled != np.trunc(x * 100) * 10000) or np.any(scaled % 50000 != 0):
+            return 'channel {}: widths should be multiples of 0.05 ns'.format(i + 1)
+        # the first high level and the last low level may be zero (but not negative)
+        if highs[0] != 0 and highs[0] < ASG_MIN_HIGH or np.any(highs[1:] < ASG_MIN_HIGH):
+            return 'channel {}: high levels shorter than {} ns'.format(i + 1, ASG_MIN_HIGH)
+        if np.any(lows[:-1] < ASG_MIN_LOW) or lows[-1] != 0 and lows[-1] < ASG_MIN_LOW:
+            return 'channel {}: low levels shorter than {} ns'.format(i + 1, ASG_MIN_LOW)
+        if x.sum() > ASG_MAX_LENGTH:
+            return 'channel {}: period exceeds {} ns'.format(i + 1, ASG_MAX_LENGTH)
+    return None
+
+
 class ASG(ASG8005):
     def __init__(self):
         super(ASG, self).__init__()
+        self.running = False  # states kept for telemetry
+        self.n_downloads = 0
         self.connect()
 
     def normalize_data(self, sequences: List[List[int]]) -> List[List[int]]:
         """
         Normalize sequences to make it acceptable data for ASG loading
+        Loop-compressed sequences are checked on their blocks and then expanded
         """
-        asg_data = deepcopy(sequences)
+        for seq in sequences:
+            if isinstance(seq, CompressedSequence) and not seq.check():
+                raise ValueError('ASG data error: {}'.format(seq))
+        asg_data = [seq.tolist() if isinstance(seq, CompressedSequence) else deepcopy(seq) for seq in sequences]
         if not self.check_data(asg_data):
             for i, seq in enumerate(asg_data):
                 # 1) convert [0,0,...,0] into [0,0]
@@ -71,24 +123,251 @@ class ASG(ASG8005):
         Connect ASG and download designed sequences data into it
         :param asg_data: ASG sequences for different channels
         """
-        is_connected = super(ASG, self).connect()
+        is_connected = self.connect()
         asg_data = self.normalize_data(asg_data)
         if is_connected == 1:
-            return super(ASG, self).download_ASG_pulse_data(asg_data, [len(row) for row in asg_data])
+            return self.download_arrays(asg_data)
         else:
             raise ConnectionError('ASG not connected')
 
     def check_data(self, asg_data: List[List[int]]):
-        return super(ASG, self).checkdata(asg_data, [len(row) for row in asg_data])
+        return pulse_data_error(asg_data) is None
+
+    def download_arrays(self, asg_data: Sequence[Sequence[float]]):
+        """
+        Download sequences of 8 channels by passing pointers of their data to the device library
+        Contiguous float64 arrays are passed without copying; other sequences are copied into persistent per-channel
+        buffers. Pointer and length arrays are reused and pointers are only updated for new arrays or reallocated
+        buffers, hence the marshalling cost does not depend on sequence lengths (besides copying lists).
+        :param asg_data: sequences of 8 channels, e.g., float64 NumPy arrays
+        """
+        if len(asg_data) != ASG_CHANNELS:
+            raise ValueError('ASG data error: {} channels instead of {}'.format(len(asg_data), ASG_CHANNELS))
+        error = pulse_data_error(asg_data)
+        if error is not None:
+            raise ValueError('ASG data error: {}'.format(error))
+        self.n_downloads += 1
+        return self.download_ASG_pulse_pointers(*self._marshal(asg_data))
+
+    def _marshal(self, asg_data: Sequence[Sequence[float]]):
+        """
+        Fill the persistent pointer and length arrays with data of 8 channels
+        :return: ctypes arrays of pointers and lengths
+        """
+        if getattr(self, '_c_pointers', None) is None:
+            self._c_pointers = (POINTER(c_double) * ASG_CHANNELS)()
+            self._c_lengths = (c_int * ASG_CHANNELS)()
+            self._buffers = [None] * ASG_CHANNELS
+            self._passed = [None] * ASG_CHANNELS  # arrays whose pointers are set, referenced until next download
+        for i, seq in enumerate(asg_data):
+            if isinstance(seq, np.ndarray) and seq.dtype == np.float64 and seq.flags.c_contiguous:
+                if seq is not self._passed[i]:
+                    self._c_pointers[i] = seq.ctypes.data_as(POINTER(c_double))
+                    self._passed[i] = seq
+            else:
+                buffer = self._buffers[i]
+                n = len(seq)
+                if buffer is None or len(buffer) < n:
+                    buffer = self._buffers[i] = np.zeros(max(n, 64, 0 if buffer is None else 2 * len(buffer)))
+                buffer[:n] = seq
+                if buffer is not self._passed[i]:
+                    self._c_pointers[i] = buffer.ctypes.data_as(POINTER(c_double))
+                    self._passed[i] = buffer
+            self._c_lengths[i] = len(seq)
+        return self._c_pointers, self._c_lengths
 
     def connect(self):
         return super(ASG, self).connect()
 
-    def start(self, count=1):
-        return super(ASG, self).start()
+    def start(self, count: int = None):
+        """
+        Start running sequences
+        :param count: number of periods to run, e.g., exactly N periods of an armed acquisition; free running if None
+        """
+        self.running = True
+        return super(ASG, self).start() if count is None else super(ASG, self).start(count)
 
     def stop(self):
+        self.running = False
         return super(ASG, self).stop()
 
     def close(self):
         return super(ASG, self).close_device()
+
+
+def check_count_data(count_data: List[int]):
+    """
+    Check count data of the ASG built-in counter, as `ASG8005.checkCountData()` does, but raise an informative
+    `ValueError` instead of exiting the interpreter
+    :param count_data: [window, gap, window, gap, ...] of one ASG period, unit: ns
+    """
+    if len(count_data) < 2 or len(count_data) % 2 != 0:
+        raise ValueError('count data should consist of (window, gap) pairs: {}'.format(count_data))
+    for i, t in enumerate(count_data):
+        minimum = COUNT_MIN_WINDOW if i % 2 == 0 else COUNT_MIN_GAP
+        if t != int(t) or t % COUNT_RESOLUTION != 0 or t < minimum:
+            raise ValueError('count data error: {} {} ns should be a multiple of {} ns, at least {} ns'.format(
+                'window' if i % 2 == 0 else 'gap', t, COUNT_RESOLUTION, minimum))
+    if sum(count_data) < COUNT_MIN_PERIOD:
+        raise ValueError('count data error: period {} ns is shorter than {} ns'.format(
+            sum(count_data), COUNT_MIN_PERIOD))
+
+
+def count_windows(gate_seq: List[float]) -> List[int]:
+    """
+    Count data of the ASG built-in counter from a gate sequence (high-level effective), e.g., the tagger channel
+    Edges are rounded to the counter resolution, and the period is rotated to begin with a window, which keeps the
+    order of windows within periods; periods shorter than `COUNT_MIN_PERIOD` are repeated in the count data
+    :param gate_seq: gate sequence of one ASG period, unit: ns
+    :return: [window, gap, window, gap, ...], unit: ns
+    """
+    edges = np.round(sequence_edges(expand_sequence(gate_seq)) / COUNT_RESOLUTION) * COUNT_RESOLUTION
+    segments = [(j % 2 == 0, int(t)) for j, t in enumerate(np.diff(edges)) if t > 0]
+    # merge adjacent segments of the same level, cyclically
+    merged = []
+    for high, t in segments:
+        if merged and merged[-1][0] == high:
+            merged[-1] = (high, merged[-1][1] + t)
+        else:
+            merged.append((high, t))
+    if len(merged) > 1 and merged[0][0] == merged[-1][0]:
+        merged[0] = (merged[0][0], merged[0][1] + merged.pop()[1])
+    if not any(high for high, _ in merged):
+        raise ValueError('gate sequence has no counting window: {}'.format(gate_seq))
+    if len(merged) == 1:
+        # always-high gate, e.g., CW readout: the counter needs a gap, taken out of the end of the window
+        merged.append((False, COUNT_MIN_GAP))
+        merged[0] = (True, merged[0][1] - COUNT_MIN_GAP)
+    if not merged[0][0]:
+        merged = merged[1:] + merged[:1]
+    data = [t for _, t in merged]
+    data = data * -(-COUNT_MIN_PERIOD // max(sum(data), 1))
+    check_count_data(data)
+    return data
+
+
+class ASGCounter:
+    """
+    Gated photon counter built in ASG8005, in the manner of `TimeTagger.CountBetweenMarkers`
+    ---
+    In continuous counting mode, the device reports counts of all segments of the count data (windows and gaps)
+    through a callback, which copies them into a preallocated ring buffer.
+    `getData()` returns counts of windows of the latest complete periods.
+    """
+
+    def __init__(self, asg: 'ASG', count_data: List[int] = None, n_values: int = 1000, capacity: int = 1 << 20):
+        """
+        :param asg: ASG instance, whose counter input is the APD
+        :param count_data: [window, gap, ...] of one ASG period, unit: ns, see `count_windows()`
+        :param n_values: number of windows returned by `getData()`
+        :param capacity: number of segment counts kept in the ring buffer
+        """
+        self.asg = asg
+        self.n_values = n_values
+        self.count_data = []
+        self.running = False
+        self._buffer = np.zeros(capacity, dtype=np.uint32)
+        self._total = 0  # number of segment counts received since start
+        self._cleared = 0  # value of `_total` at the latest clearing
+        self._origin = 0  # value of `_total` at which a period begins
+        self._lock = threading.Lock()
+        self._callback = STATUS_CALLBACK_COUNT(self._on_count)  # referenced to prevent garbage collection
+        self.asg.set_callback_count(self._callback)
+        if count_data is not None:
+            self.configure(count_data)
+
+    def configure(self, count_data: List[int], n_values: int = None):
+        """
+        Download count data into the device
+        """
+        check_count_data(count_data)
+        count_data = [int(t) for t in count_data]
+        if n_values is not None:
+            self.n_values = n_values
+        needed = -(-self.n_values // (len(count_data) // 2)) * len(count_data)
+        if needed > len(self._buffer):
+            self._buffer = np.zeros(needed, dtype=np.uint32)
+        if count_data != self.count_data:
+            if self.asg.ASG_counter_download(count_data, len(count_data)) != 1:
+                raise RuntimeError('ASG counter download failed')
+            with self._lock:
+                # periods of new count data are aligned from here
+                self.count_data = count_data
+                self._total = self._cleared = self._origin = 0
+
+    def _on_count(self, type_: int, length: int, data):
+        if length <= 0 or not self.running:
+            return
+        values = np.ctypeslib.as_array(data, shape=(length,))
+        capacity = len(self._buffer)
+        with self._lock:
+            if length > capacity:
+                values = values[-capacity:]
+            start = (self._total + length - len(values)) % capacity
+            end = start + len(values)
+            if end <= capacity:
+                self._buffer[start:end] = values
+            else:
+                self._buffer[start:] = values[:capacity - start]
+                self._buffer[:end - capacity] = values[capacity - start:]
+            self._total += length
+
+    def start(self):
+        with self._lock:
+            self._total = self._cleared = self._origin = 0
+        # the device has a single count callback, which another counter may have taken over
+        self.asg.set_callback_count(self._callback)
+        self.running = True
+        self.asg.ASG_isCountContinu(1)
+        self.asg.ASG_countConfig(1)
+
+    def stop(self):
+        self.asg.ASG_countConfig(0)
+        self.running = False
+
+    def clear(self):
+        with self._lock:
+            self._cleared = self._total
+
+    def arm(self):
+        """
+        Clear, with the next reported count beginning a period, i.e., before ASG is started (again)
+        """
+        with self._lock:
+            self._cleared = self._origin = self._total
+
+    def _complete_periods(self) -> Tuple[int, int]:
+        """
+        Range [begin, end) of counts of complete periods received since clearing and kept in the ring buffer
+        """
+        n_segments = len(self.count_data)
+        end = self._total - (self._total - self._origin) % n_segments
+        begin = self._cleared + (-(self._cleared - self._origin)) % n_segments
+        return max(begin, end - len(self._buffer) + (len(self._buffer) % n_segments)), end
+
+    def ready(self) -> bool:
+        """
+        Whether `n_values` windows have been received since clearing
+        """
+        if not self.count_data:
+            return False
+        with self._lock:
+            begin, end = self._complete_periods()
+        return max(end - begin, 0) // 2 >= self.n_values
+
+    def getData(self) -> np.ndarray:
+        """
+        Counts of the latest `n_values` windows received since clearing, zero-filled if not enough
+        """
+        n_segments = len(self.count_data)
+        data = np.zeros(self.n_values, dtype=np.int64)
+        if not n_segments:
+            return data
+        with self._lock:
+            begin, end = self._complete_periods()
+            n_periods = min(max(end - begin, 0) // n_segments, -(-self.n_values // (n_segments // 2)))
+            idx = np.arange(end - n_periods * n_segments, end) % len(self._buffer)
+            windows = self._buffer[idx][::2]
+        windows = windows[-self.n_values:]
+        data[:len(windows)] = windows
+        return data
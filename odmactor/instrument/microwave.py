@@ -9,12 +9,18 @@ class Microwave(RsInstrument):
 
     def __init__(self):
         super(Microwave, self).__init__('USB0::0x0AAD::0x0054::104174::INSTR', True, True)
+        # latest settings, kept for telemetry without querying the instrument
+        self.freq = float('nan')
+        self.power = float('nan')
+        self.output = False
 
     def set_frequency(self, freq):
         super(Microwave, self).write_float('FREQUENCY', freq)
+        self.freq = freq
 
     def set_power(self, power):
         super(Microwave, self).write_float('POW', power)
+        self.power = power
 
     def run_given_time(self, duration):
         self.start()
@@ -26,9 +32,11 @@ class Microwave(RsInstrument):
 
     def start(self):
         self.write_bool('OUTPUT:STATE', True)
+        self.output = True
 
     def stop(self):
         self.write_bool('OUTPUT:STATE', False)
+        self.output = False
 
     def close(self):
         super(Microwave, self).close()
@@ -0,0 +1,73 @@
+import numpy as np
+import nidaqmx
+from nidaqmx.constants import AcquisitionType
+from typing import Sequence, Tuple
+
+
+class GalvoScanner(object):
+    """
+    Galvo (or piezo) scanner driven by two analog outputs of a NI DAQ device
+    ---
+    Each line is a single hardware-timed buffered write, clocked by the DAQ sample clock at one sample per pixel
+    The sample clock is exported to a terminal wired to a Time Tagger input; a line of n pixels has n + 1 samples, so
+    that its n + 1 clock edges delimit the pixels
+    """
+
+    def __init__(self, x_channel: str = 'Dev1/ao0', y_channel: str = 'Dev1/ao1',
+                 volts_per_um: Tuple[float, float] = (0.1, 0.1), max_voltage: float = 10.0, settle: int = 20,
+                 clock_terminal: str = '/Dev1/PFI12'):
+        """
+        :param x_channel: analog output channel of X axis
+        :param y_channel: analog output channel of Y axis
+        :param volts_per_um: voltage per micrometer of each axis
+        :param max_voltage: maximal absolute output voltage
+        :param settle: number of samples of moving to the beginning of a line
+        :param clock_terminal: terminal exporting the sample clock, None for not exporting
+        """
+        self.volts_per_um = np.asarray(volts_per_um, dtype=float)
+        self.max_voltage = max_voltage
+        self.settle = settle
+        self.position = (0.0, 0.0)  # unit: um
+        self.task = nidaqmx.Task()
+        for channel in (x_channel, y_channel):
+            self.task.ao_channels.add_ao_voltage_chan(channel, min_val=-max_voltage, max_val=max_voltage)
+        if clock_terminal is not None:
+            self.task.export_signals.samp_clk_output_term = clock_terminal
+
+    def _write(self, xs: np.ndarray, ys: np.ndarray, rate: float):
+        """
+        Hardware-timed finite output of positions (unit: um) at a sample rate (unit: Hz)
+        """
+        volts = np.vstack([xs * self.volts_per_um[0], ys * self.volts_per_um[1]])
+        if np.abs(volts).max() > self.max_voltage:
+            raise ValueError('scanning positions exceed the voltage range ±{} V'.format(self.max_voltage))
+        self.task.timing.cfg_samp_clk_timing(rate, sample_mode=AcquisitionType.FINITE, samps_per_chan=len(xs))
+        self.task.write(volts, auto_start=False)
+        self.task.start()
+        self.task.wait_until_done(timeout=len(xs) / rate + 10)
+        self.task.stop()
+        self.position = (float(xs[-1]), float(ys[-1]))
+
+    def move_to(self, x: float, y: float, rate: float = 1e4):
+        """
+        Move to a position along a linear ramp
+        :param x: X position, unit: um
+        :param y: Y position, unit: um
+        :param rate: sample rate of the ramp, unit: Hz
+        """
+        n = max(self.settle, 2)
+        self._write(np.linspace(self.position[0], x, n), np.linspace(self.position[1], y, n), rate)
+
+    def scan_line(self, xs: Sequence[float], y: float, pixel_time: float):
+        """
+        Scan a line, dwelling `pixel_time` on each pixel; return after the line is finished
+        :param xs: X positions of pixels, unit: um
+        :param y: Y position of the line, unit: um
+        :param pixel_time: dwell time of each pixel, unit: s
+        """
+        xs = np.asarray(xs, dtype=float)
+        xs = np.append(xs, xs[-1])  # the edge of the extra sample closes the last pixel
+        self._write(xs, np.full(len(xs), y), 1 / pixel_time)
+
+    def close(self):
+        self.task.close()
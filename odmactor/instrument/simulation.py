@@ -0,0 +1,671 @@
+"""
+Simulated instruments, for development, benchmarking and analysis without hardware
+---
+This module mirrors the subset of the `TimeTagger` API used by Odmactor (`createTimeTagger`, `Counter`,
+`CountBetweenMarkers`, ...), so that it can be used as a drop-in backend module of schedulers.
+Photon counts are sampled from a simple NV-center fluorescence model.
+"""
+
+import threading
+import time
+import numpy as np
+from ctypes import POINTER, c_uint32
+from typing import List, Tuple, Callable, Optional
+from odmactor.instrument.asg import ASG, check_count_data
+from odmactor.utils import constants as C
+from odmactor.utils.imaging import GAMMA_NV
+from odmactor.utils.sequence import expand_sequence, sequence_length, sequence_levels
+
+
+class NVModel:
+    """
+    Fluorescence model of NV center(s): Lorentzian ODMR dips upon a constant count rate
+    """
+
+    def __init__(self, count_rate: float = 1e6, resonances: List[float] = None, linewidth: float = 8e6,
+                 contrast: float = 0.2, rabi_freq: float = 5e6, saturation: float = 30.0, rabi_decay: float = 2e-6,
+                 pol_time: float = 250e-9, seed: int = None):
+        """
+        :param count_rate: count rate without MW, unit: counts/s
+        :param resonances: resonance frequencies, unit: Hz
+        :param linewidth: FWHM of resonances, unit: Hz
+        :param contrast: maximal relative fluorescence decrease at resonance
+        :param rabi_freq: Rabi frequency at MW power of 0 dBm, unit: Hz
+        :param saturation: MW power at which the amplifier compresses by 3 dB, so that Rabi frequency deviates from
+                            the square root of power, unit: mW
+        :param rabi_decay: decay time of Rabi oscillation, unit: s
+        :param pol_time: spin polarization time under full laser intensity, unit: s
+        :param seed: seed of random number generator
+        """
+        self.count_rate = count_rate
+        self.resonances = [2.87 * C.giga] if resonances is None else list(resonances)
+        self.linewidth = linewidth
+        self.contrast = contrast
+        self.rabi_ref = rabi_freq
+        self.saturation = saturation
+        self.rabi_decay = rabi_decay
+        self.pol_time = pol_time
+        self.rng = np.random.default_rng(seed)
+
+    def rate(self, freq: float = None, mw_on: bool = False) -> float:
+        """
+        Fluorescence count rate
+        :param freq: MW frequency, unit: Hz
+        :param mw_on: whether MW is applied
+        :return: count rate, unit: counts/s
+        """
+        if not mw_on or freq is None:
+            return self.count_rate
+        hw = self.linewidth / 2
+        dip = sum(hw ** 2 / ((freq - f0) ** 2 + hw ** 2) for f0 in self.resonances)
+        return self.count_rate * (1 - self.contrast * min(dip, 1))
+
+    def rabi_freq(self, power: float) -> float:
+        """
+        Rabi frequency on resonance
+        :param power: MW power, unit: dBm
+        :return: unit: Hz
+        """
+        mw = 10 ** (power / 10)
+        return self.rabi_ref * np.sqrt(mw / (1 + mw / self.saturation))
+
+    def pulsed_rate(self, freq: float, power: float, t_mw: float) -> float:
+        """
+        Fluorescence count rate of readout after a MW pulse, following Rabi oscillation of the nearest resonance
+        :param freq: MW frequency, unit: Hz
+        :param power: MW power, unit: dBm
+        :param t_mw: total MW pulse time before readout, unit: s
+        :return: count rate, unit: counts/s
+        """
+        rabi = self.rabi_freq(power)
+        detuning = min(abs(freq - f0) for f0 in self.resonances)
+        rabi_eff = np.sqrt(rabi ** 2 + detuning ** 2)
+        population = rabi ** 2 / rabi_eff ** 2 * (1 - np.exp(-t_mw / self.rabi_decay) *
+                                                  np.cos(2 * np.pi * rabi_eff * t_mw)) / 2
+        return self.count_rate * (1 - self.contrast * population)
+
+    def sample(self, mean: float, n: int) -> np.ndarray:
+        """
+        Sample photon counts of Poisson statistics
+        """
+        return self.rng.poisson(mean, n)
+
+
+class SimulatedASG(ASG):
+    """
+    Simulated ASG, keeping downloaded sequences in memory
+    Its built-in counter reports counts sampled at the rate of `photon_source` (a simulated Time Tagger) from a
+    background thread, through the registered count callback, as the hardware does
+    """
+
+    def __new__(cls, *args, **kwargs):
+        # do not share the singleton instance of ASG8005
+        return object.__new__(cls)
+
+    def __init__(self):
+        self.asg_data = [[0, 0] for _ in range(8)]
+        self.running = False
+        self.n_downloads = 0
+        self.photon_source: Optional['SimulatedTimeTagger'] = None
+        self._count_data = []
+        self._count_enabled = False
+        self._count_callback = None
+        self._count_thread: Optional[threading.Thread] = None
+        self._periods_left: Optional[int] = None  # periods to run after `start(count)`, None if free running
+
+    def connect(self):
+        return 1
+
+    def download_ASG_pulse_pointers(self, c_asg_data, c_length):
+        # read back through the pointers, as the device library does
+        self.asg_data = [np.ctypeslib.as_array(c_asg_data[i], shape=(c_length[i],)).tolist() for i in range(8)]
+        return 1
+
+    def start(self, count: int = None):
+        self.running = True
+        self._periods_left = count
+        self._start_counting()
+        return 1
+
+    def stop(self):
+        self.running = False
+        return 1
+
+    def close(self):
+        self.running = False
+        return 1
+
+    def get_monitor_status(self):
+        return 0
+
+    def set_callback_count(self, func):
+        self._count_callback = func
+        return 1
+
+    def ASG_counter_download(self, count_data, length):
+        check_count_data(count_data[:length])
+        self._count_data = list(count_data[:length])
+        return 1
+
+    def ASG_countConfig(self, isCountEnable, asgConfig=0xff):
+        self._count_enabled = bool(isCountEnable)
+        self._start_counting()
+        return 1
+
+    def ASG_isCountContinu(self, isContinu):
+        return 1
+
+    def ASG_set_counter_repeat(self, repeat):
+        return 1
+
+    def ASG_countTimeStep(self, timeStep):
+        return 1
+
+    def _start_counting(self):
+        if self.running and self._count_enabled and (self._count_thread is None or not self._count_thread.is_alive()):
+            self._count_thread = threading.Thread(target=self._emit_counts, daemon=True)
+            self._count_thread.start()
+
+    def _emit_counts(self, interval: float = 1e-3, max_values: int = 1 << 16):
+        """
+        Report counts of the periods elapsed since the previous report, every `interval` seconds
+        """
+        last, carry = time.perf_counter(), 0.0
+        while self.running and self._count_enabled:
+            time.sleep(interval)
+            now = time.perf_counter()
+            data, source = np.asarray(self._count_data, dtype=float), self.photon_source
+            if not data.size or self._count_callback is None or source is None:
+                last = now
+                continue
+            periods = (now - last) / (data.sum() * C.nano) + carry
+            n = min(int(periods), max(max_values // data.size, 1))
+            last, carry = now, periods - int(periods)
+            if self._periods_left is not None:
+                n = min(n, self._periods_left)
+                self._periods_left -= n
+            if n > 0:
+                counts = source.model.rng.poisson(np.tile(source.rate() * data * C.nano, n)).astype(np.uint32)
+                self._count_callback(0, counts.size, counts.ctypes.data_as(POINTER(c_uint32)))
+            if self._periods_left == 0:
+                self.running = False
+
+    def is_high(self, channel: int) -> bool:
+        """
+        Whether a channel outputs any high-level pulse (channel number from 1)
+        """
+        return self.running and sum(self.asg_data[channel - 1][::2]) > 0
+
+    def high_width(self, channel: int) -> float:
+        """
+        Mean width of high-level pulses of a channel (channel number from 1), unit: ns
+        """
+        highs = [t for t in self.asg_data[channel - 1][::2] if t > 0]
+        return sum(highs) / len(highs) if highs else 0.0
+
+
+class SimulatedMicrowave:
+    """
+    Simulated MW instrument, with an optional latency of each remote command
+    """
+
+    def __init__(self, latency: float = 0.0):
+        """
+        :param latency: time consumption of each remote command, unit: s
+        """
+        self.latency = latency
+        self.freq = C.giga
+        self.power = 0.0
+        self.output = False
+
+    def _write(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def set_frequency(self, freq):
+        self._write()
+        self.freq = freq
+
+    def set_power(self, power):
+        self._write()
+        self.power = power
+
+    def run_given_time(self, duration):
+        self.start()
+        time.sleep(duration)
+        self.stop()
+
+    def connect(self, force_close: bool = False) -> bool:
+        return True
+
+    def start(self):
+        self._write()
+        self.output = True
+
+    def stop(self):
+        self._write()
+        self.output = False
+
+    def close(self):
+        self.output = False
+
+
+class SimulatedTimeTagger:
+    """
+    Simulated Time Tagger, counting photons emitted under the current MW and ASG states
+    """
+
+    def __init__(self, model: NVModel = None, mw: SimulatedMicrowave = None, asg: SimulatedASG = None,
+                 channel_of: Callable[[str], int] = None, laser_delay: float = 350e-9, laser_rise: float = 60e-9,
+                 mw_delay: float = 40e-9):
+        """
+        :param model: fluorescence model
+        :param mw: MW instrument whose frequency and output state are used
+        :param asg: ASG whose laser, MW and tagger channels are used
+        :param channel_of: mapping from channel name ('laser', 'mw', 'tagger') to ASG channel number
+        :param laser_delay: delay of detected fluorescence after laser channel edges (AOM and APD), unit: s
+        :param laser_rise: time constant of laser intensity switching (AOM), unit: s
+        :param mw_delay: delay of MW after MW channel edges (switch), unit: s
+        """
+        self.model = NVModel() if model is None else model
+        self.mw = mw
+        self.asg = asg
+        self.channel_of = channel_of if channel_of is not None else {'laser': 1, 'mw': 2, 'tagger': 5}.get
+        self.scanner: Optional[SimulatedScanner] = None  # count rates are modulated by scanned positions if set
+        self.stage: Optional[SimulatedStage] = None  # count rates are modulated by the focus if set
+        self.laser_delay = laser_delay
+        self.laser_rise = laser_rise
+        self.mw_delay = mw_delay
+        self._profile = (None, None)  # cached (key, rate profile of a period)
+        if asg is not None:
+            asg.photon_source = self
+
+    def getSerial(self) -> str:
+        return 'SIMULATED'
+
+    def sync(self):
+        pass
+
+    def rate(self):
+        """
+        Current count rate, unit: counts/s
+        With a scanner, an array of rates of the pixels of the latest scanned line
+        """
+        mw_on = self.mw is not None and self.mw.output
+        if mw_on and self.asg is not None:
+            mw_on = self.asg.is_high(self.channel_of('mw'))
+        mw_seq = self.asg.asg_data[self.channel_of('mw') - 1] if self.asg is not None else []
+        if mw_on and sum(mw_seq[1::2]) > 0:
+            # pulsed MW: readout after MW pulses of the period
+            rate = self.model.pulsed_rate(self.mw.freq, self.mw.power, sum(mw_seq[::2]) * C.nano)
+        else:
+            rate = self.model.rate(self.mw.freq if self.mw is not None else None, mw_on)
+        if self.scanner is not None:
+            rate = rate * self.scanner.brightness()
+        if self.stage is not None:
+            rate = rate * self.stage.brightness()
+        return rate
+
+    def arrival_profile(self) -> np.ndarray:
+        """
+        Fluorescence count rate within an ASG period, in 1-ns steps from the period start (unit: counts/s)
+        Laser intensity follows the delayed laser channel with a first-order rise; spin population of ms = ±1 is
+        pumped to ms = 0 by laser, flipped coherently by MW pulses in the dark and mixed incoherently by MW under laser
+        """
+        seqs = self.asg.asg_data
+        laser_seq = expand_sequence(seqs[self.channel_of('laser') - 1])
+        mw_seq = expand_sequence(seqs[self.channel_of('mw') - 1])
+        key = (str(laser_seq), str(mw_seq), self.mw.freq, self.mw.power, self.mw.output)
+        if self._profile[0] == key:
+            return self._profile[1]
+        n = int(round(max(sequence_length(laser_seq), sequence_length(mw_seq))))
+        ts = np.arange(n) + 0.5
+
+        def levels(seq, delay):
+            if not sequence_length(seq):
+                return np.zeros(n, dtype=int)
+            return sequence_levels(seq, (ts - delay / C.nano) % n)
+
+        laser_on = levels(laser_seq, self.laser_delay)
+        mw_on = levels(mw_seq, self.mw_delay) * self.mw.output
+        model = self.model
+        rabi = model.rabi_freq(self.mw.power)
+        detuning = min(abs(self.mw.freq - f0) for f0 in model.resonances)
+        rabi_eff = np.sqrt(rabi ** 2 + detuning ** 2)
+        decay = np.exp(-C.nano / self.laser_rise) if self.laser_rise > 0 else 0.0
+        pump = C.nano / model.pol_time
+        intensity, population, t_mw = 0.0, 0.0, 0
+        rates = np.empty(n)
+        for _ in range(3):  # until periodic steady state
+            for i in range(n):
+                intensity = laser_on[i] + (intensity - laser_on[i]) * decay
+                if mw_on[i] and intensity < 0.05:
+                    t_mw += 1
+                else:
+                    if t_mw:  # end of a coherent MW pulse
+                        flip = rabi ** 2 / rabi_eff ** 2 * np.sin(np.pi * rabi_eff * t_mw * C.nano) ** 2
+                        population += (1 - 2 * population) * flip
+                        t_mw = 0
+                    if mw_on[i]:
+                        population += (1 - 2 * population) * min(np.pi * rabi * C.nano, 0.5)
+                population -= intensity * pump * population
+                rates[i] = model.count_rate * intensity * (1 - model.contrast * population)
+        self._profile = (key, rates)
+        return rates
+
+    def readout_window(self) -> float:
+        """
+        Readout window of pulse readout, i.e., width of tagger channel pulses, unit: s
+        """
+        if self.asg is None:
+            return 0.0
+        return self.asg.high_width(self.channel_of('tagger')) * C.nano
+
+
+class _Measurement:
+    """
+    Common methods of simulated measurements, in the manner of `TimeTagger.IteratorBase`
+    """
+
+    def __init__(self, tagger: SimulatedTimeTagger, n_values: int):
+        self.tagger = tagger
+        self.n_values = n_values
+        self.running = False
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def clear(self):
+        pass
+
+    def ready(self) -> bool:
+        return True
+
+    def window(self) -> float:
+        raise NotImplementedError
+
+    def getData(self) -> np.ndarray:
+        return self.tagger.model.sample(self.tagger.rate() * self.window(), self.n_values)
+
+
+class Counter(_Measurement):
+    """
+    Simulated `TimeTagger.Counter`
+    """
+
+    def __init__(self, tagger: SimulatedTimeTagger, channels: List[int], binwidth: int = 1000000000,
+                 n_values: int = 1):
+        super(Counter, self).__init__(tagger, n_values)
+        self.channels = channels
+        self.binwidth = binwidth  # unit: ps
+
+    def window(self) -> float:
+        return self.binwidth * C.pico
+
+    def getData(self) -> np.ndarray:
+        return np.stack([super(Counter, self).getData() for _ in self.channels])
+
+
+class Countrate(_Measurement):
+    """
+    Simulated `TimeTagger.Countrate`, i.e., average count rates since started or cleared
+    """
+
+    def __init__(self, tagger: SimulatedTimeTagger, channels: List[int]):
+        super(Countrate, self).__init__(tagger, 1)
+        self.channels = channels
+        self._since = time.perf_counter()
+
+    def start(self):
+        super(Countrate, self).start()
+        self.clear()
+
+    def clear(self):
+        self._since = time.perf_counter()
+
+    def getData(self) -> np.ndarray:
+        duration = max(time.perf_counter() - self._since, 1e-6)
+        return np.array([self.tagger.model.sample(self.tagger.rate() * duration, 1)[0] / duration
+                         for _ in self.channels])
+
+
+class CountBetweenMarkers(_Measurement):
+    """
+    Simulated `TimeTagger.CountBetweenMarkers`
+    """
+
+    def __init__(self, tagger: SimulatedTimeTagger, click_channel: int, begin_channel: int,
+                 end_channel: int = 0, n_values: int = 1000):
+        super(CountBetweenMarkers, self).__init__(tagger, n_values)
+        self.click_channel = click_channel
+        self.begin_channel = begin_channel
+        self.end_channel = end_channel
+
+    def window(self) -> float:
+        scanner = self.tagger.scanner
+        if scanner is not None and self.begin_channel == scanner.clock_channel:
+            return scanner.pixel_time  # pixels gated by the sample clock of the scanner
+        return self.tagger.readout_window()
+
+
+class Histogram(_Measurement):
+    """
+    Simulated `TimeTagger.Histogram` of photon arrival times after start events, i.e., ASG period starts
+    """
+
+    def __init__(self, tagger: SimulatedTimeTagger, click_channel: int, start_channel: int, binwidth: int = 1000,
+                 n_bins: int = 1000):
+        super(Histogram, self).__init__(tagger, n_bins)
+        self.click_channel = click_channel
+        self.start_channel = start_channel
+        self.binwidth = binwidth  # unit: ps
+        self._t_start = time.perf_counter()
+
+    def start(self):
+        super(Histogram, self).start()
+        self._t_start = time.perf_counter()
+
+    def clear(self):
+        self._t_start = time.perf_counter()
+
+    def getIndex(self) -> np.ndarray:
+        return np.arange(self.n_values, dtype=np.int64) * self.binwidth
+
+    def getData(self) -> np.ndarray:
+        profile = self.tagger.arrival_profile()
+        n_periods = (time.perf_counter() - self._t_start) / (len(profile) * C.nano)
+        width = self.binwidth * C.pico / C.nano  # unit: ns
+        edges = np.minimum(np.arange(self.n_values + 1) * width, len(profile))
+        cum = np.concatenate([[0], np.cumsum(profile)])
+        counts = np.diff(np.interp(edges, np.arange(len(cum)), cum)) * C.nano * n_periods
+        return self.tagger.model.rng.poisson(np.clip(counts, 0, None))
+
+
+class SimulatedScanner:
+    """
+    Simulated galvo scanner over a sample of point-like emitters, in the manner of `GalvoScanner`
+    """
+
+    def __init__(self, emitters: np.ndarray = None, psf_width: float = 0.3, background: float = 0.05,
+                 seed: int = None, clock_channel: int = 3, **hardware):
+        """
+        :param emitters: positions of emitters, of shape (n, 2), unit: um; 20 random ones within ±5 um by default
+        :param psf_width: standard deviation of the Gaussian point spread function, unit: um
+        :param background: relative brightness of background fluorescence
+        :param seed: seed of random number generator
+        :param clock_channel: Time Tagger input receiving the sample clock
+        :param hardware: arguments of `GalvoScanner`, e.g., `x_channel`, `volts_per_um`; ignored
+        """
+        if emitters is None:
+            emitters = np.random.default_rng(seed).uniform(-5, 5, (20, 2))
+        self.emitters = np.asarray(emitters, dtype=float).reshape(-1, 2)
+        self.psf_width = psf_width
+        self.background = background
+        self.position = (0.0, 0.0)  # unit: um
+        self.clock_channel = clock_channel
+        self.pixel_time = 0.0  # unit: s
+        self.line = None  # positions (xs, ys) of the latest scanned line
+
+    def brightness(self, xs=None, ys=None):
+        """
+        Relative brightness at positions; those of the latest scanned line, or the current position by default
+        """
+        if xs is None:
+            xs, ys = self.line if self.line is not None else self.position
+        xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+        r2 = (xs[..., None] - self.emitters[:, 0]) ** 2 + (ys[..., None] - self.emitters[:, 1]) ** 2
+        return self.background + np.exp(-r2 / (2 * self.psf_width ** 2)).sum(axis=-1)
+
+    def move_to(self, x: float, y: float, rate: float = 1e4):
+        self.position = (float(x), float(y))
+        self.line = None
+
+    def scan_line(self, xs, y: float, pixel_time: float):
+        xs = np.asarray(xs, dtype=float)
+        self.line = (xs, np.full(len(xs), float(y)))
+        self.pixel_time = pixel_time
+        self.position = (float(xs[-1]), float(y))
+
+    def close(self):
+        pass
+
+
+class SimulatedStage:
+    """
+    Simulated 3-D piezo stage focusing on an emitter, in the manner of `PiezoStage`
+    The emitter drifts away from the focus at a constant velocity, and can be displaced suddenly by `displace()`
+    """
+
+    def __init__(self, emitter: Tuple[float, float, float] = (0.0, 0.0, 0.0),
+                 psf_width: Tuple[float, float, float] = (0.3, 0.3, 0.8), background: float = 0.02,
+                 drift: Tuple[float, float, float] = (0.0, 0.0, 0.0)):
+        """
+        :param emitter: initial position of the emitter, unit: um
+        :param psf_width: standard deviations of the Gaussian point spread function along X, Y and Z, unit: um
+        :param background: relative brightness of background fluorescence
+        :param drift: drift velocity of the emitter, unit: um/s
+        """
+        self.emitter = np.asarray(emitter, dtype=float)
+        self.psf_width = np.asarray(psf_width, dtype=float)
+        self.background = background
+        self.drift = np.asarray(drift, dtype=float)
+        self.position = tuple(float(v) for v in emitter)  # unit: um
+        self._since = time.perf_counter()
+
+    def emitter_position(self) -> np.ndarray:
+        return self.emitter + self.drift * (time.perf_counter() - self._since)
+
+    def displace(self, dx: float, dy: float, dz: float):
+        """
+        Displace the emitter suddenly, e.g., a mechanical shock
+        """
+        self.emitter = self.emitter + np.array([dx, dy, dz], dtype=float)
+
+    def brightness(self) -> float:
+        """
+        Relative brightness at the current position, 1 at the emitter
+        """
+        d = (np.asarray(self.position) - self.emitter_position()) / self.psf_width
+        return self.background + (1 - self.background) * float(np.exp(-0.5 * d @ d))
+
+    def move_to(self, x: float, y: float, z: float):
+        self.position = (float(x), float(y), float(z))
+
+    def close(self):
+        pass
+
+
+class SimulatedCamera:
+    """
+    Simulated widefield camera, imaging NV ensembles whose resonances are split by a nonuniform magnetic field
+    ---
+    Pixel (i, j) has resonances D ± gamma * B[i, j], where B is the field projection along the NV axis.
+    Frames are sampled from Poisson statistics under a Gaussian illumination profile.
+    """
+
+    def __init__(self, shape: Tuple[int, int] = (64, 64), b_map: np.ndarray = None, model: NVModel = None,
+                 exposure: float = 1e-3, mw: SimulatedMicrowave = None, asg: SimulatedASG = None,
+                 channel_of: Callable[[str], int] = None, seed: int = None):
+        """
+        :param shape: frame shape (H, W), unit: pixel
+        :param b_map: magnetic field projection of each pixel, of shape (H, W), unit: T;
+                        a linear gradient with a local dipole-like bump by default
+        :param model: fluorescence model; its count rate is the peak rate of a single pixel, unit: counts/s
+        :param exposure: exposure time of each frame, unit: s
+        :param mw: MW instrument whose frequency and output state are used
+        :param asg: ASG whose MW channel is used
+        :param channel_of: mapping from channel name ('mw') to ASG channel number
+        :param seed: seed of random number generator
+        """
+        self.shape = tuple(shape)
+        h, w = self.shape
+        y, x = np.mgrid[0:h, 0:w]
+        y, x = (y - (h - 1) / 2) / max(h, 1), (x - (w - 1) / 2) / max(w, 1)
+        if b_map is None:
+            b_map = 2e-3 + 1e-3 * x + 0.5e-3 * np.exp(-((x - 0.15) ** 2 + (y + 0.1) ** 2) / 0.01)
+        self.b_map = np.asarray(b_map, dtype=float)
+        if self.b_map.shape != self.shape:
+            raise ValueError('field map of shape {} for frames of shape {}'.format(self.b_map.shape, self.shape))
+        self.model = NVModel(count_rate=1e7, contrast=0.03) if model is None else model
+        self.profile = np.exp(-(x ** 2 + y ** 2) / 0.5)
+        self.exposure = exposure
+        self.mw = mw
+        self.asg = asg
+        self.channel_of = channel_of if channel_of is not None else {'mw': 2}.get
+        self.rng = np.random.default_rng(seed)
+        self.running = False
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        self.running = False
+
+    def _mw_on(self) -> bool:
+        mw_on = self.mw is not None and self.mw.output
+        if mw_on and self.asg is not None:
+            mw_on = self.asg.is_high(self.channel_of('mw'))
+        return mw_on
+
+    def rate(self) -> np.ndarray:
+        """
+        Current count rate of each pixel, unit: counts/s
+        """
+        rate = self.model.count_rate * self.profile
+        if not self._mw_on():
+            return rate
+        hw = self.model.linewidth / 2
+        dip = np.zeros(self.shape)
+        for f0 in self.model.resonances:
+            for sign in (-1, 1):
+                dip += hw ** 2 / ((self.mw.freq - f0 - sign * GAMMA_NV * self.b_map) ** 2 + hw ** 2)
+        return rate * (1 - self.model.contrast * np.minimum(dip, 1))
+
+    def grab(self, n_frames: int = 1) -> np.ndarray:
+        """
+        Acquire a stack of frames
+        :param n_frames: number of frames
+        :return: 3-D array of shape (n_frames, H, W), dtype uint16
+        """
+        mean = self.rate() * self.exposure
+        frames = self.rng.poisson(mean, (n_frames,) + self.shape)
+        return np.minimum(frames, np.iinfo(np.uint16).max).astype(np.uint16)
+
+
+def scanTimeTagger() -> List[str]:
+    return ['SIMULATED']
+
+
+def createTimeTagger(serial: str = '', model: NVModel = None, mw: SimulatedMicrowave = None,
+                     asg: SimulatedASG = None, channel_of: Callable[[str], int] = None) -> SimulatedTimeTagger:
+    return SimulatedTimeTagger(model, mw, asg, channel_of)
+
+
+def freeTimeTagger(tagger: Optional[SimulatedTimeTagger]):
+    pass
@@ -0,0 +1,48 @@
+import time
+import numpy as np
+import nidaqmx
+from typing import Sequence, Tuple
+
+
+class PiezoStage(object):
+    """
+    3-D piezo stage (or objective scanner) driven by three analog outputs of a NI DAQ device
+    ---
+    Positions are written on demand, each followed by a settling time of the piezo
+    """
+
+    def __init__(self, channels: Sequence[str] = ('Dev1/ao0', 'Dev1/ao1', 'Dev1/ao2'),
+                 volts_per_um: Tuple[float, float, float] = (0.1, 0.1, 0.1), max_voltage: float = 10.0,
+                 settle: float = 5e-3):
+        """
+        :param channels: analog output channels of X, Y and Z axes
+        :param volts_per_um: voltage per micrometer of each axis
+        :param max_voltage: maximal absolute output voltage
+        :param settle: settling time after each move, unit: s
+        """
+        if len(channels) != 3:
+            raise ValueError('three channels (X, Y, Z) are required')
+        self.volts_per_um = np.asarray(volts_per_um, dtype=float)
+        self.max_voltage = max_voltage
+        self.settle = settle
+        self.position = (0.0, 0.0, 0.0)  # unit: um
+        self.task = nidaqmx.Task()
+        for channel in channels:
+            self.task.ao_channels.add_ao_voltage_chan(channel, min_val=-max_voltage, max_val=max_voltage)
+
+    def move_to(self, x: float, y: float, z: float):
+        """
+        Move to a position and wait for settling
+        :param x: X position, unit: um
+        :param y: Y position, unit: um
+        :param z: Z position, unit: um
+        """
+        volts = np.array([x, y, z], dtype=float) * self.volts_per_um
+        if np.abs(volts).max() > self.max_voltage:
+            raise ValueError('position exceeds the voltage range ±{} V'.format(self.max_voltage))
+        self.task.write(volts.tolist(), auto_start=True)
+        time.sleep(self.settle)
+        self.position = (float(x), float(y), float(z))
+
+    def close(self):
+        self.task.close()
@@ -7,7 +7,12 @@ Arxiv link: https://arxiv.org/pdf/1910.00061.pdf
 
 from odmactor.scheduler.base import Scheduler, TimeDomainScheduler, FrequencyDomainScheduler
 from odmactor.scheduler.frequency import CWScheduler, PulseScheduler
+from odmactor.scheduler.confocal import ConfocalScheduler
 from odmactor.scheduler.time import RamseyScheduler, RabiScheduler, RelaxationScheduler
 from odmactor.scheduler.time import HahnEchoScheduler, HighDecouplingScheduler
 from odmactor.scheduler.spin import SpinControlScheduler
-from odmactor.scheduler.customization import CustomizedScheduler
+from odmactor.scheduler.customization import CustomizedScheduler, ProgrammableScheduler
+from odmactor.scheduler.sweep import Sweep
+from odmactor.scheduler.tracking import ResonanceTracker
+from odmactor.scheduler.noise import NoiseSpectroscopy
+from odmactor.scheduler.watchdog import CountRateWatchdog
@@ -5,21 +5,39 @@ Scheduler abstract base class
 import abc
 import copy
 import datetime
+import importlib
+import inspect
 import time
 import json
 import os
 import pickle
-import nidaqmx
+import sqlite3
 import numpy as np
-import scipy.constants as C
-import TimeTagger as tt
-from tqdm import tqdm
-from odmactor.instrument import ASG, Microwave, Laser, LockInAmplifier
+from odmactor.utils import constants as C
+from odmactor.instrument.asg import ASG, ASGCounter, count_windows
+from odmactor.instrument.laser import Laser
 from odmactor.utils import dBm_to_mW, mW_to_dBm
-from odmactor.utils.sequence import expand_to_same_length
-from typing import List, Any, Optional
+from odmactor.utils.sequence import flip_sequence, sequence_length, shift_sequence
+from typing import List, Any, Callable, Optional, Tuple, TYPE_CHECKING
 from odmactor.utils.sequence import sequences_to_string, sequences_to_figure
-from matplotlib.figure import Figure
+from odmactor.utils.profiling import ScanProfiler, profiled
+from odmactor.utils.estimation import TimeEstimator, ScanProgress, format_duration
+from odmactor.utils.program import PulseProgram, CompiledProgram, Pulse, Wait, Seq, Par
+from odmactor.utils.imaging import ImageStack
+from odmactor.utils.catalog import ResultCatalog, save_arrays
+from odmactor.utils.codec import encode_counts, is_counts
+from odmactor.utils.sensitivity import SensitivityEstimator, fit_sinusoid
+from odmactor.utils.calibration import PiPulseCalibration, analyze_delays, compact_paddings, suggest_timings
+from odmactor.utils.telemetry import ScanTelemetry
+
+SNAPSHOT_VERSION = 1  # version of configuration snapshots, see `Scheduler.snapshot()`
+
+if TYPE_CHECKING:
+    # vendor backends and plotting are imported lazily, only when a scheduler actually uses them
+    import nidaqmx
+    import TimeTagger as tt
+    from matplotlib.figure import Figure
+    from odmactor.instrument.microwave import Microwave
 
 
 class Scheduler(abc.ABC):
@@ -27,6 +45,15 @@ class Scheduler(abc.ABC):
     ODMR manipulation scheduler base class
     """
 
+    # attributes defining a run, saved into configuration snapshots; extended by subclasses
+    _snapshot_attrs = ('name', 'channel', 'tagger_input', 'laser_ttl', 'mw_ttl', 'apd_ttl', 'tagger_ttl', 'with_ref',
+                       'epoch_omit', 'order', 'sync_freq', 'mw_on_off', 'asg_control_mw_on_off', 'output_lockin',
+                       'two_pulse_readout', 'time_pad_ratio', 'raw_format', 'channel_delays', '_cache', 'pi_pulse',
+                       '_mw_conf', '_asg_conf', '_freqs', '_times', '_asg_sequences', '_reader', 'counter_backend',
+                       'armed')
+    # model of sensitivity estimation fitted to scanned spectra, see `SensitivityEstimator`; None for not fitting
+    _sensitivity_model: Optional[str] = None
+
     def __init__(self, *args, **kwargs):
         self._cache: Any = None
         self._data = []
@@ -34,6 +61,7 @@ class Scheduler(abc.ABC):
         self.name = 'Base Scheduler'
         # pi pulse, for spin manipulation
         self.pi_pulse = {'freq': None, 'power': None, 'time': None}  # unit: Hz, dBm, s
+        self.pi_calibration = PiPulseCalibration()  # measured pi-pulse times versus MW frequency and power
         self._result = []
         self._result_detail = {}
         self._freqs = []  # unit: Hz
@@ -54,15 +82,25 @@ class Scheduler(abc.ABC):
         self.mw_exec_modes_optional = {'scan-center-span', 'scan-start-stop'}
         self.channel = {'laser': 1, 'mw': 2, 'apd': 3, 'tagger': 5, 'mw_sync': 4, 'lockin_sync': 8}
         self.tagger_input = {'apd': 1, 'asg': 2}
-        self.counter: tt.IteratorBase = None
-        self.daqtask: nidaqmx.Task = None
+        self.channel_delays = {}  # delays of instruments controlled by channels, compensated in ASG data, unit: ns
+        self.counter: Optional['tt.IteratorBase'] = None  # or an `ASGCounter`, see `counter_backend`
+        self._reader = None  # reader type of the Time Tagger counter, see `configure_tagger_counting()`
+        self.daqtask: Optional['nidaqmx.Task'] = None
 
         # properties or method for debugging
         self.sync_delay = 0.0
         self.mw_dwell = 0.0
         self.asg_dwell = 0.0
         self.time_pad = 0.0
+        self.time_pad_ratio = 0.01  # ratio of time padding to dwell time
         self.time_total = 0.0  # total time for scanning frequencies (estimated)
+        self.estimator = TimeEstimator()  # calibrated by per-point overheads measured in previous runs
+        self.catalog = ResultCatalog() if kwargs.get('catalog', False) else None  # index of saved results
+        # format of raw counts ('origin_data'): 'json' in the result file, or 'odmc' (compact codec) in separate files
+        self.raw_format = kwargs.get('raw_format', 'json')
+        self._raw_files = {}
+        self._point_dwells = np.zeros(0)  # estimated dwell & padding time of each detection point, unit: s
+        self._point_costs = np.zeros(0)  # estimated total time of each detection point, unit: s
         self.output_dir = '../output/'
         if not os.path.exists(self.output_dir):
             os.mkdir(self.output_dir)
@@ -92,28 +130,81 @@ class Scheduler(abc.ABC):
         # use lockin or tagger
         self.use_lockin = kwargs.get('use_lockin', False)
 
+        # counter of `configure_tagger_counting()`: 'tagger' (Time Tagger) or 'asg' (ASG built-in counter)
+        self.counter_backend = kwargs.get('counter_backend', 'tagger')
+
+        # armed start: arm the counter, then fire ASG for exactly N periods of each acquisition, see `armed_start`
+        self.armed = kwargs.get('armed', False)
+
+        # per-point timing instrumentation of scanning processes
+        self.profiler = ScanProfiler() if kwargs.get('profile', False) else None
+
+        # photon-shot-noise sensitivity estimated while scanning, per unit wall-clock time
+        self.sensitivity = SensitivityEstimator() if kwargs.get('sensitivity', False) else None
+
+        # metrics of acquisitions, scan progress and instrument states, exported by a `MetricsExporter`
+        # `telemetry` is True (labelled by the class name) or the label of this scheduler
+        telemetry = kwargs.get('telemetry', False)
+        self.telemetry = ScanTelemetry(telemetry if isinstance(telemetry, str) else self.__class__.__name__) \
+            if telemetry else None
+
+        # shared-memory buffer for live view of scanning data, see `enable_live_view()`
+        self.live_buffer = None
+        self._latest = self._latest_ref = np.zeros(1)  # latest acquired data
+
+        # count-rate watchdog pausing scans to refocus or aborting them, see `enable_watchdog()`
+        self.watchdog = None
+
         # output lock-in sync sequence from ASG or not
         self.output_lockin = kwargs.get('output_lockin', False)
 
-        # initialize instruments
+        # use simulated instruments instead of hardware
+        self.simulation = kwargs.get('simulation', False)
+
+        # initialize instruments, or reuse those of another scheduler, e.g., owned by an instrument server
+        instruments = kwargs.get('instruments')
+        if instruments is not None:
+            self.laser, self.asg, self.mw = instruments['laser'], instruments['asg'], instruments['mw']
+            self.tagger, self.lockin = instruments.get('tagger'), instruments.get('lockin')
+            return
         self.laser = Laser()
+        if self.simulation:
+            from odmactor.instrument import simulation
+            self.asg = simulation.SimulatedASG()
+            self.mw = simulation.SimulatedMicrowave()
+            self.tagger = simulation.createTimeTagger(mw=self.mw, asg=self.asg, channel_of=lambda name: self.channel[name])
+            return
+
         self.asg = ASG()
         try:
+            from odmactor.instrument.microwave import Microwave
             self.mw = Microwave()
         except:
             self.mw = None
 
         if self.use_lockin:
             try:
+                from odmactor.instrument.lockin import LockInAmplifier
                 self.lockin = LockInAmplifier()
             except:
                 self.lockin = None
         else:
-            if tt.scanTimeTagger():
+            try:
+                import TimeTagger as tt
+            except ImportError:
+                tt = None
+            if tt is not None and tt.scanTimeTagger():
                 self.tagger = tt.createTimeTagger()
             else:
                 self.tagger = None
 
+    @property
+    def instruments(self) -> dict:
+        """
+        Instruments of this scheduler, which can be shared by other schedulers via the `instruments` keyword argument
+        """
+        return {name: getattr(self, name, None) for name in ('laser', 'asg', 'mw', 'tagger', 'lockin')}
+
     def reconnect(self):
         self.laser.connect()
         self.asg.connect()
@@ -122,12 +213,23 @@ class Scheduler(abc.ABC):
             self.mw.connect()
 
         if self.use_lockin:
+            from odmactor.instrument.lockin import LockInAmplifier
             self.lockin = LockInAmplifier()
         else:
             try:
                 self.tagger.getSerial()
             except:
-                self.tagger = tt.createTimeTagger()
+                self.tagger = self._tagger_backend().createTimeTagger()
+
+    def _tagger_backend(self):
+        """
+        Module providing Time Tagger measurements, i.e., `TimeTagger` or its simulated counterpart
+        """
+        if self.simulation:
+            from odmactor.instrument import simulation as tt
+        else:
+            import TimeTagger as tt
+        return tt
 
     def set_asg_sequences_ttl(self, laser_ttl=None, mw_ttl=None, apd_ttl=None, tagger_ttl=None):
         """
@@ -147,6 +249,7 @@ class Scheduler(abc.ABC):
         if tagger_ttl is not None:
             self.tagger_ttl = tagger_ttl
 
+    @profiled('download_asg_sequences')
     def download_asg_sequences(self, laser_seq: List[int] = None, mw_seq: List[int] = None,
                                tagger_seq: List[int] = None, sync_seq: List[int] = None):
         """
@@ -160,8 +263,8 @@ class Scheduler(abc.ABC):
         sequences = [laser_seq, mw_seq, tagger_seq]
         if not any(sequences):
             raise ValueError('laser_seq, mw_seq and tagger_seq cannot be all None')
-        sequences = [seq for seq in sequences if seq is not None and sum(seq) > 0]  # non-None sequences
-        lengths = np.unique(list(map(sum, sequences)))
+        sequences = [seq for seq in sequences if seq is not None and sequence_length(seq) > 0]  # non-None sequences
+        lengths = np.unique(list(map(sequence_length, sequences)))
         if len(lengths) != 1:
             raise ValueError('laser/mw/tagger sequences should have the same length')
 
@@ -179,11 +282,26 @@ class Scheduler(abc.ABC):
 
         # connect & download pulse data
         if self.output_lockin:
-            self.asg.load_data(self._asg_sequences)
+            self._load_asg(self._asg_sequences)
         else:
             seqs = copy.deepcopy(self._asg_sequences)
             seqs[self.channel['mw_sync'] - 1], seqs[self.channel['lockin_sync'] - 1] = [0, 0], [0, 0]
-            self.asg.load_data(seqs)
+            self._load_asg(seqs)
+
+    def _load_asg(self, sequences: List[List[float]]):
+        """
+        Load sequences into ASG, with channels shifted earlier by delays of their instruments (`channel_delays`)
+        """
+        if any(self.channel_delays.values()):
+            sequences = list(sequences)
+            for name, delay in self.channel_delays.items():
+                idx = self.channel[name] - 1
+                if delay and sequence_length(sequences[idx]) > 0:
+                    sequences[idx] = shift_sequence(sequences[idx], delay)
+        self.asg.load_data(sequences)
+        if isinstance(self.counter, ASGCounter) and self.counter.running:
+            # counting windows follow the tagger channel, e.g., scanning time intervals
+            self._configure_asg_counter(self._reader)
 
     def configure_lockin_counting(self, channel: str = 'Dev1/ai0', freq: int = None):
         """
@@ -191,6 +309,7 @@ class Scheduler(abc.ABC):
         :param channel: output channel from NIDAQ to PC
         :param freq: synchronization frequency between MW and Lockin
         """
+        import nidaqmx
         self.daqtask = nidaqmx.Task()
         self.daqtask.ai_channels.add_ai_voltage_chan(channel)
         if freq is not None:
@@ -203,7 +322,25 @@ class Scheduler(abc.ABC):
         :param apd_channel: APD channel number
         :param asg_channel: ASG channel number
         :param reader: counter of specific readout type
-        """
+        'cbm' counts within pulses of the tagger channel, i.e., from rising edges to falling edges, both with the
+        free-running and the armed start (where N fired periods thus give exactly N values)
+        With `counter_backend` 'asg', the ASG built-in counter (APD connected to ASG) is configured instead, counting
+        within pulses of the tagger channel ('cbm') or over whole periods ('counter')
+        """
+        if self.counter_backend == 'asg':
+            if reader not in ('counter', 'cbm'):
+                raise ValueError('unsupported reader (counter) type')
+            if not isinstance(self.counter, ASGCounter):
+                self.counter = ASGCounter(self.asg)
+            self._configure_asg_counter(reader)
+            print('ASG counter: {} windows per period of {} ns'.format(len(self.counter.count_data) // 2,
+                                                                       sum(self.counter.count_data)))
+            self._reader = reader
+            return
+
+        if self.tagger is None:
+            raise ConnectionError("Time Tagger not found, pass counter_backend='asg' to count with the ASG counter")
+        tt = self._tagger_backend()
 
         if apd_channel is not None:
             self.tagger_input['apd'] = apd_channel
@@ -219,27 +356,38 @@ class Scheduler(abc.ABC):
             t_ps = int(self._asg_conf['t'] / C.pico)
             self.counter = tt.Counter(self.tagger, channels=[self.tagger_input['apd']], binwidth=t_ps, n_values=N)
         elif reader == 'cbm':
-            # pulse readout
-            if self.two_pulse_readout:
-                self.counter = tt.CountBetweenMarkers(self.tagger, self.tagger_input['apd'],
-                                                      begin_channel=self.tagger_input['asg'],
-                                                      end_channel=-self.tagger_input['asg'],
-                                                      n_values=N * 2)
-            else:
-                self.counter = tt.CountBetweenMarkers(self.tagger, self.tagger_input['apd'],
-                                                      begin_channel=self.tagger_input['asg'],
-                                                      end_channel=self.tagger_input['asg'], n_values=N)
+            # pulse readout, windows closed by falling edges
+            n_values = N * 2 if self.two_pulse_readout else N
+            self.counter = tt.CountBetweenMarkers(self.tagger, self.tagger_input['apd'],
+                                                  begin_channel=self.tagger_input['asg'],
+                                                  end_channel=-self.tagger_input['asg'], n_values=n_values)
         else:
             raise ValueError('unsupported reader (counter) type')
+        self._reader = reader
+
+    def _configure_asg_counter(self, reader: str):
+        """
+        Download count data of the ASG built-in counter from the current sequences
+        :param reader: 'cbm' for windows of tagger channel pulses, 'counter' for whole periods
+        """
+        N = self._asg_conf['N']
+        if reader == 'counter':
+            self.counter.configure(count_windows([self._asg_conf['t'] / C.nano, 0]), N)
+        else:
+            gate = self._asg_sequences[self.channel['tagger'] - 1]
+            gate = flip_sequence(gate) if self.tagger_ttl == 0 else gate
+            self.counter.configure(count_windows(gate), N * 2 if self.two_pulse_readout else N)
 
+    @profiled('start_device')
     def _start_device(self):
         """
         Start device: MW, ASG; Execute Measurement instance.
         """
-        # 1. run ASG firstly
+        # 1. run ASG firstly, unless it is fired by each acquisition (armed start)
         self._data.clear()
         self._data_ref.clear()
-        self.asg.start()
+        if not self.armed_start:
+            self.asg.start()
 
         # 2. restart self.counter or self.lockin if necessary
         if self.counter is not None:
@@ -249,21 +397,75 @@ class Scheduler(abc.ABC):
         self.mw.start()
         # print('MW on/off status:', self.mw.instrument_status_checking)
 
-    def _acquire_data_to_cache(self, cache):
+    @profiled('acquire_data')
+    def _acquire_data_to_cache(self, cache) -> np.ndarray:
         """
         Acquire data and save it to a buffer region
         :param cache: data cache, e.g., a list instance
+        :return: acquired data
         """
+        profiler = self.profiler
         if self.use_lockin:
             time.sleep(self.time_pad)
+            t = time.perf_counter_ns()
+            time.sleep(self.asg_dwell)
+            t_read = time.perf_counter_ns()
+            data = np.asarray(self.daqtask.read(number_of_samples_per_channel=1000))
+        elif self.armed_start:
+            # stop ASG, arm the counter, then fire exactly N periods
+            self.asg.stop()
+            if isinstance(self.counter, ASGCounter):
+                self.counter.arm()
+            else:
+                self.counter.clear()
+            t = time.perf_counter_ns()
+            self.asg.start(self._asg_conf['N'])
             time.sleep(self.asg_dwell)
-            cache.append(self.daqtask.read(number_of_samples_per_channel=1000))
+            self._wait_counter_ready()
+            t_read = time.perf_counter_ns()
+            data = self.counter.getData().ravel()
         else:
             # from tagger
             self.counter.clear()
             time.sleep(self.time_pad)
+            t = time.perf_counter_ns()
             time.sleep(self.asg_dwell)
-            cache.append(self.counter.getData().ravel().tolist())
+            if isinstance(self.counter, ASGCounter):
+                self._wait_counter_ready()  # counts arrive through callbacks, with a latency
+            t_read = time.perf_counter_ns()
+            data = self.counter.getData().ravel()
+        cache.append(data.tolist())
+        if self.telemetry is not None:
+            self.telemetry.acquired(np.nan if self.use_lockin else float(data.sum()), self.asg_dwell,
+                                    ref=cache is self._data_ref)
+        if profiler is not None:
+            profiler.record('dwell', t, t_read)
+            profiler.record('read', t_read, time.perf_counter_ns())
+        return data
+
+    @property
+    def armed_start(self) -> bool:
+        """
+        Whether acquisitions use the armed start: the counter is armed before ASG runs exactly N periods, so that all
+        acquired periods are valid, without time padding and omitted epochs
+        Only gated counters are armed, i.e., Time Tagger `CountBetweenMarkers` ('cbm') or the ASG built-in counter
+        """
+        return self.armed and not self.use_lockin and self.counter is not None and (
+            self.counter_backend == 'asg' or self._reader == 'cbm')
+
+    def _wait_counter_ready(self, timeout: float = None):
+        """
+        Wait until the counter has got all values of the fired periods, e.g., after ASG start latency
+        :param timeout: unit: s, 10% of the dwell time (at least 50 ms) by default
+        """
+        if not hasattr(self.counter, 'ready'):
+            return
+        deadline = time.perf_counter() + (max(0.1 * self.asg_dwell, 0.05) if timeout is None else timeout)
+        while not self.counter.ready():
+            if time.perf_counter() > deadline:
+                print('Counter not ready after fired periods, data may be incomplete')
+                return
+            time.sleep(1e-4)
 
     def _get_data(self):
         """
@@ -274,7 +476,7 @@ class Scheduler(abc.ABC):
         2. with Lock-in Amplifier
             read M values after the last ASG operation period, M is not necessarily equal to N
         """
-        self._acquire_data_to_cache(self._data)
+        self._latest = self._acquire_data_to_cache(self._data)
 
     def _get_data_ref(self):
         """
@@ -285,7 +487,140 @@ class Scheduler(abc.ABC):
         2. with Lock-in Amplifier
             read M values after the last ASG operation period, M is not necessarily equal to N
         """
-        self._acquire_data_to_cache(self._data_ref)
+        self._latest_ref = self._acquire_data_to_cache(self._data_ref)
+
+    def enable_live_view(self, capacity: int = 65536):
+        """
+        Create a shared-memory ring buffer, into which each scanning detection point will be written
+        Consumers (e.g. `odmactor.utils.live.start_live_plot`, `start_dashboard`) attach to it by its name
+        :param capacity: number of detection points kept in the buffer
+        :return: a `SharedRingBuffer` instance
+        """
+        from odmactor.utils.live import SharedRingBuffer
+        if self.live_buffer is not None:
+            self.live_buffer.close()
+            self.live_buffer.release()
+        self.live_buffer = SharedRingBuffer(capacity)
+        return self.live_buffer
+
+    def enable_watchdog(self, stage=None, **kwargs):
+        """
+        Watch count rates of scans, recovering from drops (by refocusing), saturation or zero counts, and aborting
+        scans if recovery fails
+        :param stage: 3-D stage providing `position` and `move_to(x, y, z)`, e.g., `PiezoStage`; a simulated one for
+                    simulated schedulers by default; without a stage, drops are only re-measured
+        :param kwargs: other keyword arguments of `CountRateWatchdog`, e.g., `source`, `drop_ratio`
+        :return: a `CountRateWatchdog` instance
+        """
+        from odmactor.scheduler.watchdog import CountRateWatchdog
+        if self.use_lockin or getattr(self, 'camera', None) is not None:
+            raise ValueError('count-rate watchdog requires photon counting by Time Tagger or ASG')
+        if stage is None and self.simulation:
+            from odmactor.instrument import simulation
+            stage = simulation.SimulatedStage()
+        if self.simulation and stage is not None:
+            self.tagger.stage = stage
+        self.watchdog = CountRateWatchdog(self, stage, **kwargs)
+        return self.watchdog
+
+    def _latest_rate(self) -> float:
+        """
+        Count rate of the latest detection point over its dwell time, of reference data if acquired, unit: counts/s
+        """
+        if self.with_ref:
+            counts = self._latest_ref.sum()
+        elif self.two_pulse_readout:
+            counts = max(self._latest[1::2].sum(), self._latest[::2].sum())
+        else:
+            counts = self._latest.sum()
+        return float(counts / self.asg_dwell) if self.asg_dwell > 0 else np.nan
+
+    def _discard_point(self):
+        """
+        Discard data of the latest detection point
+        """
+        self._data.pop()
+        if self.with_ref:
+            self._data_ref.pop()
+
+    def _guard_point(self, measure: Callable[[], None]) -> bool:
+        """
+        Ask the watchdog after a detection point; on an alarm, pause to recover count rates and measure the point
+        again, or abort the scan if recovery fails, discarding the abnormal point
+        :param measure: function acquiring data of the point
+        :return: whether to continue scanning
+        """
+        watchdog = self.watchdog
+        reason = watchdog.check(self._latest_rate())
+        n_recoveries = 0
+        while reason is not None:
+            if n_recoveries >= watchdog.max_recoveries or not watchdog.recover(reason):
+                self._discard_point()
+                watchdog.aborted = reason
+                print('Scanning aborted by the watchdog: count-rate {}'.format(reason))
+                return False
+            n_recoveries += 1
+            self._discard_point()
+            measure()
+            reason = watchdog.check(self._latest_rate())
+        return True
+
+    def _latest_counts(self) -> Tuple[float, float]:
+        """
+        Mean counts (signal, reference) of the latest detection point; reference is NaN if not acquired
+        """
+        if self.with_ref:
+            return float(self._latest.mean()), float(self._latest_ref.mean())
+        elif self.two_pulse_readout:
+            counts, counts_ref = sorted([self._latest[1::2].mean(), self._latest[::2].mean()])
+            return float(counts), float(counts_ref)
+        else:
+            return float(self._latest.mean()), np.nan
+
+    def _publish_point(self, index: int, x: float):
+        """
+        Write the latest detection point into the live-view buffer: [index, x, counts, counts_ref, timestamp]
+        """
+        counts, counts_ref = self._latest_counts()
+        self.live_buffer.write((index, x, counts, counts_ref, time.time()))
+
+    def _begin_telemetry(self, n_points: int):
+        """
+        Start telemetry of a scan, watching states of the current instruments
+        """
+        self.telemetry.watch_instruments(self.mw, self.asg)
+        self.telemetry.begin_scan(n_points)
+
+    def _update_telemetry(self, index: int, progress: ScanProgress, dwell: float = None):
+        """
+        Update telemetry after the detection point of `index`, and sample the ASG status if due
+        :param dwell: dwell and padding time of the point (unit: s), estimated by `estimate_time()` by default
+        """
+        if dwell is None:
+            dwell = self._point_dwells[index] if index < len(self._point_dwells) else 0.0
+        eta = progress.eta(self.telemetry.elapsed(), index + 1)
+        self.telemetry.end_point(index + 1, dwell, eta)
+        self.telemetry.sample_status(self.asg)
+
+    def _reset_sensitivity(self, xs: List[float], progress: ScanProgress):
+        """
+        Start sensitivity estimation of a scan, reported live in the progress line
+        """
+        n_acq = 2 if self.with_ref else 1
+        self.sensitivity.reset(xs, self._sensitivity_model, self._scan_dwells() * n_acq)
+        progress.status = self.sensitivity.status
+
+    def _update_sensitivity(self, index: int):
+        """
+        Add the latest detection point into sensitivity estimation
+        """
+        if self.with_ref:
+            data, data_ref = self._latest, self._latest_ref
+        elif self.two_pulse_readout:
+            data, data_ref = sorted([self._latest[1::2], self._latest[::2]], key=np.mean)
+        else:
+            data, data_ref = self._latest, None
+        self.sensitivity.update(index, data, data_ref)
 
     def run(self):
         """
@@ -297,6 +632,23 @@ class Scheduler(abc.ABC):
         self._acquire_data()
         self.stop()
 
+    def start(self):
+        """
+        Start hardware (ASG, MW, Tagger) scheduling, so that single points can be acquired by `acquire_point()`
+        """
+        self._start_device()
+
+    def acquire_point(self, freq: float = None) -> np.ndarray:
+        """
+        Acquire data of a single detection point with started hardware, without recording it into scanning data
+        e.g., for closed-loop protocols like resonance tracking
+        :param freq: MW frequency set before acquisition, unit: Hz; the current frequency if None
+        :return: 1-D array of counts of N periods, or samples of Lock-in + DAQ
+        """
+        if freq is not None:
+            self.mw.set_frequency(freq)
+        return self._acquire_data_to_cache([])
+
     def stop(self):
         """
         Stop hardware (ASG, MW, Tagger) scheduling
@@ -318,11 +670,18 @@ class Scheduler(abc.ABC):
         if self.mw is not None:
             self.mw.close()
         if not self.use_lockin and self.tagger is not None:
-            tt.freeTimeTagger(self.tagger)
+            self._tagger_backend().freeTimeTagger(self.tagger)
         if self.use_lockin and self.daqtask is not None:
             self.daqtask.close()
+        if self.live_buffer is not None:
+            self.live_buffer.close()
+            self.live_buffer.release()
+            self.live_buffer = None
+        if self.telemetry is not None:
+            self.telemetry.close()
         print('Closed: All instrument resources has been released')
 
+    @profiled('configure_mw_paras')
     def configure_mw_paras(self, power: float = None, freq: float = None, regulate_pi: bool = False, *args, **kwargs):
         """
         Configure parameters of MW instrument
@@ -344,6 +703,8 @@ class Scheduler(abc.ABC):
     def _regulate_pi_pulse(self, power: float = None, time: float = None):
         """
         Regulate time duration of MW pi pulse according to designed MW power, or vice verse
+        The pi-pulse time is interpolated from the calibration table `pi_calibration` if it has valid entries near
+        the setting, otherwise rescaled from the current pi pulse assuming Rabi frequency proportional to √power
         :param power: MW power, unit: dBm
         :param time: time duration of MW pi pulse, unit: s
         :return:
@@ -355,38 +716,259 @@ class Scheduler(abc.ABC):
             time_ori = self.pi_pulse['time']
             if power is not None:
                 # calculate new "time"
-                time = np.sqrt(10 ** ((power_ori - power) / 10)) * time_ori
+                freq = self.pi_pulse['freq'] or self._mw_conf['freq']
+                time = self.pi_calibration.lookup(freq, power)
+                if time is None:
+                    time = np.sqrt(10 ** ((power_ori - power) / 10)) * time_ori
             elif time is not None:
                 # calculate new "power"
                 power = mW_to_dBm((time_ori / time) ** 2 * dBm_to_mW(power_ori))
             self.pi_pulse['power'] = power
             self.pi_pulse['time'] = time
 
+    def calibrate_delays(self, t_laser: float = 3000, t_dark: float = 4000, duration: float = 2.0,
+                         apply: bool = True, margin: float = 20) -> dict:
+        """
+        Measure switching delays of laser (AOM) and MW, laser rise time, spin polarization time and optimal readout
+        window from photon-arrival histograms, see `odmactor.utils.calibration.analyze_delays`
+        The pi pulse (`pi_pulse`) should have been set.
+        :param t_laser: laser pulse time of histograms, unit: ns
+        :param t_dark: dark time of histograms, unit: ns
+        :param duration: acquisition time of each histogram, unit: s
+        :param apply: whether to compensate delays in ASG data (`channel_delays`) and compact sequence paddings;
+                    laser initialization and readout times are never changed
+        :param margin: safety margin of compacted paddings, unit: ns
+        :return: dict of delays and compacted paddings, and suggested 't_init' and 't_read_sig' under 'suggested',
+                unit: ns
+        """
+        if not self.pi_pulse['time']:
+            raise ValueError('pi pulse is not set. Please set "pi_pulse" or call "calibrate_pi_pulse" firstly.')
+        tt = self._tagger_backend()
+        pad, t_pi = 1000, round(self.pi_pulse['time'] / C.nano)
+        period = pad + t_laser + t_dark
+        t_before_pi = pad + t_laser + t_dark // 3
+        laser_pulse = [0, pad, t_laser, t_dark]
+        sequences = [
+            (laser_pulse, [0, 0]),  # laser pulse
+            (laser_pulse, [0, t_before_pi, t_pi, period - t_before_pi - t_pi]),  # laser pulse after a pi pulse
+            ([period, 0], [0, pad, t_laser, t_dark]),  # MW pulse under continuous laser
+        ]
+        marker = [10, period - 10]  # period starts as start events of histograms
+
+        saved_seqs, saved_delays = copy.deepcopy(self._asg_sequences), self.channel_delays
+        self.channel_delays = {}
+        histogram = tt.Histogram(self.tagger, self.tagger_input['apd'], self.tagger_input['asg'],
+                                 binwidth=1000, n_bins=int(period))
+        self.mw.set_frequency(self.pi_pulse['freq'] or self._mw_conf['freq'])
+        self.mw.set_power(self.pi_pulse['power'] if self.pi_pulse['power'] is not None else self._mw_conf['power'])
+        self.mw.start()
+        histograms = []
+        for laser_seq, mw_seq in sequences:
+            self.download_asg_sequences(
+                laser_seq=flip_sequence(laser_seq) if self.laser_ttl == 0 else laser_seq,
+                mw_seq=flip_sequence(mw_seq) if self.mw_ttl == 0 else mw_seq,
+                tagger_seq=flip_sequence(marker) if self.tagger_ttl == 0 else marker)
+            self.asg.start()
+            histogram.start()
+            histogram.clear()
+            time.sleep(duration)
+            histograms.append(histogram.getData().ravel())
+            histogram.stop()
+            self.asg.stop()
+        self.mw.stop()
+        times = histogram.getIndex() * C.pico / C.nano
+
+        result = analyze_delays(times, *histograms, laser_edges=(pad, pad + t_laser), mw_edge=pad)
+        result.update(compact_paddings(result, margin))
+        result['suggested'] = suggest_timings(result, margin)
+        print('Laser delay: {:.1f} ns, rise: {:.1f} ns, MW delay: {:.1f} ns, polarization: {:.1f} ns, '
+              'readout window: {:.1f} ns'.format(result['laser_delay'], result['laser_rise'], result['mw_delay'],
+                                                 result['polarization_time'], result['readout_window']))
+        print('Suggested t_init: {t_init:.0f} ns, t_read_sig: {t_read_sig:.0f} ns (not applied)'.format(
+            **result['suggested']))
+
+        self._asg_sequences = saved_seqs
+        self.channel_delays = saved_delays
+        if apply:
+            self.channel_delays = {'laser': result['laser_delay'], 'mw': result['mw_delay']}
+            self._compact_paddings(result)
+        elif any(sequence_length(seq) > 0 for seq in saved_seqs):
+            self._load_asg(saved_seqs if self.output_lockin else self.sequences_no_sync)
+        return result
+
+    def _compact_paddings(self, paddings: dict):
+        """
+        Reconfigure ODMR sequences with compacted paddings (only those being parameters of `configure_odmr_seq`)
+        """
+        params = inspect.signature(self.configure_odmr_seq).parameters
+        if not isinstance(self._cache, dict) or not all(k in self._cache for k in params if k in paddings):
+            if any(sequence_length(seq) > 0 for seq in self._asg_sequences):
+                self._load_asg(self._asg_sequences if self.output_lockin else self.sequences_no_sync)
+            print('Delays are compensated, while paddings of {} are not compacted'.format(self.name))
+            return
+        kwargs = {k: v for k, v in self._cache.items() if k in params}
+        kwargs.update({k: v for k, v in paddings.items() if k in params})
+        print('Compacted sequence paddings:', {k: v for k, v in kwargs.items() if k in paddings})
+        self.configure_odmr_seq(**kwargs)
+        if self._times or self._freqs:
+            self.estimate_time()
+
+    def calibrate_pi_pulse(self, freq: float = None, power: float = None, force: bool = False,
+                           t_max: float = None, n_times: int = 40, N: int = 10000, t_init: float = 3000,
+                           t_read_sig: float = 400) -> float:
+        """
+        Set the pi pulse at a MW setting from the calibration table, refreshed by a short Rabi scan only when the
+        table has no valid entry near the setting (or `force` is True)
+        :param freq: MW frequency, unit: Hz; frequency of current pi pulse (or MW) by default
+        :param power: MW power, unit: dBm; power of current pi pulse (or MW) by default
+        :param force: whether to measure even if the table is valid
+        :param t_max: maximal MW pulse time of the Rabi scan, unit: ns; 2.5 expected pi times by default
+        :param n_times: number of MW pulse times of the Rabi scan
+        :param N: number of ASG operation periods for each detection point of the Rabi scan
+        :param t_init: time for laser initialization of the Rabi scan, unit: ns
+        :param t_read_sig: time span for fluorescence signal readout of the Rabi scan, unit: ns
+        :return: pi-pulse time, unit: s
+        """
+        freq = freq or self.pi_pulse['freq'] or self._mw_conf['freq']
+        power = power if power is not None else (
+            self.pi_pulse['power'] if self.pi_pulse['power'] is not None else self._mw_conf['power'])
+        t_pi = None if force else self.pi_calibration.lookup(freq, power)
+        if t_pi is None:
+            t_pi = self._measure_pi_pulse(freq, power, t_max, n_times, N, t_init, t_read_sig)
+            self.pi_calibration.add(freq, power, t_pi)
+        self.pi_pulse = {'freq': freq, 'power': power, 'time': t_pi}
+        print('Pi pulse: {:.3f} GHz, {:.2f} dBm, {:.2f} ns'.format(freq / C.giga, power, t_pi / C.nano))
+        return t_pi
+
+    def _measure_pi_pulse(self, freq: float, power: float, t_max: float, n_times: int, N: int, t_init: float,
+                          t_read_sig: float) -> float:
+        """
+        Measure the pi-pulse time by a Rabi scan with the instruments of this scheduler
+        :return: pi-pulse time, unit: s
+        """
+        from odmactor.scheduler.time import RabiScheduler
+        if t_max is None:
+            # expected pi time rescaled from the current pi pulse, or 200 ns
+            expected = 200.0
+            if self.pi_pulse['time'] and self.pi_pulse['power'] is not None:
+                expected = np.sqrt(10 ** ((self.pi_pulse['power'] - power) / 10)) * self.pi_pulse['time'] / C.nano
+            t_max = 2.5 * expected
+        rabi = RabiScheduler(instruments=self.instruments, simulation=self.simulation, use_lockin=self.use_lockin,
+                             with_ref=True, catalog=False, counter_backend=self.counter_backend)
+        rabi.channel, rabi.tagger_input, rabi.output_dir = self.channel, self.tagger_input, self.output_dir
+        rabi.configure_mw_paras(power=power, freq=freq)
+        rabi.configure_odmr_seq(t_init=t_init, t_read_sig=t_read_sig, N=N)
+        rabi.set_delay_times(10, max(t_max, 100), length=n_times)
+        rabi.gene_detect_seq(rabi.times[0])
+        if not self.use_lockin:
+            rabi.configure_tagger_counting(reader='cbm')
+        rabi.run_scanning()
+        times, counts, counts_ref = rabi.result
+        p = fit_sinusoid(times, np.array(counts) / np.array(counts_ref))
+        return 0.5 / abs(p['freq']) * C.nano
+
     def reset_asg_sequence(self):
         """
         Reset all channels of ASG as ZERO signals
         """
         self._asg_sequences = [[0, 0] for _ in range(8)]
 
+    @property
+    def modes(self) -> dict:
+        """
+        Constructor modes of this scheduler, i.e., keyword arguments creating its instruments and instrumentation
+        """
+        return {
+            'simulation': self.simulation,
+            'use_lockin': self.use_lockin,
+            'catalog': self.catalog is not None,
+            'profile': self.profiler is not None,
+            'sensitivity': self.sensitivity is not None,
+            'telemetry': self.telemetry.labels['scheduler'] if self.telemetry is not None else False,
+        }
+
+    def snapshot(self) -> dict:
+        """
+        Snapshot of everything defining a run, without instrument handles: channel map, TTL polarities, sequence
+        parameters, pi pulse, MW settings, sweep axes and downloaded (or compiled) sequences, along with constructor
+        modes (see `modes`)
+        :return: versioned dict, restorable by `restore()`
+        """
+        snapshot = {
+            'version': SNAPSHOT_VERSION,
+            'class': '{}.{}'.format(self.__class__.__module__, self.__class__.__name__),
+            'modes': self.modes,
+            'attrs': {attr: copy.deepcopy(getattr(self, attr)) for attr in self._snapshot_attrs},
+        }
+        if isinstance(self, TimeDomainScheduler):
+            snapshot['compiled'] = self._compiled
+        return snapshot
+
+    def restore(self, snapshot: dict):
+        """
+        Restore a snapshot into this scheduler: sequences are downloaded into ASG as they were, without
+        regenerating or recompiling them, and the Time Tagger counter is configured as it was
+        :param snapshot: dict returned by `snapshot()`
+        """
+        if snapshot.get('version', 0) > SNAPSHOT_VERSION:
+            raise ValueError('unsupported snapshot version {}'.format(snapshot.get('version')))
+        for attr, value in snapshot['attrs'].items():
+            setattr(self, attr, copy.deepcopy(value))
+        if 'compiled' in snapshot:
+            self._compiled = snapshot['compiled']
+        if self._asg_conf['t']:
+            self._conf_time_paras(self._asg_conf['t'] / C.nano, self._asg_conf['N'])
+            self._load_asg(self._asg_sequences if self.output_lockin else self.sequences_no_sync)
+        if self.mw is not None:
+            self.mw.set_power(self._mw_conf['power'])
+            self.mw.set_frequency(self._mw_conf['freq'])
+        has_counter = self.tagger is not None or self.counter_backend == 'asg'
+        if self._reader is not None and not self.use_lockin and has_counter:
+            self.configure_tagger_counting(reader=self._reader)
+        if self._freqs or self._times:
+            try:
+                self.estimate_time()
+            except ValueError:  # sequence parameters not configured
+                pass
+
     def save_configuration(self, fname: str = None):
         """
-        Save configuration parameters into a disk file
+        Save configuration snapshot (see `snapshot()`) into a disk file
         :param fname: file name for saving
         """
         if fname is None:
             fname = '{} {}.pkl'.format(self.name, datetime.date.today())
-        with open(fname, 'wr') as f:
-            pickle.dump(self, f)
+        with open(fname, 'wb') as f:
+            pickle.dump(self.snapshot(), f)
         print('Scheduler configuration has been save to {}'.format(fname))
 
+    @staticmethod
+    def load_configuration(fname: str, **kwargs) -> 'Scheduler':
+        """
+        Create a scheduler from a configuration file saved by `save_configuration()`
+        :param fname: configuration file
+        :param kwargs: keyword arguments of constructing the scheduler, e.g., `instruments` of a running scheduler
+                        or `simulation=True`; modes of the saved scheduler (`modes`, e.g., `catalog`) by default
+        :return: scheduler of the saved class, with the saved configuration restored
+        """
+        with open(fname, 'rb') as f:
+            snapshot = pickle.load(f)
+        module, cls_name = snapshot['class'].rsplit('.', 1)
+        cls = getattr(importlib.import_module(module), cls_name)
+        for mode, value in snapshot['modes'].items():
+            kwargs.setdefault(mode, value)
+        scheduler = cls(**kwargs)
+        scheduler.restore(snapshot)
+        return scheduler
+
     def laser_on_seq(self):
         """
         Set sequence to control Laser keeping on during the whole period
         """
         idx_laser_channel = self.channel['laser'] - 1
-        t = sum(self._asg_sequences[idx_laser_channel])
+        t = sequence_length(self._asg_sequences[idx_laser_channel])
         self._asg_sequences[idx_laser_channel] = [t, 0]
-        self.asg.load_data(self._asg_sequences)
+        self._load_asg(self._asg_sequences)
         self.asg.start()
 
     def laser_off_seq(self):
@@ -395,7 +977,7 @@ class Scheduler(abc.ABC):
         """
         idx_laser_channel = self.channel['laser'] - 1
         self._asg_sequences[idx_laser_channel] = [0, 0]
-        self.asg.load_data(self._asg_sequences)
+        self._load_asg(self._asg_sequences)
         self.asg.start()
 
     def mw_on_seq(self):
@@ -403,13 +985,13 @@ class Scheduler(abc.ABC):
         Set sequence to control MW keeping on during the whole period
         """
         idx_mw_channel = self.channel['mw'] - 1
-        t = sum(self._asg_sequences[idx_mw_channel])
+        t = sequence_length(self._asg_sequences[idx_mw_channel])
         if self.mw_ttl == 0:
             mw_seq = [0, t]
         else:
             mw_seq = [t, 0]
         self._asg_sequences[idx_mw_channel] = mw_seq
-        self.asg.load_data(self._asg_sequences)
+        self._load_asg(self._asg_sequences)
         self.asg.start()
 
     def mw_off_seq(self):
@@ -419,9 +1001,10 @@ class Scheduler(abc.ABC):
         mw_seq = [0, 0]
         idx_mw_channel = self.channel['mw'] - 1
         self._asg_sequences[idx_mw_channel] = mw_seq
-        self.asg.load_data(self._asg_sequences)
+        self._load_asg(self._asg_sequences)
         self.asg.start()
 
+    @profiled('mw_control_seq')
     def mw_control_seq(self, mw_seq: List[int] = None) -> Optional[List[int]]:
         """
         Get or set current MW control sequence
@@ -433,7 +1016,7 @@ class Scheduler(abc.ABC):
             return self._asg_sequences[idx_mw_channel]
         else:
             self._asg_sequences[idx_mw_channel] = mw_seq
-            self.asg.load_data(self._asg_sequences)
+            self._load_asg(self._asg_sequences)
             self.asg.start()
 
     def _conf_time_paras(self, t, N=100000):
@@ -445,8 +1028,53 @@ class Scheduler(abc.ABC):
         self._asg_conf['t'] = t * C.nano  # unit: s
         self._asg_conf['N'] = N
         self.asg_dwell = self._asg_conf['N'] * self._asg_conf['t']  # duration without padding
-        self.time_pad = 0.01 * self.asg_dwell
+        self.time_pad = self.time_pad_ratio * self.asg_dwell
 
+    @property
+    def _estimator_key(self) -> str:
+        """
+        Identifier of scheduler type and acquisition mode, with respect to which overheads are measured
+        """
+        modes = [('ref', self.with_ref), ('lockin', self.use_lockin), ('simulation', self.simulation),
+                 ('armed', self.armed_start)]
+        return '-'.join([self.__class__.__name__] + [mode for mode, on in modes if on])
+
+    def _scan_dwells(self) -> np.ndarray:
+        """
+        ASG dwell time of each scanning detection point, unit: s
+        """
+        raise NotImplementedError
+
+    def estimate_time(self) -> float:
+        """
+        Estimate total running time of scanning, considering dwell time of each detection point, time padding,
+        reference acquisition, omitted epochs and per-point overhead measured in previous runs
+        :return: estimated time, unit: s
+        """
+        dwells = self._scan_dwells()
+        n_acq = 2 if self.with_ref else 1
+        armed = self.armed_start
+        self._point_dwells = TimeEstimator.point_costs(dwells, n_acq, 0.0 if armed else self.time_pad_ratio, 0.0)
+        self._point_costs = self._point_dwells + self.estimator.overhead(self._estimator_key)
+        omitted = self.epoch_omit * self._point_dwells[0] if len(dwells) and not armed else 0.0
+        self.time_total = float(self._point_costs.sum() + omitted)
+        return self.time_total
+
+    def _update_overhead(self, progress: ScanProgress):
+        """
+        Update measured per-point overhead from durations of scanned detection points
+        """
+        n = min(progress.n_done, len(self._point_dwells))
+        if n > 0:
+            overheads = np.clip(progress.durations[:n] - self._point_dwells[:n], 0, None)
+            self.estimator.update(self._estimator_key, float(overheads.mean()), n)
+
+    def _print_estimated_time(self):
+        overhead = self.estimator.overhead(self._estimator_key)
+        print('Estimated total running time: {} ({:.2f} s, including {:.1f} ms overhead per point)'.format(
+            format_duration(self.time_total), self.time_total, overhead / C.milli))
+
+    @profiled('cal_counts_result')
     def _cal_counts_result(self):
         """
         Calculate counts of data, with respect to frequencies (scanning mode)
@@ -460,6 +1088,7 @@ class Scheduler(abc.ABC):
             xs = self._times
         else:
             raise TypeError('unsupported function in this scheduler type')
+        xs = xs[:len(self._data)]  # fewer points if scanning was aborted
 
         if self.with_ref:
             counts = [np.mean(ls) for ls in self._data]
@@ -492,6 +1121,21 @@ class Scheduler(abc.ABC):
                     'counts': counts,
                     'origin_data': self._data
                 }
+        if self.profiler is not None:
+            self._result_detail['profile'] = self.profiler.summary()
+        if self.watchdog is not None:
+            self._result_detail['watchdog'] = self.watchdog.summary()
+        if self.sensitivity is not None and self.sensitivity.n_done == len(xs):
+            self.sensitivity.finish()
+            summary = self.sensitivity.summary()
+            self._result_detail['sensitivity'] = summary
+            if summary['model'] is None:
+                print('Acquisition efficiency {:.1%} (no sensitivity model of {})'.format(summary['efficiency'],
+                                                                                       self.name))
+            else:
+                print('Sensitivity: {:.3g} nT/√Hz per wall-clock time ({:.3g} nT/√Hz per dwell time, '
+                      'efficiency {:.1%})'.format(summary['b_sensitivity'] / C.nano,
+                                                  summary['b_sensitivity_dwell'] / C.nano, summary['efficiency']))
 
     def _gene_data_result_fname(self, fmt: str = None) -> str:
         """
@@ -512,6 +1156,7 @@ class Scheduler(abc.ABC):
             fname = fname + '.{}'.format(fmt)
         return fname
 
+    @profiled('save_result')
     def save_result(self, fname: str = None):
         """
         Save self.result_detail property
@@ -521,10 +1166,48 @@ class Scheduler(abc.ABC):
             raise ValueError('empty result cannot be saved')
         if fname is None:
             fname = self._gene_data_result_fname('json')
+        detail, self._raw_files = self._result_detail, {}
+        if self.raw_format == 'odmc':
+            # raw counts are encoded compactly into separate files, referred to by the JSON file
+            detail = dict(detail)
+            for key in ('origin_data', 'origin_data_ref'):
+                if key in detail and is_counts(detail[key]):
+                    path = '{}-{}.odmc'.format(os.path.splitext(fname)[0], key)
+                    encode_counts(path, detail[key])
+                    detail[key] = {'codec': 'odmc', 'file': path}
+                    self._raw_files[key] = path
         with open(fname, 'w') as f:
-            json.dump(self._result_detail, f)
+            json.dump(detail, f)
         self.output_fname = fname
         print('Detailed data result has been saved into {}'.format(fname + '.json'))
+        if self.catalog is not None:
+            try:
+                self._catalog_result(fname)
+            except (OSError, sqlite3.Error) as e:
+                print('Result cannot be cataloged: {}'.format(e))
+
+    def _catalog_result(self, fname: str) -> int:
+        """
+        Save result arrays as ".npy" files next to the result file and record the run into the catalog;
+        raw counts are not copied but referred to in the result file or in their ".odmc" files
+        :return: id of the run in the catalog
+        """
+        fname = os.path.abspath(fname)
+        raw_keys = [k for k in self._result_detail if k.startswith('origin_data')]
+        arrays = {k: v for k, v in self._result_detail.items() if k != 'profile' and k not in raw_keys}
+        paths = save_arrays(os.path.splitext(fname)[0] + '-arrays', arrays)
+        for key in raw_keys:
+            paths[key] = os.path.abspath(self._raw_files[key]) if key in self._raw_files else '{}#{}'.format(fname, key)
+        image_stack = getattr(self, 'image_stack', None)
+        if image_stack is not None:
+            paths['signal_cube'] = image_stack.fname + '-signal.npy'
+            if image_stack.reference is not None:
+                paths['reference_cube'] = image_stack.fname + '-reference.npy'
+        axis = 'freqs' if isinstance(self, FrequencyDomainScheduler) else 'times'
+        params = dict(self._cache) if isinstance(self._cache, dict) else {}
+        params.update(self._asg_conf, order=self.order, two_pulse_readout=self.two_pulse_readout)
+        return self.catalog.record(self.name, fname, axis, self._result[0], self.with_ref, self._mw_conf,
+                                   self.pi_pulse, params, paths)
 
     def __str__(self):
         return self.name
@@ -592,7 +1275,7 @@ class Scheduler(abc.ABC):
         return self.mw
 
     @mw_instr.setter
-    def mw_instr(self, value: Microwave):
+    def mw_instr(self, value: 'Microwave'):
         self.mw = value
 
     @property
@@ -619,7 +1302,7 @@ class Scheduler(abc.ABC):
         return sequences_to_string(self._asg_sequences)
 
     @property
-    def sequences_figure(self) -> Figure:
+    def sequences_figure(self) -> 'Figure':
         """
         Ignore the lock-in frequency synchronization channel outputted to MW and Lock-in Amplifier
         """
@@ -633,9 +1316,16 @@ class FrequencyDomainScheduler(Scheduler):
     Frequency-domain ODMR detection abstract class
     """
 
+    _sensitivity_model = 'lorentzian'
+
     def __init__(self, *args, **kwargs):
         super(FrequencyDomainScheduler, self).__init__(*args, **kwargs)
         self.name = 'Base ODMR Scheduler'
+        # widefield imaging, see `configure_camera_counting()`
+        self.camera = None
+        self.camera_frames = 0
+        self.image_stack: Optional[ImageStack] = None
+        self._cur_index = 0
 
     def set_mw_freqs(self, start, end, step):
         """
@@ -648,18 +1338,59 @@ class FrequencyDomainScheduler(Scheduler):
         # unit: Hz
         # n_freqs = int((end - start) / step + 1)
         self._freqs = np.arange(start, end + step / 2, step).tolist()
-        n_freqs = len(self._freqs)
+        self.estimate_time()
+
+    def _scan_dwells(self) -> np.ndarray:
         if self.asg_dwell == 0:
             raise ValueError('"asg_dwell" is 0.0 currently. Please set ODMR sequences parameters firstly.')
-        else:
-            self.time_total = self.asg_dwell * n_freqs * 2 if self.with_ref else self.asg_dwell * n_freqs
+        return np.full(len(self._freqs), self.asg_dwell)
+
+    def configure_camera_counting(self, camera=None, frames: int = 10):
+        """
+        Configure widefield imaging with a camera instead of APD counting
+        Frames of each frequency point are accumulated into memory-mapped image cubes (`self.image_stack`) of shape
+        (n_freqs, H, W), while spatially averaged counts form the usual result
+        :param camera: camera instance providing `shape`, `start()`, `stop()` and `grab(n_frames)`;
+                        a simulated camera is created for simulated schedulers by default
+        :param frames: number of frames per frequency point (and per reference acquisition)
+        """
+        if camera is None:
+            if not self.simulation:
+                raise ValueError('a camera instance is necessary for widefield imaging')
+            from odmactor.instrument import simulation
+            camera = simulation.SimulatedCamera(mw=self.mw, asg=self.asg, channel_of=lambda name: self.channel[name])
+        self.camera = camera
+        self.camera_frames = frames
+        print('Camera counting: {} frames of shape {} per point'.format(frames, tuple(camera.shape)))
+
+    def _get_data(self):
+        if self.camera is None:
+            return super(FrequencyDomainScheduler, self)._get_data()
+        self._latest = self._acquire_image(ref=False)
+
+    def _get_data_ref(self):
+        if self.camera is None:
+            return super(FrequencyDomainScheduler, self)._get_data_ref()
+        self._latest_ref = self._acquire_image(ref=True)
+
+    @profiled('acquire_data')
+    def _acquire_image(self, ref: bool = False) -> np.ndarray:
+        """
+        Accumulate camera frames of the current frequency point into the image cube
+        :return: spatially averaged counts per frame, 1-D array of one value
+        """
+        time.sleep(self.time_pad)
+        image = self.image_stack.accumulate(self.camera, self._cur_index, self.camera_frames, ref=ref)
+        data = np.array([image.mean()])
+        (self._data_ref if ref else self._data).append(data.tolist())
+        return data
 
     def _scan_freqs_and_get_data(self):
         """
         Scanning frequencies & getting data of Counter
         """
-        # omit several scanning points
-        for _ in range(self.epoch_omit):
+        # omit several scanning points, unnecessary with armed start
+        for _ in range(0 if self.armed_start else self.epoch_omit):
             self.mw.set_frequency(self._freqs[0])
             time.sleep(self.time_pad + self.asg_dwell)
             if self.with_ref:
@@ -669,34 +1400,82 @@ class FrequencyDomainScheduler(Scheduler):
         mw_on_seq = self._asg_sequences[self.channel['mw'] - 1]
         print(self.channel)
         print(self._asg_sequences)
-        for freq in tqdm(self._freqs):
+        profiler = self.profiler
+        if self.camera is not None:
+            self.image_stack = ImageStack.create(self._gene_data_result_fname(), self._freqs, self.camera.shape,
+                                                 self.with_ref)
+            self.camera.start()
+        progress = ScanProgress(self._freqs, self._point_costs)
+        if self.sensitivity is not None:
+            self._reset_sensitivity(self._freqs, progress)
+        if self.telemetry is not None:
+            self._begin_telemetry(len(self._freqs))
+        if self.watchdog is not None:
+            self.watchdog.start()
+        for i, freq in enumerate(progress):
+            if profiler is not None:
+                profiler.begin_point()
+            self._cur_index = i
             self._cur_freq = freq
-            self.mw.set_frequency(freq)
+            self._measure_freq_point(freq, mw_on_seq)
+            if self.watchdog is not None and not self._guard_point(lambda: self._measure_freq_point(freq, mw_on_seq)):
+                break
+
+            if self.live_buffer is not None:
+                self._publish_point(progress.n_done, freq)
+            if self.sensitivity is not None:
+                self._update_sensitivity(i)
+            if self.telemetry is not None:
+                self._update_telemetry(i, progress)
+            if profiler is not None:
+                profiler.end_point()
+
+        if self.camera is not None:
+            self.camera.stop()
+            self.image_stack.flush()
+            print('Image cubes have been saved into {}-*.npy'.format(self.image_stack.fname))
+        if self.telemetry is not None:
+            self.telemetry.end_scan()
+        if self.watchdog is not None:
+            self.watchdog.stop()
+        self._update_overhead(progress)
+        print('finished data acquisition')
 
-            # need to turn on MW itself again (optional)
-            if self.mw_on_off:
-                self.mw.start()
+    def _measure_freq_point(self, freq: float, mw_on_seq: List[float]):
+        """
+        Acquire data of a detection point at a MW frequency
+        :param freq: MW frequency, unit: Hz
+        :param mw_on_seq: MW channel sequence to recover after reference acquisition
+        """
+        profiler = self.profiler
+        if profiler is not None:
+            t = time.perf_counter_ns()
+        self.mw.set_frequency(freq)
+        if profiler is not None:
+            profiler.record('set_frequency', t, time.perf_counter_ns())
 
-            # 1. signal data acquisition
-            self._get_data()
+        # need to turn on MW itself again (optional)
+        if self.mw_on_off:
+            self.mw.start()
 
-            # 2. reference data acquisition (optional)
-            if self.with_ref:
-                # turn off MW via ASG (usually necessary)
-                if self.asg_control_mw_on_off:
-                    self.mw_control_seq([0, 0])
+        # 1. signal data acquisition
+        self._get_data()
 
-                # turn off MW itself (optional)
-                if self.mw_on_off:
-                    self.mw.stop()
+        # 2. reference data acquisition (optional)
+        if self.with_ref:
+            # turn off MW via ASG (usually necessary)
+            if self.asg_control_mw_on_off:
+                self.mw_control_seq([0, 0])
 
-                self._get_data_ref()
+            # turn off MW itself (optional)
+            if self.mw_on_off:
+                self.mw.stop()
 
-                # recover the sequences (usually necessary)
-                if self.asg_control_mw_on_off:
-                    self.mw_control_seq(mw_on_seq)
+            self._get_data_ref()
 
-        print('finished data acquisition')
+            # recover the sequences (usually necessary)
+            if self.asg_control_mw_on_off:
+                self.mw_control_seq(mw_on_seq)
 
     def _acquire_data(self, *args, **kwargs):
         """
@@ -711,6 +1490,8 @@ class FrequencyDomainScheduler(Scheduler):
 
         # 3. save result
         self.save_result()
+        if self.profiler is not None:
+            self._result_detail['profile'] = self.profiler.summary()
 
     def run_scanning(self, mw_control: str = 'on'):
         """
@@ -731,8 +1512,11 @@ class FrequencyDomainScheduler(Scheduler):
                                                                         self._freqs[-1] / C.giga))
         print('t: {:.2f} ns, N: {}, T: {:.2f} s, n_freqs: {}'.format(self._asg_conf['t'] / C.nano, self._asg_conf['N'],
                                                                      self.asg_dwell, len(self._freqs)))
-        print('Estimated total running time: {:.2f} s'.format(self.time_total))
+        self.estimate_time()
+        self._print_estimated_time()
 
+        if self.profiler is not None:
+            self.profiler.reset(len(self._freqs))
         self._start_device()
         self._acquire_data()  # scanning MW frequencies in this loop
         self.stop()
@@ -757,6 +1541,7 @@ class TimeDomainScheduler(Scheduler):
     def __init__(self, *args, **kwargs):
         super(TimeDomainScheduler, self).__init__(*args, **kwargs)
         self.name = 'Time-domain ODMR Scheduler'
+        self._compiled = None  # compiled pulse program for all scanning time intervals
 
     def set_delay_times(self, start=None, end=None, step=None, times=None, length=None, logarithm=False):
         """
@@ -781,18 +1566,24 @@ class TimeDomainScheduler(Scheduler):
                 self._times = np.unique((np.linspace(start, end, length) / 10).round() * 10).tolist()
         else:
             raise ValueError('Please input sufficient parameters for time intervals generation')
-        N = self._asg_conf['N']
-        if N is None:
-            raise ValueError('"N" is None currently. Please set ODMR sequences parameters firstly.')
+        self.estimate_time()
+
+    def _scan_dwells(self) -> np.ndarray:
+        if self._cache is None:
+            raise ValueError('ODMR sequences parameters are None currently. Please set them firstly.')
+        compiled = self._compile_program(self._times[0]) if self._times else None
+        if compiled is not None:
+            periods = compiled.periods
         else:
-            self.time_total = sum(self._times) * C.nano * N  # estimated total time
+            periods = [sequence_length(self._detect_seq(t)[2]) for t in self._times]  # exact period lengths, unit: ns
+        return np.array(periods) * C.nano * self._cache['N']
 
     def _scan_times_and_get_data(self):
         """
         Scanning time intervals & getting data of Counter
         """
-        # omit several scanning points
-        for _ in range(self.epoch_omit):
+        # omit several scanning points, unnecessary with armed start
+        for _ in range(0 if self.armed_start else self.epoch_omit):
             self.gene_detect_seq(self._times[0])
             self.asg.start()
             time.sleep(self.time_pad + self.asg_dwell)
@@ -800,31 +1591,64 @@ class TimeDomainScheduler(Scheduler):
                 time.sleep(self.time_pad + self.asg_dwell)
 
         # formal data acquisition
-        for duration in tqdm(self._times):
+        profiler = self.profiler
+        progress = ScanProgress(self._times, self._point_costs)
+        if self.sensitivity is not None:
+            self._reset_sensitivity(self._times, progress)
+        if self.telemetry is not None:
+            self._begin_telemetry(len(self._times))
+        if self.watchdog is not None:
+            self.watchdog.start()
+        for duration in progress:
+            if profiler is not None:
+                profiler.begin_point()
             self._cur_time = duration
-            self.gene_detect_seq(duration)
-            self.asg.start()
+            self._measure_time_point(duration)
+            if self.watchdog is not None and not self._guard_point(lambda: self._measure_time_point(duration)):
+                break
+
+            if self.live_buffer is not None:
+                self._publish_point(progress.n_done, duration)
+            if self.sensitivity is not None:
+                self._update_sensitivity(progress.n_done)
+            if self.telemetry is not None:
+                self._update_telemetry(progress.n_done, progress)
+            if profiler is not None:
+                profiler.end_point()
+
+        if self.telemetry is not None:
+            self.telemetry.end_scan()
+        if self.watchdog is not None:
+            self.watchdog.stop()
+        self._update_overhead(progress)
+        print('finished data acquisition')
 
-            # need to turn on MW itself again (optional)
-            if self.mw_on_off:
-                self.mw.start()
+    def _measure_time_point(self, duration: float):
+        """
+        Acquire data of a detection point at a time interval
+        :param duration: time interval, unit: ns
+        """
+        self.gene_detect_seq(duration)
+        self.asg.start()
 
-            # 1. signal data acquisition
-            self._get_data()
+        # need to turn on MW itself again (optional)
+        if self.mw_on_off:
+            self.mw.start()
 
-            # 2. reference data acquisition
-            if self.with_ref:
-                # turn off MW via ASG (usually necessary)
-                if self.asg_control_mw_on_off:
-                    self.mw_control_seq([0, 0])
+        # 1. signal data acquisition
+        self._get_data()
 
-                # turn off MW itself (optional)
-                if self.mw_on_off:
-                    self.mw.stop()
+        # 2. reference data acquisition
+        if self.with_ref:
+            # turn off MW via ASG (usually necessary)
+            if self.asg_control_mw_on_off:
+                self.mw_control_seq([0, 0])
 
-                self._get_data_ref()
+            # turn off MW itself (optional)
+            if self.mw_on_off:
+                self.mw.stop()
 
-        print('finished data acquisition')
+            self._get_data_ref()
 
     def _acquire_data(self, *args, **kwargs):
         """
@@ -838,6 +1662,8 @@ class TimeDomainScheduler(Scheduler):
 
         # 3. save result
         self.save_result()
+        if self.profiler is not None:
+            self._result_detail['profile'] = self.profiler.summary()
 
     def run_scanning(self):
         """
@@ -847,12 +1673,35 @@ class TimeDomainScheduler(Scheduler):
         """
         print('Begin to run {}. Time intervals: {:.3f} - {:.3f} ns.'.format(self.name, self._times[0], self._times[-1]))
         print('N: {}, n_times: {}'.format(self._asg_conf['N'], len(self._times)))
-        print('Estimated total running time: {:.2f} s'.format(self.time_total))
+        self.estimate_time()
+        self._print_estimated_time()
 
+        if self.profiler is not None:
+            self.profiler.reset(len(self._times))
         self._start_device()
         self._acquire_data()  # scanning time intervals in this loop
         self.stop()
 
+    def gene_detect_seq(self, t):
+        """
+        Generate detection sequences and download it to ASG
+        :param t: scanning time interval, unit: ns
+        """
+        laser_seq, mw_seq, tagger_seq = self._detect_seq(t)
+
+        sync_seq = [0, 0]
+        if self.use_lockin:
+            half_period = int(1 / self.sync_freq / 2 / C.nano)
+            sync_seq = [half_period, half_period]
+
+        self._conf_time_paras(sequence_length(tagger_seq), self._cache['N'])
+        self.download_asg_sequences(
+            laser_seq=flip_sequence(laser_seq) if self.laser_ttl == 0 else laser_seq,
+            mw_seq=flip_sequence(mw_seq) if self.mw_ttl == 0 else mw_seq,
+            tagger_seq=flip_sequence(tagger_seq) if self.tagger_ttl == 0 else tagger_seq,
+            sync_seq=sync_seq
+        )
+
     def gene_pseudo_detect_seq(self):
         """
         Generate pseudo pulses for visualization and regulation
@@ -861,9 +1710,56 @@ class TimeDomainScheduler(Scheduler):
         t_sum = sum([t for t in ts if t is not None])
         self.gene_detect_seq(int(t_sum / 40) * 10)
 
-    @abc.abstractmethod
-    def gene_detect_seq(self, *args, **kwargs):
-        raise NotImplementedError
+    def pulse_program(self) -> Optional[PulseProgram]:
+        """
+        Pulse program of a detection period on channels 'laser', 'mw' and 'tagger', with the scanning time interval
+        as sweep variable `Var('t')`; None if detection sequences are generated by overriding `_detect_seq`
+        """
+        return None
+
+    def _readout_program(self) -> Par:
+        """
+        Pulse program of laser readout, with signal (and reference) tagger readout, ending a detection period
+        """
+        t_read_sig, t_read_ref = self._cache['t_read_sig'], self._cache['t_read_sig']
+        inter_readout, pre_read = self._cache['inter_readout'], self._cache['pre_read']
+        inter_period = self._cache['inter_period']
+        if self.two_pulse_readout:
+            return Par(Pulse('laser', pre_read + t_read_sig + inter_readout + t_read_ref + inter_period),
+                       Seq(Wait(pre_read), Pulse('tagger', t_read_sig), Wait(inter_readout),
+                           Pulse('tagger', t_read_ref), Wait(inter_period)))
+        else:
+            # single-pulse readout (without reference readout)
+            return Par(Pulse('laser', pre_read + t_read_sig + inter_period),
+                       Seq(Wait(pre_read), Pulse('tagger', t_read_sig), Wait(inter_period)))
+
+    def _compile_program(self, t) -> Optional[CompiledProgram]:
+        """
+        Compile the pulse program for all scanning time intervals at once, or only for `t` if it is not one of them;
+        the compiled program is cached until the program or the time intervals change
+        :param t: scanning time interval, unit: ns
+        """
+        program = self.pulse_program()
+        if program is None:
+            return None
+        compiled = self._compiled
+        if compiled is None or compiled.key != repr(program) or compiled.index(t=t) < 0 or (
+                t in self._times and len(compiled) != len(self._times)):
+            compiled = program.compile(t=self._times if t in self._times else [t])
+            self._compiled = compiled
+        return compiled
+
+    def _detect_seq(self, t) -> Tuple[List[float], List[float], List[float]]:
+        """
+        Generate detection sequences of laser, MW and tagger channels (high-level effective)
+        :param t: scanning time interval, unit: ns
+        :return: laser, MW and tagger sequences
+        """
+        compiled = self._compile_program(t)
+        if compiled is None:
+            raise NotImplementedError('either pulse_program or _detect_seq should be implemented')
+        seqs = dict(zip(compiled.channels, compiled.sequences(compiled.index(t=t))))
+        return seqs['laser'], seqs['mw'], seqs['tagger']
 
     @abc.abstractmethod
     def configure_odmr_seq(self, *args, **kwargs):
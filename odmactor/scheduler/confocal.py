@@ -0,0 +1,206 @@
+"""
+Scanning-confocal ODMR mapping
+---
+1. Count-rate image: raster scan with laser on and MW off
+2. ODMR image: raster scan at each MW frequency (and its reference with MW off), into memory-mapped cubes
+Each line is a single hardware-timed buffered write of the scanner plus a single read of a `CountBetweenMarkers`
+whose bins are the pixels of the line, instead of one software round trip per pixel. Pixels are gated by the DAQ
+sample clock, exported by the scanner and wired to a Time Tagger input, so that bins are aligned to the scanned
+positions.
+"""
+
+import numpy as np
+from typing import Tuple
+from odmactor.utils import constants as C
+from odmactor.scheduler.frequency import CWScheduler
+from odmactor.utils.estimation import ScanProgress
+from odmactor.utils.imaging import ImageStack
+
+
+class ConfocalScheduler(CWScheduler):
+    """
+    Scanning-confocal scheduler, with continuous laser and MW as CW ODMR
+
+    Usage:
+        scheduler.configure_odmr_seq(period=1000, N=1000)
+        scheduler.configure_scanner()
+        scheduler.set_raster((-5, 5), (-5, 5), shape=(100, 100), pixel_time=1e-3)
+        image = scheduler.scan_image()
+        scheduler.set_mw_freqs(2.85e9, 2.89e9, 1e6)
+        scheduler.run_scanning()  # ODMR cubes in scheduler.image_stack
+    """
+
+    _snapshot_attrs = CWScheduler._snapshot_attrs + ('pixel_time', '_xs', '_ys')
+
+    def __init__(self, *args, **kwargs):
+        super(ConfocalScheduler, self).__init__(*args, **kwargs)
+        self.name = 'Confocal ODMR Scheduler'
+        self.scanner = None
+        self.pixel_time = 1e-3  # unit: s
+        self._xs = np.zeros(0)  # unit: um
+        self._ys = np.zeros(0)  # unit: um
+        self.image: np.ndarray = None  # latest count-rate image, unit: counts/s
+        self.tagger_input['scan_clock'] = 3  # Time Tagger input of the DAQ sample clock of the scanner
+
+    def configure_scanner(self, scanner=None, **kwargs):
+        """
+        Configure the galvo/piezo scanner
+        :param scanner: scanner instance providing `move_to(x, y)` and `scan_line(xs, y, pixel_time)`;
+                        a `GalvoScanner` (or a simulated one for simulated schedulers) is created by default
+        :param kwargs: arguments of constructing the default scanner, e.g., `clock_terminal` exporting the DAQ sample
+                    clock to the Time Tagger input `tagger_input['scan_clock']`
+        """
+        if scanner is None:
+            if self.simulation:
+                from odmactor.instrument import simulation
+                scanner = simulation.SimulatedScanner(**kwargs)
+            else:
+                from odmactor.instrument.scanner import GalvoScanner
+                scanner = GalvoScanner(**kwargs)
+        if self.simulation:
+            self.tagger.scanner = scanner
+        self.scanner = scanner
+
+    def set_raster(self, x_range: Tuple[float, float], y_range: Tuple[float, float], shape: Tuple[int, int],
+                   pixel_time: float = 1e-3):
+        """
+        Set the raster of scanning, and configure line counting accordingly
+        :param x_range: (start, end) of X positions, unit: um
+        :param y_range: (start, end) of Y positions, unit: um
+        :param shape: number of (rows, columns), i.e., (lines, pixels per line)
+        :param pixel_time: dwell time of each pixel, unit: s
+        """
+        self._ys = np.linspace(y_range[0], y_range[1], shape[0])
+        self._xs = np.linspace(x_range[0], x_range[1], shape[1])
+        self.pixel_time = pixel_time
+        self.configure_line_counting()
+        if self._freqs:
+            self.estimate_time()
+
+    def restore(self, snapshot: dict):
+        super(ConfocalScheduler, self).restore(snapshot)
+        if len(self._xs) and self.tagger is not None:
+            self.configure_line_counting()
+
+    def configure_line_counting(self, apd_channel: int = None, clock_channel: int = None):
+        """
+        Configure a Time Tagger `CountBetweenMarkers` whose bins are the pixels of a line, i.e., intervals between
+        consecutive edges of the DAQ sample clock
+        :param apd_channel: APD channel number
+        :param clock_channel: channel number of the DAQ sample clock
+        """
+        tt = self._tagger_backend()
+        if apd_channel is not None:
+            self.tagger_input['apd'] = apd_channel
+        if clock_channel is not None:
+            self.tagger_input['scan_clock'] = clock_channel
+        self.counter = tt.CountBetweenMarkers(self.tagger, self.tagger_input['apd'],
+                                              begin_channel=self.tagger_input['scan_clock'], n_values=len(self._xs))
+
+    @property
+    def raster_shape(self) -> Tuple[int, int]:
+        return len(self._ys), len(self._xs)
+
+    def _scan_dwells(self) -> np.ndarray:
+        line_time = len(self._xs) * self.pixel_time
+        return np.full(len(self._freqs), len(self._ys) * line_time)
+
+    def _scan_line(self, y: float) -> np.ndarray:
+        """
+        Scan a line and read the counts of its pixels
+        The counter is cleared after the clock edges of moving to the line start have been processed, so that its
+        `n_values` bins are filled by the clock edges of the line
+        :return: count rates of pixels, unit: counts/s
+        """
+        self.scanner.move_to(self._xs[0], y)
+        self.tagger.sync()
+        self.counter.clear()
+        self.scanner.scan_line(self._xs, y, self.pixel_time)
+        self._wait_counter_ready(timeout=0.5)
+        return self.counter.getData().ravel() / self.pixel_time
+
+    def _scan_raster(self, out: np.ndarray) -> np.ndarray:
+        """
+        Scan all lines into a 2-D array of shape (rows, columns)
+        """
+        for i, y in enumerate(self._ys):
+            out[i] = self._scan_line(y)
+        return out
+
+    def scan_image(self, mw_control: str = 'off') -> np.ndarray:
+        """
+        Scan a count-rate image
+        :param mw_control: 'on' or 'off'
+        :return: 2-D array of shape (rows, columns), unit: counts/s
+        """
+        if not len(self._xs):
+            raise ValueError('raster is not set. Please call "set_raster" firstly.')
+        mw_seq_on = self.mw_control_seq()
+        if mw_control == 'off':
+            self.mw_control_seq([0, 0])
+        elif mw_control != 'on':
+            raise ValueError('unsupported mw_control parameter')
+        print('Begin to scan a {} x {} image, {:.1f} ms per pixel'.format(*self.raster_shape, self.pixel_time / C.milli))
+
+        self._start_device()
+        image = np.empty(self.raster_shape)
+        progress = ScanProgress(enumerate(self._ys), np.full(len(self._ys), len(self._xs) * self.pixel_time))
+        for i, y in progress:
+            image[i] = self._scan_line(y)
+        self.stop()
+
+        if mw_control == 'off':
+            self.mw_control_seq(mw_seq_on)
+        self.image = image
+        return image
+
+    def _scan_freqs_and_get_data(self):
+        """
+        Scanning frequencies & getting an image (and its reference) at each frequency
+        """
+        if not len(self._xs):
+            raise ValueError('raster is not set. Please call "set_raster" firstly.')
+        self.image_stack = ImageStack.create(self._gene_data_result_fname(), self._freqs, self.raster_shape,
+                                             self.with_ref)
+        mw_on_seq = self._asg_sequences[self.channel['mw'] - 1]
+        progress = ScanProgress(self._freqs, self._point_costs)
+        if self.telemetry is not None:
+            self._begin_telemetry(len(self._freqs))
+        for i, freq in enumerate(progress):
+            self._cur_index = i
+            self._cur_freq = freq
+            self.mw.set_frequency(freq)
+            if self.mw_on_off:
+                self.mw.start()
+
+            image = self._scan_raster(self.image_stack.signal[i])
+            self._latest = np.array([image.mean()])
+            self._data.append(self._latest.tolist())
+
+            if self.with_ref:
+                if self.asg_control_mw_on_off:
+                    self.mw_control_seq([0, 0])
+                if self.mw_on_off:
+                    self.mw.stop()
+                image = self._scan_raster(self.image_stack.reference[i])
+                self._latest_ref = np.array([image.mean()])
+                self._data_ref.append(self._latest_ref.tolist())
+                if self.asg_control_mw_on_off:
+                    self.mw_control_seq(mw_on_seq)
+
+            if self.live_buffer is not None:
+                self._publish_point(progress.n_done, freq)
+            if self.telemetry is not None:
+                self._update_telemetry(i, progress)
+
+        if self.telemetry is not None:
+            self.telemetry.end_scan()
+        self.image_stack.flush()
+        print('Image cubes have been saved into {}-*.npy'.format(self.image_stack.fname))
+        self._update_overhead(progress)
+        print('finished data acquisition')
+
+    def close(self):
+        if self.scanner is not None:
+            self.scanner.close()
+        super(ConfocalScheduler, self).close()
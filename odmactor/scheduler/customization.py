@@ -2,9 +2,10 @@
 User-customized Scheduler
 """
 import time
-import scipy.constants as C
+from odmactor.utils import constants as C
 from typing import List
-from .base import Scheduler
+from .base import Scheduler, TimeDomainScheduler
+from odmactor.utils.program import PulseProgram
 
 
 class CustomizedScheduler(Scheduler):
@@ -49,3 +50,40 @@ class CustomizedScheduler(Scheduler):
             self.mw_control_seq(mw_seq_on)
 
         return counts
+
+
+class ProgrammableScheduler(TimeDomainScheduler):
+    """
+    Customized time-domain scheduler defined by a pulse program
+    ---
+    Example:
+        from odmactor.utils.program import PulseProgram, Pulse, Wait, Seq, Par, Var
+        t = Var('t')
+        program = PulseProgram(Seq(
+            Pulse('laser', 3000), Wait(1000), Pulse('mw', t), Wait(100),
+            Par(Pulse('laser', 650), Seq(Wait(50), Pulse('tagger', 400), Wait(200)))
+        ))
+        scheduler = ProgrammableScheduler()
+        scheduler.configure_odmr_seq(program, N=10000)
+        scheduler.set_delay_times(20, 500, 10)
+    """
+
+    _snapshot_attrs = TimeDomainScheduler._snapshot_attrs + ('_program',)
+
+    def __init__(self, *args, **kwargs):
+        super(ProgrammableScheduler, self).__init__(*args, **kwargs)
+        self.name = 'Programmable Scheduler'
+        self._program = None
+
+    def pulse_program(self) -> PulseProgram:
+        return self._program
+
+    def configure_odmr_seq(self, program: PulseProgram, N: int = 1000, *args, **kwargs):
+        """
+        :param program: pulse program of a detection period on channels 'laser', 'mw' and 'tagger', with the
+                        scanning time interval as sweep variable `Var('t')`
+        :param N: number of ASG operation periods for each detection point
+        """
+        self._program = program
+        self._cache = {'N': N}
+        self._asg_conf['N'] = N
@@ -12,7 +12,7 @@ Frequency-domain ODMR detecting classes
 """
 
 import time
-import scipy.constants as C
+from odmactor.utils import constants as C
 from typing import List
 from odmactor.scheduler.base import FrequencyDomainScheduler
 from odmactor.utils.sequence import flip_sequence
@@ -0,0 +1,92 @@
+"""
+Dynamical-decoupling noise spectroscopy
+---
+DD order and pulse spacing are swept with a configured `HighDecouplingScheduler`. Each acquired point is converted
+into a coherence and added to an incremental estimator (`odmactor.utils.noise`), so that the reconstructed noise
+spectrum is refined while sweeping instead of after the whole scan.
+
+Usage:
+    spectroscopy = NoiseSpectroscopy(scheduler, orders=[1, 2, 4, 8, 16], spacings=np.geomspace(50, 5000, 30),
+                                     contrast=0.25)
+    result = spectroscopy.run()
+    plt.loglog(result['freqs'], result['spectrum'])
+"""
+
+import numpy as np
+from typing import Dict, Sequence, Tuple
+from odmactor.utils import constants as C
+from odmactor.scheduler.sweep import Sweep
+from odmactor.scheduler.time import HighDecouplingScheduler
+from odmactor.utils.noise import NoiseSpectrumEstimator, coherence_from_signal
+
+
+class NoiseSpectroscopy:
+    """
+    Pipeline of noise spectroscopy over DD order × pulse spacing
+    """
+
+    def __init__(self, scheduler: HighDecouplingScheduler, orders: Sequence[int], spacings: Sequence[float],
+                 contrast: float, freqs: Sequence[float] = None, refit_every: int = 10, **kwargs):
+        """
+        :param scheduler: scheduler whose sequences, counter and pi pulse have been configured, acquiring reference
+                        signals (`with_ref` or two-pulse readout)
+        :param orders: numbers of pi pulses
+        :param spacings: free precession time between pulses, unit: ns
+        :param contrast: fluorescence contrast between ms = 0 and ms = ±1, e.g., from a Rabi oscillation
+        :param freqs: nodes of the reconstructed spectrum, unit: Hz; covering filter peaks of spacings by default
+        :param refit_every: number of points between refits of the spectrum
+        :param kwargs: other keyword arguments of `NoiseSpectrumEstimator`, e.g., `smoothing`
+        """
+        if scheduler.pi_pulse['time'] is None:
+            raise ValueError('pi pulse of the scheduler should be calibrated')
+        self.scheduler = scheduler
+        self.orders = np.asarray(orders, dtype=int)
+        self.spacings = np.asarray(spacings, dtype=float)
+        self.contrast = contrast
+        self.refit_every = refit_every
+        t_pi = scheduler.pi_pulse['time']
+        if freqs is None:
+            freqs = NoiseSpectrumEstimator.default_freqs(self.spacings * C.nano, t_pi)
+        self.estimator = NoiseSpectrumEstimator(freqs, t_pi=t_pi, **kwargs)
+        self.sweep = Sweep(scheduler).add_axis('order', self.orders).add_axis('t', self.spacings)
+        self.coherence = np.full((len(self.orders), len(self.spacings)), np.nan)
+        self.spectrum = None
+        self.history = []  # (number of points, spectrum) of each refit
+
+    def _on_point(self, point: Dict[str, float], counts: Tuple[float, float]):
+        """
+        Add an acquired point into the estimator, with the error of coherence from photon shot noise
+        """
+        order, t = int(point['order']), float(point['t'])
+        signal, signal_ref = counts
+        if not signal_ref > 0:
+            raise ValueError('noise spectroscopy requires reference signals')
+        s = signal / signal_ref
+        n_periods = self.scheduler._asg_conf['N']
+        error_s = s * np.sqrt(1 / max(signal, 1e-12) + 1 / signal_ref) / np.sqrt(n_periods)
+        c = float(coherence_from_signal(s, order, self.contrast))
+        i, j = int(np.flatnonzero(self.orders == order)[0]), int(np.flatnonzero(self.spacings == t)[0])
+        self.coherence[i, j] = c
+        self.estimator.add(order, t * C.nano, c, errors=2 * error_s / self.contrast)
+        n = int(np.isfinite(self.coherence).sum())
+        if n % self.refit_every == 0 or n == self.coherence.size:
+            self.spectrum = self.estimator.spectrum()
+            self.history.append((n, self.spectrum))
+
+    def run(self) -> dict:
+        """
+        Run the sweep, refining the spectrum while points arrive
+        :return: dict of 'freqs' (Hz), 'spectrum' (rad²/s), 'orders', 'spacings' (ns), 'coherence' (orders ×
+                spacings), 'counts' (`LabelledArray` of the sweep)
+        """
+        counts = self.sweep.run(callback=self._on_point)
+        self.spectrum = self.estimator.spectrum()
+        print('Reconstructed noise spectrum from {} points'.format(self.estimator.n_points))
+        return {
+            'freqs': self.estimator.freqs,
+            'spectrum': self.spectrum,
+            'orders': self.orders,
+            'spacings': self.spacings,
+            'coherence': self.coherence,
+            'counts': counts,
+        }
@@ -0,0 +1,266 @@
+"""
+N-dimensional parameter sweep of a scheduler
+---
+Any combination of MW frequency ('freq', Hz), MW power ('power', dBm), DD order ('order'), scanning time interval
+('t', ns, time-domain schedulers) and sequence parameters (keys of `scheduler._cache` for time-domain schedulers, or
+keyword arguments of `configure_odmr_seq` passed as `seq_params` for frequency-domain schedulers) can be swept.
+Loops are ordered such that the total cost of parameter changes is minimal, i.e., slow changes (MW power settling,
+ASG reprogramming) are placed in outer loops and cheap ones (MW frequency) in inner loops.
+When sweeping MW power of time-domain schedulers, the pi pulse is regulated and MW pulses are regenerated accordingly.
+Results are stored into a preallocated `LabelledArray` with dimensions in the order of axes added. The scheduler is
+restored as it was after the sweep.
+
+Usage:
+    sweep = Sweep(scheduler, fixed={'t': 1000})
+    sweep.add_axis('power', [-10, -5, 0]).add_axis('freq', np.arange(2.85e9, 2.89e9, 1e6))
+    result = sweep.run()
+    counts = result.sel(signal='counts')  # LabelledArray of dimensions ('power', 'freq')
+"""
+
+import itertools
+import time
+import numpy as np
+from typing import List, Dict, Sequence, Callable, Tuple
+from odmactor.scheduler.base import Scheduler, TimeDomainScheduler, FrequencyDomainScheduler
+from odmactor.utils.estimation import ScanProgress
+from odmactor.utils.labelled import LabelledArray
+
+SWEEP_COSTS = {'power': 0.5, 'sequence': 0.05, 'freq': 0.01}  # typical time of changing a parameter, unit: s
+MW_PULSE_KEYS = ('t_mw', 't_mw_half_pi')  # sequence parameters of time-domain schedulers derived from the pi pulse
+
+
+class Sweep:
+    """
+    N-dimensional parameter sweep engine
+    """
+
+    def __init__(self, scheduler: Scheduler, seq_params: dict = None, fixed: dict = None, settle: dict = None):
+        """
+        :param scheduler: configured scheduler, whose counter has been configured
+        :param seq_params: keyword arguments of `scheduler.configure_odmr_seq`, necessary when sweeping sequence
+                            parameters of frequency-domain schedulers
+        :param fixed: values of parameters which are not swept, e.g., {'t': 1000} for time-domain schedulers
+        :param settle: settling time after changing a parameter, e.g., {'power': 0.2}, unit: s
+        """
+        self.scheduler = scheduler
+        self.seq_params = {} if seq_params is None else dict(seq_params)
+        self.fixed = {} if fixed is None else dict(fixed)
+        self.settle = {} if settle is None else dict(settle)
+        self.axes: Dict[str, np.ndarray] = {}
+        self.costs: Dict[str, float] = {}
+        self.result = None
+
+    def _kind(self, name: str) -> str:
+        if name in ('freq', 'power'):
+            return name
+        if name in ('order', 't') or name in self.seq_params:
+            return 'sequence'
+        if isinstance(self.scheduler, TimeDomainScheduler) and isinstance(self.scheduler._cache, dict) and \
+                name in self.scheduler._cache:
+            return 'sequence'
+        raise ValueError('unsupported sweep parameter "{}"'.format(name))
+
+    def add_axis(self, name: str, values: Sequence, cost: float = None) -> 'Sweep':
+        """
+        Add a sweep axis
+        :param name: parameter name
+        :param values: parameter values
+        :param cost: time of changing this parameter, unit: s; by default estimated by its kind and settling time
+        :return: the sweep itself, for chained calls
+        """
+        kind = self._kind(name)
+        if name == 't' and not isinstance(self.scheduler, TimeDomainScheduler):
+            raise ValueError('time interval "t" can be swept only by time-domain schedulers')
+        if name == 'power' and self._mw_pulses() and not self.scheduler.pi_pulse['time']:
+            raise ValueError('pi pulse is not set, necessary to regulate MW pulses when sweeping MW power')
+        self.axes[name] = np.asarray(values)
+        self.costs[name] = SWEEP_COSTS[kind] + self.settle.get(name, 0.0) if cost is None else cost
+        return self
+
+    @property
+    def dims(self) -> List[str]:
+        return list(self.axes)
+
+    @property
+    def shape(self) -> tuple:
+        return tuple(len(v) for v in self.axes.values())
+
+    def changes_cost(self, order: Sequence[str]) -> float:
+        """
+        Total cost of parameter changes with loops nested in `order` (from outer to inner)
+        """
+        total, n = 0.0, 1
+        for name in order:
+            n *= len(self.axes[name])
+            total += self.costs[name] * n
+        return total
+
+    def loop_order(self) -> List[str]:
+        """
+        Order of nested loops (from outer to inner) with minimal total cost of parameter changes
+        """
+        if len(self.axes) > 7:
+            return sorted(self.axes, key=lambda name: -self.costs[name])
+        return list(min(itertools.permutations(self.axes), key=self.changes_cost))
+
+    def estimate_time(self) -> float:
+        """
+        Estimated total time of the sweep: dwell time of all points and parameter changes, unit: s
+        """
+        s = self.scheduler
+        n_acq = 2 if s.with_ref else 1
+        return int(np.prod(self.shape)) * s.asg_dwell * (1 + s.time_pad_ratio) * n_acq + \
+            self.changes_cost(self.loop_order())
+
+    def _mw_pulses(self) -> List[str]:
+        """
+        Keys of MW pulse times in sequence parameters of time-domain schedulers, which depend on MW power
+        """
+        s = self.scheduler
+        if not isinstance(s, TimeDomainScheduler) or not isinstance(s._cache, dict):
+            return []
+        return [key for key in MW_PULSE_KEYS if key in s._cache and key not in self.axes]
+
+    def _set_power(self, power: float) -> bool:
+        """
+        Set MW power; for time-domain schedulers, regulate the pi pulse and rescale MW pulse times accordingly
+        :return: whether sequences should be regenerated
+        """
+        s = self.scheduler
+        pulses = self._mw_pulses()
+        if not pulses:
+            s.configure_mw_paras(power=power)
+            return False
+        t_pi = s.pi_pulse['time']
+        s.configure_mw_paras(power=power, regulate_pi=True)
+        for key in pulses:
+            s._cache[key] *= s.pi_pulse['time'] / t_pi
+        return True
+
+    def _apply(self, values: Dict[str, float]):
+        """
+        Apply changed parameters; sequences are regenerated at most once
+        """
+        s = self.scheduler
+        pulses_changed = self._set_power(values['power']) if 'power' in values else False
+        if 'freq' in values:
+            s.configure_mw_paras(freq=values['freq'])
+        seq_changed = [name for name in values if name not in ('power', 'freq')]
+        if seq_changed or pulses_changed:
+            for name in seq_changed:
+                if name == 'order':
+                    s.order = int(values[name])
+                elif name in self.seq_params:
+                    self.seq_params[name] = values[name]
+                elif name != 't':
+                    s._cache[name] = values[name]
+                    if name == 'N':
+                        s._asg_conf['N'] = values[name]
+            self._regenerate()
+        settle = max([self.settle.get(name, 0.0) for name in values], default=0.0)
+        if settle > 0:
+            time.sleep(settle)
+
+    def _regenerate(self):
+        s = self.scheduler
+        if isinstance(s, TimeDomainScheduler):
+            s.gene_detect_seq(self.fixed['t'])
+            s._cur_time = self.fixed['t']
+        elif isinstance(s, FrequencyDomainScheduler):
+            s.configure_odmr_seq(**self.seq_params)
+        else:
+            raise TypeError('unsupported scheduler type for sweeping sequence parameters')
+
+    def _acquire_point(self):
+        """
+        Acquire signal (and reference) data of a point, as scanning loops of schedulers
+        """
+        s = self.scheduler
+        mw_on_seq = s.mw_control_seq()
+        s.asg.start()
+        if s.mw_on_off:
+            s.mw.start()
+        s._get_data()
+        if s.with_ref:
+            if s.asg_control_mw_on_off:
+                s.mw_control_seq([0, 0])
+            if s.mw_on_off:
+                s.mw.stop()
+            s._get_data_ref()
+            if s.asg_control_mw_on_off:
+                s.mw_control_seq(mw_on_seq)
+
+    def run(self, callback: Callable[[Dict[str, float], Tuple[float, float]], None] = None) -> LabelledArray:
+        """
+        Run the sweep
+        :param callback: called after each point with parameter values of the point and its (counts, counts_ref),
+                        e.g., to refine an analysis while sweeping
+        :return: labelled array of dimensions (*axes, 'signal'), where 'signal' is ['counts', 'counts_ref']
+        The scheduler (MW settings, sequence parameters, pi pulse and sequences) is restored afterwards
+        """
+        s = self.scheduler
+        if not self.axes:
+            raise ValueError('no sweep axis has been added')
+        if isinstance(s, TimeDomainScheduler) and 't' not in self.axes and 't' not in self.fixed:
+            raise ValueError('time interval "t" should be swept or fixed for time-domain schedulers')
+        order = self.loop_order()
+        perm = [self.dims.index(name) for name in order]
+        shape = tuple(len(self.axes[name]) for name in order)
+        coords = dict(self.axes, signal=['counts', 'counts_ref'])
+        self.result = LabelledArray.empty(self.dims + ['signal'], coords, attrs={
+            'scheduler': s.name, 'loop_order': order, 'fixed': {k: float(v) for k, v in self.fixed.items()}})
+
+        print('Begin to sweep {} with {} ({} points), loops from outer to inner: {}'.format(
+            s.name, ', '.join('{}: {}'.format(k, len(v)) for k, v in self.axes.items()), int(np.prod(shape)),
+            ', '.join(order)))
+        n_acq = 2 if s.with_ref else 1
+        costs = np.full(shape, s.asg_dwell * (1 + s.time_pad_ratio) * n_acq)
+        for k, name in enumerate(order):
+            # a parameter changes when all inner loops restart
+            mask = np.zeros(shape, dtype=bool)
+            mask[(slice(None),) * (k + 1) + (0,) * (len(order) - k - 1)] = True
+            costs[mask] += self.costs[name]
+
+        snapshot = s.snapshot()
+        fixed, seq_params = dict(self.fixed), dict(self.seq_params)
+        s._start_device()
+        previous = None
+        progress = ScanProgress(list(np.ndindex(*shape)), costs.ravel())
+        if s.telemetry is not None:
+            s._begin_telemetry(len(progress))
+        if s.watchdog is not None:
+            s.watchdog.start()
+        try:
+            for idx in progress:
+                changed = {name: self.axes[name][i] for k, (name, i) in enumerate(zip(order, idx))
+                           if previous is None or previous[k] != i}
+                if 't' in changed:
+                    self.fixed['t'] = changed['t']
+                if s.profiler is not None:
+                    s.profiler.begin_point()
+                self._apply(changed)
+                self._acquire_point()
+                if s.watchdog is not None and not s._guard_point(self._acquire_point):
+                    break
+                counts = s._latest_counts()
+                self.result[tuple(idx[perm.index(j)] for j in range(len(perm)))] = counts
+                if callback is not None:
+                    callback({name: self.axes[name][i] for name, i in zip(order, idx)}, counts)
+                if s.live_buffer is not None:
+                    s._publish_point(progress.n_done, float(self.axes[order[-1]][idx[-1]]))
+                if s.telemetry is not None:
+                    s._update_telemetry(progress.n_done, progress, s.asg_dwell * (1 + s.time_pad_ratio) * n_acq)
+                if s.profiler is not None:
+                    s.profiler.end_point()
+                previous = idx
+        finally:
+            if s.telemetry is not None:
+                s.telemetry.end_scan()
+            if s.watchdog is not None:
+                s.watchdog.stop()
+            s.stop()
+            # swept parameters are not kept by the scheduler
+            s.restore(snapshot)
+            self.fixed, self.seq_params = fixed, seq_params
+        print('finished sweeping')
+        return self.result
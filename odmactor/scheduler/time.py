@@ -20,8 +20,8 @@ Time-domain ODMR detecting classes
 """
 
 from odmactor.scheduler.base import TimeDomainScheduler
-import scipy.constants as C
-from odmactor.utils.sequence import flip_sequence
+from odmactor.utils import constants as C
+from odmactor.utils.program import PulseProgram, Pulse, Wait, Seq, Par, Loop, Var
 
 
 class RamseyScheduler(TimeDomainScheduler):
@@ -29,51 +29,26 @@ class RamseyScheduler(TimeDomainScheduler):
     Ramsey detecting scheduler
     """
 
+    _sensitivity_model = 'sinusoid'
+
     def __init__(self, *args, **kwargs):
         super(RamseyScheduler, self).__init__(*args, **kwargs)
         self.name = 'Ramsey Scheduler'
 
-    def gene_detect_seq(self, t_free):
+    def pulse_program(self) -> PulseProgram:
         """
-        Generate Ramsey sequences and download it to ASG
-        :param t_free: free precession time (time duration between two MW pulse)
+        Ramsey pulse program, with free precession time (time duration between two MW pulse) as variable `t`
         """
         t_init, t_mw = self._cache['t_init'], self._cache['t_mw']
         inter_init_mw, inter_mw_read = self._cache['inter_init_mw'], self._cache['inter_mw_read']
-        t_read_sig, t_read_ref = self._cache['t_read_sig'], self._cache['t_read_sig']
-        inter_readout, pre_read = self._cache['inter_readout'], self._cache['pre_read']
-        inter_period = self._cache['inter_period']
-        N = self._cache['N']
-
-        # generate ASG wave forms
-        if self.two_pulse_readout:
-            laser_seq = [t_init, inter_init_mw + t_mw * 2 + t_free + inter_mw_read,
-                         pre_read + t_read_sig + inter_readout + t_read_ref + inter_period, 0]
-            mw_seq = [0, t_init + inter_init_mw, t_mw, t_free, t_mw,
-                      inter_mw_read + pre_read + t_read_sig + inter_readout + t_read_ref + inter_period]
-            tagger_seq = [0, t_init + inter_init_mw + t_mw * 2 + t_free + inter_mw_read + pre_read, t_read_sig,
-                          inter_readout, t_read_ref, inter_period]
-        else:
-            # single-pulse readout (without reference readout)
-            laser_seq = [t_init, inter_init_mw + t_mw * 2 + t_free + inter_mw_read,
-                         pre_read + t_read_sig + inter_period, 0]
-            mw_seq = [0, t_init + inter_init_mw, t_mw, t_free, t_mw,
-                      inter_mw_read + pre_read + t_read_sig + inter_period]
-            tagger_seq = [0, t_init + inter_init_mw + t_mw * 2 + t_free + inter_mw_read + pre_read, t_read_sig,
-                          inter_period]
-
-        sync_seq = [0, 0]
-        if self.use_lockin:
-            half_period = int(1 / self.sync_freq / 2 / C.nano)
-            sync_seq = [half_period, half_period]
-
-        self._conf_time_paras(sum(tagger_seq), N)
-        self.download_asg_sequences(
-            laser_seq=flip_sequence(laser_seq) if self.laser_ttl == 0 else laser_seq,
-            mw_seq=flip_sequence(mw_seq) if self.mw_ttl == 0 else mw_seq,
-            tagger_seq=flip_sequence(tagger_seq) if self.tagger_ttl == 0 else tagger_seq,
-            sync_seq=sync_seq
-        )
+        t_free = Var('t')
+        return PulseProgram(Seq(
+            Pulse('laser', t_init),
+            Wait(inter_init_mw),
+            Pulse('mw', t_mw), Wait(t_free), Pulse('mw', t_mw),
+            Wait(inter_mw_read),
+            self._readout_program()
+        ))
 
     def configure_odmr_seq(self, t_init, t_read_sig, inter_init_mw=1000, inter_mw_read=200,
                            inter_readout=200, pre_read=50, inter_period=200, N: int = 1000, *args, **kwargs):
@@ -125,47 +100,26 @@ class RabiScheduler(TimeDomainScheduler):
     Ramsey detecting scheduler
     """
 
+    _sensitivity_model = 'sinusoid'
+
     def __init__(self, *args, **kwargs):
         super(RabiScheduler, self).__init__(*args, **kwargs)
         self.name = 'Rabi Scheduler'
 
-    def gene_detect_seq(self, t_mw):
+    def pulse_program(self) -> PulseProgram:
         """
-        Generate Rabi detecting sequences and download it to ASG
-        :param t_mw: free precession time (time duration between two MW pulse)
+        Rabi pulse program, with MW duration time as variable `t`
         """
         t_init, inter_init_mw = self._cache['t_init'], self._cache['inter_init_mw']
-        t_read_sig, t_read_ref = self._cache['t_read_sig'], self._cache['t_read_sig']
-        inter_readout, inter_period = self._cache['inter_readout'], self._cache['inter_period']
-        inter_mw_read, pre_read = self._cache['inter_mw_read'], self._cache['pre_read']
-        N = self._cache['N']
-
-        # generate ASG wave forms
-        if self.two_pulse_readout:
-            laser_seq = [t_init, inter_init_mw + t_mw + inter_mw_read,
-                         pre_read + t_read_sig + inter_readout + t_read_ref + inter_period, 0]
-            mw_seq = [0, t_init + inter_init_mw, t_mw,
-                      inter_mw_read + pre_read + t_read_sig + inter_readout + t_read_ref + inter_period]
-            tagger_seq = [0, t_init + inter_init_mw + t_mw + inter_mw_read + pre_read, t_read_sig, inter_readout,
-                          t_read_ref, inter_period]
-        else:
-            # single-pulse readout (without reference readout)
-            laser_seq = [t_init, inter_init_mw + t_mw + inter_mw_read, pre_read + t_read_sig + inter_period, 0]
-            mw_seq = [0, t_init + inter_init_mw, t_mw, inter_mw_read + pre_read + t_read_sig + inter_period]
-            tagger_seq = [0, t_init + inter_init_mw + t_mw + inter_mw_read + pre_read, t_read_sig, inter_period]
-
-        sync_seq = [0, 0]
-        if self.use_lockin:
-            half_period = int(1 / self.sync_freq / 2 / C.nano)
-            sync_seq = [half_period, half_period]
-
-        self._conf_time_paras(sum(tagger_seq), N)
-        self.download_asg_sequences(
-            laser_seq=flip_sequence(laser_seq) if self.laser_ttl == 0 else laser_seq,
-            mw_seq=flip_sequence(mw_seq) if self.mw_ttl == 0 else mw_seq,
-            tagger_seq=flip_sequence(tagger_seq) if self.tagger_ttl == 0 else tagger_seq,
-            sync_seq=sync_seq
-        )
+        inter_mw_read = self._cache['inter_mw_read']
+        t_mw = Var('t')
+        return PulseProgram(Seq(
+            Pulse('laser', t_init),
+            Wait(inter_init_mw),
+            Pulse('mw', t_mw),
+            Wait(inter_mw_read),
+            self._readout_program()
+        ))
 
     def configure_odmr_seq(self, t_init, t_read_sig, inter_init_mw=1000, inter_mw_read=100,
                            pre_read=200, inter_readout=200, inter_period=200, N: int = 1000, *args, **kwargs):
@@ -215,58 +169,43 @@ class RelaxationScheduler(TimeDomainScheduler):
     T1 Relaxation measurement Scheduler
     """
 
+    _snapshot_attrs = TimeDomainScheduler._snapshot_attrs + ('ms',)
+
     def __init__(self, *args, **kwargs):
         super(RelaxationScheduler, self).__init__(*args, **kwargs)
         self.name = 'T1 Relaxation Scheduler'
         self.ms = kwargs.get('ms', 0)
 
-    def gene_detect_seq(self, t_free):
+    def pulse_program(self) -> PulseProgram:
         """
-        Generate T1 Relaxation detecting sequences and download it to ASG
-        :param t_free: free precession time (time duration of after MW pi pulse)
+        T1 Relaxation pulse program, with free precession time (time duration of after MW pi pulse) as variable `t`
         """
         t_init, t_mw = self._cache['t_init'], self._cache['t_mw']
-        inter_init_mw, pre_read = self._cache['inter_init_mw'], self._cache['pre_read']
+        inter_init_mw = self._cache['inter_init_mw']
         t_read_sig, t_read_ref = self._cache['t_read_sig'], self._cache['t_read_sig']
         inter_readout, inter_period = self._cache['inter_readout'], self._cache['inter_period']
-        N = self._cache['N']
+        t_free = Var('t')
 
         if self.ms == 1:
-            if self.two_pulse_readout:
-                # meaning t_read_ref is not None:
-                laser_seq = [t_init, inter_init_mw + t_mw + t_free,
-                             pre_read + t_read_sig + inter_readout + t_read_ref + inter_period, 0]
-                mw_seq = [0, t_init + inter_init_mw, t_mw,
-                          t_free + pre_read + t_read_sig + inter_readout + t_read_ref + inter_period]
-                tagger_seq = [0, t_init + inter_init_mw + t_mw + t_free + pre_read, t_read_sig, inter_readout,
-                              t_read_ref, inter_period]
-            else:
-                # single-pulse readout (without reference readout)
-                laser_seq = [t_init, inter_init_mw + t_mw + t_free, pre_read + t_read_sig + inter_period, 0]
-                mw_seq = [0, t_init + inter_init_mw, t_mw, t_free + pre_read + t_read_sig + inter_period]
-                tagger_seq = [0, t_init + inter_init_mw + t_mw + t_free + pre_read, t_read_sig, inter_period]
+            return PulseProgram(Seq(
+                Pulse('laser', t_init),
+                Wait(inter_init_mw),
+                Pulse('mw', t_mw),
+                Wait(t_free),
+                self._readout_program()
+            ))
         else:  # when measure Ms=0 T1, no MW operation
             if self.two_pulse_readout:
-                laser_seq = [t_init, t_free, t_read_sig + inter_readout + t_read_ref, inter_period]
-                mw_seq = [0, 0]
-                tagger_seq = [0, t_init + t_free, t_read_sig, inter_readout, t_read_ref, inter_period]
+                readout = Par(Pulse('laser', t_read_sig + inter_readout + t_read_ref),
+                              Seq(Pulse('tagger', t_read_sig), Wait(inter_readout), Pulse('tagger', t_read_ref)))
             else:
-                laser_seq = [t_init, t_free, t_read_sig, inter_period]
-                mw_seq = [0, 0]
-                tagger_seq = [0, t_init + t_free, t_read_sig, inter_period]
-
-        sync_seq = [0, 0]
-        if self.use_lockin:
-            half_period = int(1 / self.sync_freq / 2 / C.nano)
-            sync_seq = [half_period, half_period]
-
-        self._conf_time_paras(sum(tagger_seq), N)
-        self.download_asg_sequences(
-            laser_seq=flip_sequence(laser_seq) if self.laser_ttl == 0 else laser_seq,
-            mw_seq=flip_sequence(mw_seq) if self.mw_ttl == 0 else mw_seq,
-            tagger_seq=flip_sequence(tagger_seq) if self.tagger_ttl == 0 else tagger_seq,
-            sync_seq=sync_seq
-        )
+                readout = Pulse(['laser', 'tagger'], t_read_sig)
+            return PulseProgram(Seq(
+                Pulse('laser', t_init),
+                Wait(t_free),
+                readout,
+                Wait(inter_period)
+            ))
 
     def configure_odmr_seq(self, t_init, t_read_sig, inter_init_mw=10000, inter_readout=200,
                            pre_read=50, inter_period=200, N: int = 10000, *args, **kwargs):
@@ -323,66 +262,22 @@ class HahnEchoScheduler(TimeDomainScheduler):
         super(HahnEchoScheduler, self).__init__(*args, **kwargs)
         self.name = 'Hahn Echo Scheduler'
 
-    def gene_detect_seq(self, t_free):
+    def pulse_program(self) -> PulseProgram:
         """
-        Generate Hahn Echo sequences and download it to ASG
-        :param t_free: free precession time between neighbor the MW pi pulse and pi/2 pulse
+        Hahn Echo pulse program, with free precession time between neighbor the MW pi pulse and pi/2 pulse as
+        variable `t`
         """
         t_init, t_mw_half_pi = self._cache['t_init'], self._cache['t_mw_half_pi']
         inter_init_mw, inter_mw_read = self._cache['inter_init_mw'], self._cache['inter_mw_read']
-        t_read_sig, t_read_ref = self._cache['t_read_sig'], self._cache['t_read_sig']
-        pre_read = self._cache['pre_read']
-        inter_readout, inter_period = self._cache['inter_readout'], self._cache['inter_period']
-        N = self._cache['N']
         t_mw_pi = t_mw_half_pi * 2
-
-        # generate ASG wave forms
-        if self.two_pulse_readout:
-            laser_seq = [t_init,
-                         inter_init_mw + t_mw_half_pi * 2 + t_free * 2 + t_mw_pi + inter_mw_read,
-                         pre_read + t_read_sig + inter_readout + t_read_ref + inter_period, 0]
-            mw_seq = [0, t_init + inter_init_mw,
-                      t_mw_half_pi,
-                      t_free,
-                      t_mw_pi,
-                      t_free,
-                      t_mw_half_pi,
-                      inter_mw_read + pre_read + t_read_sig + inter_readout + t_read_ref + inter_period]
-            tagger_seq = [0,
-                          t_init + inter_init_mw + t_mw_half_pi * 2 + t_mw_pi + t_free * 2 + + inter_mw_read + pre_read,
-                          t_read_sig,
-                          inter_readout,
-                          t_read_ref,
-                          inter_period]
-        else:
-            # single-pulse readout (without reference readout)
-            laser_seq = [t_init,
-                         inter_init_mw + t_mw_half_pi * 2 + t_free * 2 + t_mw_pi + inter_mw_read,
-                         pre_read + t_read_sig + inter_period, 0]
-            mw_seq = [0, t_init + inter_init_mw,
-                      t_mw_half_pi,
-                      t_free,
-                      t_mw_pi,
-                      t_free,
-                      t_mw_half_pi,
-                      inter_mw_read + pre_read + t_read_sig + inter_period]
-            tagger_seq = [0,
-                          t_init + inter_init_mw + t_mw_half_pi * 2 + t_mw_pi + t_free * 2 + + inter_mw_read + pre_read,
-                          t_read_sig,
-                          inter_period]
-
-        sync_seq = [0, 0]
-        if self.use_lockin:
-            half_period = int(1 / self.sync_freq / 2 / C.nano)
-            sync_seq = [half_period, half_period]
-
-        self._conf_time_paras(sum(tagger_seq), N)
-        self.download_asg_sequences(
-            laser_seq=flip_sequence(laser_seq) if self.laser_ttl == 0 else laser_seq,
-            mw_seq=flip_sequence(mw_seq) if self.mw_ttl == 0 else mw_seq,
-            tagger_seq=flip_sequence(tagger_seq) if self.tagger_ttl == 0 else tagger_seq,
-            sync_seq=sync_seq
-        )
+        t_free = Var('t')
+        return PulseProgram(Seq(
+            Pulse('laser', t_init),
+            Wait(inter_init_mw),
+            Pulse('mw', t_mw_half_pi), Wait(t_free), Pulse('mw', t_mw_pi), Wait(t_free), Pulse('mw', t_mw_half_pi),
+            Wait(inter_mw_read),
+            self._readout_program()
+        ))
 
     def configure_odmr_seq(self, t_init, t_read_sig, inter_init_mw=3e3, inter_mw_read=200, pre_read=50,
                            inter_readout=200, inter_period=200, N: int = 100000, *args, **kwargs):
@@ -438,57 +333,24 @@ class HighDecouplingScheduler(TimeDomainScheduler):
         super(HighDecouplingScheduler, self).__init__(*args, **kwargs)
         self.name = 'High-order Dynamical Decoupling Scheduler'
 
-    def gene_detect_seq(self, t_free):
+    def pulse_program(self) -> PulseProgram:
         """
-        Generate high-order dynamic decoupling sequences and download it to ASG
-        :param t_free: free precession time between neighbor the MW pi pulse and pi/2 pulse
+        High-order dynamic decoupling pulse program, with free precession time between neighbor the MW pi pulse and
+        pi/2 pulse as variable `t`
         """
         t_init, t_mw_half_pi = self._cache['t_init'], self._cache['t_mw_half_pi']
         inter_init_mw, inter_mw_read = self._cache['inter_init_mw'], self._cache['inter_mw_read']
-        t_read_sig, t_read_ref = self._cache['t_read_sig'], self._cache['t_read_sig']
-        pre_read = self._cache['pre_read']
-        inter_readout, inter_period = self._cache['inter_readout'], self._cache['inter_period']
-        N = self._cache['N']
         t_mw_pi = t_mw_half_pi * 2
-        n = self.order
-
-        # generate ASG wave forms
-        if self.two_pulse_readout:
-            laser_seq = [t_init,
-                         inter_init_mw + (t_mw_pi + t_free) * (n + 1) + inter_mw_read,
-                         pre_read + t_read_sig + inter_readout + t_read_ref + inter_period, 0]
-            mw_seq = [0, t_init + inter_init_mw, t_mw_half_pi] + [t_free, t_mw_pi] * n + [t_free, t_mw_half_pi,
-                                                                                          inter_mw_read + pre_read + t_read_sig + inter_readout + t_read_ref + inter_period]
-            tagger_seq = [0,
-                          t_init + inter_init_mw + (t_mw_pi + t_free) * (n + 1) + + inter_mw_read + pre_read,
-                          t_read_sig,
-                          inter_readout,
-                          t_read_ref,
-                          inter_period]
-        else:
-            # single-pulse readout (without reference readout)
-            laser_seq = [t_init,
-                         inter_init_mw + (t_mw_pi + t_free) * (n + 1) + inter_mw_read,
-                         pre_read + t_read_sig + inter_period, 0]
-            mw_seq = [0, t_init + inter_init_mw, t_mw_half_pi] + [t_free, t_mw_pi] * n + [t_free, t_mw_half_pi,
-                                                                                          inter_mw_read + pre_read + t_read_sig + inter_period]
-            tagger_seq = [0,
-                          t_init + inter_init_mw + (t_mw_pi + t_free) * (n + 1) + + inter_mw_read + pre_read,
-                          t_read_sig,
-                          inter_period]
-
-        sync_seq = [0, 0]
-        if self.use_lockin:
-            half_period = int(1 / self.sync_freq / 2 / C.nano)
-            sync_seq = [half_period, half_period]
-
-        self._conf_time_paras(sum(tagger_seq), N)
-        self.download_asg_sequences(
-            laser_seq=flip_sequence(laser_seq) if self.laser_ttl == 0 else laser_seq,
-            mw_seq=flip_sequence(mw_seq) if self.mw_ttl == 0 else mw_seq,
-            tagger_seq=flip_sequence(tagger_seq) if self.tagger_ttl == 0 else tagger_seq,
-            sync_seq=sync_seq
-        )
+        t_free = Var('t')
+        return PulseProgram(Seq(
+            Pulse('laser', t_init),
+            Wait(inter_init_mw),
+            Pulse('mw', t_mw_half_pi),
+            Loop(self.order, Wait(t_free), Pulse('mw', t_mw_pi)),
+            Wait(t_free), Pulse('mw', t_mw_half_pi),
+            Wait(inter_mw_read),
+            self._readout_program()
+        ))
 
     def configure_odmr_seq(self, t_init, t_read_sig, inter_init_mw=3e3, inter_mw_read=200, pre_read=50,
                            inter_readout=200, inter_period=200, N: int = 100000, *args, **kwargs):
@@ -0,0 +1,193 @@
+"""
+Closed-loop resonance tracking for continuous magnetometry (and thermometry)
+---
+Instead of sweeping the whole spectrum, the MW frequency alternates between the two steepest points of each dip,
+f_c ± δ with δ = Γ / (2√3) for a Lorentzian of FWHM Γ. The normalized two-point contrast
+r = (S+ - S-) / (S+ + S-) ≈ -k Δ is linear in the detuning Δ of the resonance from f_c, where k is the relative
+slope at the operating points. Each cycle estimates Δ, re-centers f_c and emits a timestamped record of
+resonance frequencies, magnetic field and temperature shift.
+With two resonances (ms = 0 ↔ ±1), B = (f_2 - f_1) / (2 γ) and the zero-field splitting D = (f_1 + f_2) / 2 gives
+the temperature shift; with one resonance, B = (f_1 - D) / γ.
+
+Usage:
+    tracker = ResonanceTracker(scheduler, resonances=[2.84e9, 2.90e9], linewidth=8e6, contrast=0.2)
+    tracker.calibrate(span=40e6, step=1e6)
+    start_live_plot(tracker.buffer.name)
+    records = tracker.run(duration=60)
+"""
+
+import datetime
+import os
+import time
+import numpy as np
+from typing import List, Sequence
+from odmactor.utils import constants as C
+from odmactor.scheduler.base import FrequencyDomainScheduler
+from odmactor.utils.imaging import GAMMA_NV, fit_lorentzians
+from odmactor.utils.live import SharedRingBuffer
+
+ZFS_NV = 2.87e9  # zero-field splitting of NV ground state at room temperature, unit: Hz
+DZFS_DT = -74.2e3  # temperature dependence of zero-field splitting, unit: Hz/K
+
+
+class ResonanceTracker:
+    """
+    Closed-loop tracker of NV resonances, driving a configured frequency-domain scheduler (e.g. `CWScheduler`)
+    """
+
+    def __init__(self, scheduler: FrequencyDomainScheduler, resonances: Sequence[float], linewidth: float,
+                 contrast: float, gain: float = 1.0, zfs: float = ZFS_NV, capacity: int = 65536,
+                 fname: str = None):
+        """
+        :param scheduler: scheduler whose ODMR sequences and counter have been configured
+        :param resonances: initial resonance frequencies, one or two, unit: Hz
+        :param linewidth: FWHM of resonances, unit: Hz
+        :param contrast: relative depth of resonances
+        :param gain: feedback gain of re-centering, in (0, 1]
+        :param zfs: zero-field splitting, used for magnetic field with a single resonance, unit: Hz
+        :param capacity: number of records kept in the ring buffer
+        :param fname: CSV file of records; generated in the output directory of the scheduler by default
+        """
+        if not 1 <= len(resonances) <= 2:
+            raise ValueError('one or two resonances can be tracked')
+        self.scheduler = scheduler
+        self.centers = np.asarray(resonances, dtype=float)
+        self.linewidth = linewidth
+        self.contrast = contrast
+        self.gain = gain
+        self.zfs = zfs
+        self.fname = fname
+        self.fields = ['timestamp', 'b_field', 'temperature_shift'] + \
+                      ['freq_{}'.format(i + 1) for i in range(len(self.centers))]
+        self.buffer = SharedRingBuffer(capacity, len(self.fields))
+        self._zfs_start = None
+        self._running = False
+
+    @property
+    def offset(self) -> float:
+        """
+        Offset δ of the steepest points from the resonance center, unit: Hz
+        """
+        return self.linewidth / 2 / np.sqrt(3)
+
+    @property
+    def slope(self) -> float:
+        """
+        Relative slope k = S'(δ) / S(δ) at the operating points, unit: 1/Hz
+        """
+        hw, u = self.linewidth / 2, self.offset
+        lor = hw ** 2 / (u ** 2 + hw ** 2)
+        return self.contrast * 2 * u * lor / (u ** 2 + hw ** 2) / (1 - self.contrast * lor)
+
+    def _measure(self, freq: float) -> float:
+        """
+        Mean counts at a MW frequency
+        """
+        return float(np.mean(self.scheduler.acquire_point(freq)))
+
+    def calibrate(self, span: float = None, step: float = None) -> dict:
+        """
+        Sweep around each resonance and fit a Lorentzian, updating centers, linewidth and contrast
+        :param span: frequency span around each resonance, unit: Hz; 5 linewidths by default
+        :param step: frequency step, unit: Hz; 1/8 linewidth by default
+        :return: dict of 'centers', 'linewidth', 'contrast'
+        """
+        span = 5 * self.linewidth if span is None else span
+        step = self.linewidth / 8 if step is None else step
+        self.scheduler.start()
+        fits = []
+        for center in self.centers:
+            freqs = np.arange(center - span / 2, center + span / 2 + step / 2, step)
+            counts = np.array([self._measure(f) for f in freqs])
+            fits.append(fit_lorentzians(freqs, counts[None], n_dips=1, linewidth=self.linewidth))
+        self.scheduler.stop()
+        self.centers = np.array([fit['centers'][0, 0] for fit in fits])
+        self.linewidth = float(np.mean([fit['linewidth'][0] for fit in fits]))
+        self.contrast = float(np.mean([fit['contrast'][0, 0] for fit in fits]))
+        print('Calibrated resonances: {} GHz, linewidth: {:.3f} MHz, contrast: {:.3f}'.format(
+            ', '.join('{:.6f}'.format(f / C.giga) for f in self.centers), self.linewidth / C.mega, self.contrast))
+        return {'centers': self.centers.tolist(), 'linewidth': self.linewidth, 'contrast': self.contrast}
+
+    def step(self, reverse: bool = False) -> List[float]:
+        """
+        One tracking cycle: measure both operating points of each resonance and re-center
+        :param reverse: measure the lower operating point firstly, alternated between cycles to cancel linear drift
+        :return: record of fields `self.fields`
+        """
+        delta = self.offset
+        for i, center in enumerate(self.centers):
+            if reverse:
+                lower, upper = self._measure(center - delta), self._measure(center + delta)
+            else:
+                upper, lower = self._measure(center + delta), self._measure(center - delta)
+            r = (upper - lower) / (upper + lower)
+            detuning = np.clip(-r / self.slope, -delta, delta)
+            self.centers[i] = center + self.gain * detuning
+
+        if len(self.centers) == 2:
+            b_field = (self.centers[1] - self.centers[0]) / (2 * GAMMA_NV)
+            zfs = self.centers.mean()
+            if self._zfs_start is None:
+                self._zfs_start = zfs
+            temperature_shift = (zfs - self._zfs_start) / DZFS_DT
+        else:
+            b_field = (self.centers[0] - self.zfs) / GAMMA_NV
+            temperature_shift = np.nan
+        return [time.time(), b_field, temperature_shift] + self.centers.tolist()
+
+    def _gene_fname(self) -> str:
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        sub_dir = os.path.join(self.scheduler.output_dir, str(datetime.date.today()))
+        if not os.path.exists(sub_dir):
+            os.mkdir(sub_dir)
+        return os.path.join(sub_dir, 'Tracking-{}.csv'.format(timestamp))
+
+    def run(self, duration: float = None, n_cycles: int = None, flush_every: int = 100) -> np.ndarray:
+        """
+        Track resonances until `duration` elapses, `n_cycles` finish, `stop()` is called or KeyboardInterrupt
+        Records are written into the ring buffer `self.buffer` and appended to the CSV file `self.fname`
+        :param duration: tracking time, unit: s
+        :param n_cycles: number of tracking cycles
+        :param flush_every: number of records between flushes of the CSV file
+        :return: records of this run, in shape of [n, len(self.fields)]
+        """
+        if self.fname is None:
+            self.fname = self._gene_fname()
+        new_file = not os.path.exists(self.fname)
+        start, cursor = time.time(), self.buffer.count
+        print('Begin to track {} resonance(s), records saved into {}'.format(len(self.centers), self.fname))
+        self.scheduler.start()
+        self._running = True
+        n = 0
+        with open(self.fname, 'a') as f:
+            if new_file:
+                f.write(','.join(self.fields) + '\n')
+            try:
+                while self._running:
+                    if n_cycles is not None and n >= n_cycles:
+                        break
+                    if duration is not None and time.time() - start >= duration:
+                        break
+                    record = self.step(reverse=bool(n % 2))
+                    self.buffer.write(record)
+                    f.write(','.join(repr(float(v)) for v in record) + '\n')
+                    n += 1
+                    if n % flush_every == 0:
+                        f.flush()
+            except KeyboardInterrupt:
+                print('Tracking interrupted')
+            finally:
+                self._running = False
+                self.scheduler.stop()
+        print('finished tracking: {} cycles in {:.2f} s'.format(n, time.time() - start))
+        return self.buffer.read(cursor)[0]
+
+    def stop(self):
+        """
+        Stop tracking after the current cycle, e.g., from another thread
+        """
+        self._running = False
+
+    def close(self):
+        self.buffer.close()
+        self.buffer.release()
@@ -0,0 +1,271 @@
+"""
+Count-rate watchdog of long scans, with automatic refocus
+---
+Count rates are monitored either by a lightweight Time Tagger `Countrate` measurement polled from a background thread
+('countrate'), or by the mean counts of each acquired detection point ('points', e.g., with the ASG built-in counter).
+A rate is abnormal if it is zero, above the saturation of the detector, or below a ratio of the baseline learned at
+the beginning of the scan. After each detection point, the scanning loop asks the watchdog; on an alarm the scan is
+paused: a drop is recovered by refocusing on the emitter with golden-section searches along X, Y and Z of a stage,
+saturation by waiting. If the rate is normal again, the latest point is measured again and the scan resumes,
+otherwise the scan is aborted and the points acquired so far are kept.
+
+Usage:
+    watchdog = scheduler.enable_watchdog(stage=PiezoStage(), drop_ratio=0.6)
+    scheduler.run_scanning()
+    print(watchdog.summary())
+"""
+
+import datetime
+import threading
+import time
+import numpy as np
+from typing import Callable, List, Optional, Sequence, Tuple
+
+GOLDEN = (5 ** 0.5 - 1) / 2
+
+
+def golden_section_max(func: Callable[[float], float], a: float, b: float, tol: float) -> Tuple[float, float]:
+    """
+    Maximize a unimodal function on [a, b] by golden-section search
+    :param tol: final width of the bracket
+    :return: (argument, value) of the best evaluation
+    """
+    c, d = b - GOLDEN * (b - a), a + GOLDEN * (b - a)
+    fc, fd = func(c), func(d)
+    best = max((fc, c), (fd, d))
+    while b - a > tol:
+        if fc >= fd:
+            b, d, fd = d, c, fc
+            c = b - GOLDEN * (b - a)
+            fc = func(c)
+            best = max(best, (fc, c))
+        else:
+            a, c, fc = c, d, fd
+            d = a + GOLDEN * (b - a)
+            fd = func(d)
+            best = max(best, (fd, d))
+    return best[1], best[0]
+
+
+def refocus(stage, measure: Callable[[], float], spans: Sequence[float] = (1.0, 1.0, 3.0),
+            tols: Sequence[float] = (0.02, 0.02, 0.1), n_rounds: int = 2) -> Tuple[Tuple[float, ...], float]:
+    """
+    Maximize the count rate by golden-section searches along X, Y and Z in turn, around the current position
+    Spans are halved in each subsequent round
+    :param stage: stage providing `position` and `move_to(x, y, z)`, unit: um
+    :param measure: function measuring the count rate at the current position
+    :param spans: half widths of the searched ranges, unit: um
+    :param tols: final bracket widths, unit: um
+    :param n_rounds: rounds over the three axes
+    :return: (position, count rate) of the best evaluation, where the stage is finally moved to
+    """
+    position = [float(v) for v in stage.position]
+    best = measure()
+    for k in range(n_rounds):
+        for axis in range(3):
+            def rate_at(v: float) -> float:
+                p = list(position)
+                p[axis] = v
+                stage.move_to(*p)
+                return measure()
+
+            span = spans[axis] / 2 ** k
+            v, rate = golden_section_max(rate_at, position[axis] - span, position[axis] + span, tols[axis])
+            if rate >= best:
+                position[axis], best = v, rate
+    stage.move_to(*position)
+    return tuple(position), best
+
+
+class CountRateWatchdog:
+    """
+    Watchdog of count rates of a scheduler, pausing its scans to recover from drops, saturation or zero counts
+    """
+
+    def __init__(self, scheduler, stage=None, source: str = 'countrate', baseline: float = None,
+                 drop_ratio: float = 0.6, saturation: float = 1e7, patience: int = 2, interval: float = 0.2,
+                 n_baseline: int = 5, probe_time: float = 0.05, spans: Sequence[float] = (1.0, 1.0, 3.0),
+                 tols: Sequence[float] = (0.02, 0.02, 0.1), n_rounds: int = 2, settle: float = 1.0,
+                 max_recoveries: int = 3):
+        """
+        :param scheduler: scheduler whose scans are watched
+        :param stage: 3-D stage used for refocusing, e.g., `PiezoStage`; without it drops are only re-measured
+        :param source: 'countrate' (Time Tagger `Countrate` on the APD channel) or 'points' (means of points)
+        :param baseline: normal count rate, unit: counts/s; learned at the beginning of scans by default
+        :param drop_ratio: rates below `drop_ratio` × baseline are drops
+        :param saturation: rates not below it saturate the detector, unit: counts/s
+        :param patience: consecutive abnormal `Countrate` samples raising an alarm; each point is judged alone
+        :param interval: sampling interval of `Countrate`, unit: s; shorter than detection points, so that only the
+                        latest point is affected when an alarm is raised
+        :param n_baseline: number of normal samples (or points) of which the median is the baseline
+        :param probe_time: measurement time of each refocus probe with `Countrate`, unit: s; with 'points', each probe
+                        is an acquisition of the scheduler
+        :param spans: half widths of refocus ranges along X, Y and Z, unit: um
+        :param tols: refocus precision along X, Y and Z, unit: um
+        :param n_rounds: refocus rounds over the three axes
+        :param settle: waiting time before re-measuring saturated rates, unit: s
+        :param max_recoveries: maximal recoveries of a single point before aborting
+        """
+        if source not in ('countrate', 'points'):
+            raise ValueError('unsupported source "{}"'.format(source))
+        if source == 'countrate' and scheduler.tagger is None:
+            print('Time Tagger not found, watching count rates of detection points')
+            source = 'points'
+        self.scheduler = scheduler
+        self.stage = stage
+        self.source = source
+        self.baseline = baseline
+        self.drop_ratio = drop_ratio
+        self.saturation = saturation
+        self.patience = patience
+        self.interval = interval
+        self.n_baseline = n_baseline
+        self.probe_time = probe_time
+        self.spans = spans
+        self.tols = tols
+        self.n_rounds = n_rounds
+        self.settle = settle
+        self.max_recoveries = max_recoveries
+        self.rate = np.nan  # latest sampled count rate, unit: counts/s
+        self.events: List[dict] = []  # alarms and their recoveries
+        self.aborted: Optional[str] = None  # reason of aborting the latest scan
+        self._learn_baseline = baseline is None
+        self._samples = []
+        self._bad = 0
+        self._alarm: Optional[Tuple[str, float]] = None  # (reason, rate), set by the polling thread
+        self._countrate = None
+        self._lock = threading.Lock()  # guarding the `Countrate` measurement, shared by polling and refocusing
+        self._paused = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def classify(self, rate: float) -> Optional[str]:
+        """
+        Reason why a rate is abnormal: 'zero', 'saturation' or 'drop'; None if normal or the baseline is unknown
+        """
+        if not rate > 0:
+            return 'zero'
+        if rate >= self.saturation:
+            return 'saturation'
+        if self.baseline is not None and rate < self.drop_ratio * self.baseline:
+            return 'drop'
+        return None
+
+    def _evaluate(self, rate: float, patience: int) -> Optional[str]:
+        """
+        Judge a sampled rate, learning the baseline from normal ones; raise an alarm after `patience` abnormal ones
+        """
+        self.rate = rate
+        reason = self.classify(rate)
+        if reason is None:
+            self._bad = 0
+            if self._learn_baseline and len(self._samples) < self.n_baseline:
+                self._samples.append(rate)
+                self.baseline = float(np.median(self._samples)) if len(self._samples) == self.n_baseline else None
+            return None
+        self._bad += 1
+        if self._bad >= patience:
+            self._alarm = (reason, rate)
+        return reason
+
+    def measure_rate(self, duration: float = None) -> float:
+        """
+        Measure the current count rate, unit: counts/s
+        :param duration: measurement time with `Countrate`, `probe_time` by default; ignored with 'points'
+        """
+        s = self.scheduler
+        if self._countrate is None:
+            data = s.acquire_point()
+            return float(data.sum() / s.asg_dwell) if s.asg_dwell > 0 else np.nan
+        with self._lock:
+            self._countrate.clear()
+            time.sleep(self.probe_time if duration is None else duration)
+            return float(self._countrate.getData()[0])
+
+    def _poll(self):
+        while not self._stopped.is_set():
+            if self._paused.is_set():
+                self._stopped.wait(self.interval)
+                continue
+            self._evaluate(self.measure_rate(self.interval), self.patience)
+
+    def start(self):
+        """
+        Start watching a scan, resetting alarms and (if not given) the baseline
+        """
+        s = self.scheduler
+        self.aborted = None
+        self._alarm, self._bad = None, 0
+        if self._learn_baseline:
+            self.baseline, self._samples = None, []
+        if self.source == 'countrate':
+            self._countrate = s._tagger_backend().Countrate(s.tagger, [s.tagger_input['apd']])
+            self._stopped.clear()
+            self._paused.clear()
+            self._thread = threading.Thread(target=self._poll, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._countrate is not None:
+            self._countrate.stop()
+            self._countrate = None
+
+    def check(self, point_rate: float) -> Optional[str]:
+        """
+        Called by the scanning loop after each detection point
+        :param point_rate: count rate of the point, used with 'points'
+        :return: reason of the alarm, None if no alarm
+        """
+        if self.source == 'points':
+            self._evaluate(point_rate, 1)
+        return self._alarm[0] if self._alarm is not None else None
+
+    def recover(self, reason: str) -> bool:
+        """
+        Pause polling and try to recover normal count rates: refocus on drops, wait on saturation
+        Laser is kept on (free-running ASG) and MW output off meanwhile
+        :return: whether the count rate is normal again
+        """
+        s = self.scheduler
+        rate_before = self._alarm[1] if self._alarm is not None else self.rate
+        self._paused.set()
+        mw_on = getattr(s.mw, 'output', True)
+        position = None
+        try:
+            if mw_on:
+                s.mw.stop()
+            if s.armed_start:
+                s.asg.start()
+            if reason == 'saturation' or self.stage is None:
+                time.sleep(self.settle)
+            else:
+                print('Refocusing after a count-rate {} ({:.3g} counts/s)'.format(reason, rate_before))
+                position, _ = refocus(self.stage, self.measure_rate, self.spans, self.tols, self.n_rounds)
+            rate = self.measure_rate(max(self.probe_time, self.interval))
+        finally:
+            if mw_on:
+                s.mw.start()
+            self._alarm, self._bad = None, 0
+            self._paused.clear()
+        recovered = self.classify(rate) is None
+        self.rate = rate
+        self.events.append({
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'reason': reason,
+            'rate_before': rate_before,
+            'rate_after': rate,
+            'position': position,
+            'recovered': recovered,
+        })
+        print('Count rate {} ({:.3g} counts/s)'.format('recovered' if recovered else 'not recovered', rate))
+        return recovered
+
+    def summary(self) -> dict:
+        """
+        Baseline, alarm events and the reason of aborting (None if not aborted) of watched scans
+        """
+        return {'source': self.source, 'baseline': self.baseline, 'events': self.events, 'aborted': self.aborted}
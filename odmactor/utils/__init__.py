@@ -2,4 +2,4 @@
 Utils functions
 """
 
-from odmactor.utils.utils import cut_edge_zeros, cal_contrast, dBm_to_mW, mW_to_dBm
+from odmactor.utils.utils import cut_edge_zeros, cal_contrast, dBm_to_mW, mW_to_dBm, local_state_path
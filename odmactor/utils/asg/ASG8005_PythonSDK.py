@@ -141,7 +141,7 @@ class ASG8005:
 
     def download_ASG_pulse_data(self, asg_data, length):
         if True != self.checkdata(asg_data, length):
-            exit(" ASG Data  error !")
+            raise ValueError(" ASG Data  error !")
         c_length = (c_int * 8)(*tuple(length))
         max = 0
         for i in range(8):
@@ -151,6 +151,13 @@ class ASG8005:
         c_asg_data = (POINTER(c_double) * len(c_asg_data))(*c_asg_data)
         return self.__dll.pulse_download(c_asg_data, c_length)
 
+    def download_ASG_pulse_pointers(self, c_asg_data, c_length):
+        """
+        Download pulse data without marshalling: `c_asg_data` is an array of 8 pointers to double buffers,
+        `c_length` an array of 8 lengths; data must be checked by the caller
+        """
+        return self.__dll.pulse_download(c_asg_data, c_length)
+
     def ASG_trigger_download(self):
         return self.__dll.trigger_download()
 
@@ -182,7 +189,7 @@ class ASG8005:
 
     def ASG_counter_download(self, count_data, length):
         if True != self.checkCountData(count_data, length):
-            exit(" Count Data  error !")
+            raise ValueError(" Count Data  error !")
         m_CountCount = 1
         count_data = (c_int * len(count_data))(*tuple(count_data))
         return self.__dll.counter_download(count_data, length)
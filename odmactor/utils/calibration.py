@@ -0,0 +1,261 @@
+"""
+Persistent calibrations of instruments and sequences
+---
+1. Pi-pulse table: pi-pulse times measured (by Rabi oscillation) at several MW frequencies and powers. A pi time at
+other settings is interpolated from entries that are still valid, i.e., measured recently and close enough in
+frequency and power. Interpolation works on the residual r = ln(t) + P ln(10) / 20 from the ideal scaling
+t ∝ 1 / √(P_mW), which varies slowly with frequency and power (MW transmission, amplifier compression), so that
+a few entries suffice.
+2. Switching delays: photon-arrival histograms (relative to ASG period starts) of a laser pulse, of a laser pulse
+after a MW pi pulse, and of a MW pulse under continuous laser give the delays of laser (AOM and APD) and MW
+switch, laser rise time, spin polarization time and the optimal readout window. Delays are relative to detected
+photons, so that shifting laser and MW channels earlier by them aligns all channels with the tagger channel.
+"""
+
+import datetime
+import json
+import os
+import numpy as np
+from typing import List, Optional, Tuple
+from odmactor.utils.utils import local_state_path
+
+_LN10_20 = np.log(10) / 20
+
+
+class PiPulseCalibration:
+    """
+    Calibration table of pi-pulse times versus MW frequency and power, persisted locally
+    """
+
+    def __init__(self, fname: str = None, max_age: float = 24 * 3600, freq_window: float = 50e6,
+                 power_window: float = 3.0):
+        """
+        :param fname: file persisting the table, "pi_pulse.json" in the local state directory by default
+        :param max_age: validity of an entry since its measurement, unit: s
+        :param freq_window: maximal frequency distance from the nearest valid entry, unit: Hz
+        :param power_window: maximal power distance from the nearest valid entry, unit: dB
+        """
+        self.fname = fname
+        self.max_age = max_age
+        self.freq_window = freq_window
+        self.power_window = power_window
+        self._entries = None
+        self._interp = None  # cached (timestamps of valid entries, points, linear, nearest interpolators)
+
+    @property
+    def entries(self) -> List[dict]:
+        """
+        Entries of 'freq' (Hz), 'power' (dBm), 'time' (s) and 'timestamp' (ISO)
+        """
+        if self._entries is None:
+            if self.fname is None:
+                self.fname = local_state_path('pi_pulse.json')
+            try:
+                with open(self.fname, 'r') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = []
+        return self._entries
+
+    def add(self, freq: float, power: float, time: float, timestamp: str = None):
+        """
+        Add a measured pi-pulse time and persist the table; an entry at the same setting is replaced
+        :param freq: MW frequency, unit: Hz
+        :param power: MW power, unit: dBm
+        :param time: pi-pulse time, unit: s
+        :param timestamp: ISO timestamp of measurement, now by default
+        """
+        entries = [e for e in self.entries if not (e['freq'] == freq and e['power'] == power)]
+        entries.append({'freq': float(freq), 'power': float(power), 'time': float(time),
+                        'timestamp': timestamp or datetime.datetime.now().isoformat(timespec='seconds')})
+        self._entries = entries
+        self._interp = None
+        try:
+            tmp = self.fname + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(entries, f, indent=2)
+            os.replace(tmp, self.fname)
+        except OSError as e:
+            print('Pi-pulse calibration cannot be saved: {}'.format(e))
+
+    def _valid(self, now: datetime.datetime) -> List[dict]:
+        oldest = now - datetime.timedelta(seconds=self.max_age)
+        return [e for e in self.entries if datetime.datetime.fromisoformat(e['timestamp']) >= oldest]
+
+    def _interpolators(self, now: datetime.datetime):
+        """
+        Interpolators of residuals over valid entries, rebuilt when entries change or expire
+        """
+        valid = self._valid(now)
+        key = [e['timestamp'] for e in valid]
+        if self._interp is not None and self._interp[0] == key:
+            return self._interp[1:]
+        from scipy.interpolate import LinearNDInterpolator, NearestNDInterpolator
+        points = np.array([[e['freq'] / self.freq_window, e['power'] / self.power_window] for e in valid])
+        residuals = np.array([np.log(e['time']) + e['power'] * _LN10_20 for e in valid])
+        linear = nearest = None
+        if len(valid):
+            nearest = NearestNDInterpolator(points, residuals)
+            # triangulation needs entries not all collinear, e.g., not all at one frequency
+            if len(valid) >= 3 and np.linalg.matrix_rank(points - points.mean(axis=0), tol=1e-9) == 2:
+                linear = LinearNDInterpolator(points, residuals)
+        self._interp = (key, points, linear, nearest)
+        return self._interp[1:]
+
+    def lookup(self, freq: float, power: float) -> Optional[float]:
+        """
+        Interpolated pi-pulse time
+        :param freq: MW frequency, unit: Hz
+        :param power: MW power, unit: dBm
+        :return: pi-pulse time (unit: s), or None if no valid entry is within the frequency and power windows
+        """
+        points, linear, nearest = self._interpolators(datetime.datetime.now())
+        if nearest is None:
+            return None
+        q = np.array([freq / self.freq_window, power / self.power_window])
+        if np.min(np.max(np.abs(points - q), axis=1)) > 1:
+            return None
+        r = float(linear(*q)) if linear is not None else np.nan
+        if not np.isfinite(r):  # outside of the convex hull of entries
+            r = float(nearest(*q))
+        return float(np.exp(r - power * _LN10_20))
+
+    def is_stale(self, freq: float, power: float) -> bool:
+        """
+        Whether a new measurement is necessary at a setting
+        """
+        return self.lookup(freq, power) is None
+
+
+def _smooth(y: np.ndarray, n: int) -> np.ndarray:
+    return np.convolve(y, np.ones(n) / n, mode='same') if n > 1 else y
+
+
+def _crossing(times: np.ndarray, y: np.ndarray, level: float, start: float, rising: bool) -> float:
+    """
+    First time not before `start` at which `y` crosses `level` upwards (or downwards), linearly interpolated
+    """
+    i0 = int(np.searchsorted(times, start))
+    above = y[i0:] >= level
+    idx = np.flatnonzero(above if rising else ~above)
+    if not len(idx):
+        return np.nan
+    i = i0 + idx[0]
+    if i == 0:
+        return float(times[0])
+    y0, y1 = y[i - 1], y[i]
+    frac = (level - y0) / (y1 - y0) if y1 != y0 else 0.0
+    return float(times[i - 1] + frac * (times[i] - times[i - 1]))
+
+
+def _onset(times: np.ndarray, y: np.ndarray, base: float, floor: float, t_start: float, t_mid: float) -> float:
+    """
+    Onset of an exponential step response of `y` from `base` towards `floor`, fitted around its edge
+    :param t_start: time before the onset, unit: ns
+    :param t_mid: time of the half crossing of the response, unit: ns
+    """
+    from scipy.optimize import curve_fit
+
+    def response(t, t0, amplitude, tau):
+        return base - amplitude * (1 - np.exp(-np.clip(t - t0, 0, None) / max(tau, 1e-3)))
+
+    tau0 = max(t_mid - t_start, 1.0)
+    window = (times >= t_start - 5 * tau0) & (times <= t_mid + 5 * tau0)
+    try:
+        popt, _ = curve_fit(response, times[window], y[window], p0=[t_start + tau0 / 2, base - floor, tau0],
+                            maxfev=5000)
+    except RuntimeError:
+        return np.nan
+    return float(popt[0])
+
+
+def analyze_delays(times: np.ndarray, laser_only: np.ndarray, with_pi: np.ndarray, mw_gated: np.ndarray,
+                   laser_edges: Tuple[float, float], mw_edge: float, smooth: int = 16) -> dict:
+    """
+    Analyze photon-arrival histograms of delay calibration
+    :param times: bin times relative to period starts, unit: ns
+    :param laser_only: histogram of a laser pulse
+    :param with_pi: histogram of the same laser pulse after a MW pi pulse in the dark
+    :param mw_gated: histogram of a MW pulse under continuous laser
+    :param laser_edges: commanded (rising, falling) edges of the laser pulse, unit: ns
+    :param mw_edge: commanded rising edge of the MW pulse, unit: ns
+    :param smooth: width of moving average applied to histograms, unit: bins
+    :return: dict of 'laser_delay', 'laser_rise', 'laser_fall', 'mw_delay', 'polarization_time' and
+            'readout_window', unit: ns
+    """
+    times = np.asarray(times, dtype=float)
+    a = _smooth(np.asarray(laser_only, dtype=float), smooth)
+    b = _smooth(np.asarray(with_pi, dtype=float), smooth)
+    c = _smooth(np.asarray(mw_gated, dtype=float), smooth)
+
+    # laser: 10%, 50% and 90% crossings of the rising edge, 50% crossing of the falling edge
+    on, off = laser_edges
+    bright = (times > on) & (times < off)
+    high = np.median(a[bright][len(a[bright]) // 2:])
+    low = np.median(a[times < on][smooth:]) if np.any(times < on) else 0.0
+    t10, t50, t90 = [_crossing(times, a, low + frac * (high - low), on, True) for frac in (0.1, 0.5, 0.9)]
+    fall90, fall10 = [_crossing(times, a, low + frac * (high - low), off, False) for frac in (0.9, 0.1)]
+
+    # spin readout: difference of fluorescence without and with pi pulse, after the laser onset
+    diff = a - b
+    after = times >= t50
+    peak = int(np.argmax(np.where(after, diff, -np.inf)))
+    polarization = _crossing(times, diff, 0.1 * diff[peak], times[peak], False) - t50
+    # optimal readout window maximizes accumulated contrast over its shot noise
+    i0 = int(np.searchsorted(times, t50))
+    end = int(np.searchsorted(times, off + (t50 - on)))
+    signal = np.cumsum(diff[i0:end])
+    noise = np.sqrt(np.cumsum(a[i0:end] + b[i0:end]))
+    window = float(times[i0 + int(np.argmax(signal / np.maximum(noise, 1e-12)))] - times[i0])
+
+    # MW switch: onset of the fluorescence decrease under continuous laser, fitted by an exponential response of the
+    # spin, since threshold crossings would include its response time
+    before = (times < mw_edge) & (times > mw_edge - 1000)
+    base = np.median(c[before]) if np.any(before) else np.median(c)
+    floor = np.min(c[(times > mw_edge) & (times < mw_edge + 1000)])
+    t_mid = _crossing(times, c, base - 0.5 * (base - floor), mw_edge, False)
+    mw_onset = _onset(times, np.asarray(mw_gated, dtype=float), base, floor, mw_edge, t_mid)
+
+    return {
+        'laser_delay': t50 - on,
+        'laser_rise': t90 - t10,
+        'laser_fall': fall10 - fall90,
+        'mw_delay': mw_onset - mw_edge,
+        'polarization_time': polarization,
+        'readout_window': window,
+    }
+
+
+def _round_up(t: float, margin: float, resolution: float) -> float:
+    return float(np.ceil((max(t, 0) + margin) / resolution) * resolution)
+
+
+def compact_paddings(delays: dict, margin: float = 20, resolution: float = 10) -> dict:
+    """
+    Minimal safe sequence paddings once laser and MW channels are shifted to compensate their delays
+    Laser initialization and readout times are experiment parameters, only suggested by `suggest_timings()`
+    :param delays: result of `analyze_delays()`
+    :param margin: safety margin of each padding, unit: ns
+    :param resolution: paddings are rounded up to multiples of it, unit: ns
+    :return: dict of 'inter_init_mw', 'inter_mw_read', 'pre_read', 'inter_period' (ns)
+    """
+    return {
+        'inter_init_mw': _round_up(delays['laser_fall'], margin, resolution),
+        'inter_mw_read': _round_up(0, margin, resolution),
+        'pre_read': _round_up(delays['laser_rise'] / 2 - margin, margin, resolution),
+        'inter_period': _round_up(0, margin, resolution),
+    }
+
+
+def suggest_timings(delays: dict, margin: float = 20, resolution: float = 10) -> dict:
+    """
+    Suggested laser initialization time (polarization after the laser rise) and readout window
+    :param delays: result of `analyze_delays()`
+    :param margin: safety margin of initialization, unit: ns
+    :param resolution: times are rounded up to multiples of it, unit: ns
+    :return: dict of 't_init', 't_read_sig' (ns)
+    """
+    return {
+        't_init': _round_up(delays['polarization_time'] + delays['laser_rise'], margin, resolution),
+        't_read_sig': _round_up(delays['readout_window'] - margin, margin, resolution),
+    }
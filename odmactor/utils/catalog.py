@@ -0,0 +1,225 @@
+"""
+Indexed local catalog of measurement results
+---
+Saved results are recorded into an embedded SQLite database: scheduler name, sweep axis, sequence parameters,
+MW configuration, pi pulse and file locations. Arrays of results are stored as ".npy" files next to the JSON file,
+while raw counts are referred to where they are already saved (the JSON file, or compact ".odmc" files), so that
+a query returns lazy records whose arrays are memory-mapped (or decoded chunk by chunk) only when accessed.
+
+Usage:
+    catalog = ResultCatalog()
+    runs = catalog.query(scheduler='Ramsey Scheduler', since='2023-01-01', t_init=5000)
+    counts = runs[0]['counts']  # memory-mapped array
+"""
+
+import contextlib
+import datetime
+import json
+import os
+import sqlite3
+import numpy as np
+from typing import Dict, List, Any, Union
+from odmactor.utils.utils import local_state_path
+from odmactor.utils.codec import CountArchive, encode_counts, is_counts, load_counts
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    scheduler TEXT NOT NULL,
+    axis TEXT,
+    axis_start REAL,
+    axis_stop REAL,
+    n_points INTEGER,
+    with_ref INTEGER,
+    mw_freq REAL,
+    mw_power REAL,
+    pi_freq REAL,
+    pi_power REAL,
+    pi_time REAL,
+    params TEXT,
+    fname TEXT UNIQUE,
+    arrays TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_scheduler_timestamp ON runs (scheduler, timestamp);
+CREATE INDEX IF NOT EXISTS runs_timestamp ON runs (timestamp);
+'''
+
+_COLUMNS = ['id', 'timestamp', 'scheduler', 'axis', 'axis_start', 'axis_stop', 'n_points', 'with_ref', 'mw_freq',
+            'mw_power', 'pi_freq', 'pi_power', 'pi_time', 'params', 'fname', 'arrays']
+
+
+def save_arrays(dirname: str, arrays: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Save arrays as ".npy" files into a directory; ragged or non-numeric values are skipped
+    Raw counts (names starting with "origin_data") are encoded compactly as ".odmc" files
+    :return: mapping from array names to file paths
+    """
+    os.makedirs(dirname, exist_ok=True)
+    paths = {}
+    for name, value in arrays.items():
+        try:
+            arr = np.asarray(value)
+        except ValueError:  # ragged nested lists
+            continue
+        if arr.dtype == object or arr.size == 0:
+            continue
+        if name.startswith('origin_data') and is_counts(arr):
+            path = os.path.join(dirname, name + '.odmc')
+            encode_counts(path, arr)
+            paths[name] = path
+            continue
+        path = os.path.join(dirname, name + '.npy')
+        np.save(path, arr)
+        paths[name] = path
+    return paths
+
+
+class RunRecord:
+    """
+    Lazy record of a cataloged run; arrays are memory-mapped on first access
+    """
+
+    def __init__(self, row: sqlite3.Row):
+        self._row = row
+        self._arrays = {}
+
+    def __getattr__(self, name: str):
+        if name.startswith('_') or name not in _COLUMNS:
+            raise AttributeError(name)
+        return self._row[name]
+
+    def __repr__(self):
+        return 'RunRecord(id={}, scheduler={!r}, timestamp={!r}, n_points={})'.format(
+            self.id, self.scheduler, self.timestamp, self.n_points)
+
+    @property
+    def params(self) -> dict:
+        return json.loads(self._row['params'] or '{}')
+
+    @property
+    def array_names(self) -> List[str]:
+        return list(json.loads(self._row['arrays'] or '{}'))
+
+    def __getitem__(self, name: str) -> Union[np.ndarray, CountArchive]:
+        """
+        Memory-mapped array, or a `CountArchive` decoding chunks of accessed rows for encoded raw counts;
+        arrays referred to as "<file>.json#<key>" are loaded from the JSON result file
+        """
+        if name not in self._arrays:
+            paths = json.loads(self._row['arrays'] or '{}')
+            if name not in paths:
+                raise KeyError('no array "{}" in run {}'.format(name, self.id))
+            path, _, key = paths[name].partition('#')
+            if key:
+                with open(path, 'r') as f:
+                    self._arrays[name] = np.asarray(json.load(f)[key])
+            elif path.endswith('.odmc'):
+                self._arrays[name] = CountArchive(path)
+            else:
+                self._arrays[name] = np.load(path, mmap_mode='r')
+        return self._arrays[name]
+
+    def load_json(self) -> dict:
+        """
+        Load the full JSON result file, decoding raw counts stored in separate files
+        """
+        with open(self._row['fname'], 'r') as f:
+            detail = json.load(f)
+        for key, value in detail.items():
+            if isinstance(value, dict) and value.get('codec') == 'odmc':
+                detail[key] = load_counts(value['file'])
+        return detail
+
+
+class ResultCatalog:
+    """
+    SQLite catalog of measurement results
+    """
+
+    def __init__(self, fname: str = None):
+        """
+        :param fname: database file, "catalog.sqlite" in the local state directory by default
+        """
+        self.fname = fname
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.fname is None:
+            self.fname = local_state_path('catalog.sqlite')
+        conn = sqlite3.connect(self.fname)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            conn.executescript(_SCHEMA)
+            self._initialized = True
+        return conn
+
+    def record(self, scheduler: str, fname: str, axis: str = None, xs=None, with_ref: bool = None,
+               mw_conf: dict = None, pi_pulse: dict = None, params: dict = None, arrays: Dict[str, str] = None,
+               timestamp: str = None) -> int:
+        """
+        Record a run; a run of the same result file is updated instead of being recorded twice
+        :param scheduler: scheduler name
+        :param fname: result file
+        :param axis: name of the sweep axis, e.g., 'freqs' or 'times'
+        :param xs: values of the sweep axis
+        :param with_ref: whether reference signals were acquired
+        :param mw_conf: MW configuration, i.e., {'freq': ..., 'power': ...}
+        :param pi_pulse: pi pulse, i.e., {'freq': ..., 'power': ..., 'time': ...}
+        :param params: sequence parameters and other JSON-serializable settings
+        :param arrays: mapping from array names to ".npy" (or ".odmc") file paths, or "<file>.json#<key>"
+        :param timestamp: ISO timestamp, now by default
+        :return: id of the run
+        """
+        mw_conf, pi_pulse = mw_conf or {}, pi_pulse or {}
+        xs = [] if xs is None else xs
+        row = (timestamp or datetime.datetime.now().isoformat(timespec='seconds'), scheduler, axis,
+               float(xs[0]) if len(xs) else None, float(xs[-1]) if len(xs) else None, len(xs),
+               None if with_ref is None else int(with_ref), mw_conf.get('freq'), mw_conf.get('power'),
+               pi_pulse.get('freq'), pi_pulse.get('power'), pi_pulse.get('time'),
+               json.dumps(params or {}, default=str), os.path.abspath(fname), json.dumps(arrays or {}))
+        with contextlib.closing(self._connect()) as conn, conn:
+            conn.execute('INSERT INTO runs ({}) VALUES ({}) ON CONFLICT (fname) DO UPDATE SET {}'.format(
+                ', '.join(_COLUMNS[1:]), ', '.join('?' * (len(_COLUMNS) - 1)),
+                ', '.join('{0} = excluded.{0}'.format(c) for c in _COLUMNS[1:])), row)
+            return conn.execute('SELECT id FROM runs WHERE fname = ?', (row[-2],)).fetchone()[0]
+
+    def query(self, scheduler: str = None, since: str = None, until: str = None, limit: int = None,
+              **params) -> List[RunRecord]:
+        """
+        Query runs, latest first
+        :param scheduler: scheduler name, e.g., 'CW ODMR Scheduler'
+        :param since: earliest ISO timestamp (inclusive), e.g., '2023-01-01'
+        :param until: latest ISO timestamp (exclusive)
+        :param limit: maximal number of runs
+        :param params: equality conditions on recorded parameters, e.g., t_init=5000
+        :return: lazy records
+        """
+        conditions, values = [], []
+        for column, op, value in [('scheduler', '=', scheduler), ('timestamp', '>=', since),
+                                  ('timestamp', '<', until)]:
+            if value is not None:
+                conditions.append('{} {} ?'.format(column, op))
+                values.append(value)
+        for key, value in params.items():
+            conditions.append('json_extract(params, ?) = ?')
+            values.extend(['$.' + key, value])
+        sql = 'SELECT * FROM runs'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY timestamp DESC, id DESC'
+        if limit is not None:
+            sql += ' LIMIT {:d}'.format(limit)
+        with contextlib.closing(self._connect()) as conn:
+            return [RunRecord(row) for row in conn.execute(sql, values)]
+
+    def get(self, run_id: int) -> RunRecord:
+        with contextlib.closing(self._connect()) as conn:
+            row = conn.execute('SELECT * FROM runs WHERE id = ?', (run_id,)).fetchone()
+        if row is None:
+            raise KeyError('no run of id {}'.format(run_id))
+        return RunRecord(row)
+
+    def __len__(self):
+        with contextlib.closing(self._connect()) as conn:
+            return conn.execute('SELECT COUNT(*) FROM runs').fetchone()[0]
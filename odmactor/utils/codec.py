@@ -0,0 +1,235 @@
+"""
+Compact storage codec of photon counts
+---
+Raw counts (e.g. `origin_data` of schedulers) are small non-negative integers. They are stored in chunks of rows:
+each chunk is encoded either as raw values or as zigzag-encoded deltas, whichever fits the narrower unsigned
+dtype (uint8/16/32/64), and then compressed losslessly (zstd if the `zstandard` package is installed, otherwise
+zlib at a fast level). A chunk index in the file header allows random access to rows without decoding the others.
+
+File layout (little endian):
+    header: magic "ODMC", version (u1), compressor (u1), ndim (u1), reserved (u1), dtype (8s),
+            shape (ndim x u8), chunk rows (u8), number of chunks (u8)
+    index:  per chunk, offset (u8), length (u8), dtype code (u1), delta flag (u1), 6 reserved bytes
+    chunks: compressed payloads
+"""
+
+import struct
+import zlib
+import numpy as np
+from typing import Union, Sequence
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b'ODMC'
+VERSION = 1
+COMPRESSORS = {'none': 0, 'zlib': 1, 'zstd': 2}
+_DTYPES = [np.uint8, np.uint16, np.uint32, np.uint64]
+_HEADER = struct.Struct('<4sBBBB8s')
+_INDEX = struct.Struct('<QQBB6x')
+
+
+def _narrowest(max_value: int) -> int:
+    """
+    Code of the narrowest unsigned dtype holding values up to `max_value`
+    """
+    for code, dtype in enumerate(_DTYPES):
+        if max_value <= np.iinfo(dtype).max:
+            return code
+    raise OverflowError('value {} cannot be encoded'.format(max_value))
+
+
+def _compress(data: bytes, compressor: int, level: int) -> bytes:
+    if compressor == COMPRESSORS['zlib']:
+        return zlib.compress(data, level)
+    if compressor == COMPRESSORS['zstd']:
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return data
+
+
+def _decompress(data: bytes, compressor: int) -> bytes:
+    if compressor == COMPRESSORS['zlib']:
+        return zlib.decompress(data)
+    if compressor == COMPRESSORS['zstd']:
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+def encode_chunk(values: np.ndarray) -> tuple:
+    """
+    Encode integers into the narrowest unsigned dtype, as raw values or zigzag-encoded deltas (C order)
+    :return: (encoded array, dtype code, delta flag)
+    """
+    x = np.ascontiguousarray(values, dtype=np.int64).ravel()
+    d = np.diff(x, prepend=np.int64(0))
+    zigzag = ((d << 1) ^ (d >> 63)).view(np.uint64)
+    delta_code = _narrowest(int(zigzag.max())) if x.size else 0
+    if x.size and x.min() >= 0:
+        raw_code = _narrowest(int(x.max()))
+        if raw_code <= delta_code:
+            return x.astype(_DTYPES[raw_code]), raw_code, False
+    return zigzag.astype(_DTYPES[delta_code]), delta_code, True
+
+
+def decode_chunk(encoded: np.ndarray, delta: bool) -> np.ndarray:
+    """
+    Inverse of `encode_chunk()`
+    :return: 1-D int64 array
+    """
+    x = encoded.astype(np.uint64)
+    if not delta:
+        return x.view(np.int64)
+    d = (x >> np.uint64(1)).view(np.int64) ^ -(x & np.uint64(1)).view(np.int64)
+    return np.cumsum(d)
+
+
+def is_counts(data) -> bool:
+    """
+    Whether data is a (rectangular) array of integers, i.e., encodable by this codec
+    """
+    try:
+        arr = np.asarray(data)
+    except ValueError:  # ragged nested lists
+        return False
+    if arr.dtype.kind in 'iu':
+        return arr.size > 0
+    return arr.dtype.kind == 'f' and arr.size > 0 and bool(np.all(np.isfinite(arr)) and np.all(arr == np.round(arr)))
+
+
+def encode_counts(fname: str, data, chunk_rows: int = None, compressor: str = None, level: int = None):
+    """
+    Encode an integer array (e.g. raw counts of all detection points) into a file
+    :param fname: file name, conventionally with suffix ".odmc"
+    :param data: integer array (or nested lists) of at least one dimension, chunked along the first axis
+    :param chunk_rows: rows per chunk; about 1 MiB of int64 values per chunk by default
+    :param compressor: 'zstd', 'zlib' or 'none'; 'zstd' if available, otherwise 'zlib'
+    :param level: compression level; 1 for zlib and 3 for zstd by default
+    """
+    arr = np.asarray(data)
+    if arr.ndim == 0:
+        arr = arr.reshape(1)
+    if not is_counts(arr):
+        raise ValueError('only arrays of integers can be encoded')
+    orig_dtype = arr.dtype if arr.dtype.kind in 'iu' else np.dtype(np.int64)
+    if compressor is None:
+        compressor = 'zstd' if zstandard is not None else 'zlib'
+    if compressor == 'zstd' and zstandard is None:
+        raise ImportError('package "zstandard" is not installed')
+    comp = COMPRESSORS[compressor]
+    if level is None:
+        level = 3 if comp == COMPRESSORS['zstd'] else 1
+    row_size = int(np.prod(arr.shape[1:], dtype=np.int64)) or 1
+    if chunk_rows is None:
+        chunk_rows = max(1, (1 << 17) // row_size)
+    n_chunks = -(-arr.shape[0] // chunk_rows)
+
+    header = _HEADER.pack(MAGIC, VERSION, comp, arr.ndim, 0, orig_dtype.str.encode().ljust(8)) + \
+        struct.pack('<{}Q'.format(arr.ndim), *arr.shape) + struct.pack('<QQ', chunk_rows, n_chunks)
+    offset = len(header) + n_chunks * _INDEX.size
+    index, payloads = [], []
+    for i in range(n_chunks):
+        encoded, code, delta = encode_chunk(arr[i * chunk_rows:(i + 1) * chunk_rows])
+        payload = _compress(encoded.tobytes(), comp, level)
+        index.append(_INDEX.pack(offset, len(payload), code, int(delta)))
+        payloads.append(payload)
+        offset += len(payload)
+    with open(fname, 'wb') as f:
+        f.write(header)
+        f.write(b''.join(index))
+        for payload in payloads:
+            f.write(payload)
+
+
+class CountArchive:
+    """
+    Reader of an encoded count file, decoding only chunks of accessed rows
+    """
+
+    def __init__(self, fname: str):
+        self.fname = fname
+        with open(fname, 'rb') as f:
+            magic, version, self.compressor, ndim, _, dtype = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC:
+                raise ValueError('{} is not an encoded count file'.format(fname))
+            if version > VERSION:
+                raise ValueError('unsupported codec version {}'.format(version))
+            self.dtype = np.dtype(dtype.rstrip(b' ').decode())
+            self.shape = struct.unpack('<{}Q'.format(ndim), f.read(8 * ndim))
+            self.chunk_rows, n_chunks = struct.unpack('<QQ', f.read(16))
+            self.index = [_INDEX.unpack(f.read(_INDEX.size)) for _ in range(n_chunks)]
+        self._cached = (None, None)  # latest decoded chunk
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    @property
+    def n_chunks(self) -> int:
+        return len(self.index)
+
+    def _rows_of(self, i: int) -> int:
+        return min(self.chunk_rows, self.shape[0] - i * self.chunk_rows)
+
+    def _decode(self, i: int, payload: bytes) -> np.ndarray:
+        _, _, code, delta = self.index[i]
+        encoded = np.frombuffer(_decompress(payload, self.compressor), dtype=_DTYPES[code])
+        values = decode_chunk(encoded, bool(delta))
+        return values.astype(self.dtype, copy=False).reshape((self._rows_of(i),) + tuple(self.shape[1:]))
+
+    def chunk(self, i: int) -> np.ndarray:
+        """
+        Decode the i-th chunk
+        """
+        if self._cached[0] == i:
+            return self._cached[1]
+        offset, length, _, _ = self.index[i]
+        with open(self.fname, 'rb') as f:
+            f.seek(offset)
+            values = self._decode(i, f.read(length))
+        self._cached = (i, values)
+        return values
+
+    def read(self) -> np.ndarray:
+        """
+        Decode the whole array, reading the file sequentially
+        """
+        out = np.empty(self.shape, dtype=self.dtype)
+        with open(self.fname, 'rb') as f:
+            for i, (offset, length, _, _) in enumerate(self.index):
+                f.seek(offset)
+                start = i * self.chunk_rows
+                out[start:start + self._rows_of(i)] = self._decode(i, f.read(length))
+        return out
+
+    def __array__(self, dtype=None):
+        arr = self.read()
+        return arr if dtype is None else arr.astype(dtype)
+
+    def __getitem__(self, key: Union[int, slice, tuple, Sequence[int]]) -> np.ndarray:
+        rest = ()
+        if isinstance(key, tuple):
+            key, rest = key[0], key[1:]
+        if isinstance(key, (int, np.integer)):
+            row = int(key) + self.shape[0] if key < 0 else int(key)
+            if not 0 <= row < self.shape[0]:
+                raise IndexError('index {} out of range of {} rows'.format(key, self.shape[0]))
+            out = self.chunk(row // self.chunk_rows)[row % self.chunk_rows]
+            return out[rest] if rest else out
+        rows = np.arange(self.shape[0])[key]
+        out = np.empty((len(rows),) + tuple(self.shape[1:]), dtype=self.dtype)
+        for i in np.unique(rows // self.chunk_rows):
+            mask = rows // self.chunk_rows == i
+            out[mask] = self.chunk(int(i))[rows[mask] - i * self.chunk_rows]
+        return out[(slice(None),) + rest] if rest else out
+
+
+def load_counts(fname: str) -> np.ndarray:
+    """
+    Decode a whole encoded count file
+    """
+    return CountArchive(fname).read()
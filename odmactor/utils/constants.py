@@ -0,0 +1,13 @@
+"""
+Unit prefixes used throughout Odmactor
+---
+Same names and values as in `scipy.constants`, kept here to avoid importing SciPy at package import time
+"""
+
+giga = 1e9
+mega = 1e6
+kilo = 1e3
+milli = 1e-3
+micro = 1e-6
+nano = 1e-9
+pico = 1e-12
@@ -0,0 +1,158 @@
+"""
+Running-time estimation of scanning processes
+---
+The estimated cost of each detection point consists of the dwell time of all its acquisitions (signal and
+reference), their time padding, and the host overhead per point (MW writes, ASG downloads, counter reads, ...)
+measured in previous runs and persisted locally.
+"""
+
+import datetime
+import json
+import os
+import sys
+import time
+import numpy as np
+from typing import Iterable, Sequence
+from odmactor.utils.utils import local_state_path
+
+
+class TimeEstimator:
+    """
+    Estimator of scanning time, calibrated by per-point overheads measured in previous runs
+    """
+
+    def __init__(self, fname: str = None, weight: float = 0.3):
+        """
+        :param fname: file persisting measured overheads, "overhead.json" in the local state directory by default
+        :param weight: weight of the latest measurement in the exponential moving average of overheads
+        """
+        self.fname = fname
+        self.weight = weight
+        self._overheads = None
+
+    @property
+    def overheads(self) -> dict:
+        if self._overheads is None:
+            if self.fname is None:
+                self.fname = local_state_path('overhead.json')
+            try:
+                with open(self.fname, 'r') as f:
+                    self._overheads = json.load(f)
+            except (OSError, ValueError):
+                self._overheads = {}
+        return self._overheads
+
+    def overhead(self, key: str) -> float:
+        """
+        Measured host overhead per detection point, 0.0 if never measured
+        :param key: identifier of the scheduler type and acquisition mode
+        :return: overhead, unit: s
+        """
+        return self.overheads.get(key, {}).get('per_point', 0.0)
+
+    def update(self, key: str, per_point: float, n_points: int):
+        """
+        Update the measured overhead per detection point and persist it
+        :param key: identifier of the scheduler type and acquisition mode
+        :param per_point: overhead per detection point measured in the latest run, unit: s
+        :param n_points: number of detection points in the latest run
+        """
+        record = self.overheads.get(key)
+        if record is None:
+            record = {'per_point': per_point, 'n_points': 0}
+        else:
+            record['per_point'] = (1 - self.weight) * record['per_point'] + self.weight * per_point
+        record['n_points'] += n_points
+        record['updated'] = datetime.datetime.now().isoformat(timespec='seconds')
+        self.overheads[key] = record
+        try:
+            tmp = self.fname + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.overheads, f, indent=2)
+            os.replace(tmp, self.fname)
+        except OSError as e:
+            print('Measured overhead cannot be saved: {}'.format(e))
+
+    @staticmethod
+    def point_costs(dwells: Sequence[float], n_acq: int, pad_ratio: float, overhead: float) -> np.ndarray:
+        """
+        Estimated time cost of each detection point
+        :param dwells: ASG dwell time (N periods) of each detection point, unit: s
+        :param n_acq: number of acquisitions per detection point, i.e., 2 with reference, otherwise 1
+        :param pad_ratio: ratio of time padding to dwell time
+        :param overhead: host overhead per detection point, unit: s
+        :return: 1-D array, unit: s
+        """
+        return np.asarray(dwells, dtype=float) * (1 + pad_ratio) * n_acq + overhead
+
+
+def format_duration(seconds: float) -> str:
+    """
+    Format a duration as "H:MM:SS"
+    """
+    seconds = int(round(max(seconds, 0)))
+    return '{}:{:02d}:{:02d}'.format(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+
+class ScanProgress:
+    """
+    Progress of a scanning process with live ETA, printed in place
+    ---
+    The ETA is the estimated cost of remaining detection points, rescaled by the ratio of elapsed time to the
+    estimated cost of finished points, so that it converges to the actual speed while scanning
+    """
+
+    def __init__(self, items: Iterable, costs: Sequence[float] = None, stream=None, interval: float = 0.2):
+        """
+        :param items: scanning points
+        :param costs: estimated time cost of each detection point, unit: s
+        :param stream: output stream, `sys.stderr` by default
+        :param interval: minimal interval of refreshing, unit: s
+        """
+        self.items = list(items)
+        n = len(self.items)
+        self.costs = np.ones(n) if costs is None or len(costs) != n else np.asarray(costs, dtype=float)
+        self.durations = np.zeros(n)
+        self.stream = sys.stderr if stream is None else stream
+        self.interval = interval
+        self.n_done = 0
+        self.status = None  # optional callable returning a brief text appended to the progress line
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        start = last = time.perf_counter()
+        shown = 0.0
+        for i, item in enumerate(self.items):
+            yield item
+            now = time.perf_counter()
+            self.durations[i] = now - last
+            self.n_done = i + 1
+            last = now
+            if now - shown >= self.interval or self.n_done == len(self.items):
+                self._show(now - start)
+                shown = now
+        self.stream.write('\n')
+        self.stream.flush()
+
+    def eta(self, elapsed: float, n_done: int = None) -> float:
+        """
+        Estimated remaining time, unit: s
+        :param n_done: number of finished points, `n_done` by default
+        """
+        n_done = self.n_done if n_done is None else n_done
+        done = self.costs[:n_done].sum()
+        ratio = elapsed / done if done > 0 else 1.0
+        return float(self.costs[n_done:].sum() * ratio)
+
+    def _show(self, elapsed: float):
+        n = len(self.items)
+        eta = self.eta(elapsed)
+        finish = datetime.datetime.now() + datetime.timedelta(seconds=eta)
+        self.stream.write('\r{:>{w}}/{} {:5.1f}% | elapsed {} | ETA {} | finish at {}'.format(
+            self.n_done, n, 100 * self.n_done / n, format_duration(elapsed), format_duration(eta),
+            finish.strftime('%H:%M:%S'), w=len(str(n))))
+        if self.status is not None:
+            self.stream.write(' | ' + self.status())
+        self.stream.flush()
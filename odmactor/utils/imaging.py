@@ -0,0 +1,240 @@
+"""
+Widefield ODMR imaging: frame accumulation into memory-mapped cubes and per-pixel spectral fitting
+---
+Frames of each frequency point are summed chunk by chunk and only their mean image is written into a
+memory-mapped cube of shape (n_freqs, H, W), so raw frames are never held. Lorentzian fits are vectorized over
+pixels (Levenberg-Marquardt on a batch of pixels at a time) and processed block by block of rows, so that
+megapixel images are fitted in bounded RAM.
+"""
+
+import numpy as np
+from typing import Dict, Sequence, Tuple
+
+GAMMA_NV = 28.025e9  # gyromagnetic ratio of NV electron spin, unit: Hz/T
+
+
+def _lorentzian_model(x: np.ndarray, p: np.ndarray, n_dips: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Multi-dip Lorentzian model y = a * (1 - sum_j d_j * w^2 / ((x - c_j)^2 + w^2)) and its Jacobian
+    :param x: 1-D normalized frequencies, (n,)
+    :param p: parameters [a, w, d_1, ..., d_k, c_1, ..., c_k] of each pixel, (P, 2 + 2k)
+    :return: model values (P, n), Jacobian (P, 2 + 2k, n)
+    """
+    a, w = p[:, :1], p[:, 1:2]
+    jac = np.empty((p.shape[0], p.shape[1], x.size))
+    y, dy_dw = jac[:, 0], jac[:, 1]
+    y[:] = 1
+    dy_dw[:] = 0
+    for j in range(n_dips):
+        d, c = p[:, 2 + j:3 + j], p[:, 2 + n_dips + j:3 + n_dips + j]
+        u = x - c
+        lor = 1 / (u ** 2 + w ** 2)  # 1 / den
+        dlor = lor * lor * u  # u / den^2
+        lor *= w ** 2
+        y -= d * lor
+        dy_dw -= (2 * d * w) * dlor * u
+        jac[:, 2 + j] = -a * lor
+        jac[:, 2 + n_dips + j] = (-2 * a * d * w ** 2) * dlor
+    dy_dw *= a
+    return a * y, jac
+
+
+def fit_lorentzians(freqs: Sequence[float], spectra: np.ndarray, n_dips: int = 2, linewidth: float = None,
+                    n_iter: int = 50, tol: float = 1e-6) -> Dict[str, np.ndarray]:
+    """
+    Fit Lorentzian dips of many spectra at once
+    Initial resonances are the minima of `n_dips` equal frequency sub-ranges; the linewidth is shared by all dips
+    :param freqs: frequencies, unit: Hz
+    :param spectra: 2-D array of shape (P, n_freqs), one spectrum per row
+    :param n_dips: number of resonance dips
+    :param linewidth: initial FWHM, unit: Hz; 4 frequency steps by default
+    :param n_iter: maximal number of Levenberg-Marquardt iterations
+    :param tol: relative decrease of squared residuals, below which a fit is converged
+    :return: dict of 'baseline', 'linewidth' (Hz), 'residual' (RMS) of shape (P,),
+            and 'contrast', 'centers' (Hz) of shape (n_dips, P), centers in ascending order
+    """
+    freqs = np.asarray(freqs, dtype=float)
+    y = np.asarray(spectra, dtype=float)
+    n_pix, n = y.shape
+    mid, scale = (freqs[0] + freqs[-1]) / 2, max((freqs[-1] - freqs[0]) / 2, 1.0)
+    x = (freqs - mid) / scale
+
+    # normalize each spectrum, so that fits are conditioned uniformly
+    norm = np.quantile(y, 0.9, axis=1)
+    valid = np.isfinite(norm) & (norm > 0)
+    norm[~valid] = 1.0
+    y = y / norm[:, None]
+
+    # initial guesses
+    if linewidth is None:
+        linewidth = 4 * abs(freqs[1] - freqs[0]) if n > 1 else scale
+    p = np.empty((n_pix, 2 + 2 * n_dips))
+    p[:, 0] = 1.0
+    p[:, 1] = linewidth / 2 / scale
+    for j, idx in enumerate(np.array_split(np.arange(n), n_dips)):
+        k = idx[np.argmin(y[:, idx], axis=1)]
+        p[:, 2 + j] = np.clip(1 - y[np.arange(n_pix), k], 1e-3, 1)
+        p[:, 2 + n_dips + j] = x[k]
+
+    # Levenberg-Marquardt iterations, vectorized over pixels not yet converged
+    model, jac = _lorentzian_model(x, p, n_dips)
+    cost = ((model - y) ** 2).sum(axis=1)
+    lam = np.full(n_pix, 1e-3)
+    eye = np.eye(p.shape[1])
+    active = np.arange(n_pix)
+    for _ in range(n_iter):
+        if not active.size:
+            break
+        jac_a, res_a = jac[active], model[active] - y[active]
+        jtj = jac_a @ jac_a.transpose(0, 2, 1)
+        grad = (jac_a @ res_a[:, :, None])[:, :, 0]
+        diag = np.einsum('pii->pi', jtj)
+        lhs = jtj + (lam[active, None] * diag + 1e-12)[:, :, None] * eye
+        p_new = p[active] - np.linalg.solve(lhs, grad[:, :, None])[:, :, 0]
+        p_new[:, 1] = np.abs(p_new[:, 1])
+        model_new, jac_new = _lorentzian_model(x, p_new, n_dips)
+        cost_new = ((model_new - y[active]) ** 2).sum(axis=1)
+        accept = cost_new < cost[active]
+        converged = (accept & (cost[active] - cost_new <= tol * cost_new)) | (lam[active] > 1e8)
+        idx = active[accept]
+        p[idx], model[idx], jac[idx], cost[idx] = p_new[accept], model_new[accept], jac_new[accept], cost_new[accept]
+        lam[active] = np.where(accept, lam[active] * 0.3, lam[active] * 10)
+        active = active[~converged]
+
+    centers = mid + p[:, 2 + n_dips:] * scale
+    order = np.argsort(centers, axis=1)
+    result = {
+        'baseline': p[:, 0] * norm,
+        'linewidth': 2 * p[:, 1] * scale,
+        'contrast': np.take_along_axis(p[:, 2:2 + n_dips], order, axis=1).T,
+        'centers': np.take_along_axis(centers, order, axis=1).T,
+        'residual': np.sqrt(cost / n),
+    }
+    for key in result:
+        result[key][..., ~valid] = np.nan
+    return result
+
+
+class ImageStack:
+    """
+    Memory-mapped cubes of widefield ODMR images, of shape (n_freqs, H, W)
+    ---
+    Files: "<fname>-signal.npy", "<fname>-reference.npy" (optional) and "<fname>-freqs.npy"
+    """
+
+    def __init__(self, fname: str, freqs: Sequence[float], signal: np.ndarray, reference: np.ndarray = None):
+        """
+        Use `create()` or `load()` to construct instances
+        """
+        self.fname = fname
+        self.freqs = np.asarray(freqs, dtype=float)
+        self.signal = signal
+        self.reference = reference
+
+    @classmethod
+    def create(cls, fname: str, freqs: Sequence[float], shape: Tuple[int, int], with_ref: bool = True) -> 'ImageStack':
+        """
+        Create cubes on disk, filled with zeros
+        :param fname: common prefix of file names
+        :param freqs: frequencies, unit: Hz
+        :param shape: frame shape (H, W)
+        :param with_ref: whether to create a reference cube
+        """
+        cube_shape = (len(freqs),) + tuple(shape)
+        signal = np.lib.format.open_memmap(fname + '-signal.npy', mode='w+', dtype=np.float32, shape=cube_shape)
+        reference = None
+        if with_ref:
+            reference = np.lib.format.open_memmap(fname + '-reference.npy', mode='w+', dtype=np.float32,
+                                                  shape=cube_shape)
+        np.save(fname + '-freqs.npy', np.asarray(freqs, dtype=float))
+        return cls(fname, freqs, signal, reference)
+
+    @classmethod
+    def load(cls, fname: str, mode: str = 'r') -> 'ImageStack':
+        """
+        Open cubes created by `create()`
+        :param fname: common prefix of file names
+        :param mode: memory-map mode, 'r' or 'r+'
+        """
+        signal = np.load(fname + '-signal.npy', mmap_mode=mode)
+        try:
+            reference = np.load(fname + '-reference.npy', mmap_mode=mode)
+        except FileNotFoundError:
+            reference = None
+        return cls(fname, np.load(fname + '-freqs.npy'), signal, reference)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.signal.shape[1:]
+
+    def accumulate(self, camera, index: int, n_frames: int, ref: bool = False, chunk: int = 8) -> np.ndarray:
+        """
+        Grab frames chunk by chunk and write their mean image into a frequency slice
+        :param camera: camera instance providing `grab(n_frames)`
+        :param index: index of frequency
+        :param n_frames: number of frames
+        :param ref: write into the reference cube or not
+        :param chunk: maximal number of frames held at once
+        :return: mean image
+        """
+        acc = np.zeros(self.shape)
+        for start in range(0, n_frames, chunk):
+            acc += camera.grab(min(chunk, n_frames - start)).sum(axis=0)
+        image = acc / max(n_frames, 1)
+        (self.reference if ref else self.signal)[index] = image
+        return image
+
+    def flush(self):
+        for cube in (self.signal, self.reference):
+            if isinstance(cube, np.memmap):
+                cube.flush()
+
+    def spectra(self, rows: slice) -> np.ndarray:
+        """
+        Spectra of pixels within several rows, normalized by reference if available
+        :return: 2-D array of shape (n_rows * W, n_freqs)
+        """
+        sig = np.asarray(self.signal[:, rows], dtype=float)
+        if self.reference is not None:
+            ref = np.asarray(self.reference[:, rows], dtype=float)
+            sig = np.divide(sig, ref, out=np.full_like(sig, np.nan), where=ref > 0)
+        return sig.reshape(sig.shape[0], -1).T
+
+    def fit(self, n_dips: int = 2, max_memory: float = 64e6, **kwargs) -> Dict[str, np.ndarray]:
+        """
+        Per-pixel Lorentzian fits, block by block of rows
+        :param n_dips: number of resonance dips
+        :param max_memory: approximate memory budget of fitting a block, unit: byte
+        :param kwargs: other arguments of `fit_lorentzians`
+        :return: dict of maps 'baseline', 'linewidth', 'residual' of shape (H, W), 'contrast', 'centers' of shape
+                (n_dips, H, W)
+        """
+        h, w = self.shape
+        n_params = 2 + 2 * n_dips
+        # Jacobians, normal matrices and spectra of a block dominate the memory of fitting
+        per_pixel = 8 * (3 * len(self.freqs) * (n_params + 1) + 2 * n_params ** 2)
+        n_rows = int(np.clip(max_memory // (per_pixel * w), 1, h))
+        maps = {key: np.full(shape, np.nan, dtype=np.float32) for key, shape in [
+            ('baseline', (h, w)), ('linewidth', (h, w)), ('residual', (h, w)),
+            ('contrast', (n_dips, h, w)), ('centers', (n_dips, h, w))]}
+        for r in range(0, h, n_rows):
+            rows = slice(r, min(r + n_rows, h))
+            spectra = self.spectra(rows)
+            finite = np.isfinite(spectra).all(axis=1)
+            result = fit_lorentzians(self.freqs, np.where(finite[:, None], spectra, 0.0), n_dips, **kwargs)
+            for key, values in result.items():
+                values[..., ~finite] = np.nan
+                maps[key][..., rows, :] = values.reshape(values.shape[:-1] + (rows.stop - rows.start, w))
+        return maps
+
+    def b_field_map(self, fits: Dict[str, np.ndarray] = None, **kwargs) -> np.ndarray:
+        """
+        Magnetic field projection along the NV axis, from the splitting of the outermost two resonances
+        :param fits: result of `fit()`, fitted (with two dips) if not given
+        :param kwargs: arguments of `fit()`
+        :return: 2-D array of shape (H, W), unit: T
+        """
+        if fits is None:
+            fits = self.fit(n_dips=2, **kwargs)
+        centers = fits['centers']
+        return (centers[-1] - centers[0]) / (2 * GAMMA_NV)
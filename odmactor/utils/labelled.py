@@ -0,0 +1,120 @@
+"""
+N-dimensional arrays with named dimensions and coordinates
+"""
+
+import json
+import numpy as np
+from typing import List, Dict, Sequence, Union
+
+
+class LabelledArray:
+    """
+    N-dimensional array with named dimensions and their coordinates
+    """
+
+    def __init__(self, data: np.ndarray, dims: Sequence[str], coords: Dict[str, Sequence] = None,
+                 attrs: dict = None):
+        """
+        :param data: N-dimensional array
+        :param dims: names of dimensions
+        :param coords: coordinates of each dimension; integer indices by default
+        :param attrs: additional attributes, JSON-serializable
+        """
+        self.data = np.asarray(data)
+        self.dims = list(dims)
+        if len(self.dims) != self.data.ndim:
+            raise ValueError('{} dimension names for {}-D data'.format(len(self.dims), self.data.ndim))
+        coords = {} if coords is None else coords
+        self.coords = {dim: np.asarray(coords[dim]) if dim in coords else np.arange(n)
+                       for dim, n in zip(self.dims, self.data.shape)}
+        for dim, n in zip(self.dims, self.data.shape):
+            if len(self.coords[dim]) != n:
+                raise ValueError('{} coordinates for dimension "{}" of size {}'.format(len(self.coords[dim]), dim, n))
+        self.attrs = {} if attrs is None else dict(attrs)
+
+    @classmethod
+    def empty(cls, dims: Sequence[str], coords: Dict[str, Sequence], fill_value: float = np.nan,
+              dtype=float, attrs: dict = None) -> 'LabelledArray':
+        """
+        Preallocate an array of shape determined by coordinates of all dimensions
+        """
+        shape = tuple(len(coords[dim]) for dim in dims)
+        return cls(np.full(shape, fill_value, dtype=dtype), dims, coords, attrs)
+
+    @property
+    def shape(self) -> tuple:
+        return self.data.shape
+
+    @property
+    def ndim(self) -> int:
+        return self.data.ndim
+
+    def __array__(self, dtype=None):
+        return self.data if dtype is None else self.data.astype(dtype)
+
+    def __getitem__(self, item):
+        return self.data[item]
+
+    def __setitem__(self, item, value):
+        self.data[item] = value
+
+    def __repr__(self):
+        dims = ', '.join('{}: {}'.format(dim, n) for dim, n in zip(self.dims, self.shape))
+        return 'LabelledArray({})'.format(dims)
+
+    def index(self, dim: str, value) -> int:
+        """
+        Index of a coordinate value along a dimension; the nearest one for numeric coordinates
+        """
+        coords = self.coords[dim]
+        if np.issubdtype(coords.dtype, np.number):
+            return int(np.argmin(np.abs(coords - value)))
+        idx = np.flatnonzero(coords == value)
+        if not len(idx):
+            raise KeyError('{!r} not in coordinates of dimension "{}"'.format(value, dim))
+        return int(idx[0])
+
+    def isel(self, **indexers) -> Union['LabelledArray', float]:
+        """
+        Select by integer indices (or slices) along dimensions; dimensions selected by integers are dropped
+        """
+        key, dims, coords = [], [], {}
+        for dim in self.dims:
+            idx = indexers.get(dim, slice(None))
+            key.append(idx)
+            if not isinstance(idx, (int, np.integer)):
+                dims.append(dim)
+                coords[dim] = self.coords[dim][idx]
+        data = self.data[tuple(key)]
+        if not dims:
+            return data.item()
+        return LabelledArray(data, dims, coords, self.attrs)
+
+    def sel(self, **indexers) -> Union['LabelledArray', float]:
+        """
+        Select by coordinate values along dimensions; dimensions selected by scalars are dropped
+        """
+        key = {}
+        for dim, value in indexers.items():
+            if np.ndim(value):
+                key[dim] = [self.index(dim, v) for v in value]
+            else:
+                key[dim] = self.index(dim, value)
+        return self.isel(**key)
+
+    def save(self, fname: str):
+        """
+        Save into a ".npz" file
+        """
+        arrays = {'coord_{}'.format(i): self.coords[dim] for i, dim in enumerate(self.dims)}
+        np.savez(fname, data=self.data, dims=json.dumps(self.dims), attrs=json.dumps(self.attrs), **arrays)
+
+    @classmethod
+    def load(cls, fname: str) -> 'LabelledArray':
+        """
+        Load from a ".npz" file saved by `save()`
+        """
+        with np.load(fname) as f:
+            dims: List[str] = json.loads(str(f['dims']))
+            coords = {dim: f['coord_{}'.format(i)] for i, dim in enumerate(dims)}
+            return cls(f['data'], dims, coords, json.loads(str(f['attrs'])))
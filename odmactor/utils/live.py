@@ -0,0 +1,312 @@
+"""
+Live view of scanning data
+---
+The scanning loop of a scheduler writes one row per detection point into a `SharedRingBuffer`, a single-writer
+ring buffer in shared memory without locks. Any number of consumers, e.g., a matplotlib window (`start_live_plot`)
+or a local browser dashboard (`start_dashboard`), attach to it by name from separate processes and keep their
+own read cursors, so rendering costs the acquisition loop nothing but one row copy per point.
+
+Usage:
+    buffer = scheduler.enable_live_view()
+    start_live_plot(buffer.name)
+    start_dashboard(buffer.name, port=8050)
+    scheduler.run_scanning()
+"""
+
+import json
+import multiprocessing
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Tuple, Sequence
+
+FIELDS = ['index', 'x', 'counts', 'counts_ref', 'timestamp']
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    Attach an existing shared memory block without letting this process's resource tracker unlink it at exit
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python >= 3.13
+    except TypeError:
+        from multiprocessing import resource_tracker
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+class SharedRingBuffer:
+    """
+    Single-writer multi-reader ring buffer of float64 rows in shared memory
+    ---
+    Header (int64): [number of rows ever written, capacity, number of fields, closed flag].
+    The writer copies a row and then publishes it by increasing the write count; readers detect rows which were
+    overwritten while being copied, so no lock is needed.
+    """
+
+    _HEADER = 4
+
+    def __init__(self, capacity: int = 65536, n_fields: int = len(FIELDS), name: str = None):
+        """
+        :param capacity: number of rows kept in the buffer
+        :param n_fields: number of fields of each row
+        :param name: if designated, attach to the existing buffer of this name instead of creating a new one
+        """
+        if name is None:
+            size = 8 * (self._HEADER + capacity * n_fields)
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._owner = True
+            self._header = np.ndarray((self._HEADER,), dtype=np.int64, buffer=self._shm.buf)
+            self._header[:] = [0, capacity, n_fields, 0]
+        else:
+            self._shm = _attach_shared_memory(name)
+            self._owner = False
+            self._header = np.ndarray((self._HEADER,), dtype=np.int64, buffer=self._shm.buf)
+            capacity, n_fields = int(self._header[1]), int(self._header[2])
+        self.capacity = capacity
+        self.n_fields = n_fields
+        self._data = np.ndarray((capacity, n_fields), dtype=np.float64, buffer=self._shm.buf, offset=8 * self._HEADER)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def count(self) -> int:
+        """
+        Number of rows ever written
+        """
+        return int(self._header[0])
+
+    @property
+    def closed(self) -> bool:
+        return bool(self._header[3])
+
+    def write(self, row: Sequence[float]):
+        """
+        Write a row (single writer only)
+        """
+        count = self._header[0]
+        self._data[count % self.capacity] = row
+        self._header[0] = count + 1
+
+    def read(self, cursor: int = 0) -> Tuple[np.ndarray, int]:
+        """
+        Read rows written since `cursor`; rows already overwritten are skipped
+        :param cursor: number of rows already read by this reader
+        :return: rows in shape of [n, n_fields], and the new cursor
+        """
+        count = self.count
+        cursor = max(cursor, count - self.capacity)
+        if count <= cursor:
+            return np.empty((0, self.n_fields)), count
+        start, stop = cursor % self.capacity, count % self.capacity
+        if start < stop:
+            rows = self._data[start:stop].copy()
+        else:
+            rows = np.concatenate([self._data[start:], self._data[:stop]])
+        # drop rows which might have been overwritten by the writer during copying, including the row in the slot
+        # being written, which the writer stores into before publishing it by increasing the count
+        lapped = self.count + 1 - self.capacity - cursor
+        if lapped > 0:
+            rows = rows[lapped:]
+        return rows, count
+
+    def close(self):
+        """
+        Mark the buffer as closed, i.e., no more rows will be written
+        """
+        self._header[3] = 1
+
+    def release(self):
+        """
+        Release the shared memory (and destroy it if owned by this instance)
+        """
+        self._header = self._data = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def minmax_downsample(x: np.ndarray, y: np.ndarray, n_bins: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Min/max downsampling of a trace for display: keep the minimum and maximum of each of `n_bins` bins
+    :return: at most 2 * n_bins points, in original order
+    """
+    n = len(x)
+    if n <= 2 * n_bins:
+        return x, y
+    edges = np.linspace(0, n, n_bins + 1).astype(int)
+    y_bins = np.split(y, edges[1:-1])
+    idx_min = edges[:-1] + np.array([np.nanargmin(b) if not np.all(np.isnan(b)) else 0 for b in y_bins])
+    idx_max = edges[:-1] + np.array([np.nanargmax(b) if not np.all(np.isnan(b)) else 0 for b in y_bins])
+    idx = np.sort(np.concatenate([idx_min, idx_max]))
+    return x[idx], y[idx]
+
+
+class _Trace:
+    """
+    Scanning trace accumulated by a consumer, restarted when a new scan (index 0) begins
+    """
+
+    def __init__(self):
+        self.rows = np.empty((0, len(FIELDS)))
+
+    def extend(self, rows: np.ndarray) -> bool:
+        """
+        :return: True if a new scan begins
+        """
+        restarts = np.flatnonzero(rows[:, 0] == 0)
+        if len(restarts):
+            self.rows = rows[restarts[-1]:]
+            return True
+        self.rows = np.concatenate([self.rows, rows])
+        return False
+
+
+def _run_live_plot(name: str, interval: float, max_points: int):
+    import matplotlib.pyplot as plt
+
+    buffer = SharedRingBuffer(name=name)
+    trace = _Trace()
+    fig, ax = plt.subplots()
+    line_sig, = ax.plot([], [], 'o-', ms=3, label='counts', animated=True)
+    line_ref, = ax.plot([], [], 'o-', ms=3, label='counts_ref', animated=True)
+    ax.set_xlabel('scanning parameter')
+    ax.set_ylabel('counts')
+    ax.legend(loc='upper right')
+    plt.show(block=False)
+    fig.canvas.draw()
+    background = fig.canvas.copy_from_bbox(fig.bbox)
+    cursor = 0
+    while plt.fignum_exists(fig.number):
+        rows, cursor = buffer.read(cursor)
+        if len(rows):
+            trace.extend(rows)
+            x = trace.rows[:, 1]
+            for line, j in [(line_sig, 2), (line_ref, 3)]:
+                line.set_data(*minmax_downsample(x, trace.rows[:, j], max_points // 2))
+            lo, hi = np.nanmin(trace.rows[:, 2:4]), np.nanmax(trace.rows[:, 2:4])
+            x_lo, x_hi = np.min(x), np.max(x)
+            (ax_lo, ax_hi), (ay_lo, ay_hi) = ax.get_xlim(), ax.get_ylim()
+            if x_lo < ax_lo or x_hi > ax_hi or lo < ay_lo or hi > ay_hi or len(trace.rows) == len(rows):
+                # axes limits changed: redraw everything and cache the new background
+                pad_x, pad_y = 0.05 * (x_hi - x_lo) or 1, 0.05 * (hi - lo) or 1
+                ax.set_xlim(x_lo - pad_x, x_hi + pad_x)
+                ax.set_ylim(lo - pad_y, hi + pad_y)
+                fig.canvas.draw()
+                background = fig.canvas.copy_from_bbox(fig.bbox)
+            fig.canvas.restore_region(background)
+            ax.draw_artist(line_sig)
+            ax.draw_artist(line_ref)
+            fig.canvas.blit(fig.bbox)
+        fig.canvas.flush_events()
+        time.sleep(interval)
+    buffer.release()
+
+
+_DASHBOARD_HTML = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Odmactor live view</title>
+<style>body{font-family:sans-serif;margin:20px}canvas{border:1px solid #ccc}</style></head>
+<body><h3>Odmactor live view</h3><div id="status"></div><canvas id="plot" width="1000" height="500"></canvas>
+<script>
+let cursor = 0, rows = [];
+const canvas = document.getElementById('plot'), ctx = canvas.getContext('2d');
+function draw() {
+  ctx.clearRect(0, 0, canvas.width, canvas.height);
+  if (!rows.length) return;
+  const xs = rows.map(r => r[1]), ys = rows.flatMap(r => [r[2], r[3]]).filter(v => v !== null);
+  const x0 = Math.min(...xs), x1 = Math.max(...xs), y0 = Math.min(...ys), y1 = Math.max(...ys);
+  const sx = x => 40 + (canvas.width - 60) * (x - x0) / ((x1 - x0) || 1);
+  const sy = y => canvas.height - 30 - (canvas.height - 60) * (y - y0) / ((y1 - y0) || 1);
+  [[2, '#1f77b4'], [3, '#ff7f0e']].forEach(([j, color]) => {
+    ctx.strokeStyle = color; ctx.beginPath();
+    rows.forEach((r, k) => { if (r[j] === null) return; k ? ctx.lineTo(sx(r[1]), sy(r[j])) : ctx.moveTo(sx(r[1]), sy(r[j])); });
+    ctx.stroke();
+  });
+  ctx.fillText(y1.toPrecision(5), 2, 30); ctx.fillText(y0.toPrecision(5), 2, canvas.height - 30);
+  ctx.fillText(x0.toPrecision(6), 40, canvas.height - 10); ctx.fillText(x1.toPrecision(6), canvas.width - 80, canvas.height - 10);
+}
+async function poll() {
+  try {
+    const resp = await fetch('data?cursor=' + cursor), data = await resp.json();
+    cursor = data.cursor;
+    data.rows.forEach(r => { if (r[0] === 0) rows = []; rows.push(r); });
+    document.getElementById('status').textContent = rows.length + ' points' + (data.closed ? ' (closed)' : '');
+    draw();
+  } catch (e) {}
+  setTimeout(poll, INTERVAL);
+}
+poll();
+</script></body></html>
+'''
+
+
+def _run_dashboard(name: str, port: int, interval: float):
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    from urllib.parse import urlparse, parse_qs
+
+    buffer = SharedRingBuffer(name=name)
+    html = _DASHBOARD_HTML.replace('INTERVAL', str(int(interval * 1000))).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/':
+                body, content_type = html, 'text/html'
+            elif url.path == '/data':
+                cursor = int(parse_qs(url.query).get('cursor', ['0'])[0])
+                rows, cursor = buffer.read(cursor)
+                rows = [[None if np.isnan(v) else float(v) for v in row] for row in rows]
+                body = json.dumps({'cursor': cursor, 'rows': rows, 'closed': buffer.closed}).encode()
+                content_type = 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    try:
+        server.serve_forever()
+    finally:
+        buffer.release()
+
+
+def start_live_plot(name: str, interval: float = 0.1, max_points: int = 2000) -> multiprocessing.Process:
+    """
+    Render a live-view buffer in a matplotlib window of a separate process, with blitting and min/max downsampling
+    :param name: name of the `SharedRingBuffer`
+    :param interval: refreshing interval, unit: s
+    :param max_points: maximal number of points drawn for each trace
+    :return: the rendering process
+    """
+    process = multiprocessing.get_context('spawn').Process(target=_run_live_plot, args=(name, interval, max_points),
+                                                           daemon=True)
+    process.start()
+    return process
+
+
+def start_dashboard(name: str, port: int = 8050, interval: float = 0.5) -> multiprocessing.Process:
+    """
+    Serve a live-view buffer as a local browser dashboard (http://127.0.0.1:port) in a separate process
+    :param name: name of the `SharedRingBuffer`
+    :param port: local HTTP port
+    :param interval: polling interval of the browser, unit: s
+    :return: the serving process
+    """
+    process = multiprocessing.get_context('spawn').Process(target=_run_dashboard, args=(name, port, interval),
+                                                           daemon=True)
+    process.start()
+    print('Live dashboard: http://127.0.0.1:{}'.format(port))
+    return process
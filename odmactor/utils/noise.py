@@ -0,0 +1,158 @@
+"""
+Noise spectroscopy by dynamical decoupling
+---
+A DD sequence of n pi pulses (as `HighDecouplingScheduler`: π/2 - (t - π) × n - t - π/2, with equal spacing t
+between pulses) filters the phase noise of the spin. The coherence decays as C = exp(-χ) with
+    χ = (1 / π) ∫ S(ω) F(ω) / ω² dω
+where S(ω) is the (one-sided, angular) spectral density of frequency noise, unit: rad²/s, and F is the filter
+function of the pulse timing (Cywiński et al., PRB 77, 174509 (2008)), peaked at ω = π / (t + t_π).
+Filter functions of all (order, spacing) points are evaluated at once on a fine frequency grid, in closed form of
+the geometric sum over pulses. The spectrum, linearly interpolated between nodes of a coarse log-spaced grid, is
+reconstructed from the decays of all points by regularized non-negative least squares. Points are accumulated into
+normal equations, so the estimate can be refined after each new point at a cost independent of the number of points.
+"""
+
+import numpy as np
+from typing import Optional, Sequence
+
+
+def filter_functions(omegas: np.ndarray, orders: Sequence[int], spacings: Sequence[float],
+                     t_pi: float = 0.0) -> np.ndarray:
+    """
+    Filter functions of DD sequences with equally spaced pi pulses of finite width
+    :param omegas: angular frequencies, unit: rad/s
+    :param orders: numbers of pi pulses n, one per point
+    :param spacings: free precession time t between pulses, one per point, unit: s
+    :param t_pi: pi-pulse time, unit: s
+    :return: array of shape (n_points, n_omegas)
+    """
+    w = np.asarray(omegas, dtype=float)[None, :]
+    n = np.asarray(orders, dtype=int)[:, None]
+    t = np.asarray(spacings, dtype=float)[:, None]
+    total = (n + 1) * t + n * t_pi
+    # pulse j (1..n) centered at j (t + t_π) - t_π / 2; sum of (-1)^j e^{iω t_j} as a geometric series of -q
+    r = -np.exp(1j * w * (t + t_pi))
+    near = np.abs(1 - r) < 1e-9
+    series = np.where(near, n.astype(float), r * (1 - r ** n) / np.where(near, 1, 1 - r))
+    pulses = 2 * np.exp(-0.5j * w * t_pi) * np.cos(w * t_pi / 2) * series
+    y = 1 + (-1.0) ** (n + 1) * np.exp(1j * w * total) + pulses
+    return np.abs(y) ** 2
+
+
+def coherence_from_signal(signal: np.ndarray, orders: Sequence[int], contrast: float) -> np.ndarray:
+    """
+    Coherence C from normalized fluorescence s = counts / counts_ref of DD sequences ending with a π/2 pulse:
+    the bright population is (1 + (-1)^(n+1) C) / 2, and s = 1 - contrast (1 - P_bright)
+    :param signal: normalized signal
+    :param orders: numbers of pi pulses
+    :param contrast: fluorescence contrast between ms = 0 and ms = ±1
+    """
+    p_bright = 1 - (1 - np.asarray(signal, dtype=float)) / contrast
+    return (-1.0) ** (np.asarray(orders) + 1) * (2 * p_bright - 1)
+
+
+class NoiseSpectrumEstimator:
+    """
+    Incremental reconstruction of the noise spectrum from decays of DD sequences
+    """
+
+    def __init__(self, freqs: Sequence[float], t_pi: float = 0.0, oversampling: int = 64, smoothing: float = 1e-3,
+                 min_coherence: float = 0.05):
+        """
+        :param freqs: nodes of the reconstructed spectrum, ascending, unit: Hz
+        :param t_pi: pi-pulse time, unit: s
+        :param oversampling: points of the integration grid per node interval
+        :param smoothing: weight of the second-difference penalty, relative to the data term
+        :param min_coherence: points with lower coherence carry little information and are ignored
+        """
+        self.freqs = np.asarray(freqs, dtype=float)
+        self.t_pi = t_pi
+        self.smoothing = smoothing
+        self.min_coherence = min_coherence
+        # log-spaced integration grid and the interpolation matrix from nodes onto it
+        log_nodes = np.log(self.freqs)
+        log_fine = np.linspace(log_nodes[0], log_nodes[-1], (len(self.freqs) - 1) * oversampling + 1)
+        self._omegas = 2 * np.pi * np.exp(log_fine)
+        eye = np.eye(len(self.freqs))
+        basis = np.stack([np.interp(log_fine, log_nodes, e) for e in eye], axis=1)
+        # trapezoidal weights of ∫ dω on the fine grid, times 1 / (π ω²)
+        dw = np.gradient(self._omegas)
+        self._weights = dw / (np.pi * self._omegas ** 2)
+        self._basis = basis
+        self.reset()
+
+    def reset(self):
+        m = len(self.freqs)
+        self._normal = np.zeros((m, m))
+        self._rhs = np.zeros(m)
+        self.n_points = 0
+        self._spectrum = None
+
+    def kernel(self, orders: Sequence[int], spacings: Sequence[float]) -> np.ndarray:
+        """
+        Linear map from spectrum values at nodes to χ of points, shape (n_points, n_nodes)
+        :param orders: numbers of pi pulses
+        :param spacings: free precession time between pulses, unit: s
+        """
+        filters = filter_functions(self._omegas, orders, spacings, self.t_pi)
+        return (filters * self._weights) @ self._basis
+
+    def add(self, orders: Sequence[int], spacings: Sequence[float], coherences: Sequence[float],
+            errors: Sequence[float] = None):
+        """
+        Add measured points, possibly a single one
+        :param orders: numbers of pi pulses
+        :param spacings: free precession time between pulses, unit: s
+        :param coherences: coherence C of each point, in (0, 1]
+        :param errors: standard errors of coherences; if not given, the errors are assumed equal
+        """
+        orders, spacings = np.atleast_1d(orders), np.atleast_1d(spacings)
+        c = np.atleast_1d(np.asarray(coherences, dtype=float))
+        valid = np.isfinite(c) & (c > self.min_coherence)
+        if not valid.any():
+            return
+        c = np.minimum(c[valid], 1.0)
+        k = self.kernel(orders[valid], spacings[valid])
+        # var(χ) = var(C) / C²
+        sigma = np.ones_like(c) if errors is None else np.atleast_1d(np.asarray(errors, dtype=float))[valid]
+        w = c ** 2 / np.maximum(sigma, 1e-12) ** 2
+        self._normal += (k * w[:, None]).T @ k
+        self._rhs += k.T @ (w * -np.log(c))
+        self.n_points += int(valid.sum())
+        self._spectrum = None
+
+    def spectrum(self) -> Optional[np.ndarray]:
+        """
+        Non-negative spectrum at nodes, unit: rad²/s; None if no point has been added
+        """
+        if self.n_points == 0:
+            return None
+        if self._spectrum is None:
+            from scipy.optimize import nnls
+            m = len(self.freqs)
+            d2 = np.diff(np.eye(m), n=2, axis=0)
+            penalty = d2.T @ d2
+            lam = self.smoothing * np.trace(self._normal) / max(np.trace(penalty), 1e-300)
+            a = self._normal + lam * penalty + 1e-12 * np.trace(self._normal) * np.eye(m)
+            scale = np.sqrt(np.diag(a))  # column scaling for conditioning
+            a_scaled = a / np.outer(scale, scale)
+            r = np.linalg.cholesky(a_scaled).T
+            y = np.linalg.solve(r.T, self._rhs / scale)
+            self._spectrum = nnls(r, y)[0] / scale
+        return self._spectrum
+
+    def predict(self, orders: Sequence[int], spacings: Sequence[float]) -> np.ndarray:
+        """
+        Coherence predicted by the current spectrum
+        """
+        s = self.spectrum()
+        return np.exp(-self.kernel(orders, spacings) @ s) if s is not None else np.full(len(orders), np.nan)
+
+    @staticmethod
+    def default_freqs(spacings: Sequence[float], t_pi: float = 0.0, n_nodes: int = 48) -> np.ndarray:
+        """
+        Log-spaced nodes covering filter peaks 1 / (2 (t + t_π)) of the spacings, with margins, unit: Hz
+        :param spacings: free precession time between pulses, unit: s
+        """
+        peaks = 1 / (2 * (np.asarray(spacings, dtype=float) + t_pi))
+        return np.geomspace(peaks.min() / 2, peaks.max() * 2, n_nodes)
@@ -0,0 +1,474 @@
+"""
+Declarative pulse programs compiled into ASG channel sequences
+---
+A pulse program describes one detection period as nested blocks with relative timing:
+    - `Pulse(channels, duration)`: high level on one or several channels
+    - `Wait(duration)`: low level on all channels
+    - `Seq(*items)`: items one after another
+    - `Par(*items)`: items starting at the same time, lasting as long as the longest one
+    - `Loop(n, *items)`: items repeated n times, kept symbolic in compiled sequences (`CompressedSequence`)
+Durations (unit: ns) are numbers or expressions of symbolic sweep variables, e.g., `2 * Var('t') + 100`.
+`PulseProgram.compile(t=times)` evaluates the program for all sweep values at once with NumPy, rounds timing to the
+ASG resolution, validates pulse widths and returns the high-level-effective sequences of every channel.
+
+Example (Ramsey):
+    t = Var('t')
+    program = PulseProgram(Seq(
+        Pulse('laser', 2000), Wait(1000),
+        Pulse('mw', 40), Wait(t), Pulse('mw', 40), Wait(200),
+        Par(Pulse('laser', 650), Seq(Wait(50), Pulse('tagger', 400), Wait(200)))
+    ), channels=['laser', 'mw', 'tagger'])
+    compiled = program.compile(t=[100, 200, 300])
+    laser_seq, mw_seq, tagger_seq = compiled.sequences(0)
+"""
+
+import numpy as np
+from typing import List, Dict, Sequence, Union
+from odmactor.utils.sequence import CompressedSequence, ASG_MIN_HIGH, ASG_MIN_LOW, ASG_MAX_LENGTH
+
+ASG_RESOLUTION = 0.5  # timing resolution kept by compiled sequences, unit: ns
+
+
+class Expr:
+    """
+    Expression of sweep variables, evaluated for all sweep values at once
+    """
+
+    def evaluate(self, env: Dict[str, np.ndarray]) -> np.ndarray:
+        raise NotImplementedError
+
+    def __add__(self, other):
+        return _BinOp('+', self, other)
+
+    def __radd__(self, other):
+        return _BinOp('+', other, self)
+
+    def __sub__(self, other):
+        return _BinOp('-', self, other)
+
+    def __rsub__(self, other):
+        return _BinOp('-', other, self)
+
+    def __mul__(self, other):
+        return _BinOp('*', self, other)
+
+    def __rmul__(self, other):
+        return _BinOp('*', other, self)
+
+    def __truediv__(self, other):
+        return _BinOp('/', self, other)
+
+    def __neg__(self):
+        return _BinOp('*', -1, self)
+
+
+class Const(Expr):
+    def __init__(self, value: float):
+        self.value = float(value)
+
+    def evaluate(self, env: Dict[str, np.ndarray]) -> np.ndarray:
+        return np.asarray(self.value)
+
+    def __repr__(self):
+        return repr(self.value)
+
+
+class Var(Expr):
+    """
+    Symbolic sweep variable
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def evaluate(self, env: Dict[str, np.ndarray]) -> np.ndarray:
+        try:
+            return env[self.name]
+        except KeyError:
+            raise ValueError('values of sweep variable "{}" are not designated'.format(self.name))
+
+    def __repr__(self):
+        return 'Var({!r})'.format(self.name)
+
+
+class _BinOp(Expr):
+    _ops = {'+': np.add, '-': np.subtract, '*': np.multiply, '/': np.divide}
+
+    def __init__(self, op: str, left, right):
+        self.op = op
+        self.left = as_expr(left)
+        self.right = as_expr(right)
+
+    def evaluate(self, env: Dict[str, np.ndarray]) -> np.ndarray:
+        return self._ops[self.op](self.left.evaluate(env), self.right.evaluate(env))
+
+    def __repr__(self):
+        return '({!r} {} {!r})'.format(self.left, self.op, self.right)
+
+
+def as_expr(x: Union[Expr, float]) -> Expr:
+    return x if isinstance(x, Expr) else Const(x)
+
+
+class Item:
+    """
+    Element of a pulse program
+    """
+
+    def emit(self, start: np.ndarray, env: Dict[str, np.ndarray], pulses: Dict[str, list],
+             resolution: float) -> np.ndarray:
+        """
+        Append (start, stop) of high-level pulses on each channel into `pulses`
+        :param start: start time for each sweep value, unit: ns
+        :return: stop time for each sweep value, unit: ns
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _duration(duration: Expr, start: np.ndarray, env: Dict[str, np.ndarray], resolution: float) -> np.ndarray:
+        d = np.round(np.broadcast_to(duration.evaluate(env), start.shape) / resolution) * resolution
+        if np.any(d < 0):
+            i = int(np.flatnonzero(d < 0)[0])
+            raise ValueError('negative duration {!r} = {} ns at sweep point {}'.format(duration, d[i], i))
+        return d
+
+
+class Pulse(Item):
+    """
+    High-level pulse on one or several channels
+    """
+
+    def __init__(self, channels: Union[str, Sequence[str]], duration: Union[Expr, float]):
+        """
+        :param channels: channel name, or names of channels being high at the same time
+        :param duration: pulse width, unit: ns
+        """
+        self.channels = [channels] if isinstance(channels, str) else list(channels)
+        self.duration = as_expr(duration)
+
+    def emit(self, start, env, pulses, resolution):
+        stop = start + self._duration(self.duration, start, env, resolution)
+        for ch in self.channels:
+            if ch not in pulses:
+                raise ValueError('unknown channel "{}"'.format(ch))
+            pulses[ch].append((start, stop))
+        return stop
+
+    def __repr__(self):
+        return 'Pulse({!r}, {!r})'.format(self.channels, self.duration)
+
+
+class Wait(Item):
+    """
+    Low level on all channels
+    """
+
+    def __init__(self, duration: Union[Expr, float]):
+        """
+        :param duration: waiting time, unit: ns
+        """
+        self.duration = as_expr(duration)
+
+    def emit(self, start, env, pulses, resolution):
+        return start + self._duration(self.duration, start, env, resolution)
+
+    def __repr__(self):
+        return 'Wait({!r})'.format(self.duration)
+
+
+class Seq(Item):
+    """
+    Sequential block: each item starts when the previous one stops
+    """
+
+    def __init__(self, *items: Item):
+        self.items = list(items)
+
+    def emit(self, start, env, pulses, resolution):
+        for item in self.items:
+            start = item.emit(start, env, pulses, resolution)
+        return start
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(map(repr, self.items)))
+
+
+class Par(Seq):
+    """
+    Parallel block: all items start at the same time, the block stops when the longest item stops
+    """
+
+    def emit(self, start, env, pulses, resolution):
+        stops = [item.emit(start, env, pulses, resolution) for item in self.items]
+        return np.max(stops, axis=0) if stops else start
+
+
+class _Repeat:
+    """
+    Pulses of a channel within a loop: `entries` relative to the beginning of each of `n` iterations
+    """
+
+    def __init__(self, start: np.ndarray, entries: list, period: np.ndarray, n: int):
+        self.start = start
+        self.stop = start + period * n
+        self.entries = entries
+        self.period = period
+        self.n = n
+
+
+class Loop(Seq):
+    """
+    Sequential block repeated for several times, without unrolling
+    """
+
+    def __init__(self, n: int, *items: Item):
+        """
+        :param n: number of repetitions
+        """
+        super(Loop, self).__init__(*items)
+        self.n = int(n)
+
+    def emit(self, start, env, pulses, resolution):
+        body = {ch: [] for ch in pulses}
+        period = super(Loop, self).emit(np.zeros_like(start), env, body, resolution)
+        if self.n > 0:
+            for ch, entries in body.items():
+                if entries:
+                    pulses[ch].append(_Repeat(start, entries, period, self.n))
+        return start + period * self.n
+
+    def __repr__(self):
+        return 'Loop({}, {})'.format(self.n, ', '.join(map(repr, self.items)))
+
+
+class _Stream:
+    """
+    Loop-compressed sequence [low, high, low, ..., low] of a channel for all sweep values
+    ---
+    Blocks are [content, repeat], where content is a list of columns (1-D arrays over sweep values) or a nested
+    `_Stream`; the last block is always a list of columns repeated once, whose last column can be extended.
+    """
+
+    def __init__(self, n: int):
+        self.blocks = [[[np.zeros(n)], 1]]
+
+    def extend_low(self, width: np.ndarray):
+        columns = self.blocks[-1][0]
+        columns[-1] = columns[-1] + width
+
+    def add_pulse(self, width: np.ndarray):
+        self.blocks[-1][0].extend([width, np.zeros_like(width)])
+
+    def add_repeat(self, body: '_Stream', n: int):
+        """
+        Append `n` iterations of `body`, whose leading low interval is merged into the last low interval of each
+        previous iteration, so that the repeated unit begins with a high-level pulse
+        """
+        lead = body.blocks[0][0][0]
+        rest = [[list(c) if isinstance(c, list) else c, r] for c, r in body.blocks]
+        rest[0][0] = rest[0][0][1:]
+        rest = [b for b in rest if not isinstance(b[0], list) or b[0]]
+        self.extend_low(lead)
+        if n > 1:
+            unit = _Stream(0)
+            unit.blocks = [[list(c) if isinstance(c, list) else c, r] for c, r in rest]
+            unit.extend_low(lead)
+            self.blocks.append([unit, n - 1])
+        self.blocks.extend(rest)
+
+    def freeze(self) -> '_Stream':
+        """
+        Stack columns into 2-D arrays in shape of [n_values, n_columns]
+        """
+        for block in self.blocks:
+            if isinstance(block[0], list):
+                block[0] = np.stack(block[0], axis=1)
+            elif isinstance(block[0], _Stream):
+                block[0].freeze()  # nested streams may be shared by several blocks
+        return self
+
+    def leaves(self, index: int = 0):
+        """
+        Iterate over (arrays, index of the first column in the whole stream) of all blocks without repetition
+        """
+        for content, repeat in self.blocks:
+            if isinstance(content, np.ndarray):
+                yield content, index
+                index += content.shape[1] * repeat
+            else:
+                yield from content.leaves(index)
+                index += content.n_columns * repeat
+
+    @property
+    def n_columns(self) -> int:
+        return sum((c.shape[1] if isinstance(c, np.ndarray) else c.n_columns) * r for c, r in self.blocks)
+
+    def blocks_of(self, i: int) -> list:
+        """
+        Blocks of `CompressedSequence` at the i-th sweep point
+        """
+        return [(c[i] if isinstance(c, np.ndarray) else CompressedSequence(c.blocks_of(i)), r) for c, r in self.blocks]
+
+
+def _sweep_point(values: Dict[str, np.ndarray], mask: np.ndarray) -> str:
+    i = int(np.flatnonzero(mask.reshape(len(mask), -1).any(axis=1))[0])
+    return ', '.join('{}={}'.format(name, v[i]) for name, v in values.items()) or 'index {}'.format(i)
+
+
+def _check_widths(ch: str, highs: np.ndarray, lows: np.ndarray, values: Dict[str, np.ndarray]):
+    """
+    Check widths of non-zero high-level pulses and low-level intervals, both in shape of [n_values, n]
+    """
+    narrow = (highs > 0) & (highs < ASG_MIN_HIGH)
+    if np.any(narrow):
+        raise ValueError('pulse on channel "{}" narrower than {} ns at {}'.format(
+            ch, ASG_MIN_HIGH, _sweep_point(values, narrow)))
+    short = (lows > 0) & (lows < ASG_MIN_LOW)
+    if np.any(short):
+        raise ValueError('interval on channel "{}" shorter than {} ns at {}'.format(
+            ch, ASG_MIN_LOW, _sweep_point(values, short)))
+
+
+class CompiledProgram:
+    """
+    High-level-effective sequences of all channels for all sweep values
+    """
+
+    def __init__(self, key: str, values: Dict[str, np.ndarray], channels: List[str],
+                 arrays: Dict[str, np.ndarray], periods: np.ndarray):
+        """
+        :param key: representation of the compiled program
+        :param values: sweep values of each variable, 1-D arrays of the same length
+        :param channels: channel names
+        :param arrays: sequences of each channel, in shape of [n_values, 2 * n_pulses + 2], or loop-compressed
+        :param periods: period length of each sweep value, unit: ns
+        """
+        self.key = key
+        self.values = values
+        self.channels = channels
+        self.arrays = arrays
+        self.periods = periods
+
+    def __len__(self):
+        return len(self.periods)
+
+    def index(self, **values) -> int:
+        """
+        Index of the sweep point with designated variable values, -1 if not compiled
+        """
+        match = np.ones(len(self), dtype=bool)
+        for name, value in values.items():
+            if name not in self.values:
+                return -1
+            match &= self.values[name] == value
+        idx = np.flatnonzero(match)
+        return int(idx[0]) if len(idx) else -1
+
+    def sequences(self, i: int) -> List[Union[List[float], CompressedSequence]]:
+        """
+        Sequences of all channels at the i-th sweep point, in order of `channels`; channels with pulses in loops
+        are given as `CompressedSequence` instances
+        """
+        seqs = []
+        for ch in self.channels:
+            arr = self.arrays[ch]
+            if isinstance(arr, _Stream):
+                seqs.append(CompressedSequence([([0.0], 1)] + arr.blocks_of(i)))
+            else:
+                seqs.append(arr[i].tolist())
+        return seqs
+
+
+class PulseProgram:
+    """
+    Pulse program of a detection period
+    """
+
+    def __init__(self, body: Item, channels: Sequence[str] = ('laser', 'mw', 'tagger'),
+                 resolution: float = ASG_RESOLUTION):
+        """
+        :param body: program items
+        :param channels: names of channels, in order of compiled sequences
+        :param resolution: timing resolution, unit: ns; half-integer nanoseconds are exactly representable in
+                            binary floating point and thus always accepted by ASG data checking
+        """
+        self.body = body
+        self.channels = list(channels)
+        self.resolution = resolution
+
+    def __repr__(self):
+        return 'PulseProgram({!r}, {!r}, {!r})'.format(self.body, self.channels, self.resolution)
+
+    def compile(self, **values) -> CompiledProgram:
+        """
+        Compile the program for all sweep values at once
+        :param values: values of each sweep variable, scalars or 1-D arrays of the same length
+        :return: compiled program
+        """
+        values = {name: np.atleast_1d(np.asarray(v, dtype=float)) for name, v in values.items()}
+        shape = np.broadcast_shapes(*[v.shape for v in values.values()]) if values else (1,)
+        values = {name: np.broadcast_to(v, shape) for name, v in values.items()}
+        pulses = {ch: [] for ch in self.channels}
+        periods = self.body.emit(np.zeros(shape), values, pulses, self.resolution)
+        if np.any(periods > ASG_MAX_LENGTH):
+            raise ValueError('period length exceeds {} ns'.format(ASG_MAX_LENGTH))
+        arrays = {ch: self._channel_array(ch, pulses[ch], periods, values) for ch in self.channels}
+        return CompiledProgram(repr(self), values, self.channels, arrays, periods)
+
+    @staticmethod
+    def _channel_array(ch: str, pulses: list, periods: np.ndarray,
+                       values: Dict[str, np.ndarray]) -> Union[np.ndarray, _Stream]:
+        """
+        Convert (start, stop) of pulses into ASG sequences [high, low, high, low, ...] for all sweep values
+        """
+        n = len(periods)
+        if not pulses:
+            return np.zeros((n, 2))
+        if any(isinstance(p, _Repeat) for p in pulses):
+            stream = PulseProgram._channel_stream(ch, pulses, periods, values).freeze()
+            for arr, index in stream.leaves():
+                high = (index + np.arange(arr.shape[1])) % 2 == 1
+                _check_widths(ch, arr[:, high], arr[:, ~high], values)
+            return stream
+        starts = np.stack([p[0] for p in pulses], axis=1)
+        stops = np.stack([p[1] for p in pulses], axis=1)
+        order = np.argsort(starts, axis=1, kind='stable')
+        starts, stops = np.take_along_axis(starts, order, 1), np.take_along_axis(stops, order, 1)
+        highs = stops - starts
+        lows = np.concatenate([starts[:, :1], starts[:, 1:] - stops[:, :-1], (periods - stops[:, -1])[:, None]], 1)
+        if np.any(lows < 0):
+            raise ValueError('overlapping pulses on channel "{}" at {}'.format(ch, _sweep_point(values, lows < 0)))
+        _check_widths(ch, highs, lows, values)
+
+        seqs = np.empty((n, 2 * len(pulses) + 2))
+        seqs[:, 0], seqs[:, 1] = 0, starts[:, 0]
+        seqs[:, 2::2], seqs[:, 3::2] = highs, lows[:, 1:]
+        if not np.any(seqs[:, 1]):
+            seqs = seqs[:, 2:]  # channel starting with a high-level pulse
+        return seqs
+
+    @staticmethod
+    def _channel_stream(ch: str, entries: list, period: np.ndarray, values: Dict[str, np.ndarray]) -> _Stream:
+        """
+        Convert pulses and loops of a channel into a loop-compressed stream, in time order
+        """
+        starts = np.stack([e.start if isinstance(e, _Repeat) else e[0] for e in entries], axis=1)
+        order = np.argsort(starts, axis=1, kind='stable')
+        if np.any(order != order[0]):
+            raise ValueError('order of pulses and loops on channel "{}" varies with sweep values'.format(ch))
+        stream = _Stream(len(period))
+        cursor = np.zeros_like(period)
+        for e in [entries[j] for j in order[0]]:
+            start = e.start if isinstance(e, _Repeat) else e[0]
+            if np.any(start < cursor):
+                raise ValueError('overlapping pulses on channel "{}" at {}'.format(
+                    ch, _sweep_point(values, start < cursor)))
+            stream.extend_low(start - cursor)
+            if isinstance(e, _Repeat):
+                stream.add_repeat(PulseProgram._channel_stream(ch, e.entries, e.period, values), e.n)
+                cursor = e.stop
+            else:
+                stream.add_pulse(e[1] - e[0])
+                cursor = e[1]
+        stream.extend_low(period - cursor)
+        return stream
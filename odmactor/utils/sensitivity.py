@@ -0,0 +1,228 @@
+"""
+Photon-shot-noise sensitivity estimated while scanning
+---
+For each detection point i, the measured signal S_i (counts, or counts normalized by reference counts) has a standard
+error σ_i estimated from the variance of the per-period counts. With the slope dS/dx of a model fitted to the
+spectrum, the noise-equivalent shift of the sweep parameter per unit measurement time is
+    η_i = σ_i * √T_i / |dS/dx|_i
+where T_i is the wall-clock time spent on the point, i.e., dwell time plus all host and instrument overheads.
+The best (smallest) η over points is the sensitivity achievable by sitting at the steepest point of the spectrum.
+Refits run in a background thread, so that fitting time is not charged to the wall-clock time of points.
+
+Models:
+    - 'lorentzian' (frequency axis, unit: Hz): η is a frequency sensitivity (Hz/√Hz), and η / γ the magnetic
+      sensitivity (T/√Hz)
+    - 'sinusoid' (time axis, unit: ns): S = a + b * exp(-t / τ) * cos(2π f t + φ), η is the sensitivity to the
+      oscillation frequency f (Hz/√Hz), i.e., detuning for Ramsey fringes (η / γ in T/√Hz) or Rabi frequency
+    - None: no model, e.g., for decay curves of T1, Hahn echo or dynamical decoupling; only the efficiency is estimated
+"""
+
+import threading
+import time
+import numpy as np
+from typing import Optional, Sequence
+from odmactor.utils import constants as C
+from odmactor.utils.imaging import GAMMA_NV, fit_lorentzians
+
+
+def _sinusoid(t, a, b, tau, f, phi):
+    return a + b * np.exp(-t / tau) * np.cos(2 * np.pi * f * t + phi)
+
+
+def fit_sinusoid(times: Sequence[float], signal: Sequence[float]) -> dict:
+    """
+    Fit a damped sinusoid S = a + b * exp(-t / τ) * cos(2π f t + φ), with initial frequency from FFT
+    :param times: time intervals, unit: ns
+    :param signal: signal values
+    :return: dict of 'a', 'b', 'tau' (ns), 'freq' (1/ns), 'phase'
+    """
+    from scipy.optimize import curve_fit
+    t, y = np.asarray(times, dtype=float), np.asarray(signal, dtype=float)
+    span = t[-1] - t[0]
+    grid = np.linspace(t[0], t[-1], len(t))
+    spectrum = np.abs(np.fft.rfft(np.interp(grid, t, y) - y.mean()))
+    k = int(np.argmax(spectrum[1:])) + 1 if len(spectrum) > 1 else 1
+    p0 = [y.mean(), (y.max() - y.min()) / 2, 2 * span, k / span, 0.0]
+    p0[4] = -2 * np.pi * p0[3] * t[0] + (0.0 if y[0] >= y.mean() else np.pi)
+    popt, _ = curve_fit(_sinusoid, t, y, p0=p0, maxfev=5000)
+    return dict(zip(['a', 'b', 'tau', 'freq', 'phase'], popt.tolist()))
+
+
+class SensitivityEstimator:
+    """
+    Streaming estimator of photon-shot-noise limited sensitivity, updated at each detection point of scanning
+    """
+
+    def __init__(self, refit_every: int = 10, min_points: int = 8, gamma: float = GAMMA_NV, n_dips: int = 1):
+        """
+        :param refit_every: number of detection points between refits of the model
+        :param min_points: minimal number of points before the first fit
+        :param gamma: gyromagnetic ratio converting frequency into magnetic field, unit: Hz/T
+        :param n_dips: number of resonance dips of the Lorentzian model
+        """
+        self.refit_every = refit_every
+        self.min_points = min_points
+        self.gamma = gamma
+        self.n_dips = n_dips
+        self.reset([])
+
+    def reset(self, xs: Sequence[float], model: Optional[str] = 'lorentzian', dwells: Sequence[float] = None):
+        """
+        Start a new scan
+        :param xs: scanning points, i.e., frequencies (Hz) or time intervals (ns)
+        :param model: 'lorentzian', 'sinusoid', or None for not fitting
+        :param dwells: pure acquisition time of each point, unit: s; for comparison with wall-clock time
+        """
+        if model not in ('lorentzian', 'sinusoid', None):
+            raise ValueError('unsupported model "{}"'.format(model))
+        self.join()
+        if model is not None:
+            import scipy.optimize  # imported before scanning rather than by the first refit
+        n = len(xs)
+        self.xs = np.asarray(xs, dtype=float)
+        self.model = model
+        self.dwells = np.full(n, np.nan) if dwells is None else np.asarray(dwells, dtype=float)
+        self.signal = np.full(n, np.nan)  # signal, normalized by reference if acquired
+        self.error = np.full(n, np.nan)  # standard error of signal
+        self.durations = np.full(n, np.nan)  # wall-clock time of each point, unit: s
+        self.slopes = np.full(n, np.nan)  # dS/dx of the fitted model
+        self.params: Optional[dict] = None
+        self.n_done = 0
+        self._fitting: Optional[threading.Thread] = None
+        self._last = time.perf_counter()
+
+    @staticmethod
+    def _mean_error(data: np.ndarray):
+        data = np.asarray(data, dtype=float).ravel()
+        if data.size < 2:
+            return float(data.mean()), np.nan
+        return float(data.mean()), float(np.sqrt(data.var(ddof=1) / data.size))
+
+    def update(self, index: int, data: np.ndarray, data_ref: np.ndarray = None):
+        """
+        Add a detection point; its wall-clock time is the time elapsed since the previous point (or `reset()`),
+        excluding the bookkeeping of the estimator
+        :param index: index of the scanning point
+        :param data: per-period signal counts of the point
+        :param data_ref: per-period reference counts of the point, optional
+        """
+        self.durations[index] = time.perf_counter() - self._last
+        mean, err = self._mean_error(data)
+        if data_ref is not None:
+            mean_ref, err_ref = self._mean_error(data_ref)
+            ratio = mean / mean_ref if mean_ref > 0 else np.nan
+            err = abs(ratio) * np.sqrt((err / mean) ** 2 + (err_ref / mean_ref) ** 2) if mean > 0 else np.nan
+            mean = ratio
+        self.signal[index], self.error[index] = mean, err
+        self.n_done = max(self.n_done, index + 1)
+        if self.n_done >= self.min_points and self.n_done % self.refit_every == 0:
+            self._refit()
+        self._last = time.perf_counter()
+
+    def _refit(self):
+        """
+        Refit in a background thread, skipped if the previous refit is still running
+        """
+        if self.model is None or (self._fitting is not None and self._fitting.is_alive()):
+            return
+        self._fitting = threading.Thread(target=self.fit, daemon=True)
+        self._fitting.start()
+
+    def join(self):
+        """
+        Wait for the running refit, if any
+        """
+        fitting = getattr(self, '_fitting', None)
+        if fitting is not None:
+            fitting.join()
+
+    def finish(self) -> Optional[dict]:
+        """
+        Final fit over all acquired points, after the scan
+        :return: fitted parameters, None if fitting failed or no model
+        """
+        self.join()
+        return self.fit()
+
+    def fit(self) -> Optional[dict]:
+        """
+        Fit the model to acquired points and update slopes of all points
+        :return: fitted parameters, None if fitting failed or no model
+        """
+        done = np.isfinite(self.signal)
+        if self.model is None or done.sum() < self.min_points:
+            return None
+        x, y = self.xs[done], self.signal[done]
+        try:
+            if self.model == 'lorentzian':
+                fit = fit_lorentzians(x, y[None], n_dips=self.n_dips)
+                a, w = fit['baseline'][0], fit['linewidth'][0] / 2
+                d, c = fit['contrast'][:, 0], fit['centers'][:, 0]
+                u = self.xs[:, None] - c
+                self.slopes = (a * d * w ** 2 * 2 * u / (u ** 2 + w ** 2) ** 2).sum(axis=1)
+                self.params = {'baseline': float(a), 'linewidth': float(2 * w), 'contrast': d.tolist(),
+                               'centers': c.tolist()}
+            else:
+                p = fit_sinusoid(x, y)
+                t = self.xs
+                # derivative with respect to frequency in Hz, times being in ns
+                self.slopes = -p['b'] * np.exp(-t / p['tau']) * np.sin(2 * np.pi * p['freq'] * t + p['phase']) * \
+                    2 * np.pi * t * C.nano
+                self.params = p
+        except (RuntimeError, ValueError, np.linalg.LinAlgError):
+            return None
+        return self.params
+
+    def sensitivities(self, wall_clock: bool = True) -> np.ndarray:
+        """
+        Noise-equivalent frequency shift per unit measurement time of each point, unit: Hz/√Hz
+        :param wall_clock: whether to use wall-clock time of points, otherwise their pure acquisition time
+        """
+        times = self.durations if wall_clock else self.dwells
+        with np.errstate(divide='ignore', invalid='ignore'):
+            eta = self.error * np.sqrt(times) / np.abs(self.slopes)
+        eta[~np.isfinite(eta)] = np.nan
+        return eta
+
+    def best(self, wall_clock: bool = True) -> dict:
+        """
+        Best sensitivity over acquired points
+        :return: dict of 'index', 'x', 'freq_sensitivity' (Hz/√Hz), 'b_sensitivity' (T/√Hz)
+        """
+        eta = self.sensitivities(wall_clock)
+        if np.all(np.isnan(eta)):
+            return {'index': None, 'x': None, 'freq_sensitivity': np.nan, 'b_sensitivity': np.nan}
+        i = int(np.nanargmin(eta))
+        return {'index': i, 'x': float(self.xs[i]), 'freq_sensitivity': float(eta[i]),
+                'b_sensitivity': float(eta[i] / self.gamma)}
+
+    @property
+    def efficiency(self) -> float:
+        """
+        Ratio of pure acquisition time to wall-clock time of acquired points
+        """
+        done = np.isfinite(self.durations)
+        return float(np.nansum(self.dwells[done]) / self.durations[done].sum()) if done.any() else np.nan
+
+    def status(self) -> str:
+        """
+        Brief live report of the best sensitivity so far
+        """
+        b = self.best()['b_sensitivity']
+        return 'η {:.3g} nT/√Hz'.format(b / C.nano) if np.isfinite(b) else 'η --'
+
+    def summary(self) -> dict:
+        """
+        Summary of estimation: best sensitivities with wall-clock and pure acquisition time, efficiency and model
+        """
+        wall, ideal = self.best(True), self.best(False)
+        return {
+            'model': self.model,
+            'params': self.params,
+            'freq_sensitivity': wall['freq_sensitivity'],
+            'b_sensitivity': wall['b_sensitivity'],
+            'b_sensitivity_dwell': ideal['b_sensitivity'],
+            'best_x': wall['x'],
+            'efficiency': self.efficiency,
+            'wall_time': float(np.nansum(self.durations)),
+        }
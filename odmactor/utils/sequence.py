@@ -3,149 +3,474 @@ Utils functions processing ASG sequences
 """
 import math
 import numpy as np
-import matplotlib.pyplot as plt
 from functools import reduce
-from typing import List
-from operator import add
-from copy import deepcopy
-from matplotlib.figure import Figure
+from typing import List, Tuple, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
+ASG_MIN_HIGH = 7.5  # minimal width of high-level pulses, unit: ns
+ASG_MIN_LOW = 10  # minimal width of low-level intervals, unit: ns
+ASG_MAX_LENGTH = 5.2e9  # maximal length of a channel sequence, unit: ns
+
+
+class CompressedSequence:
+    """
+    Loop-compressed sequence of segment widths [high, low, high, low, ...]
+    ---
+    The sequence is a concatenation of blocks `(content, repeat)`, where `content` is a 1-D array of segment widths
+    or a nested `CompressedSequence`. Repeated contents have an even number of segments, so the level of a segment
+    is determined by the parity of its index in the whole sequence, as in lists. Lengths, validation and rendering
+    work on blocks, and the sequence is expanded only when downloaded into ASG.
+    """
+
+    def __init__(self, blocks: List[Tuple[Union[np.ndarray, list, 'CompressedSequence'], int]] = None):
+        """
+        :param blocks: list of (content, number of repetitions)
+        """
+        self.blocks = []
+        for content, repeat in blocks or []:
+            if not isinstance(content, CompressedSequence):
+                content = np.asarray(content, dtype=float)
+            repeat = int(repeat)
+            if repeat > 1 and len(content) % 2:
+                raise ValueError('repeated content should have an even number of segments')
+            if repeat > 0 and len(content):
+                self.blocks.append((content, repeat))
+        self._n_segments = sum(len(c) * r for c, r in self.blocks)
+        self._length = float(sum(_content_length(c) * r for c, r in self.blocks))
+
+    @classmethod
+    def from_list(cls, seq: List[float]) -> 'CompressedSequence':
+        return cls([(seq, 1)])
+
+    @property
+    def length(self) -> float:
+        """
+        Total time length, unit: ns
+        """
+        return self._length
+
+    @property
+    def n_blocks(self) -> int:
+        return sum(1 if isinstance(c, np.ndarray) else c.n_blocks + 1 for c, _ in self.blocks)
+
+    def __len__(self):
+        return self._n_segments
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __mul__(self, n: int) -> 'CompressedSequence':
+        return CompressedSequence([(self, n)])
+
+    __rmul__ = __mul__
+
+    def __add__(self, other) -> 'CompressedSequence':
+        return CompressedSequence(self.blocks + _as_blocks(other))
+
+    def __radd__(self, other) -> 'CompressedSequence':
+        return CompressedSequence(_as_blocks(other) + self.blocks)
+
+    def __repr__(self):
+        return 'CompressedSequence({} blocks, {} segments, length {} ns)'.format(
+            self.n_blocks, len(self), self.length)
+
+    def expand(self) -> np.ndarray:
+        """
+        Expand all repetitions into a 1-D array of segment widths
+        """
+        if not self.blocks:
+            return np.empty(0)
+        return np.concatenate([np.tile(c if isinstance(c, np.ndarray) else c.expand(), r) for c, r in self.blocks])
+
+    def tolist(self) -> List[float]:
+        return self.expand().tolist()
+
+    def widths(self) -> np.ndarray:
+        """
+        Distinct segment widths
+        """
+        return np.unique(np.concatenate([c if isinstance(c, np.ndarray) else c.widths() for c, _ in self.blocks]))
+
+    def has_levels(self, index: int = 0) -> Tuple[bool, bool]:
+        """
+        Whether the sequence contains high and low levels, if it begins at the `index`-th segment
+        """
+        has_high = has_low = False
+        for content, repeat in self.blocks:
+            if isinstance(content, np.ndarray):
+                high = (index + np.arange(len(content))) % 2 == 0
+                h, l = bool(np.any(content[high] > 0)), bool(np.any(content[~high] > 0))
+            else:
+                h, l = content.has_levels(index)
+            has_high, has_low = has_high or h, has_low or l
+            index += len(content) * repeat
+        return has_high, has_low
+
+    def segments(self, resolution: float = 0.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Time intervals of segments, in O(blocks + length / resolution); repeated blocks whose period is shorter than
+        `resolution` are given as single intervals which may contain both levels
+        :param resolution: time resolution, unit: ns
+        :return: starts, stops, whether containing high level, whether containing low level
+        """
+        parts = []
+        self._collect(0.0, 0, resolution, parts)
+        if not parts:
+            return np.empty(0), np.empty(0), np.empty(0, dtype=bool), np.empty(0, dtype=bool)
+        return tuple(np.concatenate([p[k] for p in parts]) for k in range(4))
+
+    def _collect(self, t: float, index: int, resolution: float, parts: list) -> Tuple[float, int]:
+        for content, repeat in self.blocks:
+            period = _content_length(content)
+            if repeat > 1 and period < resolution:
+                has_high, has_low = CompressedSequence([(content, 1)]).has_levels(index)
+                parts.append(([t], [t + period * repeat], [has_high], [has_low]))
+                t, index = t + period * repeat, index + len(content) * repeat
+                continue
+            for _ in range(repeat):
+                if isinstance(content, np.ndarray):
+                    edges = t + np.concatenate([[0], np.cumsum(content)])
+                    high = (index + np.arange(len(content))) % 2 == 0
+                    parts.append((edges[:-1], edges[1:], high, ~high))
+                    t, index = edges[-1], index + len(content)
+                else:
+                    t, index = content._collect(t, index, resolution, parts)
+        return t, index
+
+    def check(self, index: int = 0) -> bool:
+        """
+        Check widths of all segments in O(blocks): non-zero high-level pulses should be no narrower than
+        `ASG_MIN_HIGH`, and non-zero low-level intervals no shorter than `ASG_MIN_LOW`
+        """
+        if index == 0 and self.length > ASG_MAX_LENGTH:
+            return False
+        for content, repeat in self.blocks:
+            if isinstance(content, np.ndarray):
+                high = (index + np.arange(len(content))) % 2 == 0
+                if np.any((content < 0) | (high & (content > 0) & (content < ASG_MIN_HIGH)) |
+                          (~high & (content > 0) & (content < ASG_MIN_LOW))):
+                    return False
+            elif not content.check(index):
+                return False
+            index += len(content) * repeat
+        return True
+
+
+def _content_length(content: Union[np.ndarray, CompressedSequence]) -> float:
+    return float(content.sum()) if isinstance(content, np.ndarray) else content.length
+
+
+def _as_blocks(seq) -> list:
+    return list(seq.blocks) if isinstance(seq, CompressedSequence) else [(seq, 1)]
+
+
+def sequence_length(seq: Union[List[float], CompressedSequence]) -> float:
+    """
+    Total time length of a sequence (list or compressed), unit: ns
+    """
+    return seq.length if isinstance(seq, CompressedSequence) else float(sum(seq))
+
+
+def expand_sequence(seq: Union[List[float], CompressedSequence]) -> List[float]:
+    """
+    Expand a compressed sequence into a list; lists are returned as they are
+    """
+    return seq.tolist() if isinstance(seq, CompressedSequence) else seq
 
 
 class SequenceString:
     """
     A OOP encapsulation: String representation of a sequence of pulses
+    ---
+    Pieces of each row are kept in lists and joined only when converted into a string
     """
 
     def __init__(self, height: int = 3, unit_width=1):
-        self.strings = [''] * height
+        self.rows = [[] for _ in range(height)]
         self.unit_width = unit_width
 
+    @property
+    def strings(self) -> List[str]:
+        return [''.join(row) for row in self.rows]
+
+    def append_edge(self, level_before: int, level_after: int):
+        """
+        Append a one-character column at the boundary of two segments, a vertical bar if the level changes
+        """
+        if level_before != level_after:
+            self.rows[0].append('-')
+            for row in self.rows[1:]:
+                row.append('|')
+        else:
+            self.append_level(level_before, 1)
+
+    def append_level(self, level: int, width: int, compressed: bool = False):
+        """
+        Append a segment of constant level
+        :param level: 1 for high level, 0 for low level
+        :param width: width in characters
+        :param compressed: if True, the segment is marked by "~~" as a compressed long segment
+        """
+        width = width * self.unit_width
+        idx_level = 0 if level else len(self.rows) - 1
+        for i, row in enumerate(self.rows):
+            if i != idx_level:
+                row.append(' ' * width)
+            elif compressed and width >= 4:
+                row.append('-' * ((width - 2) // 2) + '~~' + '-' * (width - 2 - (width - 2) // 2))
+            else:
+                row.append('-' * width)
+
+    def append_mixed(self, width: int):
+        """
+        Append a segment containing both levels, which is too fine to be drawn
+        """
+        width = width * self.unit_width
+        self.rows[0].append('-' * width)
+        for row in self.rows[1:-1]:
+            row.append('#' * width)
+        self.rows[-1].append('-' * width)
+
     def append_low_pulse(self, width):
-        l = len(self.strings)
-        for i in range(l - 1):
-            # for string in self.strings[:-1]:
-            self.strings[i] += ' ' * width * self.unit_width
-        self.strings[-1] += '-' * width * self.unit_width
+        self.append_level(0, width)
 
     def append_high_pulse(self, width):
-        l = len(self.strings)
-        if width == 0:
-            pass
-        else:
-            for i in range(1, l):
-                # for string in self.strings[1:]:
-                self.strings[i] += '|'
-                self.strings[i] += ' ' * width * self.unit_width
-                self.strings[i] += '|'
-            self.strings[0] += '-' * width * self.unit_width + '-' * 2
+        if width > 0:
+            self.append_edge(0, 1)
+            self.append_level(1, width)
+            self.append_edge(1, 0)
 
     def __str__(self):
         return '\n'.join(self.strings)
 
 
-def sequences_to_figure(sequences: List[List[int]]) -> Figure:
+def sequence_edges(seq: List[int]) -> np.ndarray:
+    """
+    Edges (boundaries of segments) of a sequence, i.e., [0, cumulative sums of segment widths]
+    Segment `j` lasts from edges[j] to edges[j + 1], being high level if `j` is even
+    """
+    return np.concatenate([[0], np.cumsum(np.asarray(seq, dtype=float))])
+
+
+def sequence_levels(seq: List[int], ts: np.ndarray) -> np.ndarray:
+    """
+    Levels (1 or 0) of a sequence at time points `ts`
+    """
+    idx = np.searchsorted(sequence_edges(seq), ts, side='right') - 1
+    return (idx % 2 == 0).astype(int)
+
+
+def downsample_levels(seq: List[int], n_bins: int, length: float = None) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    Min/max downsampling of a sequence for level-of-detail rendering, in O(segments + bins) for lists and
+    O(blocks + bins) for compressed sequences
+    :param seq: sequence of segment widths, list or `CompressedSequence`
+    :param n_bins: number of time bins
+    :param length: total time length, sum of sequence by default
+    :return: bin edges, min levels and max levels of bins
+    """
+    length = sequence_length(seq) if length is None else length
+    bins = np.linspace(0, length, n_bins + 1)
+    if isinstance(seq, CompressedSequence):
+        starts, stops, high, low = seq.segments(length / n_bins)
+    else:
+        edges = sequence_edges(seq)
+        starts, stops = edges[:-1], edges[1:]
+        high = np.arange(len(starts)) % 2 == 0
+        low = ~high
+    nonzero = stops > starts
+    starts, stops, high, low = starts[nonzero], stops[nonzero], high[nonzero], low[nonzero]
+    first = np.clip(np.searchsorted(bins, starts, side='right') - 1, 0, n_bins - 1)
+    last = np.clip(np.searchsorted(bins, stops, side='left') - 1, 0, n_bins - 1)
+    occupied = []
+    for mask in [high, low]:
+        diff = np.zeros(n_bins + 1, dtype=int)
+        np.add.at(diff, first[mask], 1)
+        np.add.at(diff, last[mask] + 1, -1)
+        occupied.append(np.cumsum(diff[:-1]) > 0)
+    has_high, has_low = occupied
+    return bins, (has_high & ~has_low).astype(int), has_high.astype(int)
+
+
+def _time_unit(length: float) -> (float, str):
+    if length >= 1e6:
+        return 1e6, 'ms'
+    elif length >= 1e3:
+        return 1e3, 'us'
+    return 1.0, 'ns'
+
+
+def sequences_to_figure(sequences: List[List[int]], max_edges: int = 4000) -> 'Figure':
     """
     Convert sequences (list of lists) into a Figure instance
+    ---
+    Each channel is drawn as a step plot from its edges, i.e., in O(segments) rather than O(time / gcd);
+    channels with more than `max_edges` edges are min/max downsampled into `max_edges // 2` time bins,
+    where bins containing both levels are drawn in a lighter color
+    :param sequences: sequences of all channels, lists or `CompressedSequence` instances
+    :param max_edges: maximal number of edges drawn exactly for each channel
     """
+    import matplotlib.pyplot as plt
     sequences = expand_to_same_length(sequences)
-    if sum(reduce(add, sequences)) == 0:
+    idx_exist = [i for i, l in enumerate(sequences) if sequence_length(l) > 0]
+    if not idx_exist:
         return plt.figure()
 
     N = len(sequences)  # num_channels
-    idx_exist = [i for i, l in enumerate(sequences) if sum(l) > 0]
-    n = len(idx_exist)  # effective number of channels
     channels = ['ch {}'.format(i + 1) for i in range(N)]
-    seq_eff = [sequences[i] for i in idx_exist]
-    gcd = reduce(math.gcd, list(map(int, reduce(add, seq_eff))))
-    for i in range(n):
-        seq_eff[i] = [int(t / gcd) for t in seq_eff[i]]
-    baselines = []
-    levels = []
-
-    seq_all = [[] for i in range(N)]
-    length = sum(seq_eff[0])
-    for i in range(N):
-        if i in idx_exist:
-            seq_all[i] = seq_eff[idx_exist.index(i)]
-        else:
-            seq_all[i] = [0, length]  # 0 个 '1', length 个 '0'
-
-    for i in range(N):
-        # 0,1,2,3,...,N-1
-        level = []
-        j = 0
-        l = len(seq_all[i])
-        while j < l:
-            level += [1] * seq_all[i][j] + [0] * seq_all[i][j + 1]
-            j += 2
-
-        b = 1.2 * i
-        level = [lev + b for lev in level]
-        baselines.append(b)
-        levels.append(level)
+    length = max(sequence_length(sequences[i]) for i in idx_exist)
+    scale, unit = _time_unit(length)
+    baselines = [1.2 * i for i in range(N)]
 
     fig = plt.figure(figsize=(14, 2 * len(idx_exist)))
     for i, ch in enumerate(channels):
-        plt.stairs(levels[i], baseline=baselines[i] - 0.03, label=ch, fill=True)
+        b = baselines[i]
+        if i not in idx_exist:
+            plt.stairs([b], [0, length / scale], baseline=b - 0.03, label=ch, fill=True)
+        elif len(sequences[i]) <= max_edges:
+            values = np.resize([1.0, 0.0], len(sequences[i])) + b
+            edges = sequence_edges(expand_sequence(sequences[i]))
+            plt.stairs(values, edges / scale, baseline=b - 0.03, label=ch, fill=True)
+        else:
+            bins, levels_min, levels_max = downsample_levels(sequences[i], max_edges // 2, length)
+            artist = plt.stairs(levels_max + b, bins / scale, baseline=b - 0.03, label=ch, fill=True, alpha=0.4)
+            plt.stairs(levels_min + b, bins / scale, baseline=b - 0.03, fill=True, color=artist.get_facecolor())
     plt.title('Sequences', fontsize=20)
-    plt.xlabel('time ({} ns)'.format(int(gcd)), fontsize=15)
+    plt.xlabel('time ({})'.format(unit), fontsize=15)
     plt.yticks(baselines, channels, fontsize=13)
 
-    plt.xlim(0, max([sum(s) for s in seq_eff]))
-    plt.ylim(-0.1, max(levels[-1]) + 0.1)
+    plt.xlim(0, length / scale)
+    plt.ylim(-0.1, baselines[-1] + 1.1)
     plt.xticks(fontsize=13)
     return fig
 
 
-def sequences_to_string(sequences: List[List[int]]) -> str:
+def sequences_to_string(sequences: List[List[int]], max_width: int = 20, max_length: int = 2000) -> str:
     """
     Convert sequences (list of list) into a string
+    ---
+    All channels are aligned on the union of their edges; each interval between neighbor edges is drawn with
+    a width proportional to its duration (in units of the GCD of all segment widths), and intervals wider than
+    `max_width` characters are compressed into `max_width` characters marked by "~~".
+    If the string would be longer than `max_length` characters, sequences are min/max downsampled into
+    `max_length` time bins instead, where bins containing both levels are marked by "#".
+    :param sequences: sequences of all channels, lists or `CompressedSequence` instances
+    :param max_width: maximal width of an interval in characters
+    :param max_length: maximal length of each line in characters
     """
     sequences = expand_to_same_length(sequences)
-    idx_exist = [i for i, l in enumerate(sequences) if sum(l) > 0]
+    idx_exist = [i for i, l in enumerate(sequences) if sequence_length(l) > 0]
+    if not idx_exist:
+        return ''
+    length = max(sequence_length(sequences[i]) for i in idx_exist)
 
-    # flatten; float --> integer; calculate gcd
-    gcd = reduce(math.gcd, list(map(int, reduce(add, sequences))))
-
-    str_dict = {'channel {}'.format(i + 1): SequenceString() for i in idx_exist}
+    lod = sum(len(sequences[i]) for i in idx_exist) > max_length
+    if not lod:
+        # flatten; float --> integer; calculate gcd
+        gcd = reduce(math.gcd, [int(t) for i in idx_exist for t in expand_sequence(sequences[i]) if int(t) > 0])
+        edges = np.unique(np.concatenate([sequence_edges(expand_sequence(sequences[i])) for i in idx_exist]))
+        units = np.diff(edges) / gcd
+        widths = np.clip(np.rint(units), 1, max_width).astype(int)
+        compressed = units > max_width
+        mids = (edges[:-1] + edges[1:]) / 2
+        lod = widths.sum() + len(widths) + 1 > max_length
 
+    str_dict = {}
     for i in idx_exist:
-        length = len(sequences[i])
-        j = 0
-        while j < length:
-            # pair of a high pulse and a low pulse
-            high_width = int(sequences[i][j] / gcd)
-            low_width = int(sequences[i][j + 1] / gcd)
-            str_dict['channel {}'.format(i + 1)].append_high_pulse(high_width)
-            str_dict['channel {}'.format(i + 1)].append_low_pulse(low_width)
-            j += 2
+        seq_str = SequenceString()
+        if lod:
+            # level-of-detail downsampling
+            _, levels_min, levels_max = downsample_levels(sequences[i], max_length, length)
+            for lmin, lmax in zip(levels_min, levels_max):
+                if lmin == lmax:
+                    seq_str.append_level(lmin, 1)
+                else:
+                    seq_str.append_mixed(1)
+        else:
+            levels = sequence_levels(expand_sequence(sequences[i]), mids)
+            # treat levels before and after the whole period as low
+            levels_around = np.concatenate([[0], levels, [0]])
+            for k in range(len(levels)):
+                seq_str.append_edge(levels_around[k], levels_around[k + 1])
+                seq_str.append_level(levels[k], widths[k], compressed[k])
+            seq_str.append_edge(levels_around[-2], levels_around[-1])
+        str_dict['channel {}'.format(i + 1)] = seq_str
 
     str_list = ['\n'.join([k, str(v)]) for k, v in str_dict.items()]
     return '\n\n'.join(str_list)
 
 
-def expand_to_same_length(sequences: List[List[int]]) -> List[List[int]]:
+def expand_to_same_length(sequences: List[List[int]]) -> List[Union[List[int], CompressedSequence]]:
     """
-    Expand eac sequence to the same length, by calculating the LCM of all sequences lengths
+    Expand each sequence to the same length, i.e., the LCM of all sequences lengths
+    ---
+    Sequences shorter than the LCM are repeated symbolically as `CompressedSequence` instances, so that the memory
+    consumption does not grow with the LCM even for incommensurate channels
     """
-    if sum(reduce(add, sequences)) == 0:
-        return sequences
-    sequences_expanded = deepcopy(sequences)
-    len_eff = [(i, int(sum(seq))) for i, seq in enumerate(sequences) if int(sum(seq)) > 0]
-    if len(np.unique(len_eff)) == 1:
-        return sequences_expanded
-    else:
-        tm = np.lcm.reduce([t for i, t in len_eff])
-        for i, t in len_eff:
-            sequences_expanded[i] *= int(tm / t)
+    sequences_expanded = list(sequences)
+    len_eff = [(i, int(sequence_length(seq))) for i, seq in enumerate(sequences) if sequence_length(seq) > 0]
+    if len({t for _, t in len_eff}) <= 1:
         return sequences_expanded
+    tm = np.lcm.reduce([t for _, t in len_eff])
+    for i, t in len_eff:
+        if tm != t:
+            seq = sequences[i] if isinstance(sequences[i], CompressedSequence) else \
+                CompressedSequence.from_list(sequences[i])
+            if len(seq) % 2:
+                seq = seq + [0]
+            sequences_expanded[i] = seq * int(tm // t)
+    return sequences_expanded
+
+
+def shift_sequence(seq: Union[List[float], CompressedSequence], dt: float) -> List[float]:
+    """
+    Shift a sequence cyclically within its period, earlier by `dt` (later if negative), e.g., to compensate the
+    delay of the instrument controlled by this channel; compressed sequences are expanded
+    The shift is rounded to 0.5 ns, and moved onto a segment boundary if it would split a segment into a piece
+    shorter than `ASG_MIN_LOW`, so that the shifted sequence is acceptable for ASG
+    :param seq: sequence, high-level effective
+    :param dt: time shift, unit: ns
+    :return: shifted sequence, starting with a high-level segment (maybe of zero width)
+    """
+    seq = list(expand_sequence(seq))
+    length = sequence_length(seq)
+    dt = round(dt * 2) / 2 % length if length else 0
+    if dt == 0:
+        return seq
+    edges = sequence_edges(seq)
+    j = int(np.searchsorted(edges, dt, side='right')) - 1
+    if dt - edges[j] < ASG_MIN_LOW:
+        dt = edges[j]
+    elif edges[j + 1] - dt < ASG_MIN_LOW:
+        dt, j = edges[j + 1], j + 1
+    if dt % length == 0:
+        return seq
+    segments = [(edges[j + 1] - dt, j % 2 == 0)] + [(seq[k], k % 2 == 0) for k in range(j + 1, len(seq))] + \
+               [(seq[k], k % 2 == 0) for k in range(j)] + [(dt - edges[j], j % 2 == 0)]
+    shifted, high, width = [], True, 0
+    for w, level in segments:
+        if w == 0:
+            continue
+        if level != high:
+            shifted.append(width)
+            high, width = level, 0
+        width += w
+    shifted.append(width)
+    if len(shifted) % 2:
+        shifted.append(0)
+    return [float(w) for w in shifted]
 
 
-def flip_sequence(seq: list) -> list:
+def flip_sequence(seq: Union[list, CompressedSequence]) -> Union[list, CompressedSequence]:
     """
     Flip the control sequence
     i.e., high-level effective <---> low level effective
     """
+    if isinstance(seq, CompressedSequence):
+        # zero-width segments at both ends are merged when normalized for ASG
+        return [0] + seq + [0]
     if seq[0] == 0:
         if seq[-1] == 0:
             return seq[1:-1]
@@ -0,0 +1,496 @@
+"""
+Local instrument server, so that several clients share one hardware session
+---
+A long-running daemon owns the instruments (ASG, MW, Time Tagger, ...) and the schedulers built on them, and serves
+clients (notebooks, CLI, dashboards) over a Unix socket. Clients attach instantly without reconnecting hardware.
+Protocol: each message is a 4-byte big-endian length followed by a JSON body.
+    request:  {"id": n, "cmds": [{"op": ..., ...}, ...]}  -- a batch of commands executed in order
+    response: {"id": n, "results": [{"ok": true, "value": ...} | {"ok": false, "error": "..."}, ...]}
+Commands touching instruments are executed one by one by a single worker thread, so access is serialized and
+asynchronous calls (e.g. scans) are queued. Large arrays are returned via shared memory blocks, which are kept by the
+server until the next request of the same connection; live data of scans are streamed by `SharedRingBuffer`.
+
+Usage:
+    python -m odmactor.utils.server --simulation  # daemon
+
+    client = InstrumentClient()
+    cw = client.create('cw', 'CWScheduler', with_ref=True)
+    cw.configure_odmr_seq(period=1000, N=1000)
+    job = cw.submit('run_scanning')
+    client.wait(job)
+    result = cw.get('result')
+"""
+
+import argparse
+import itertools
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import traceback
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List
+from odmactor.utils.utils import local_state_path
+from odmactor.utils.live import SharedRingBuffer, _attach_shared_memory
+
+
+def default_socket_path() -> str:
+    return local_state_path('server.sock')
+
+
+def _send(sock: socket.socket, obj: Any):
+    body = json.dumps(obj).encode()
+    sock.sendall(struct.pack('>I', len(body)) + body)
+
+
+def _recv_exactly(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError('connection closed')
+        buf += chunk
+    return bytes(buf)
+
+
+def _recv(sock: socket.socket) -> Any:
+    n, = struct.unpack('>I', _recv_exactly(sock, 4))
+    return json.loads(_recv_exactly(sock, n))
+
+
+def _encode(value: Any, blocks: List[shared_memory.SharedMemory], threshold: int) -> Any:
+    """
+    Encode a value into JSON-serializable objects; arrays larger than `threshold` bytes go into shared memory
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        if value.nbytes >= threshold and value.dtype != object:
+            shm = shared_memory.SharedMemory(create=True, size=max(value.nbytes, 1))
+            np.ndarray(value.shape, value.dtype, buffer=shm.buf)[...] = value
+            blocks.append(shm)
+            return {'__ndarray__': {'shm': shm.name, 'shape': value.shape, 'dtype': value.dtype.str}}
+        return {'__ndarray__': {'data': value.tolist(), 'dtype': value.dtype.str}}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v, blocks, threshold) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _encode(v, blocks, threshold) for k, v in value.items()}
+    if isinstance(value, SharedRingBuffer):
+        return {'__ring__': value.name}
+    return {'__repr__': repr(value)}
+
+
+def _decode(value: Any) -> Any:
+    """
+    Decode values encoded by `_encode()`; arrays in shared memory are copied
+    """
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if '__ndarray__' in value:
+        info = value['__ndarray__']
+        if 'shm' not in info:
+            return np.asarray(info['data'], dtype=info['dtype'])
+        shm = _attach_shared_memory(info['shm'])
+        try:
+            return np.ndarray(tuple(info['shape']), info['dtype'], buffer=shm.buf).copy()
+        finally:
+            shm.close()
+    if '__ring__' in value:
+        return SharedRingBuffer(name=value['__ring__'])
+    if '__repr__' in value:
+        return value['__repr__']
+    return {k: _decode(v) for k, v in value.items()}
+
+
+class _Job:
+    """
+    Command executed by the worker thread
+    """
+
+    def __init__(self, job_id: int, func: Callable[[], Any], description: str):
+        self.id = job_id
+        self.func = func
+        self.description = description
+        self.state = 'queued'
+        self.value = None
+        self.error = None
+        self.done = threading.Event()
+
+    def run(self):
+        self.state = 'running'
+        try:
+            self.value = self.func()
+            self.state = 'done'
+        except Exception as e:
+            self.error = '{}: {}'.format(type(e).__name__, e)
+            self.state = 'failed'
+            traceback.print_exc()
+        finally:
+            self.done.set()
+
+    def status(self) -> dict:
+        return {'job': self.id, 'state': self.state, 'description': self.description, 'value': self.value,
+                'error': self.error}
+
+
+class InstrumentServer:
+    """
+    Daemon owning instruments and schedulers, serving clients over a Unix socket
+    """
+
+    def __init__(self, path: str = None, simulation: bool = False, shm_threshold: int = 65536):
+        """
+        :param path: path of the Unix socket, "server.sock" in the local state directory by default
+        :param simulation: use simulated instruments instead of hardware
+        :param shm_threshold: arrays of at least this size (unit: byte) are returned via shared memory
+        """
+        self.path = default_socket_path() if path is None else path
+        self.simulation = simulation
+        self.shm_threshold = shm_threshold
+        self.schedulers: Dict[str, Any] = {}
+        self.instruments = None
+        self.jobs: Dict[int, _Job] = {}
+        self._job_ids = itertools.count(1)
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._work, daemon=True)
+        self._server = None
+        self._stopped = threading.Event()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            job.run()
+
+    def submit(self, func: Callable[[], Any], description: str = '') -> _Job:
+        """
+        Queue a function to be executed by the worker thread
+        """
+        job = _Job(next(self._job_ids), func, description)
+        self.jobs[job.id] = job
+        self._queue.put(job)
+        return job
+
+    def _create(self, name: str, cls_name: str, kwargs: dict = None) -> str:
+        import odmactor.scheduler
+        from odmactor.scheduler.base import Scheduler
+        cls = getattr(odmactor.scheduler, cls_name, None)
+        if not (isinstance(cls, type) and issubclass(cls, Scheduler)):
+            raise ValueError('unsupported scheduler type "{}"'.format(cls_name))
+        kwargs = dict(kwargs or {}, simulation=self.simulation)
+        if self.instruments is not None:
+            kwargs['instruments'] = self.instruments
+        scheduler = cls(**kwargs)
+        if self.instruments is None:
+            self.instruments = scheduler.instruments
+        self.schedulers[name] = scheduler
+        return name
+
+    def _target(self, name: str):
+        if name not in self.schedulers:
+            raise KeyError('no scheduler named "{}"'.format(name))
+        return self.schedulers[name]
+
+    @staticmethod
+    def _public(name: str) -> str:
+        if name.startswith('_'):
+            raise AttributeError('private attribute "{}" is not accessible'.format(name))
+        return name
+
+    def execute(self, cmd: dict) -> Any:
+        """
+        Execute a single command
+        """
+        op = cmd.get('op')
+        if op == 'ping':
+            return 'pong'
+        if op == 'list':
+            return {name: type(s).__name__ for name, s in self.schedulers.items()}
+        if op == 'get':
+            return getattr(self._target(cmd['target']), self._public(cmd['attr']))
+        if op == 'job':
+            return self.jobs[cmd['job']].status()
+        if op == 'wait':
+            job = self.jobs[cmd['job']]
+            job.done.wait(cmd.get('timeout'))
+            return job.status()
+        if op == 'create':
+            func, description = lambda: self._create(cmd['name'], cmd['type'], cmd.get('kwargs')), 'create'
+        elif op == 'drop':
+            func, description = lambda: self.schedulers.pop(cmd['name']) and None, 'drop'
+        elif op == 'set':
+            target, attr = self._target(cmd['target']), self._public(cmd['attr'])
+            func, description = lambda: setattr(target, attr, _decode(cmd['value'])), 'set {}'.format(attr)
+        elif op == 'call':
+            method = getattr(self._target(cmd['target']), self._public(cmd['method']))
+            args, kwargs = _decode(cmd.get('args', [])), _decode(cmd.get('kwargs', {}))
+            func, description = lambda: method(*args, **kwargs), '{}.{}'.format(cmd['target'], cmd['method'])
+        elif op == 'shutdown':
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return None
+        else:
+            raise ValueError('unsupported operation "{}"'.format(op))
+        job = self.submit(func, description)
+        if not cmd.get('wait', True):
+            return job.id
+        job.done.wait()
+        if job.error is not None:
+            raise RuntimeError(job.error)
+        return job.value
+
+    def _handler(self):
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                blocks = []
+                try:
+                    while True:
+                        try:
+                            request = _recv(self.request)
+                        except ConnectionError:
+                            break
+                        # shared memory of the previous response has been copied by the client
+                        for shm in blocks:
+                            shm.close()
+                            shm.unlink()
+                        blocks.clear()
+                        results = []
+                        for cmd in request.get('cmds', []):
+                            try:
+                                results.append({'ok': True,
+                                                'value': _encode(server.execute(cmd), blocks, server.shm_threshold)})
+                            except Exception as e:
+                                results.append({'ok': False, 'error': '{}: {}'.format(type(e).__name__, e)})
+                        _send(self.request, {'id': request.get('id'), 'results': results})
+                finally:
+                    for shm in blocks:
+                        shm.close()
+                        shm.unlink()
+
+        return Handler
+
+    def start(self) -> 'InstrumentServer':
+        """
+        Start serving in background threads
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._server = socketserver.ThreadingUnixStreamServer(self.path, self._handler())
+        self._server.daemon_threads = True
+        self._worker.start()
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print('Instrument server is listening on {}'.format(self.path))
+        return self
+
+    def serve_forever(self):
+        """
+        Start serving and block until shutdown
+        """
+        self.start()
+        self._stopped.wait()
+
+    def shutdown(self):
+        """
+        Stop serving, finish queued commands and release instruments
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self._queue.put(None)
+        if self._worker.is_alive() and threading.current_thread() is not self._worker:
+            self._worker.join()
+        if self.schedulers:
+            next(iter(self.schedulers.values())).close()  # instruments are shared by all schedulers
+            self.schedulers.clear()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        print('Instrument server has shut down')
+        self._stopped.set()
+
+
+class _Batch:
+    """
+    Commands collected and sent in a single request
+    """
+
+    def __init__(self, client: 'InstrumentClient'):
+        self.client = client
+        self.cmds = []
+        self.results = None
+
+    def add(self, op: str, **kwargs) -> '_Batch':
+        self.cmds.append(dict(kwargs, op=op))
+        return self
+
+    def call(self, target: str, method: str, *args, wait: bool = True, **kwargs) -> '_Batch':
+        return self.add('call', target=target, method=method, args=_encode(list(args), [], np.inf),
+                        kwargs=_encode(kwargs, [], np.inf), wait=wait)
+
+    def set(self, target: str, attr: str, value) -> '_Batch':
+        return self.add('set', target=target, attr=attr, value=_encode(value, [], np.inf))
+
+    def get(self, target: str, attr: str) -> '_Batch':
+        return self.add('get', target=target, attr=attr)
+
+    def __enter__(self) -> '_Batch':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.results = self.client.request(self.cmds)
+
+
+class RemoteScheduler:
+    """
+    Proxy of a scheduler owned by an instrument server; methods are called remotely
+    """
+
+    def __init__(self, client: 'InstrumentClient', name: str):
+        self._client = client
+        self._name = name
+
+    def __getattr__(self, method: str):
+        if method.startswith('_'):
+            raise AttributeError(method)
+        return lambda *args, **kwargs: self._client.call(self._name, method, *args, **kwargs)
+
+    def get(self, attr: str):
+        return self._client.get(self._name, attr)
+
+    def set(self, attr: str, value):
+        return self._client.set(self._name, attr, value)
+
+    def submit(self, method: str, *args, **kwargs) -> int:
+        """
+        Queue a method call (e.g. a scan) without waiting for it
+        :return: job id
+        """
+        return self._client.call(self._name, method, *args, wait=False, **kwargs)
+
+
+class InstrumentClient:
+    """
+    Client of an instrument server
+    """
+
+    def __init__(self, path: str = None, timeout: float = None):
+        """
+        :param path: path of the Unix socket, "server.sock" in the local state directory by default
+        :param timeout: socket timeout, unit: s
+        """
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(default_socket_path() if path is None else path)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def request(self, cmds: List[dict]) -> List[Any]:
+        """
+        Send a batch of commands and wait for their results
+        :raise RuntimeError: if any command fails
+        """
+        with self._lock:
+            _send(self.sock, {'id': next(self._ids), 'cmds': cmds})
+            response = _recv(self.sock)
+            # copy arrays out of shared memory before the next request releases them
+            results = [_decode(r['value']) if r['ok'] else r for r in response['results']]
+        errors = [r['error'] for r in response['results'] if not r['ok']]
+        if errors:
+            raise RuntimeError('; '.join(errors))
+        return results
+
+    def batch(self) -> _Batch:
+        """
+        Collect commands in a `with` block and send them in a single request, results in `batch.results`
+        """
+        return _Batch(self)
+
+    def _single(self, op: str, **kwargs) -> Any:
+        return self.request(_Batch(self).add(op, **kwargs).cmds)[0]
+
+    def ping(self) -> str:
+        return self._single('ping')
+
+    def list(self) -> dict:
+        return self._single('list')
+
+    def create(self, name: str, type: str, **kwargs) -> RemoteScheduler:
+        """
+        Create a scheduler on the server, sharing the instruments of the server
+        :param name: name of the scheduler
+        :param type: class name of the scheduler, e.g., 'CWScheduler'
+        :param kwargs: keyword arguments of the scheduler
+        """
+        self._single('create', name=name, type=type, kwargs=kwargs)
+        return RemoteScheduler(self, name)
+
+    def scheduler(self, name: str) -> RemoteScheduler:
+        """
+        Proxy of an existing scheduler on the server
+        """
+        return RemoteScheduler(self, name)
+
+    def call(self, target: str, method: str, *args, wait: bool = True, **kwargs) -> Any:
+        return self.request(_Batch(self).call(target, method, *args, wait=wait, **kwargs).cmds)[0]
+
+    def get(self, target: str, attr: str) -> Any:
+        return self._single('get', target=target, attr=attr)
+
+    def set(self, target: str, attr: str, value):
+        return self.request(_Batch(self).set(target, attr, value).cmds)[0]
+
+    def job(self, job_id: int) -> dict:
+        return self._single('job', job=job_id)
+
+    def wait(self, job_id: int, timeout: float = None) -> dict:
+        """
+        Wait for a queued job
+        :return: status of the job
+        """
+        status = self._single('wait', job=job_id, timeout=timeout)
+        if status['state'] == 'failed':
+            raise RuntimeError(status['error'])
+        return status
+
+    def shutdown(self):
+        self._single('shutdown')
+
+    def close(self):
+        self.sock.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Odmactor instrument server')
+    parser.add_argument('--path', default=None, help='path of the Unix socket')
+    parser.add_argument('--simulation', action='store_true', help='use simulated instruments')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='serve metrics of schedulers created with telemetry on this local port')
+    parser.add_argument('--metrics-file', default=None, help='append metrics to this size-rotated file')
+    args = parser.parse_args(argv)
+    server = InstrumentServer(args.path, simulation=args.simulation)
+    exporter = None
+    if args.metrics_port is not None or args.metrics_file is not None:
+        from odmactor.utils.telemetry import MetricsExporter
+        exporter = MetricsExporter(port=args.metrics_port, fname=args.metrics_file).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+    finally:
+        if exporter is not None:
+            exporter.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,375 @@
+"""
+Telemetry of schedulers and instruments
+---
+Counters and gauges are plain Python objects updated in place by the acquisition loop: an update is a single
+attribute assignment, without locks, I/O or allocation. Each metric has a single writer (the thread running the
+scan), and readers only ever see its previous or its new value. Instrument states, e.g., MW output, are read
+at export time from attributes kept by the instrument wrappers, except the ASG monitor status, which is a device
+call and is therefore sampled by the scanning thread at a limited rate.
+An exporter renders all metrics of a registry in the OpenMetrics text format, served by a local HTTP endpoint
+(for Prometheus or any other scraper) and appended periodically to a size-rotated file.
+
+Usage:
+    scheduler = CWScheduler(telemetry=True)
+    exporter = MetricsExporter(port=9464, fname='metrics.txt').start()
+    scheduler.run_scanning()
+    # curl http://127.0.0.1:9464/metrics
+"""
+
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+    escaped = ['{}="{}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+               for k, v in labels]
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value != value:
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class Counter:
+    """
+    Monotonically increasing metric, e.g., number of acquired points
+    """
+    __slots__ = ('labels', 'value')
+
+    def __init__(self, labels: Tuple[Tuple[str, str], ...]):
+        self.labels = labels
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Gauge:
+    """
+    Metric taking arbitrary values, set by the writer or evaluated at export time by a function
+    """
+    __slots__ = ('labels', 'value', 'function')
+
+    def __init__(self, labels: Tuple[Tuple[str, str], ...], function: Callable[[], float] = None):
+        self.labels = labels
+        self.value = math.nan
+        self.function = function
+
+    def set(self, value: float):
+        self.value = value
+
+    def get(self) -> float:
+        if self.function is None:
+            return self.value
+        try:
+            return float(self.function())
+        except Exception:
+            return math.nan
+
+
+class MetricsRegistry:
+    """
+    Families of counters and gauges, each metric identified by its name and labels
+    Registration is guarded by a lock; updates of registered metrics are not
+    """
+
+    def __init__(self):
+        self._families: Dict[str, Tuple[str, str, Dict[tuple, object]]] = {}  # name: (type, help, {labels: metric})
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, help: str, labels: Optional[dict], **kwargs):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            kind = cls.__name__.lower()
+            family = self._families.setdefault(name, (kind, help, {}))
+            if family[0] != kind:
+                raise ValueError('metric "{}" is already registered as a {}'.format(name, family[0]))
+            metrics = dict(family[2])  # copy on write, so that readers iterate without locking
+            metric = metrics.get(key)
+            if metric is None:
+                metric = metrics[key] = cls(key, **kwargs)
+            elif kwargs.get('function') is not None:
+                metric.function = kwargs['function']
+            self._families[name] = (kind, help, metrics)
+        return metric
+
+    def counter(self, name: str, help: str, labels: dict = None) -> Counter:
+        """
+        Counter named without the "_total" suffix, which is appended when exported
+        """
+        return self._register(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels: dict = None, function: Callable[[], float] = None) -> Gauge:
+        """
+        :param function: if given, the gauge value is evaluated by it at export time
+        """
+        return self._register(Gauge, name, help, labels, function=function)
+
+    def remove(self, labels: dict):
+        """
+        Remove all metrics carrying the given labels, e.g., those of a closed scheduler
+        """
+        items = set(labels.items())
+        with self._lock:
+            for name, (kind, help, metrics) in list(self._families.items()):
+                self._families[name] = (kind, help, {k: m for k, m in metrics.items() if not items <= set(k)})
+
+    def samples(self) -> List[Tuple[str, Tuple[Tuple[str, str], ...], float]]:
+        """
+        Current (sample name, labels, value) of all metrics
+        """
+        out = []
+        for name, (kind, _, metrics) in list(self._families.items()):
+            for metric in list(metrics.values()):
+                if kind == 'counter':
+                    out.append((name + '_total', metric.labels, metric.value))
+                else:
+                    out.append((name, metric.labels, metric.get()))
+        return out
+
+    def render(self, timestamp: float = None) -> str:
+        """
+        Exposition of all metrics in the OpenMetrics text format
+        :param timestamp: Unix time attached to every sample, omitted if None
+        """
+        suffix = '' if timestamp is None else ' {:.3f}'.format(timestamp)
+        lines = []
+        for name, (kind, help, metrics) in sorted(self._families.items()):
+            metrics = list(metrics.values())
+            if not metrics:
+                continue
+            lines.append('# TYPE {} {}'.format(name, kind))
+            lines.append('# HELP {} {}'.format(name, help))
+            for metric in metrics:
+                sample, value = (name + '_total', metric.value) if kind == 'counter' else (name, metric.get())
+                lines.append('{}{} {}{}'.format(sample, _format_labels(metric.labels), _format_value(value), suffix))
+        lines.append('# EOF\n')
+        return '\n'.join(lines)
+
+
+REGISTRY = MetricsRegistry()  # default registry shared by all schedulers of a process
+
+
+class ScanTelemetry:
+    """
+    Metrics of a scheduler: acquisitions, count rates, scan progress and per-point overhead
+    """
+
+    def __init__(self, name: str, registry: MetricsRegistry = None, status_interval: float = 1.0):
+        """
+        :param name: value of the "scheduler" label
+        :param registry: registry of metrics, `REGISTRY` by default
+        :param status_interval: minimal interval of sampling instrument statuses by device calls, unit: s
+        """
+        self.registry = REGISTRY if registry is None else registry
+        self.labels = {'scheduler': name}
+        self.status_interval = status_interval
+        r, lb = self.registry, self.labels
+        self.points = r.counter('odmactor_points', 'Detection points acquired', lb)
+        self.acquisitions = r.counter('odmactor_acquisitions', 'Counter or lock-in acquisitions', lb)
+        self.counts = r.counter('odmactor_counts', 'Photon counts acquired', lb)
+        self.overhead = r.counter('odmactor_overhead_seconds', 'Wall-clock time of points beyond their dwell time',
+                                  lb)
+        self.count_rate = r.gauge('odmactor_count_rate', 'Count rate of the latest signal acquisition, unit: 1/s', lb)
+        self.count_rate_ref = r.gauge('odmactor_count_rate_ref',
+                                      'Count rate of the latest reference acquisition, unit: 1/s', lb)
+        self.scanning = r.gauge('odmactor_scanning', 'Whether a scan is running', lb)
+        self.scan_points = r.gauge('odmactor_scan_points', 'Number of detection points of the current scan', lb)
+        self.scan_done = r.gauge('odmactor_scan_done', 'Detection points done in the current scan', lb)
+        self.scan_eta = r.gauge('odmactor_scan_eta_seconds', 'Estimated remaining time of the current scan', lb)
+        self.point_duration = r.gauge('odmactor_point_duration_seconds', 'Wall-clock time of the latest point', lb)
+        self.point_overhead = r.gauge('odmactor_point_overhead_seconds',
+                                      'Wall-clock time of the latest point beyond its dwell time', lb)
+        self.last_point = r.gauge('odmactor_last_point_timestamp_seconds', 'Unix time of the latest point', lb)
+        self.asg_status = r.gauge('odmactor_asg_monitor_status', 'Latest ASG monitor status code', lb)
+        self.scanning.set(0)
+        self._last = time.perf_counter()
+        self._start = self._last
+        self._sampled = -math.inf
+
+    def watch_instruments(self, mw=None, asg=None):
+        """
+        Export states kept by instrument wrappers, read at export time
+        """
+        r, lb = self.registry, self.labels
+        if mw is not None:
+            r.gauge('odmactor_mw_output', 'Whether MW output is on', lb, lambda: mw.output)
+            r.gauge('odmactor_mw_frequency_hertz', 'MW frequency', lb, lambda: mw.freq)
+            r.gauge('odmactor_mw_power_dbm', 'MW power, unit: dBm', lb, lambda: mw.power)
+        if asg is not None:
+            r.gauge('odmactor_asg_running', 'Whether ASG is running sequences', lb, lambda: asg.running)
+            r.gauge('odmactor_asg_downloads', 'Sequence downloads into ASG', lb, lambda: asg.n_downloads)
+
+    def begin_scan(self, n_points: int):
+        self.scan_points.set(n_points)
+        self.scan_done.set(0)
+        self.scan_eta.set(math.nan)
+        self.scanning.set(1)
+        self._start = self._last = time.perf_counter()
+
+    def acquired(self, counts: float, dwell: float, ref: bool = False):
+        """
+        :param counts: total counts of the acquisition, NaN if not counting photons (lock-in)
+        :param dwell: acquisition time, unit: s
+        :param ref: whether it is a reference acquisition
+        """
+        self.acquisitions.inc()
+        if counts == counts:
+            self.counts.inc(counts)
+            (self.count_rate_ref if ref else self.count_rate).set(counts / dwell if dwell > 0 else math.nan)
+
+    def end_point(self, n_done: int, dwell: float, eta: float = math.nan):
+        """
+        :param n_done: detection points done in the current scan
+        :param dwell: estimated dwell and padding time of the point, unit: s
+        :param eta: estimated remaining time of the scan, unit: s
+        """
+        now = time.perf_counter()
+        duration = now - self._last
+        self._last = now
+        overhead = max(duration - dwell, 0.0)
+        self.points.inc()
+        self.overhead.inc(overhead)
+        self.point_duration.set(duration)
+        self.point_overhead.set(overhead)
+        self.scan_done.set(n_done)
+        self.scan_eta.set(eta)
+        self.last_point.set(time.time())
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def end_scan(self):
+        self.scanning.set(0)
+        self.scan_eta.set(0)
+
+    def sample_status(self, asg):
+        """
+        Sample the ASG monitor status, at most once per `status_interval`; to be called by the scanning thread only
+        """
+        now = time.perf_counter()
+        if now - self._sampled >= self.status_interval:
+            self._sampled = now
+            try:
+                self.asg_status.set(asg.get_monitor_status())
+            except Exception:
+                self.asg_status.set(math.nan)
+
+    def close(self):
+        self.registry.remove(self.labels)
+
+
+class MetricsExporter:
+    """
+    Export a registry via an OpenMetrics HTTP endpoint on localhost and/or a size-rotated file
+    """
+
+    def __init__(self, registry: MetricsRegistry = None, port: int = None, fname: str = None,
+                 interval: float = 10.0, max_bytes: int = 1 << 24, backups: int = 5):
+        """
+        :param registry: registry of metrics, `REGISTRY` by default
+        :param port: port of the HTTP endpoint "http://127.0.0.1:<port>/metrics"; no endpoint if None
+        :param fname: file to which timestamped expositions are appended; no file if None
+        :param interval: interval of appending to the file, unit: s
+        :param max_bytes: the file is rotated once exceeding this size, unit: byte
+        :param backups: number of rotated files kept, i.e., "<fname>.1" (newest) to "<fname>.<backups>"
+        """
+        self.registry = REGISTRY if registry is None else registry
+        self.port = port
+        self.fname = fname
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._server = None
+        self._writer: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def _handler(self):
+        from http.server import BaseHTTPRequestHandler
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            src = '{}.{}'.format(self.fname, i)
+            if os.path.exists(src):
+                os.replace(src, '{}.{}'.format(self.fname, i + 1))
+        if self.backups > 0:
+            os.replace(self.fname, self.fname + '.1')
+        else:
+            os.remove(self.fname)
+
+    def write(self):
+        """
+        Append a timestamped exposition to the file, rotating it if necessary
+        """
+        text = self.registry.render(timestamp=time.time())
+        try:
+            if os.path.exists(self.fname) and os.path.getsize(self.fname) + len(text) > self.max_bytes:
+                self._rotate()
+            with open(self.fname, 'a') as f:
+                f.write(text)
+        except OSError as e:
+            print('Metrics cannot be written: {}'.format(e))
+
+    def _write_periodically(self):
+        while not self._stopped.wait(self.interval):
+            self.write()
+
+    def start(self) -> 'MetricsExporter':
+        """
+        Start exporting in background threads
+        """
+        self._stopped.clear()
+        if self.port is not None and self._server is None:
+            from http.server import ThreadingHTTPServer
+            self._server = ThreadingHTTPServer(('127.0.0.1', self.port), self._handler())
+            self._server.daemon_threads = True
+            self.port = self._server.server_address[1]  # actual port if 0 is given
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+            print('Metrics are served at http://127.0.0.1:{}/metrics'.format(self.port))
+        if self.fname is not None and self._writer is None:
+            self._writer = threading.Thread(target=self._write_periodically, daemon=True)
+            self._writer.start()
+        return self
+
+    def stop(self):
+        """
+        Stop exporting; the file gets a final exposition
+        """
+        self._stopped.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+            self.write()
@@ -1,3 +1,4 @@
+import os
 import numpy as np
 
 
@@ -28,3 +29,16 @@ def dBm_to_mW(dBm):
 
 def mW_to_dBm(mW):
     return 10 * np.log10(mW)
+
+
+def local_state_path(fname: str) -> str:
+    """
+    Path of a file keeping local state of Odmactor, e.g., measured overheads and calibrations
+    The directory is "~/.odmactor" by default, or designated by the environment variable "ODMACTOR_HOME"
+    :param fname: file name
+    :return: absolute file path
+    """
+    state_dir = os.environ.get('ODMACTOR_HOME', os.path.join(os.path.expanduser('~'), '.odmactor'))
+    if not os.path.exists(state_dir):
+        os.makedirs(state_dir)
+    return os.path.join(state_dir, fname)
@@ -0,0 +1,18 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def sim_env(tmp_path, monkeypatch):
+    """
+    Isolated local state and output directories for simulated schedulers
+    """
+    monkeypatch.setenv('ODMACTOR_HOME', str(tmp_path / 'state'))
+    work = tmp_path / 'work'
+    work.mkdir()
+    (tmp_path / 'out').mkdir()
+    monkeypatch.chdir(work)  # schedulers create "../output/"
+    return tmp_path
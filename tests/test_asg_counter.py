@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from odmactor.instrument.asg import COUNT_MIN_GAP, COUNT_MIN_PERIOD, check_count_data, count_windows
+
+
+def test_count_windows_pulsed_gate():
+    assert count_windows([400, 600, 0, 0]) == [400, 600, 400, 600]
+
+
+def test_count_windows_rotates_to_window():
+    # low first, wrapped gap is merged
+    assert count_windows([0, 300, 500, 200]) == [500, 500, 500, 500]
+
+
+def test_count_windows_always_high_gate():
+    data = count_windows([1000, 0])
+    check_count_data(data)
+    assert data[:2] == [1000 - COUNT_MIN_GAP, COUNT_MIN_GAP]
+    assert sum(data) >= COUNT_MIN_PERIOD
+
+
+def test_count_windows_rounds_edges():
+    data = count_windows([403, 1597])
+    assert data == [405, 1595]
+
+
+def test_count_windows_without_window():
+    with pytest.raises(ValueError):
+        count_windows([0, 1000])
+
+
+def test_check_count_data_rejects_zero_gap():
+    with pytest.raises(ValueError):
+        check_count_data([1500, 0])
+
+
+def test_cw_cbm_with_asg_counter(sim_env):
+    from odmactor.scheduler import CWScheduler
+    cw = CWScheduler(simulation=True, catalog=False, with_ref=True, counter_backend='asg')
+    cw.output_dir = str(sim_env / 'out') + '/'
+    cw.configure_odmr_seq(period=1000, N=2000)
+    cw.set_mw_freqs(2.80e9, 2.81e9, 5e6)
+    cw.configure_tagger_counting(reader='cbm')
+    cw.run_scanning()
+    _, counts, counts_ref = cw.result
+    # continuous readout windows of ~1000 ns at 1e6 counts/s, away from resonances
+    assert np.allclose(counts, 1.0, rtol=0.1)
+    assert np.allclose(counts_ref, 1.0, rtol=0.1)
+    cw.close()
+
+
+def test_missing_tagger_is_not_replaced_by_asg_counter(sim_env):
+    from odmactor.scheduler import CWScheduler
+    cw = CWScheduler(simulation=True, catalog=False)
+    cw.tagger = None  # as if no Time Tagger was found
+    with pytest.raises(ConnectionError):
+        cw.configure_tagger_counting(reader='cbm')
+    assert cw.counter_backend == 'tagger' and cw.counter is None
+    cw.close()
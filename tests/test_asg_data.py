@@ -0,0 +1,118 @@
+import ctypes
+import numpy as np
+import pytest
+from odmactor.instrument.asg import ASG, ASG_CHANNELS, pulse_data_error
+from odmactor.utils.asg import ASG8005
+
+
+def random_channel(rng, p: float) -> list:
+    """
+    Valid segment widths, each replaced with probability `p` by zero, short, off-grid, negative or huge widths;
+    odd lengths with probability `p`
+    """
+    n = 2 * int(rng.integers(1, 7)) + (1 if rng.random() < p else 0)
+    seq = list(np.round(rng.uniform(10, 2000, n) * 2) / 2)  # multiples of 0.5 ns, exact in binary
+    for j in range(n):
+        r = rng.random() / p if p else 1
+        if r < 0.3:
+            seq[j] = 0.0
+        elif r < 0.6:
+            seq[j] = float(rng.choice([5, 7.45, 7.5, 9.95, 10, 7.55]))
+        elif r < 0.8:
+            seq[j] = float(np.round(rng.uniform(10, 100), 3))  # maybe off the 0.05-ns grid
+        elif r < 0.9:
+            seq[j] = -float(rng.choice([0.05, 20]))
+        elif r < 1:
+            seq[j] = float(rng.choice([26e9, 26e9 + 0.05, 3e9]))
+    return seq
+
+
+def checkdata(asg_data) -> bool:
+    return ASG8005.checkdata(None, asg_data, [len(seq) for seq in asg_data])
+
+
+def test_pulse_data_error_agrees_with_checkdata():
+    rng = np.random.default_rng(0)
+    n_valid = 0
+    for _ in range(20000):
+        p = rng.choice([0, 0.005, 0.02, 0.1])
+        asg_data = [random_channel(rng, p) for _ in range(ASG_CHANNELS)]
+        valid = checkdata(asg_data)
+        assert (pulse_data_error(asg_data) is None) == valid, asg_data
+        n_valid += valid
+    # both outcomes are exercised
+    assert 0.1 < n_valid / 20000 < 0.9
+
+
+def test_pulse_data_error_edge_cases():
+    base = [[0, 0]] * (ASG_CHANNELS - 1)
+    # two-segment channels are not checked against the 0.05-ns grid
+    for seq in ([0, 0], [7.5, 10], [0, 100, 20, 0], [100, 0], [10, 10, 10, 10], [2.6e9, 2.6e9], [100.01, 100]):
+        assert pulse_data_error(base + [seq]) is None and checkdata(base + [seq]), seq
+    for seq in ([7.4, 10], [100, 5], [100.01, 100, 10, 10], [10, 10, 7, 10], [2.6e9, 2.6e9, 10, 10], [10],
+                [10, 10, 10], [-20, 100], [100, -20], [-20, 100, 10, 10], [10, 10, 10, -20]):
+        assert pulse_data_error(base + [seq]) is not None and not checkdata(base + [seq]), seq
+    assert pulse_data_error([[0, 0]] * (ASG_CHANNELS + 1)) is not None
+
+
+@pytest.fixture
+def asg():
+    # no device: downloads are recorded instead of being passed to the library
+    device = object.__new__(ASG)
+    device.n_downloads = 0
+    device.downloads = []
+
+    def download(pointers, lengths):
+        device.downloads.append([np.ctypeslib.as_array(pointers[i], shape=(lengths[i],)).tolist()
+                                 if lengths[i] else [] for i in range(ASG_CHANNELS)])
+        return 1
+
+    device.download_ASG_pulse_pointers = download
+    return device
+
+
+def addresses(pointers) -> list:
+    return [ctypes.cast(p, ctypes.c_void_p).value for p in pointers]
+
+
+def test_download_arrays_reuses_buffers(asg):
+    data = [[100, 200], [0, 150, 50, 100], [300, 0]] + [[0, 0]] * 5
+    asg.download_arrays(data)
+    pointers, lengths = asg._c_pointers, asg._c_lengths
+    buffers, first = list(asg._buffers), addresses(pointers)
+    assert asg.downloads[-1] == [[float(t) for t in seq] for seq in data]
+    assert list(lengths) == [2, 4, 2, 2, 2, 2, 2, 2]
+
+    data2 = [[120, 180], [0, 100, 100, 100], [150, 150]] + [[0, 0]] * 5
+    asg.download_arrays(data2)
+    assert asg._c_pointers is pointers and asg._c_lengths is lengths
+    assert all(a is b for a, b in zip(asg._buffers, buffers))
+    assert addresses(pointers) == first
+    assert asg.downloads[-1] == [[float(t) for t in seq] for seq in data2]
+
+    # a longer sequence reallocates the buffer of its channel only
+    long_seq = [20, 20] * 100
+    asg.download_arrays([long_seq] + data2[1:])
+    assert asg._buffers[0] is not buffers[0] and len(asg._buffers[0]) >= 200
+    assert addresses(pointers)[0] != first[0] and addresses(pointers)[1:] == first[1:]
+    assert asg.downloads[-1][0] == long_seq and asg.n_downloads == 3
+
+
+def test_download_arrays_passes_float64_arrays_without_copying(asg):
+    arr = np.array([0, 150, 50, 100], dtype=np.float64)
+    data = [arr] + [[0, 0]] * 7
+    asg.download_arrays(data)
+    assert addresses(asg._c_pointers)[0] == arr.ctypes.data
+    assert asg._buffers[0] is None
+    asg.download_arrays([arr[::1]] + [[0, 0]] * 7)  # a view of the same memory
+    assert addresses(asg._c_pointers)[0] == arr.ctypes.data
+
+
+def test_download_arrays_raises_on_invalid_data(asg):
+    with pytest.raises(ValueError):
+        asg.download_arrays([[5, 100]] + [[0, 0]] * 7)
+    with pytest.raises(ValueError):
+        asg.download_arrays([[100, 100, 10]] + [[0, 0]] * 7)
+    with pytest.raises(ValueError):
+        asg.download_arrays([[100, 100]] * 3)
+    assert asg.downloads == [] and asg.n_downloads == 0
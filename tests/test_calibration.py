@@ -0,0 +1,141 @@
+import datetime
+import json
+import numpy as np
+import pytest
+from odmactor.instrument import simulation
+from odmactor.scheduler import RamseyScheduler
+from odmactor.utils.calibration import PiPulseCalibration, analyze_delays, compact_paddings, suggest_timings
+
+
+def arrival_profiles(pad=1000, t_laser=3000, t_dark=4000, t_pi=100):
+    """
+    Noiseless histograms of delay calibration from the simulated photon source
+    """
+    mw = simulation.SimulatedMicrowave()
+    mw.set_frequency(2.87e9)
+    mw.set_power(0)
+    mw.start()
+    asg = simulation.SimulatedASG()
+    tagger = simulation.SimulatedTimeTagger(mw=mw, asg=asg)
+    period = pad + t_laser + t_dark
+    t_before_pi = pad + t_laser + t_dark // 3
+    laser_pulse = [0, pad, t_laser, t_dark]
+    profiles = []
+    for laser_seq, mw_seq in [(laser_pulse, [0, 0]),
+                              (laser_pulse, [0, t_before_pi, t_pi, period - t_before_pi - t_pi]),
+                              ([period, 0], [0, pad, t_laser, t_dark])]:
+        asg.asg_data = [laser_seq, mw_seq] + [[0, 0]] * 6
+        profiles.append(tagger.arrival_profile().copy())
+    return tagger, np.arange(period) + 0.5, profiles
+
+
+def test_mw_delay_excludes_spin_response():
+    tagger, times, profiles = arrival_profiles()
+    result = analyze_delays(times, *profiles, laser_edges=(1000, 4000), mw_edge=1000)
+    assert result['mw_delay'] == pytest.approx(tagger.mw_delay * 1e9, abs=2)
+
+
+def test_paddings_and_suggested_timings():
+    delays = {'laser_delay': 350, 'laser_rise': 120, 'laser_fall': 130, 'mw_delay': 40, 'polarization_time': 300,
+              'readout_window': 400}
+    assert set(compact_paddings(delays)) == {'inter_init_mw', 'inter_mw_read', 'pre_read', 'inter_period'}
+    assert suggest_timings(delays) == {'t_init': 440, 't_read_sig': 400}
+
+
+def test_calibrate_delays_keeps_experiment_parameters(sim_env):
+    s = RamseyScheduler(simulation=True, catalog=False)
+    s.output_dir = str(sim_env / 'out') + '/'
+    s.pi_pulse = {'freq': 2.87e9, 'power': 0, 'time': 100e-9}
+    s.configure_mw_paras(power=0, freq=2.87e9)
+    s.configure_odmr_seq(t_init=5000, t_read_sig=800, inter_init_mw=3000, inter_mw_read=1000, pre_read=500,
+                         inter_period=1000, N=1000)
+    result = s.calibrate_delays(duration=0.2)
+    assert s._cache['t_init'] == 5000 and s._cache['t_read_sig'] == 800
+    assert s._cache['inter_init_mw'] == result['inter_init_mw'] < 3000
+    assert set(result['suggested']) == {'t_init', 't_read_sig'}
+    s.close()
+
+
+def ago(seconds: float) -> str:
+    return (datetime.datetime.now() - datetime.timedelta(seconds=seconds)).isoformat(timespec='seconds')
+
+
+def test_pi_table_expiry(tmp_path):
+    table = PiPulseCalibration(str(tmp_path / 'pi.json'), max_age=3600)
+    table.add(2.87e9, 0, 100e-9, timestamp=ago(7200))
+    assert table.lookup(2.87e9, 0) is None and table.is_stale(2.87e9, 0)
+    table.add(2.87e9, 0, 120e-9, timestamp=ago(60))  # replaces the entry of the same setting
+    assert len(table.entries) == 1
+    assert table.lookup(2.87e9, 0) == pytest.approx(120e-9)
+    assert not table.is_stale(2.87e9, 0)
+
+
+def test_pi_table_windows(tmp_path):
+    table = PiPulseCalibration(str(tmp_path / 'pi.json'), freq_window=50e6, power_window=3)
+    assert table.lookup(2.87e9, 0) is None
+    table.add(2.87e9, 0, 100e-9)
+    assert table.lookup(2.87e9 + 60e6, 0) is None
+    assert table.lookup(2.87e9, 4) is None
+    assert table.lookup(2.87e9, -3.5) is None
+    # nearest entry rescaled by t ∝ 1 / √P
+    assert table.lookup(2.87e9 + 40e6, 0) == pytest.approx(100e-9)
+    assert table.lookup(2.87e9, -2) == pytest.approx(100e-9 * 10 ** (2 / 20))
+
+
+def test_pi_table_linear_and_nearest(tmp_path):
+    table = PiPulseCalibration(str(tmp_path / 'pi.json'), freq_window=100e6, power_window=3)
+    # all at one frequency: collinear entries, no triangulation
+    for power, t in [(-3, 140e-9), (0, 100e-9), (3, 70e-9)]:
+        table.add(2.87e9, power, t)
+    _, linear, nearest = table._interpolators(datetime.datetime.now())
+    assert linear is None and nearest is not None
+    assert table.lookup(2.88e9, -2.9) == pytest.approx(140e-9 * 10 ** (-0.1 / 20))
+
+    # residuals linear in frequency are interpolated exactly within the hull
+    table = PiPulseCalibration(str(tmp_path / 'pi2.json'), freq_window=100e6, power_window=3)
+
+    def t_pi(freq, power):
+        return 100e-9 * np.exp((freq - 2.87e9) / 1e9) * 10 ** (-power / 20)
+
+    for freq, power in [(2.82e9, -2), (2.92e9, -2), (2.87e9, 2)]:
+        table.add(freq, power, t_pi(freq, power))
+    _, linear, _ = table._interpolators(datetime.datetime.now())
+    assert linear is not None
+    assert table.lookup(2.88e9, 0) == pytest.approx(t_pi(2.88e9, 0), rel=1e-9)
+
+
+def test_pi_table_persistence(tmp_path):
+    fname = str(tmp_path / 'pi.json')
+    PiPulseCalibration(fname).add(2.87e9, 0, 100e-9)
+    PiPulseCalibration(fname).add(2.90e9, 0, 110e-9)
+    table = PiPulseCalibration(fname)
+    assert sorted(e['freq'] for e in table.entries) == [2.87e9, 2.90e9]
+    assert table.lookup(2.90e9, 0) == pytest.approx(110e-9)
+    with open(fname) as f:
+        assert json.load(f) == table.entries
+
+
+def test_calibrate_pi_pulse_measures_only_stale_settings(sim_env, monkeypatch):
+    s = RamseyScheduler(simulation=True, catalog=False)
+    s.output_dir = str(sim_env / 'out') + '/'
+    assert s.pi_calibration.entries == []
+    measured = []
+    measure = RamseyScheduler._measure_pi_pulse
+
+    def spy(self, *args):
+        measured.append(args[:2])
+        return measure(self, *args)
+
+    monkeypatch.setattr(RamseyScheduler, '_measure_pi_pulse', spy)
+    expected = 0.5 / (5e6 * np.sqrt(1 / (1 + 1 / 30)))  # simulated Rabi frequency at 0 dBm
+    t_pi = s.calibrate_pi_pulse(freq=2.87e9, power=0, N=2000)
+    assert measured == [(2.87e9, 0)]
+    assert t_pi == pytest.approx(expected, rel=0.1)
+    assert s.pi_pulse == {'freq': 2.87e9, 'power': 0, 'time': t_pi}
+    assert PiPulseCalibration().lookup(2.87e9, 0) == pytest.approx(t_pi)  # persisted
+
+    assert s.calibrate_pi_pulse(freq=2.87e9, power=-1) == pytest.approx(t_pi * 10 ** (1 / 20))
+    assert len(measured) == 1  # the table is valid
+    s.calibrate_pi_pulse(freq=2.87e9, power=0, force=True, N=2000)
+    assert len(measured) == 2
+    s.close()
@@ -0,0 +1,118 @@
+import json
+import os
+import numpy as np
+import pytest
+from odmactor.scheduler import CWScheduler
+from odmactor.utils.catalog import ResultCatalog, RunRecord, save_arrays
+from odmactor.utils.codec import CountArchive, encode_counts
+
+
+def record_run(catalog, tmp_path, name, scheduler='Ramsey Scheduler', timestamp='2023-05-01T10:00:00', **params):
+    fname = str(tmp_path / (name + '.json'))
+    with open(fname, 'w') as f:
+        json.dump({}, f)
+    return catalog.record(scheduler, fname, 'times', [100, 200, 300], True, {'freq': 2.87e9, 'power': 0},
+                          {'freq': 2.87e9, 'power': 0, 'time': 1e-7}, params, timestamp=timestamp)
+
+
+def test_record_and_query(tmp_path):
+    catalog = ResultCatalog(str(tmp_path / 'catalog.sqlite'))
+    a = record_run(catalog, tmp_path, 'a', timestamp='2023-01-01T00:00:00', t_init=5000, N=100)
+    b = record_run(catalog, tmp_path, 'b', timestamp='2023-06-01T00:00:00', t_init=3000, N=100)
+    c = record_run(catalog, tmp_path, 'c', scheduler='Rabi Scheduler', timestamp='2023-07-01T00:00:00', t_init=5000)
+    assert len(catalog) == 3
+
+    assert [r.id for r in catalog.query()] == [c, b, a]  # latest first
+    assert [r.id for r in catalog.query(since='2023-06-01')] == [c, b]
+    assert [r.id for r in catalog.query(until='2023-06-01')] == [a]
+    assert [r.id for r in catalog.query(scheduler='Ramsey Scheduler')] == [b, a]
+    assert [r.id for r in catalog.query(t_init=5000)] == [c, a]
+    assert [r.id for r in catalog.query(scheduler='Ramsey Scheduler', t_init=5000, N=100)] == [a]
+    assert [r.id for r in catalog.query(limit=1)] == [c]
+
+    run = catalog.get(a)
+    assert isinstance(run, RunRecord)
+    assert run.scheduler == 'Ramsey Scheduler' and run.axis == 'times' and run.n_points == 3
+    assert run.axis_start == 100 and run.axis_stop == 300 and run.with_ref == 1 and run.pi_time == 1e-7
+    assert run.params == {'t_init': 5000, 'N': 100}
+    with pytest.raises(KeyError):
+        catalog.get(100)
+
+
+def test_record_same_file_updates(tmp_path):
+    catalog = ResultCatalog(str(tmp_path / 'catalog.sqlite'))
+    first = record_run(catalog, tmp_path, 'a', t_init=5000)
+    second = record_run(catalog, tmp_path, 'a', timestamp='2023-05-01T10:00:01', t_init=3000)
+    assert first == second and len(catalog) == 1
+    assert catalog.get(first).params == {'t_init': 3000}
+    assert catalog.get(first).timestamp == '2023-05-01T10:00:01'
+
+
+def test_arrays_are_memory_mapped(tmp_path):
+    catalog = ResultCatalog(str(tmp_path / 'catalog.sqlite'))
+    counts = np.random.default_rng(0).random(50)
+    raw = np.random.default_rng(1).poisson(4, (50, 300))
+    paths = save_arrays(str(tmp_path / 'a-arrays'), {'counts': counts, 'origin_data': raw, 'ragged': [[1], [1, 2]]})
+    assert set(paths) == {'counts', 'origin_data'}
+    run_id = catalog.record('CW ODMR Scheduler', str(tmp_path / 'a.json'), arrays=paths)
+    run = catalog.get(run_id)
+    assert run.array_names == ['counts', 'origin_data']
+    assert isinstance(run['counts'], np.memmap) and np.array_equal(run['counts'], counts)
+    assert isinstance(run['origin_data'], CountArchive)
+    assert np.array_equal(run['origin_data'][10:20], raw[10:20])
+    with pytest.raises(KeyError):
+        run['missing']
+
+
+def test_load_json_decodes_odmc_references(tmp_path):
+    raw = np.random.default_rng(2).poisson(4, (20, 30))
+    encode_counts(str(tmp_path / 'a-origin_data.odmc'), raw)
+    fname = str(tmp_path / 'a.json')
+    with open(fname, 'w') as f:
+        json.dump({'counts': [1.0, 2.0], 'origin_data': {'codec': 'odmc', 'file': str(tmp_path / 'a-origin_data.odmc')},
+                   'origin_data_ref': raw.tolist()}, f)
+    catalog = ResultCatalog(str(tmp_path / 'catalog.sqlite'))
+    detail = catalog.get(catalog.record('CW ODMR Scheduler', fname)).load_json()
+    assert detail['counts'] == [1.0, 2.0]
+    assert np.array_equal(detail['origin_data'], raw)
+    assert detail['origin_data_ref'] == raw.tolist()
+
+
+def make_cw(sim_env, **kwargs):
+    cw = CWScheduler(simulation=True, with_ref=True, **kwargs)
+    cw.output_dir = str(sim_env / 'out') + '/'
+    cw.configure_odmr_seq(period=1000, N=1000)
+    cw.set_mw_freqs(2.85e9, 2.89e9, 1e7)
+    cw.configure_tagger_counting(reader='cbm')
+    return cw
+
+
+def test_catalog_is_opt_in(sim_env):
+    cw = make_cw(sim_env)
+    cw.run_scanning()
+    cw.close()
+    assert cw.catalog is None
+    assert not os.path.exists(sim_env / 'state' / 'catalog.sqlite')
+    assert not any(name.endswith('-arrays') for name in os.listdir(os.path.dirname(cw.output_fname)))
+
+
+@pytest.mark.parametrize('raw_format', ['json', 'odmc'])
+def test_scheduler_refers_to_raw_counts(sim_env, raw_format):
+    cw = make_cw(sim_env, catalog=True, raw_format=raw_format)
+    cw.run_scanning()  # saved once
+    cw.save_result(cw.output_fname)  # saved again into the same file
+    cw.close()
+
+    runs = ResultCatalog().query(scheduler=cw.name)
+    assert len(runs) == 1
+    run = runs[0]
+    assert run.fname == os.path.abspath(cw.output_fname) and run.n_points == 5
+    # raw counts are not copied among result arrays
+    arrays_dir = os.path.splitext(cw.output_fname)[0] + '-arrays'
+    assert sorted(os.listdir(arrays_dir)) == ['counts.npy', 'counts_ref.npy', 'freqs.npy']
+    assert np.array_equal(run['counts'], cw.result_detail['counts'])
+    origin = run['origin_data']
+    if raw_format == 'odmc':
+        assert isinstance(origin, CountArchive)
+    assert np.array_equal(np.asarray(origin), cw.result_detail['origin_data'])
+    assert np.array_equal(run.load_json()['origin_data'], cw.result_detail['origin_data'])
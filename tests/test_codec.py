@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from odmactor.utils.codec import CountArchive, encode_counts, is_counts, load_counts
+
+
+@pytest.mark.parametrize('compressor', ['zlib', 'none'])
+@pytest.mark.parametrize('data', [
+    np.random.default_rng(0).poisson(3, (50, 200)),  # per-period counts
+    np.cumsum(np.random.default_rng(1).poisson(5, (30, 4)), axis=0).astype(np.uint32),  # delta-friendly
+    np.array([[-3, 0, 2 ** 40], [7, -2 ** 40, 1]]),  # wide and negative values
+    np.arange(7, dtype=np.int16),
+])
+def test_round_trip(tmp_path, data, compressor):
+    fname = str(tmp_path / 'counts.odmc')
+    encode_counts(fname, data, chunk_rows=7, compressor=compressor)
+    decoded = load_counts(fname)
+    assert decoded.dtype == data.dtype and decoded.shape == data.shape
+    assert np.array_equal(decoded, data)
+
+
+def test_random_access(tmp_path):
+    data = np.random.default_rng(2).poisson(10, (100, 6))
+    fname = str(tmp_path / 'counts.odmc')
+    encode_counts(fname, data.tolist(), chunk_rows=16)
+    archive = CountArchive(fname)
+    assert len(archive) == 100 and archive.n_chunks == 7
+    assert np.array_equal(archive[37], data[37])
+    assert np.array_equal(archive[-1], data[-1])
+    assert np.array_equal(archive[10:90:7, 2], data[10:90:7, 2])
+    assert np.array_equal(archive[[99, 0, 50]], data[[99, 0, 50]])
+    assert np.array_equal(np.asarray(archive), data)
+    with pytest.raises(IndexError):
+        archive[100]
+
+
+def test_rejects_non_counts(tmp_path):
+    assert is_counts([[1.0, 2.0], [3.0, 4.0]])
+    assert not is_counts([0.5, 1.0])
+    assert not is_counts([[1, 2], [3]])
+    with pytest.raises(ValueError):
+        encode_counts(str(tmp_path / 'x.odmc'), [0.5, 1.0])
@@ -0,0 +1,16 @@
+import numpy as np
+from odmactor.scheduler import ConfocalScheduler
+
+
+def test_scan_image_gated_by_sample_clock(sim_env):
+    s = ConfocalScheduler(simulation=True, catalog=False)
+    s.output_dir = str(sim_env / 'out') + '/'
+    s.configure_odmr_seq(period=1000, N=100)
+    # hardware arguments of the galvo scanner are accepted by the simulated one
+    s.configure_scanner(emitters=[(1.0, -2.0)], x_channel='Dev1/ao0', volts_per_um=(0.1, 0.1))
+    s.set_raster((-5, 5), (-5, 5), shape=(21, 21), pixel_time=1e-3)
+    assert s.counter.begin_channel == s.tagger_input['scan_clock']
+    image = s.scan_image()
+    i, j = np.unravel_index(image.argmax(), image.shape)
+    assert (s._xs[j], s._ys[i]) == (1.0, -2.0)
+    s.close()
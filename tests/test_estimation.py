@@ -0,0 +1,114 @@
+import io
+import json
+import os
+import time
+import numpy as np
+import pytest
+from odmactor.scheduler import CWScheduler, RamseyScheduler
+from odmactor.utils.estimation import TimeEstimator, ScanProgress, format_duration
+
+
+def test_overheads_persist_across_estimators(sim_env):
+    estimator = TimeEstimator(weight=0.5)
+    assert estimator.overhead('CWScheduler-ref') == 0.0
+    estimator.update('CWScheduler-ref', 0.02, 10)
+    estimator.update('CWScheduler-ref', 0.04, 5)
+    assert estimator.fname == str(sim_env / 'state' / 'overhead.json')
+
+    with open(estimator.fname) as f:
+        record = json.load(f)['CWScheduler-ref']
+    assert record['per_point'] == pytest.approx(0.03) and record['n_points'] == 15
+
+    reloaded = TimeEstimator()
+    assert reloaded.overhead('CWScheduler-ref') == pytest.approx(0.03)
+    assert reloaded.overhead('RabiScheduler') == 0.0
+
+
+def test_unreadable_or_unwritable_overheads(tmp_path, capsys):
+    fname = tmp_path / 'overhead.json'
+    fname.write_text('not json')
+    assert TimeEstimator(str(fname)).overhead('CWScheduler') == 0.0
+
+    estimator = TimeEstimator(str(tmp_path / 'missing' / 'overhead.json'))
+    estimator.update('CWScheduler', 0.01, 3)
+    assert 'cannot be saved' in capsys.readouterr().out
+    assert estimator.overhead('CWScheduler') == 0.01
+
+
+def test_estimate_uses_exact_periods(sim_env):
+    s = RamseyScheduler(simulation=True, with_ref=True, epoch_omit=2)
+    s.pi_pulse = {'freq': 2.87e9, 'power': 0, 'time': 80e-9}
+    s.configure_odmr_seq(t_init=3000, t_read_sig=400, N=1000)
+    times = [100, 2000, 50000]
+    s.set_delay_times(times=times)
+
+    c = s._cache
+    periods = np.array([c['t_init'] + c['inter_init_mw'] + c['t_mw'] * 2 + t + c['inter_mw_read'] + c['pre_read'] +
+                        c['t_read_sig'] + c['inter_period'] for t in times])
+    dwells = periods * 1e-9 * 1000 * (1 + s.time_pad_ratio) * 2  # with reference
+    assert s.time_total == pytest.approx(dwells.sum() + 2 * dwells[0])  # two omitted epochs
+
+    s.estimator.update(s._estimator_key, 0.05, 10)
+    assert s.estimate_time() == pytest.approx(dwells.sum() + 2 * dwells[0] + 3 * 0.05)
+    s.close()
+
+
+def make_cw(sim_env):
+    cw = CWScheduler(simulation=True, with_ref=True)
+    cw.output_dir = str(sim_env / 'out') + '/'
+    cw.configure_odmr_seq(period=1000, N=1000)
+    cw.set_mw_freqs(2.85e9, 2.89e9, 1e7)
+    cw.configure_tagger_counting(reader='cbm')
+    return cw
+
+
+def test_measured_overhead_calibrates_next_estimate(sim_env):
+    cw = make_cw(sim_env)
+    key = cw._estimator_key
+    first = cw.estimate_time()
+    assert TimeEstimator().overhead(key) == 0.0
+
+    set_frequency = cw.mw.set_frequency
+
+    def slow_set_frequency(freq):
+        time.sleep(0.03)
+        set_frequency(freq)
+
+    cw.mw.set_frequency = slow_set_frequency
+    cw.run_scanning()
+    cw.close()
+
+    overhead = TimeEstimator().overhead(key)
+    assert overhead >= 0.03
+    assert os.path.exists(sim_env / 'state' / 'overhead.json')
+
+    cw = make_cw(sim_env)
+    assert cw._estimator_key == key
+    assert cw.time_total == pytest.approx(first + 5 * overhead)
+    cw.close()
+
+
+def test_scan_progress_eta():
+    progress = ScanProgress(range(4), [1, 1, 2, 4])
+    assert progress.eta(0.0, 0) == pytest.approx(8)
+    assert progress.eta(2.0, 2) == pytest.approx(6)  # on schedule
+    assert progress.eta(4.0, 2) == pytest.approx(12)  # twice slower than estimated
+    assert progress.eta(1.0, 3) == pytest.approx(1)
+    assert progress.eta(5.0, 4) == 0.0
+    # costs not matching the points are ignored
+    assert np.array_equal(ScanProgress(range(3), [1, 2]).costs, np.ones(3))
+
+
+def test_scan_progress_iteration():
+    stream = io.StringIO()
+    progress = ScanProgress(['a', 'b', 'c'], [0.01, 0.01, 0.01], stream=stream, interval=0)
+    progress.status = lambda: 'ok'
+    items = []
+    for item in progress:
+        time.sleep(0.01)
+        items.append(item)
+    assert items == ['a', 'b', 'c'] and progress.n_done == 3 and len(progress) == 3
+    assert np.all(progress.durations >= 0.01)
+    lines = stream.getvalue().split('\r')
+    assert lines[-1].startswith('3/3 100.0%') and lines[-1].endswith(' | ok\n')
+    assert format_duration(3725.4) == '1:02:05' and format_duration(-1) == '0:00:00'
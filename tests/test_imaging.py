@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from odmactor.instrument.simulation import SimulatedCamera
+from odmactor.scheduler import CWScheduler
+from odmactor.utils.imaging import ImageStack, fit_lorentzians, GAMMA_NV
+
+
+def lorentzians(freqs, centers, linewidth=8e6, contrast=0.03, baseline=1000.0):
+    hw = linewidth / 2
+    dip = sum(hw ** 2 / ((freqs - c) ** 2 + hw ** 2) for c in centers)
+    return baseline * (1 - contrast * dip)
+
+
+def test_fit_lorentzians():
+    freqs = np.arange(2.80e9, 2.94e9 + 1, 1e6)
+    rng = np.random.default_rng(0)
+    splittings = rng.uniform(20e6, 100e6, 200)
+    centers = np.stack([2.87e9 - splittings / 2, 2.87e9 + splittings / 2])
+    spectra = np.array([lorentzians(freqs, c) for c in centers.T])
+    spectra[-1] = 0  # an invalid pixel
+    result = fit_lorentzians(freqs, spectra, n_dips=2)
+    assert result['centers'].shape == (2, 200) and result['baseline'].shape == (200,)
+    assert np.allclose(result['centers'][:, :-1], centers[:, :-1], atol=1e4)
+    assert np.allclose(result['linewidth'][:-1], 8e6, rtol=1e-3)
+    assert np.allclose(result['contrast'][:, :-1], 0.03, rtol=1e-3)
+    assert np.allclose(result['baseline'][:-1], 1000, rtol=1e-4)
+    assert np.all(np.isnan(result['centers'][:, -1]))
+
+
+def test_fit_is_independent_of_row_blocks(tmp_path):
+    freqs = np.arange(2.82e9, 2.92e9 + 1, 2e6)
+    h, w = 6, 5
+    stack = ImageStack.create(str(tmp_path / 'cube'), freqs, (h, w), with_ref=False)
+    for i, f in enumerate(freqs):
+        stack.signal[i] = lorentzians(f, [2.85e9 + np.arange(h * w).reshape(h, w) * 1e5, 2.89e9])
+    stack.flush()
+    stack = ImageStack.load(str(tmp_path / 'cube'))
+    whole = stack.fit()
+    blocks = stack.fit(max_memory=1)  # one row at a time
+    for key in whole:
+        assert np.allclose(whole[key], blocks[key], equal_nan=True)
+    assert whole['centers'].shape == (2, h, w)
+
+
+def test_camera_scan_recovers_field_map(sim_env):
+    cw = CWScheduler(simulation=True, with_ref=True)
+    cw.output_dir = str(sim_env / 'out') + '/'
+    cw.configure_odmr_seq(period=1000, N=100)
+    cw.set_mw_freqs(2.78e9, 2.96e9, 2e6)
+    camera = SimulatedCamera((24, 20), mw=cw.mw, asg=cw.asg, channel_of=lambda name: cw.channel[name], seed=0)
+    cw.configure_camera_counting(camera, frames=10)
+    cw.run_scanning()
+    cw.close()
+
+    n_freqs = len(cw.frequencies)
+    assert cw.image_stack.signal.shape == (n_freqs, 24, 20)
+    stack = ImageStack.load(cw.image_stack.fname)
+    assert isinstance(stack.signal, np.memmap) and isinstance(stack.reference, np.memmap)
+    assert stack.signal.shape == stack.reference.shape == (n_freqs, 24, 20)
+    assert np.array_equal(stack.freqs, cw.frequencies)
+    # spatially averaged counts form the usual result
+    assert np.allclose(cw.result[1], stack.signal.mean(axis=(1, 2)), rtol=1e-5)
+
+    fits = stack.fit(n_dips=2)
+    b_map = stack.b_field_map(fits)
+    assert b_map.shape == (24, 20)
+    error = np.abs(b_map - camera.b_map)
+    assert np.median(error) < 3e-5  # 0.84 MHz, below half the frequency step
+    assert np.mean(error < 1e-4) > 0.95
+    splitting = fits['centers'][1] - fits['centers'][0]
+    assert np.allclose(b_map, splitting / (2 * GAMMA_NV))
@@ -0,0 +1,14 @@
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import bench_import
+
+
+def test_scheduler_import_budget():
+    probes = [bench_import.probe('odmactor.scheduler') for _ in range(5)]
+    eager_packages = sorted(set(sum([p['loaded'] for p in probes], [])))
+    assert eager_packages == []
+    assert statistics.median([p['time'] for p in probes]) <= bench_import.BUDGET
@@ -0,0 +1,38 @@
+import numpy as np
+from odmactor.utils.live import SharedRingBuffer
+
+
+def make_buffer(capacity, n_rows):
+    buffer = SharedRingBuffer(capacity, n_fields=2)
+    for i in range(n_rows):
+        buffer.write((i, 10 * i))
+    return buffer
+
+
+def test_read_incrementally():
+    buffer = make_buffer(8, 5)
+    rows, cursor = buffer.read()
+    assert rows[:, 0].tolist() == [0, 1, 2, 3, 4] and cursor == 5
+    buffer.write((5, 50))
+    rows, cursor = buffer.read(cursor)
+    assert rows[:, 0].tolist() == [5] and cursor == 6
+    assert buffer.read(cursor)[0].shape == (0, 2)
+    buffer.release()
+
+
+def test_lapped_rows_are_skipped():
+    buffer = make_buffer(4, 10)
+    rows, cursor = buffer.read()
+    # the oldest row kept shares its slot with the next row to be written
+    assert rows[:, 0].tolist() == [7, 8, 9] and cursor == 10
+    buffer.release()
+
+
+def test_row_being_written_is_dropped():
+    buffer = make_buffer(4, 4)
+    # the writer has stored row 4 into the slot of row 0, but not yet published it
+    buffer._data[0] = (-1, -1)
+    rows, cursor = buffer.read()
+    assert rows[:, 0].tolist() == [1, 2, 3] and cursor == 4
+    assert not np.any(rows < 0)
+    buffer.release()
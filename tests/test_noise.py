@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from odmactor.utils.noise import NoiseSpectrumEstimator, coherence_from_signal, filter_functions
+
+
+def explicit_filter(omegas, n, t, t_pi):
+    """
+    Filter function as the explicit sum over pi pulses
+    """
+    total = (n + 1) * t + n * t_pi
+    centers = np.arange(1, n + 1) * (t + t_pi) - t_pi / 2
+    signs = (-1.0) ** np.arange(1, n + 1)
+    pulses = np.sum(signs[:, None] * np.exp(1j * omegas[None] * centers[:, None]), axis=0)
+    y = 1 + (-1.0) ** (n + 1) * np.exp(1j * omegas * total) + 2 * np.cos(omegas * t_pi / 2) * pulses
+    return np.abs(y) ** 2
+
+
+@pytest.mark.parametrize('t_pi', [0.0, 20e-9])
+def test_filter_functions_match_pulse_sum(t_pi):
+    omegas = 2 * np.pi * np.geomspace(1e5, 1e8, 200)
+    orders, spacings = [1, 2, 7, 16], [100e-9, 300e-9, 50e-9, 1e-6]
+    filters = filter_functions(omegas, orders, spacings, t_pi)
+    for i, (n, t) in enumerate(zip(orders, spacings)):
+        expected = explicit_filter(omegas, n, t, t_pi)
+        assert np.allclose(filters[i], expected, atol=1e-9 * expected.max())
+
+
+def test_filter_function_peak():
+    n, t = 16, 500e-9
+    omegas = 2 * np.pi * np.linspace(0.5e6, 1.5e6, 2001)
+    peak = omegas[np.argmax(filter_functions(omegas, [n], [t])[0])]
+    assert peak == pytest.approx(np.pi / t, rel=0.01)
+
+
+def test_coherence_from_signal():
+    contrast, coherence = 0.3, 0.6
+    for n in (1, 2):
+        p_bright = (1 + (-1) ** (n + 1) * coherence) / 2
+        signal = 1 - contrast * (1 - p_bright)
+        assert coherence_from_signal(signal, [n], contrast)[0] == pytest.approx(coherence)
+
+
+def test_spectrum_recovery():
+    def spectrum(f):
+        return 2e5 / (1 + (f / 3e5) ** 2) + 4e6 * np.exp(-0.5 * ((f - 1.5e6) / 0.2e6) ** 2)
+
+    t_pi = 20e-9
+    orders, spacings = np.meshgrid([1, 2, 4, 8, 16, 32, 64], np.geomspace(40e-9, 4e-6, 40), indexing='ij')
+    orders, spacings = orders.ravel(), spacings.ravel()
+    truth = NoiseSpectrumEstimator(np.geomspace(2e4, 2e7, 400), t_pi=t_pi, oversampling=16)
+    coherences = np.exp(-truth.kernel(orders, spacings) @ spectrum(truth.freqs))
+
+    estimator = NoiseSpectrumEstimator(NoiseSpectrumEstimator.default_freqs(spacings, t_pi), t_pi=t_pi)
+    for n, t, c in zip(orders, spacings, coherences):  # point by point, as while scanning
+        estimator.add(n, t, c)
+    band = (estimator.freqs > 1e5) & (estimator.freqs < 5e6)
+    error = np.abs(estimator.spectrum()[band] - spectrum(estimator.freqs[band])) / spectrum(estimator.freqs[band])
+    assert np.median(error) < 0.2
+    # the peak of the spectrum is located
+    assert estimator.freqs[np.argmax(estimator.spectrum())] == pytest.approx(1.5e6, rel=0.15)
+    informative = coherences > 0.05
+    assert np.allclose(estimator.predict(orders, spacings)[informative], coherences[informative], atol=0.02)
+
+
+def test_noise_spectroscopy_pipeline(sim_env):
+    from odmactor.scheduler import HighDecouplingScheduler
+    from odmactor.scheduler.noise import NoiseSpectroscopy
+
+    s = HighDecouplingScheduler(simulation=True, catalog=False, with_ref=True)
+    s.output_dir = str(sim_env / 'out') + '/'
+    s.pi_pulse = {'freq': 2.87e9, 'power': 0, 'time': 100e-9}
+    s.configure_mw_paras(power=0, freq=2.87e9)
+    s.configure_odmr_seq(t_init=3000, t_read_sig=400, N=200)
+    s.gene_detect_seq(100)
+    s.configure_tagger_counting(reader='cbm')
+    # odd orders and a large contrast keep every simulated coherence close to 1, thus informative
+    spectroscopy = NoiseSpectroscopy(s, orders=[1, 3], spacings=[100, 200, 400], contrast=100, refit_every=2)
+    result = spectroscopy.run()
+    s.close()
+
+    assert np.isfinite(spectroscopy.coherence).all()
+    assert spectroscopy.estimator.n_points == 6
+    assert [n for n, _ in spectroscopy.history] == [2, 4, 6]
+    assert all(spectrum is not None for _, spectrum in spectroscopy.history)
+    assert spectroscopy.spectrum is not None and result['spectrum'] is spectroscopy.spectrum
+    assert result['counts'].data.shape == (2, 3, 2)
+    assert not np.isnan(result['counts'].data).any()
@@ -0,0 +1,131 @@
+import json
+import time
+import numpy as np
+import pytest
+from odmactor.scheduler import CWScheduler, RabiScheduler
+from odmactor.utils.profiling import ScanProfiler, profiled, STAGES
+
+
+def test_profiler_records_points_and_scan_stages():
+    profiler = ScanProfiler(capacity=2)
+    profiler.record('start_device', 0, 1000)  # outside detection points
+    for i in range(5):  # beyond the preallocated capacity
+        profiler.begin_point()
+        t = time.perf_counter_ns()
+        profiler.record('set_frequency', t, t + 1000)
+        profiler.record('dwell', t + 1000, t + 9000)
+        profiler.record('dwell', t + 9000, t + 10000)  # accumulated within a point
+        if i % 2 == 0:
+            profiler.record('read', t + 10000, t + 10000 + 1000 * (i + 1))
+        profiler.end_point()
+    profiler.record('save_result', 0, 3000)
+
+    assert profiler.n_points == 5
+    assert profiler.durations.shape == (5, len(STAGES))
+    summary = profiler.summary()
+    stages = summary['stages']
+    assert set(stages) == {'start_device', 'set_frequency', 'dwell', 'read', 'save_result'}
+    assert stages['dwell'] == {'count': 5, 'mean': pytest.approx(9e-6), 'p95': pytest.approx(9e-6),
+                               'total': pytest.approx(45e-6)}
+    assert stages['read']['count'] == 3 and stages['read']['mean'] == pytest.approx(3e-6)
+    assert stages['read']['p95'] == pytest.approx(np.percentile([1e-6, 3e-6, 5e-6], 95))
+    assert stages['start_device'] == {'count': 0, 'mean': None, 'p95': None, 'total': pytest.approx(1e-6)}
+    assert summary['dwell'] == pytest.approx(45e-6)
+    assert summary['duty_cycle'] == pytest.approx(summary['dwell'] / summary['total'])
+
+    profiler.reset()
+    assert profiler.n_points == 0 and profiler.summary()['stages'] == {}
+    assert profiler.summary()['duty_cycle'] is None
+
+
+class Instrumented:
+    def __init__(self, profiler=None):
+        self.profiler = profiler
+
+    @profiled('read')
+    def read(self, x):
+        """Docstring of the wrapped method"""
+        if x < 0:
+            raise ValueError(x)
+        return x * 2
+
+
+def test_profiled_decorator():
+    assert Instrumented.read.__doc__ == 'Docstring of the wrapped method'
+    assert Instrumented().read(2) == 4  # no profiler
+
+    profiler = ScanProfiler()
+    obj = Instrumented(profiler)
+    profiler.begin_point()
+    assert obj.read(3) == 6
+    with pytest.raises(ValueError):
+        obj.read(-1)  # recorded as well
+    profiler.end_point()
+    assert profiler.summary()['stages']['read']['count'] == 1
+    assert profiler.durations[0, STAGES.index('read')] > 0
+
+
+def make_cw(sim_env, **kwargs):
+    cw = CWScheduler(simulation=True, with_ref=True, **kwargs)
+    cw.output_dir = str(sim_env / 'out') + '/'
+    cw.configure_odmr_seq(period=1000, N=1000)
+    cw.set_mw_freqs(2.85e9, 2.89e9, 1e7)
+    cw.configure_tagger_counting(reader='cbm')
+    return cw
+
+
+def make_rabi(sim_env, **kwargs):
+    s = RabiScheduler(simulation=True, with_ref=True, **kwargs)
+    s.output_dir = str(sim_env / 'out') + '/'
+    s.pi_pulse = {'freq': 2.87e9, 'power': 0, 'time': 100e-9}
+    s.configure_mw_paras()
+    s.configure_odmr_seq(t_init=3000, t_read_sig=400, N=1000)
+    s.set_delay_times(times=[20, 60, 100])
+    s.configure_tagger_counting(reader='cbm')
+    return s
+
+
+@pytest.mark.parametrize('make, n_points, point_stages', [
+    (make_cw, 5, ['set_frequency', 'mw_control_seq', 'acquire_data', 'dwell', 'read']),
+    (make_rabi, 3, ['download_asg_sequences', 'mw_control_seq', 'acquire_data', 'dwell', 'read']),
+])
+def test_scan_profile(sim_env, make, n_points, point_stages):
+    s = make(sim_env, profile=True)
+    s.run_scanning()
+    s.close()
+
+    profile = s.result_detail['profile']
+    assert profile['n_points'] == n_points
+    stages = profile['stages']
+    assert set(stages) == set(point_stages) | {'start_device', 'cal_counts_result', 'save_result'}
+    for stage in point_stages:
+        assert stages[stage]['count'] == n_points
+        assert 0 < stages[stage]['mean'] <= stages[stage]['p95'] * (1 + 1e-9)
+        assert stages[stage]['total'] == pytest.approx(stages[stage]['mean'] * n_points)
+    for stage in ['start_device', 'cal_counts_result', 'save_result']:  # once per scan
+        assert stages[stage]['count'] == 0 and stages[stage]['total'] > 0
+    # each point dwells for N periods, twice with reference
+    assert stages['dwell']['mean'] >= 2 * s.asg_dwell
+    assert stages['dwell']['mean'] <= stages['acquire_data']['mean']
+    assert 0 < profile['duty_cycle'] < 1
+    assert profile['duty_cycle'] == pytest.approx(profile['dwell'] / profile['total'])
+
+    with open(s.output_fname) as f:
+        saved = json.load(f)['profile']  # summarized before saving
+    assert saved['n_points'] == n_points and 'dwell' in saved['stages']
+
+
+def test_profiling_is_off_by_default(sim_env, monkeypatch):
+    def fail(*args):
+        raise AssertionError('recorded without profiling')
+
+    monkeypatch.setattr(ScanProfiler, 'record', fail)
+    monkeypatch.setattr(ScanProfiler, 'begin_point', fail)
+    for make in (make_cw, make_rabi):
+        s = make(sim_env)
+        assert s.profiler is None
+        s.run_scanning()
+        s.close()
+        assert 'profile' not in s.result_detail
+        with open(s.output_fname) as f:
+            assert 'profile' not in json.load(f)
@@ -0,0 +1,168 @@
+import numpy as np
+import pytest
+from odmactor.scheduler import RamseyScheduler, RabiScheduler, RelaxationScheduler, HahnEchoScheduler, \
+    HighDecouplingScheduler
+from odmactor.utils.program import PulseProgram, Pulse, Wait, Seq, Par, Loop, Var
+from odmactor.utils.sequence import expand_sequence
+
+
+# hand-written sequences of schedulers before pulse programs, as (laser_seq, mw_seq, tagger_seq)
+
+def ramsey(c, t_free, two):
+    t_init, t_mw = c['t_init'], c['t_mw']
+    inter_init_mw, inter_mw_read = c['inter_init_mw'], c['inter_mw_read']
+    t_read_sig = t_read_ref = c['t_read_sig']
+    inter_readout, pre_read, inter_period = c['inter_readout'], c['pre_read'], c['inter_period']
+    if two:
+        return ([t_init, inter_init_mw + t_mw * 2 + t_free + inter_mw_read,
+                 pre_read + t_read_sig + inter_readout + t_read_ref + inter_period, 0],
+                [0, t_init + inter_init_mw, t_mw, t_free, t_mw,
+                 inter_mw_read + pre_read + t_read_sig + inter_readout + t_read_ref + inter_period],
+                [0, t_init + inter_init_mw + t_mw * 2 + t_free + inter_mw_read + pre_read, t_read_sig,
+                 inter_readout, t_read_ref, inter_period])
+    return ([t_init, inter_init_mw + t_mw * 2 + t_free + inter_mw_read, pre_read + t_read_sig + inter_period, 0],
+            [0, t_init + inter_init_mw, t_mw, t_free, t_mw, inter_mw_read + pre_read + t_read_sig + inter_period],
+            [0, t_init + inter_init_mw + t_mw * 2 + t_free + inter_mw_read + pre_read, t_read_sig, inter_period])
+
+
+def rabi(c, t_mw, two):
+    t_init, inter_init_mw = c['t_init'], c['inter_init_mw']
+    t_read_sig = t_read_ref = c['t_read_sig']
+    inter_readout, inter_period = c['inter_readout'], c['inter_period']
+    inter_mw_read, pre_read = c['inter_mw_read'], c['pre_read']
+    if two:
+        return ([t_init, inter_init_mw + t_mw + inter_mw_read,
+                 pre_read + t_read_sig + inter_readout + t_read_ref + inter_period, 0],
+                [0, t_init + inter_init_mw, t_mw,
+                 inter_mw_read + pre_read + t_read_sig + inter_readout + t_read_ref + inter_period],
+                [0, t_init + inter_init_mw + t_mw + inter_mw_read + pre_read, t_read_sig, inter_readout,
+                 t_read_ref, inter_period])
+    return ([t_init, inter_init_mw + t_mw + inter_mw_read, pre_read + t_read_sig + inter_period, 0],
+            [0, t_init + inter_init_mw, t_mw, inter_mw_read + pre_read + t_read_sig + inter_period],
+            [0, t_init + inter_init_mw + t_mw + inter_mw_read + pre_read, t_read_sig, inter_period])
+
+
+def relaxation(c, t_free, two, ms):
+    t_init, t_mw = c['t_init'], c['t_mw']
+    inter_init_mw, pre_read = c['inter_init_mw'], c['pre_read']
+    t_read_sig = t_read_ref = c['t_read_sig']
+    inter_readout, inter_period = c['inter_readout'], c['inter_period']
+    if ms == 1:
+        if two:
+            return ([t_init, inter_init_mw + t_mw + t_free,
+                     pre_read + t_read_sig + inter_readout + t_read_ref + inter_period, 0],
+                    [0, t_init + inter_init_mw, t_mw,
+                     t_free + pre_read + t_read_sig + inter_readout + t_read_ref + inter_period],
+                    [0, t_init + inter_init_mw + t_mw + t_free + pre_read, t_read_sig, inter_readout,
+                     t_read_ref, inter_period])
+        return ([t_init, inter_init_mw + t_mw + t_free, pre_read + t_read_sig + inter_period, 0],
+                [0, t_init + inter_init_mw, t_mw, t_free + pre_read + t_read_sig + inter_period],
+                [0, t_init + inter_init_mw + t_mw + t_free + pre_read, t_read_sig, inter_period])
+    if two:
+        return ([t_init, t_free, t_read_sig + inter_readout + t_read_ref, inter_period],
+                [0, 0],
+                [0, t_init + t_free, t_read_sig, inter_readout, t_read_ref, inter_period])
+    return ([t_init, t_free, t_read_sig, inter_period],
+            [0, 0],
+            [0, t_init + t_free, t_read_sig, inter_period])
+
+
+def decoupling(c, t_free, two, n):
+    """
+    Hahn echo for n = 1
+    """
+    t_init, t_mw_half_pi = c['t_init'], c['t_mw_half_pi']
+    inter_init_mw, inter_mw_read = c['inter_init_mw'], c['inter_mw_read']
+    t_read_sig = t_read_ref = c['t_read_sig']
+    pre_read, inter_readout, inter_period = c['pre_read'], c['inter_readout'], c['inter_period']
+    t_mw_pi = t_mw_half_pi * 2
+    if two:
+        return ([t_init, inter_init_mw + (t_mw_pi + t_free) * (n + 1) + inter_mw_read,
+                 pre_read + t_read_sig + inter_readout + t_read_ref + inter_period, 0],
+                [0, t_init + inter_init_mw, t_mw_half_pi] + [t_free, t_mw_pi] * n + [
+                    t_free, t_mw_half_pi, inter_mw_read + pre_read + t_read_sig + inter_readout + t_read_ref +
+                    inter_period],
+                [0, t_init + inter_init_mw + (t_mw_pi + t_free) * (n + 1) + inter_mw_read + pre_read, t_read_sig,
+                 inter_readout, t_read_ref, inter_period])
+    return ([t_init, inter_init_mw + (t_mw_pi + t_free) * (n + 1) + inter_mw_read,
+             pre_read + t_read_sig + inter_period, 0],
+            [0, t_init + inter_init_mw, t_mw_half_pi] + [t_free, t_mw_pi] * n + [
+                t_free, t_mw_half_pi, inter_mw_read + pre_read + t_read_sig + inter_period],
+            [0, t_init + inter_init_mw + (t_mw_pi + t_free) * (n + 1) + inter_mw_read + pre_read, t_read_sig,
+             inter_period])
+
+
+def levels(seq) -> list:
+    """
+    Runs of (level, width) of a high-level-effective sequence, merging zero-width segments
+    """
+    runs = []
+    for i, width in enumerate(expand_sequence(seq)):
+        if width == 0:
+            continue
+        level = int(i % 2 == 0)
+        if runs and runs[-1][0] == level:
+            runs[-1][1] += width
+        else:
+            runs.append([level, width])
+    return [(level, pytest.approx(width)) for level, width in runs]
+
+
+CASES = [
+    (RamseyScheduler, {}, ramsey),
+    (RabiScheduler, {}, rabi),
+    (RelaxationScheduler, {'ms': 0}, lambda c, t, two: relaxation(c, t, two, 0)),
+    (RelaxationScheduler, {'ms': 1}, lambda c, t, two: relaxation(c, t, two, 1)),
+    (HahnEchoScheduler, {}, lambda c, t, two: decoupling(c, t, two, 1)),
+    (HighDecouplingScheduler, {'order': 1}, lambda c, t, two: decoupling(c, t, two, 1)),
+    (HighDecouplingScheduler, {'order': 3}, lambda c, t, two: decoupling(c, t, two, 3)),
+]
+
+
+@pytest.mark.parametrize('ttl', [1, 0])
+@pytest.mark.parametrize('two_pulse_readout', [False, True])
+@pytest.mark.parametrize('cls, attrs, baseline', CASES)
+def test_compiled_sequences_match_baseline(sim_env, cls, attrs, baseline, two_pulse_readout, ttl):
+    s = cls(simulation=True, catalog=False, **attrs)
+    for name, value in attrs.items():
+        setattr(s, name, value)
+    s.pi_pulse = {'freq': 2.87e9, 'power': 0, 'time': 80e-9}
+    s.configure_odmr_seq(t_init=3000, t_read_sig=400, N=100)
+    s.two_pulse_readout = two_pulse_readout
+    s.laser_ttl = s.mw_ttl = ttl
+    times = [100, 250.5, 1000]
+    s.set_delay_times(times=times)
+    for t in times:
+        s.gene_detect_seq(t)
+        expected = baseline(s._cache, t, two_pulse_readout)
+        for name, seq in zip(['laser', 'mw', 'tagger'], expected):
+            actual = s._asg_sequences[s.channel[name] - 1]
+            if ttl == 0 and name in ('laser', 'mw'):
+                assert levels(actual) == [(1 - level, width) for level, width in levels(seq)]
+            else:
+                assert levels(actual) == levels(seq)
+            if sum(seq) > 0:
+                assert sum(expand_sequence(actual)) == pytest.approx(sum(seq))
+    s.close()
+
+
+def test_compile_validation():
+    t = Var('t')
+    with pytest.raises(ValueError, match='narrower'):
+        PulseProgram(Seq(Wait(100), Pulse('mw', t), Wait(100))).compile(t=[20, 5])
+    with pytest.raises(ValueError, match='unknown channel'):
+        PulseProgram(Seq(Pulse('camera', 100), Wait(100))).compile()
+    with pytest.raises(ValueError, match='overlapping'):
+        PulseProgram(Par(Pulse('laser', 100), Seq(Wait(50), Pulse('laser', 100)))).compile()
+    with pytest.raises(ValueError, match='negative duration'):
+        PulseProgram(Seq(Pulse('laser', 100), Wait(t - 200), Pulse('laser', 100))).compile(t=[300, 100])
+
+
+def test_loop_is_not_unrolled():
+    t = Var('t')
+    program = PulseProgram(Seq(Pulse('laser', 100), Loop(1000, Wait(t), Pulse('mw', 40)), Wait(100)))
+    compiled = program.compile(t=[100, 200])
+    laser, mw, tagger = compiled.sequences(1)
+    assert laser == [100.0, 240100.0]
+    assert mw.n_blocks < 10 and len(mw) >= 2000
+    assert np.array_equal(mw.expand(), [0, 300] + [40, 200] * 999 + [40, 100])
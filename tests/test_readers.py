@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+from odmactor.scheduler import RamseyScheduler
+
+
+@pytest.mark.parametrize('armed', [False, True])
+def test_cbm_windows_are_tagger_pulses(sim_env, armed):
+    s = RamseyScheduler(simulation=True, catalog=False, armed=armed)
+    s.output_dir = str(sim_env / 'out') + '/'
+    s.pi_pulse = {'freq': 2.87e9, 'power': 0, 'time': 100e-9}
+    s.configure_mw_paras(power=0, freq=2.87e9)
+    s.configure_odmr_seq(t_init=3000, t_read_sig=400, N=2000)
+    s.set_delay_times(20, 220, 100)
+    s.gene_detect_seq(s.times[0])
+    s.configure_tagger_counting(reader='cbm')
+    assert s.counter.begin_channel == s.tagger_input['asg']
+    assert s.counter.end_channel == -s.tagger_input['asg']
+    s.run_scanning()
+    _, counts, counts_ref = s.result
+    # ~1e6 counts/s within 400-ns windows
+    assert np.allclose(counts_ref, 0.4, rtol=0.15)
+    assert all(len(d) == 2000 for d in s._data)
+    s.close()
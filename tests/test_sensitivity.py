@@ -0,0 +1,42 @@
+import time
+import numpy as np
+from odmactor.utils.sensitivity import SensitivityEstimator, fit_sinusoid
+
+
+def test_fit_sinusoid():
+    t = np.arange(20, 620, 10.0)
+    y = 0.4 + 0.05 * np.exp(-t / 3000) * np.cos(2 * np.pi * 0.005 * t + 0.3)
+    p = fit_sinusoid(t, y)
+    assert abs(p['freq'] - 0.005) < 1e-5
+
+
+def test_refit_not_charged_to_points(monkeypatch):
+    rng = np.random.default_rng(0)
+    freqs = np.linspace(2.85e9, 2.89e9, 41)
+    estimator = SensitivityEstimator(refit_every=5)
+    estimator.reset(freqs, 'lorentzian', np.full(len(freqs), 1e-3))
+    fit = estimator.fit
+
+    def slow_fit():
+        time.sleep(0.05)
+        return fit()
+
+    monkeypatch.setattr(estimator, 'fit', slow_fit)
+    for i, f in enumerate(freqs):
+        rate = 1 - 0.2 / (1 + ((f - 2.87e9) / 4e6) ** 2)
+        estimator.update(i, rng.poisson(20 * rate, 1000))
+    assert np.nanmax(estimator.durations) < 0.05
+    params = estimator.finish()
+    assert abs(params['centers'][0] - 2.87e9) < 1e6
+    assert np.isfinite(estimator.best()['b_sensitivity'])
+
+
+def test_no_model():
+    estimator = SensitivityEstimator(min_points=2)
+    estimator.reset([100, 200, 300], None, [1e-3] * 3)
+    for i in range(3):
+        estimator.update(i, np.ones(100))
+    assert estimator.finish() is None
+    summary = estimator.summary()
+    assert summary['model'] is None and np.isnan(summary['b_sensitivity'])
+    assert 0 < summary['efficiency']
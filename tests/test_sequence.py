@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+from odmactor.utils.program import PulseProgram, Pulse, Wait, Seq, Loop
+from odmactor.utils.sequence import CompressedSequence, expand_to_same_length, expand_sequence, flip_sequence, \
+    sequence_length
+
+
+def dd_sequence(n: int, t_free: float = 300, t_pi: float = 40) -> CompressedSequence:
+    program = PulseProgram(Seq(Pulse('laser', 3000), Wait(1000), Loop(n, Wait(t_free), Pulse('mw', t_pi)),
+                               Wait(t_free), Pulse('laser', 650)))
+    return program.compile().sequences(0)[1]
+
+
+def test_expand_matches_materialized():
+    t_free, t_pi, n = 300, 40, 8
+    seq = dd_sequence(n, t_free, t_pi)
+    assert isinstance(seq, CompressedSequence)
+    materialized = [0, 4000 + t_free] + [t_pi, t_free] * (n - 1) + [t_pi, t_free + 650]
+    assert seq.tolist() == materialized
+    assert len(seq) == len(materialized)
+    assert seq.length == sum(materialized)
+    assert (CompressedSequence.from_list([t_free, t_pi]) * n).tolist() == [t_free, t_pi] * n
+
+
+def test_large_loop_stays_compressed(monkeypatch):
+    n = 100000
+    seq = dd_sequence(n)
+
+    def expand(self):
+        raise AssertionError('sequence expanded')
+
+    monkeypatch.setattr(CompressedSequence, 'expand', expand)
+    assert seq.n_blocks < 10
+    assert len(seq) == 2 * n + 2
+    assert sequence_length(seq) == 4000 + 340 * n + 300 + 650
+    assert seq.check()
+    assert not (CompressedSequence.from_list([5, 300]) * n).check()  # narrower than ASG_MIN_HIGH
+    assert not (CompressedSequence.from_list([40, 5]) * n).check()  # shorter than ASG_MIN_LOW
+    with pytest.raises(ValueError, match='narrower'):
+        dd_sequence(n, t_pi=5)  # validated on blocks while compiling
+
+
+def test_expand_to_same_length_keeps_incommensurate_compressed():
+    a, b = [1000, 2000], [7, 6994]  # lengths 3000 and 7001
+    expanded = expand_to_same_length([a, b, [0, 0]])
+    lcm = 3000 * 7001
+    assert all(isinstance(seq, CompressedSequence) for seq in expanded[:2])
+    assert expanded[0].length == expanded[1].length == lcm
+    assert expanded[0].n_blocks < 10 and expanded[1].n_blocks < 10
+    assert expanded[2] == [0, 0]
+    # sequences of the same length are returned as they are
+    assert expand_to_same_length([a, [1500, 1500]]) == [a, [1500, 1500]]
+
+
+def levels(seq, resolution=1.0):
+    edges = np.concatenate([[0], np.cumsum(expand_sequence(seq))])
+    ts = np.arange(0, edges[-1], resolution) + resolution / 2
+    return (np.searchsorted(edges, ts, side='right') - 1) % 2 == 0
+
+
+@pytest.mark.parametrize('n', [1, 5])
+def test_flip_compressed(n):
+    seq = dd_sequence(n)
+    flipped = flip_sequence(seq)
+    assert isinstance(flipped, CompressedSequence)
+    assert flipped.length == seq.length
+    assert np.array_equal(levels(flipped), ~levels(seq))
+    # the same as flipping the expanded list
+    assert np.array_equal(levels(flipped), levels(flip_sequence(seq.tolist())))
+
+
+def t1_sequences(t_free: float = 5e6):
+    """
+    Laser, MW and tagger sequences of a multi-millisecond T1 period, plus a 1 MHz lock-in reference
+    """
+    t_init, t_read, inter_period = 3000, 400, 200
+    laser = [t_init, t_free, t_read, inter_period]
+    tagger = [0, t_init + t_free, t_read, inter_period]
+    length = sum(laser)
+    sync = CompressedSequence.from_list([500, 500]) * int(length // 1000) + [0, length % 1000]
+    return [laser, [0, 0], tagger, sync]
+
+
+def test_sequences_to_figure_bounds_edges():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.patches import StepPatch
+    from odmactor.utils.sequence import sequences_to_figure
+
+    max_edges = 400
+    fig = sequences_to_figure(t1_sequences(), max_edges=max_edges)
+    patches = [p for p in fig.axes[0].patches if isinstance(p, StepPatch)]
+    assert patches
+    for patch in patches:
+        assert len(patch.get_data().edges) <= max_edges + 1
+    assert fig.axes[0].get_xlim()[1] == pytest.approx(sum(t1_sequences()[0]) / 1e6)
+    plt.close(fig)
+
+
+def test_sequences_to_string_compresses_long_intervals():
+    from odmactor.utils.sequence import sequences_to_string
+    max_width, max_length = 20, 500
+    text = sequences_to_string(t1_sequences()[:3], max_width=max_width, max_length=max_length)
+    assert '~~' in text and '#' not in text
+    assert max(map(len, text.splitlines())) <= max_length
+    assert text.count('channel') == 2  # channels without pulses are omitted
+
+
+def test_sequences_to_string_downsamples_dense_channels():
+    from odmactor.utils.sequence import sequences_to_string
+    max_length = 500
+    text = sequences_to_string(t1_sequences(), max_length=max_length)
+    assert '#' in text
+    assert max(map(len, text.splitlines())) <= max_length
+    assert len(text) < 20 * max_length
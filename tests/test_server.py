@@ -0,0 +1,63 @@
+import threading
+import numpy as np
+import pytest
+from odmactor.utils.server import InstrumentClient, InstrumentServer
+
+
+@pytest.fixture
+def server(sim_env):
+    server = InstrumentServer(str(sim_env / 'server.sock'), simulation=True).start()
+    yield server
+    server.shutdown()
+
+
+def test_two_concurrent_clients(server, sim_env):
+    a, b = InstrumentClient(server.path), InstrumentClient(server.path)
+    cw = a.create('cw', 'CWScheduler', with_ref=True, catalog=False)
+    cw.set('output_dir', str(sim_env / 'out') + '/')
+    with a.batch() as batch:
+        batch.call('cw', 'configure_odmr_seq', period=1000, N=2000)
+        batch.call('cw', 'set_mw_freqs', 2.85e9, 2.89e9, 2e6)
+        batch.call('cw', 'configure_tagger_counting')
+    assert len(batch.results) == 3  # errors would have been raised
+
+    job = cw.submit('run_scanning')
+    # the other client is served while the scan is queued or running
+    assert b.ping() == 'pong'
+    assert b.list() == {'cw': 'CWScheduler'}
+    assert b.job(job)['state'] in ('queued', 'running', 'done')
+
+    errors = []
+
+    def round_trips(client, k):
+        try:
+            for i in range(20):
+                client.set('cw', 'tag_{}'.format(k), i)
+                assert client.get('cw', 'tag_{}'.format(k)) == i
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=round_trips, args=(c, k)) for k, c in enumerate((a, b))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+
+    assert b.wait(job, timeout=60)['state'] == 'done'
+    freqs, counts, counts_ref = b.get('cw', 'result')
+    assert len(freqs) == len(counts) == len(counts_ref) == 21
+    with pytest.raises(RuntimeError):
+        b.get('cw', '_data')
+    a.close()
+    b.close()
+
+
+def test_large_arrays_via_shared_memory(server):
+    client = InstrumentClient(server.path)
+    client.create('cw', 'CWScheduler', catalog=False)
+    client.set('cw', 'big', np.arange(100000.0))
+    for _ in range(2):  # blocks of a response are released at the next request
+        big = client.get('cw', 'big')
+        assert isinstance(big, np.ndarray) and big.shape == (100000,) and big[-1] == 99999
+    client.close()
@@ -0,0 +1,67 @@
+import pickle
+import numpy as np
+import pytest
+from odmactor.scheduler import Scheduler, RamseyScheduler
+from odmactor.scheduler.base import SNAPSHOT_VERSION
+from odmactor.utils.program import PulseProgram
+
+
+def make_ramsey(sim_env, **kwargs):
+    s = RamseyScheduler(simulation=True, **kwargs)
+    s.output_dir = str(sim_env / 'out') + '/'
+    s.pi_pulse = {'freq': 2.87e9, 'power': 0, 'time': 100e-9}
+    s.configure_mw_paras(power=0, freq=2.87e9)
+    s.configure_odmr_seq(t_init=3000, t_read_sig=400, N=500)
+    s.set_delay_times(times=[100, 200, 300, 400])
+    s.gene_detect_seq(100)
+    s.configure_tagger_counting(reader='cbm')
+    return s
+
+
+def test_load_configuration_round_trip(sim_env, monkeypatch):
+    s = make_ramsey(sim_env, profile=True)
+    fname = str(sim_env / 'ramsey.pkl')
+    s.save_configuration(fname)
+
+    def compile(*args, **kwargs):
+        raise AssertionError('sequences recompiled')
+
+    monkeypatch.setattr(PulseProgram, 'compile', compile)
+    rerun = Scheduler.load_configuration(fname)
+    assert isinstance(rerun, RamseyScheduler) and rerun is not s
+    assert rerun._cache == s._cache
+    assert rerun.pi_pulse == s.pi_pulse
+    assert rerun._times == s._times
+    assert rerun._asg_sequences == s._asg_sequences
+    assert rerun._mw_conf == s._mw_conf and rerun._asg_conf == s._asg_conf
+    assert rerun._reader == 'cbm' and rerun.counter is not None
+    # constructor modes of the saved scheduler
+    assert rerun.simulation and rerun.catalog is None and rerun.profiler is not None and rerun.telemetry is None
+
+    rerun.output_dir = s.output_dir
+    rerun.run_scanning()
+    times, counts, counts_ref = rerun.result
+    assert list(times) == [100, 200, 300, 400]
+    assert np.all(np.asarray(counts) > 0) and np.all(np.asarray(counts_ref) > 0)
+    rerun.close()
+    s.close()
+
+
+def test_modes_can_be_passed_again(sim_env):
+    s = make_ramsey(sim_env, telemetry='saved')
+    fname = str(sim_env / 'ramsey.pkl')
+    s.save_configuration(fname)
+    s.close()
+    assert pickle.load(open(fname, 'rb'))['modes']['telemetry'] == 'saved'
+    rerun = Scheduler.load_configuration(fname, telemetry=False, sensitivity=True)
+    assert rerun.telemetry is None and rerun.sensitivity is not None
+    rerun.close()
+
+
+def test_newer_snapshot_version_rejected(sim_env):
+    s = make_ramsey(sim_env)
+    snapshot = s.snapshot()
+    snapshot['version'] = SNAPSHOT_VERSION + 1
+    with pytest.raises(ValueError):
+        s.restore(snapshot)
+    s.close()
@@ -0,0 +1,38 @@
+import copy
+import numpy as np
+import pytest
+from odmactor.scheduler import RamseyScheduler, Sweep
+
+
+def make_ramsey(sim_env):
+    s = RamseyScheduler(simulation=True, catalog=False)
+    s.output_dir = str(sim_env / 'out') + '/'
+    s.pi_pulse = {'freq': 2.87e9, 'power': 0, 'time': 100e-9}
+    s.configure_mw_paras(power=0, freq=2.87e9)
+    s.configure_odmr_seq(t_init=3000, t_read_sig=400, N=500)
+    s.gene_detect_seq(100)
+    s.configure_tagger_counting(reader='cbm')
+    return s
+
+
+def test_power_sweep_regulates_pulses_and_restores(sim_env):
+    s = make_ramsey(sim_env)
+    mw_conf, cache, pi_pulse = copy.deepcopy((s._mw_conf, s._cache, s.pi_pulse))
+    t_mw = {}
+    sweep = Sweep(s, fixed={'t': 100}).add_axis('power', [-6, 0]).add_axis('freq', [2.86e9, 2.87e9])
+    sweep.run(lambda values, counts: t_mw.setdefault(values['power'], s._cache['t_mw']))
+    # Rabi frequency proportional to √power
+    assert t_mw[0] == pytest.approx(50)
+    assert t_mw[-6] == pytest.approx(50 * 10 ** 0.3)
+    assert s._mw_conf == mw_conf and s._cache == cache and s.pi_pulse == pi_pulse
+    assert s.mw.power == 0 and s.mw.freq == 2.87e9
+    assert not np.isnan(sweep.result.data).any()
+    s.close()
+
+
+def test_power_sweep_requires_pi_pulse(sim_env):
+    s = make_ramsey(sim_env)
+    s.pi_pulse['time'] = None
+    with pytest.raises(ValueError):
+        Sweep(s, fixed={'t': 100}).add_axis('power', [-6, 0])
+    s.close()
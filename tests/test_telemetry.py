@@ -0,0 +1,72 @@
+import os
+import re
+import urllib.request
+from odmactor.scheduler import CWScheduler
+from odmactor.utils.telemetry import CONTENT_TYPE, MetricsExporter, MetricsRegistry
+
+
+def parse(text: str) -> dict:
+    """
+    Samples of an OpenMetrics exposition, keyed by "name{labels}"
+    """
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            key, value = line.rsplit(' ', 1)
+            samples[key] = float(value)
+    return samples
+
+
+def test_scan_metrics_scraped(sim_env):
+    cw = CWScheduler(simulation=True, catalog=False, with_ref=True, telemetry='test-scan')
+    cw.output_dir = str(sim_env / 'out') + '/'
+    cw.configure_odmr_seq(period=1000, N=1000)
+    cw.set_mw_freqs(2.85e9, 2.89e9, 5e6)
+    cw.configure_tagger_counting(reader='cbm')
+    exporter = MetricsExporter(port=0).start()
+    try:
+        cw.run_scanning()
+        with urllib.request.urlopen('http://127.0.0.1:{}/metrics'.format(exporter.port)) as response:
+            assert response.headers['Content-Type'] == CONTENT_TYPE
+            text = response.read().decode()
+    finally:
+        exporter.stop()
+        cw.close()
+
+    assert text.endswith('# EOF\n')
+    # counters are declared without the suffix, and their samples are named with "_total"
+    counters = re.findall(r'^# TYPE (\S+) counter$', text, re.M)
+    assert 'odmactor_points' in counters and not any(name.endswith('_total') for name in counters)
+    samples = parse(text)
+    label = '{scheduler="test-scan"}'
+    for name in counters:
+        if name + label in samples:
+            raise AssertionError('counter sample {} without "_total"'.format(name))
+    assert samples['odmactor_points_total' + label] == len(cw.frequencies)
+    assert samples['odmactor_acquisitions_total' + label] >= len(cw.frequencies)
+    assert samples['odmactor_counts_total' + label] > 0
+    assert samples['odmactor_scanning' + label] == 0
+    assert samples['odmactor_scan_done' + label] == samples['odmactor_scan_points' + label] == len(cw.frequencies)
+    # metrics of a closed scheduler are removed
+    assert 'test-scan' not in MetricsExporter().registry.render()
+
+
+def test_file_rotation(tmp_path):
+    registry = MetricsRegistry()
+    points = registry.counter('odmactor_points', 'Detection points acquired', {'scheduler': 'rotation'})
+    fname = str(tmp_path / 'metrics.txt')
+    exporter = MetricsExporter(registry, fname=fname, max_bytes=300, backups=2)
+    for _ in range(5):
+        points.inc()
+        exporter.write()
+    assert os.path.exists(fname + '.1') and os.path.exists(fname + '.2')
+    assert not os.path.exists(fname + '.3')
+    for path in (fname, fname + '.1', fname + '.2'):
+        assert os.path.getsize(path) <= 300
+    with open(fname) as f:
+        text = f.read()
+    assert text.endswith('# EOF\n')
+    # timestamped samples of the latest exposition
+    assert re.search(r'^odmactor_points_total\{scheduler="rotation"\} 5(\.0)? \d+\.\d{3}$', text, re.M)
+    with open(fname + '.1') as f:
+        assert re.search(r'scheduler="rotation"\} 4(\.0)? ', f.read())
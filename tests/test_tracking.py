@@ -0,0 +1,60 @@
+import csv
+import numpy as np
+import pytest
+from odmactor.scheduler import CWScheduler
+from odmactor.scheduler.tracking import ResonanceTracker, DZFS_DT
+from odmactor.utils.imaging import GAMMA_NV
+
+
+@pytest.fixture
+def cw(sim_env):
+    cw = CWScheduler(simulation=True)
+    cw.output_dir = str(sim_env / 'out') + '/'
+    cw.configure_odmr_seq(period=1000, N=20000)  # 20 ms per point
+    cw.configure_tagger_counting(reader='cbm')
+    model = cw.tagger.model
+    model.resonances = [2.85e9, 2.89e9]
+    model.rng = np.random.default_rng(0)
+    yield cw
+    cw.close()
+
+
+def test_acquire_point(cw):
+    cw.start()
+    off = cw.acquire_point(2.80e9)
+    on = cw.acquire_point(2.85e9)
+    cw.stop()
+    assert off.shape == on.shape == (20000,)
+    assert cw.mw.freq == 2.85e9
+    assert np.mean(on) / np.mean(off) == pytest.approx(0.8, abs=0.02)
+    assert cw._data == [] and cw._data_ref == []  # not recorded as scanning data
+
+
+def test_tracker_follows_shifted_resonances(cw):
+    tracker = ResonanceTracker(cw, resonances=[2.851e9, 2.888e9], linewidth=10e6, contrast=0.1)
+    calibrated = tracker.calibrate(span=30e6, step=1e6)
+    assert calibrated['centers'] == pytest.approx([2.85e9, 2.89e9], abs=0.3e6)
+    assert calibrated['linewidth'] == pytest.approx(8e6, rel=0.1)
+    assert calibrated['contrast'] == pytest.approx(0.2, rel=0.1)
+
+    # a field change splits the resonances further
+    cw.tagger.model.resonances = [2.847e9, 2.893e9]
+    records = tracker.run(n_cycles=20)
+    assert records.shape == (20, len(tracker.fields))
+    assert np.all(np.diff(records[:, 0]) >= 0)
+    freqs = records[-10:, 3:]
+    assert freqs.mean(axis=0) == pytest.approx([2.847e9, 2.893e9], abs=0.1e6)
+    b_field = records[-10:, 1].mean()
+    assert b_field == pytest.approx(46e6 / (2 * GAMMA_NV), rel=0.02)
+    # temperature shift from the zero-field splitting of the first record, none for a symmetric splitting
+    zfs = records[:, 3:].mean(axis=1)
+    assert np.allclose(records[:, 2], (zfs - zfs[0]) / DZFS_DT)
+    assert abs(records[-10:, 2].mean()) < 10
+
+    assert tracker.buffer.count == 20
+    assert np.array_equal(tracker.buffer.read(0)[0], records)
+    with open(tracker.fname) as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == tracker.fields
+    assert np.allclose(np.array(rows[1:], dtype=float), records)
+    tracker.close()
@@ -0,0 +1,61 @@
+import numpy as np
+from odmactor.scheduler import CWScheduler
+from odmactor.scheduler.watchdog import golden_section_max
+
+
+def make_cw(sim_env):
+    cw = CWScheduler(simulation=True, catalog=False, with_ref=True)
+    cw.output_dir = str(sim_env / 'out') + '/'
+    cw.configure_odmr_seq(period=1000, N=5000)
+    cw.set_mw_freqs(2.85e9, 2.89e9, 4e6)
+    cw.configure_tagger_counting(reader='cbm')
+    return cw
+
+
+def displace_after(cw, n_points, shift):
+    """
+    Displace the simulated emitter after `n_points` detection points
+    """
+    measure = cw._measure_freq_point
+    calls = []
+
+    def wrapped(freq, mw_on_seq):
+        measure(freq, mw_on_seq)
+        calls.append(freq)
+        if len(calls) == n_points:
+            cw.watchdog.stage.displace(*shift)
+
+    cw._measure_freq_point = wrapped
+
+
+def test_golden_section_max():
+    x, y = golden_section_max(lambda v: -(v - 0.3) ** 2, -1, 1, 1e-3)
+    assert abs(x - 0.3) < 1e-3
+    assert y <= 0
+
+
+def test_watchdog_recovers_by_refocusing(sim_env):
+    cw = make_cw(sim_env)
+    watchdog = cw.enable_watchdog(source='points')
+    displace_after(cw, 7, (0.3, -0.2, 0.5))
+    cw.run_scanning()
+    summary = watchdog.summary()
+    assert summary['aborted'] is None
+    assert [e['recovered'] for e in summary['events']] == [True]
+    assert len(cw._data) == len(cw._freqs)
+    rates = np.array([np.sum(d) for d in cw._data_ref]) / cw.asg_dwell
+    assert rates.min() > watchdog.drop_ratio * watchdog.baseline
+    cw.close()
+
+
+def test_watchdog_aborts_and_discards_abnormal_point(sim_env):
+    cw = make_cw(sim_env)
+    watchdog = cw.enable_watchdog(source='points', max_recoveries=1)
+    displace_after(cw, 7, (50, 50, 50))
+    cw.run_scanning()
+    assert watchdog.summary()['aborted'] == 'drop'
+    # the point measured after the displacement is discarded
+    assert len(cw._data) == len(cw._data_ref) == 7
+    rates = np.array([np.sum(d) for d in cw._data_ref]) / cw.asg_dwell
+    assert rates.min() > watchdog.drop_ratio * watchdog.baseline
+    cw.close()